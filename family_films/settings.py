@@ -138,6 +138,14 @@ STATICFILES_DIRS = [
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Thumbnails, and the resized variants written by generate_thumbnail_derivatives
+THUMBNAIL_ROOT = os.path.join(BASE_DIR, 'static', 'thumbnails')
+THUMBNAIL_DERIVATIVES_DIR = os.path.join(THUMBNAIL_ROOT, 'derived')
+
+# Disk cache for the on-demand thumbnail resize endpoint, least recently used files evicted first
+THUMBNAIL_RESIZE_CACHE_DIR = config('THUMBNAIL_RESIZE_CACHE_DIR', default=os.path.join(BASE_DIR, 'cache', 'thumbnails'))
+THUMBNAIL_RESIZE_CACHE_BYTES = config('THUMBNAIL_RESIZE_CACHE_BYTES', default=256 * 1024 * 1024, cast=int)
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -0,0 +1,412 @@
+"""
+Diff-based bulk writes for film and chapter metadata.
+
+Editing endpoints describe the people, locations and tags an object should
+have; these helpers load the current through-table rows once, validate the
+requested ids in a single query per model and apply only the difference
+with one delete and one bulk_create per relation.
+"""
+from django.db.models import Q
+from main import journal
+from main.models import (
+    Film, Chapter, Person, Location, Tag,
+    FilmPeople, FilmLocations, FilmTags,
+    ChapterPeople, ChapterLocations, ChapterTags,
+)
+
+RELATIONS = ('people', 'locations', 'tags')
+
+# (owner type, relation) -> (through model, owner column, target column)
+THROUGH_TABLES = {
+    ('film', 'people'): (FilmPeople, 'film_id', 'person_id'),
+    ('film', 'locations'): (FilmLocations, 'film_id', 'location_id'),
+    ('film', 'tags'): (FilmTags, 'film_id', 'tag_id'),
+    ('chapter', 'people'): (ChapterPeople, 'chapter_id', 'person_id'),
+    ('chapter', 'locations'): (ChapterLocations, 'chapter_id', 'location_id'),
+    ('chapter', 'tags'): (ChapterTags, 'chapter_id', 'tag_id'),
+}
+
+# Chapter flag kept in sync with each relation
+CHAPTER_FLAGS = {
+    'people': 'has_people_metadata',
+    'locations': 'has_location_metadata',
+    'tags': 'has_tags_metadata',
+}
+
+
+def resolve_people(ids):
+    """Return {id: Person} for the given ids, raising ValueError if any are unknown"""
+    ids = {int(person_id) for person_id in ids}
+    people = Person.objects.in_bulk(ids)
+    missing = ids - people.keys()
+    if missing:
+        raise ValueError(f'Unknown person id(s): {sorted(missing)}')
+    return people
+
+
+def resolve_locations(ids):
+    """Return {id: Location} for the given ids, raising ValueError if any are unknown"""
+    ids = {int(location_id) for location_id in ids}
+    locations = Location.objects.in_bulk(ids)
+    missing = ids - locations.keys()
+    if missing:
+        raise ValueError(f'Unknown location id(s): {sorted(missing)}')
+    return locations
+
+
+def split_person_name(name):
+    """Split 'First Last Name' the way the editing endpoints always have"""
+    parts = name.strip().split(' ', 1)
+    return parts[0], parts[1] if len(parts) > 1 else ''
+
+
+def resolve_people_by_name(names, create=True):
+    """Return {name: Person}, creating missing people in one insert"""
+    keys = {name: split_person_name(name) for name in names if name and name.strip()}
+    if not keys:
+        return {}
+
+    def lookup():
+        condition = Q()
+        for first_name, last_name in set(keys.values()):
+            condition |= Q(first_name=first_name, last_name=last_name)
+        return {(p.first_name, p.last_name): p for p in Person.objects.filter(condition)}
+
+    found = lookup()
+    missing = set(keys.values()) - found.keys()
+    if missing and create:
+        Person.objects.bulk_create(
+            [Person(first_name=first, last_name=last) for first, last in missing],
+            ignore_conflicts=True,
+        )
+        # ignore_conflicts leaves primary keys unset, so read the rows back
+        found = lookup()
+        journal.record(journal.instance_entry(found[key], 'create') for key in missing if key in found)
+    return {name: found[key] for name, key in keys.items() if key in found}
+
+
+def resolve_locations_by_name(names, create=True):
+    """Return {name: Location}, creating missing locations in one insert"""
+    names = {name.strip() for name in names if name and name.strip()}
+    if not names:
+        return {}
+
+    def lookup():
+        found = {}
+        for location in Location.objects.filter(name__in=names).order_by('id'):
+            found.setdefault(location.name, location)
+        return found
+
+    found = lookup()
+    missing = names - found.keys()
+    if missing and create:
+        Location.objects.bulk_create([Location(name=name) for name in missing])
+        found = lookup()
+        journal.record(journal.instance_entry(found[name], 'create') for name in missing)
+    return found
+
+
+def resolve_tags(names):
+    """Return {name: Tag}, creating tags that do not exist yet in one insert"""
+    names = {str(name).strip() for name in names if str(name).strip()}
+    tags = Tag.objects.in_bulk(names)
+    new_tags = [Tag(tag=name) for name in names - tags.keys()]
+    if new_tags:
+        Tag.objects.bulk_create(new_tags, ignore_conflicts=True)
+        tags.update({tag.tag: tag for tag in new_tags})
+        journal.record(journal.instance_entry(tag, 'create') for tag in new_tags)
+    return tags
+
+
+RESOLVERS = {
+    'people': resolve_people,
+    'locations': resolve_locations,
+    'tags': resolve_tags,
+}
+
+
+def current_links(owner_type, relation, owner_ids):
+    """Return {owner_id: set(target ids)} from one query on the through table"""
+    model, owner_field, target_field = THROUGH_TABLES[(owner_type, relation)]
+    links = {owner_id: set() for owner_id in owner_ids}
+    rows = model.objects.filter(**{f'{owner_field}__in': list(links)}).values_list(owner_field, target_field)
+    for owner_id, target_id in rows:
+        links[owner_id].add(target_id)
+    return links
+
+
+def apply_link_changes(owner_type, relation, additions, removals):
+    """Insert and delete (owner_id, target_id) pairs with at most one query each"""
+    model, owner_field, target_field = THROUGH_TABLES[(owner_type, relation)]
+
+    removals = set(removals)
+    if removals:
+        by_owner = {}
+        for owner_id, target_id in removals:
+            by_owner.setdefault(owner_id, set()).add(target_id)
+        condition = Q()
+        for owner_id, target_ids in by_owner.items():
+            condition |= Q(**{owner_field: owner_id, f'{target_field}__in': target_ids})
+        with journal.muted():
+            model.objects.filter(condition).delete()
+
+    additions = set(additions)
+    if additions:
+        model.objects.bulk_create(
+            [model(**{owner_field: owner_id, target_field: target_id}) for owner_id, target_id in additions],
+            ignore_conflicts=True,
+        )
+
+    journal.record(
+        [journal.association_entry(model, owner_id, target_id, 'delete') for owner_id, target_id in removals] +
+        [journal.association_entry(model, owner_id, target_id, 'create') for owner_id, target_id in additions]
+    )
+    return len(additions), len(removals)
+
+
+def set_links(owner_type, relation, owner_id, target_ids, current=None):
+    """Make an owner's links exactly target_ids; return the resulting set"""
+    if current is None:
+        current = current_links(owner_type, relation, [owner_id])[owner_id]
+    target_ids = set(target_ids)
+    apply_link_changes(
+        owner_type, relation,
+        additions=[(owner_id, target_id) for target_id in target_ids - current],
+        removals=[(owner_id, target_id) for target_id in current - target_ids],
+    )
+    return target_ids
+
+
+def serialize_people(people):
+    people = sorted(people, key=lambda p: (p.last_name, p.first_name))
+    return [{'id': p.id, 'full_name': p.full_name()} for p in people]
+
+
+def serialize_locations(locations):
+    return [{'id': l.id, 'name': l.name} for l in sorted(locations, key=lambda l: l.name)]
+
+
+def serialize_tags(tags):
+    return [{'id': t.tag, 'tag': t.tag} for t in sorted(tags, key=lambda t: t.tag)]
+
+
+SERIALIZERS = {
+    'people': serialize_people,
+    'locations': serialize_locations,
+    'tags': serialize_tags,
+}
+
+ENTITY_MODELS = {
+    'people': Person,
+    'locations': Location,
+    'tags': Tag,
+}
+
+
+def parse_chapter_years(years):
+    """Parse a chapter's free-text years into a list of ints"""
+    if not years:
+        return []
+    return [int(year.strip()) for year in years.replace(',', ' ').split() if year.strip().isdigit()]
+
+
+def film_aggregates(film_ids):
+    """
+    Return {film_id: {people, locations, tags, years}} as the union of film
+    and chapter metadata, using a fixed number of queries for any number
+    of films.
+    """
+    film_ids = list(film_ids)
+    links = {film_id: {relation: set() for relation in RELATIONS} for film_id in film_ids}
+    for relation in RELATIONS:
+        film_model, _, target_field = THROUGH_TABLES[('film', relation)]
+        chapter_model, _, _ = THROUGH_TABLES[('chapter', relation)]
+        rows = list(film_model.objects.filter(film_id__in=film_ids).values_list('film_id', target_field))
+        rows += chapter_model.objects.filter(chapter__film_id__in=film_ids).values_list('chapter__film_id', target_field)
+        for film_id, target_id in rows:
+            links[film_id][relation].add(target_id)
+
+    objects = {
+        relation: ENTITY_MODELS[relation].objects.in_bulk(
+            {target_id for film_links in links.values() for target_id in film_links[relation]}
+        )
+        for relation in RELATIONS
+    }
+
+    years = {film_id: set() for film_id in film_ids}
+    for film in Film.objects.filter(id__in=film_ids).only('id', 'years'):
+        years[film.id].update(film.get_year_list())
+    for film_id, chapter_years in Chapter.objects.filter(film_id__in=film_ids).values_list('film_id', 'years'):
+        years[film_id].update(parse_chapter_years(chapter_years))
+
+    aggregates = {}
+    for film_id in film_ids:
+        aggregates[film_id] = {
+            relation: SERIALIZERS[relation](objects[relation][target_id] for target_id in links[film_id][relation])
+            for relation in RELATIONS
+        }
+        aggregates[film_id]['years'] = sorted(years[film_id])
+    return aggregates
+
+
+BATCH_ACTIONS = ('add', 'remove', 'set')
+SCALAR_FIELDS = {
+    # type -> {owner type: model field}
+    'years': {'film': 'years', 'chapter': 'years'},
+    'notes': {'chapter': 'description'},
+}
+
+
+def _resolve_batch_targets(operations):
+    """Resolve every id and name referenced by relation operations in bulk"""
+    ids = {relation: set() for relation in RELATIONS}
+    names = {relation: set() for relation in RELATIONS}
+    creating = {relation: set() for relation in RELATIONS}
+    for op in operations:
+        if op['type'] not in RELATIONS:
+            continue
+        relation = op['type']
+        if relation == 'tags':
+            # The tag autocomplete uses the tag name as its id
+            op_names = op.get('values', []) + op.get('ids', [])
+        else:
+            ids[relation].update(op.get('ids', []))
+            op_names = op.get('names', [])
+        names[relation].update(op_names)
+        if op['action'] != 'remove':
+            creating[relation].update(op_names)
+
+    # Names are created only when some operation adds them
+    people = resolve_people(ids['people'])
+    people_by_name = resolve_people_by_name(creating['people'])
+    people_by_name.update(resolve_people_by_name(names['people'] - creating['people'], create=False))
+    locations = resolve_locations(ids['locations'])
+    locations_by_name = resolve_locations_by_name(creating['locations'])
+    locations_by_name.update(resolve_locations_by_name(names['locations'] - creating['locations'], create=False))
+    tag_names = {str(name).strip() for name in names['tags']}
+    tags = resolve_tags(creating['tags'])
+    tags.update(Tag.objects.in_bulk(tag_names - tags.keys()))
+
+    def targets(op):
+        relation = op['type']
+        if relation == 'people':
+            return ({people[int(i)].pk for i in op.get('ids', [])} |
+                    {people_by_name[n].pk for n in op.get('names', []) if n in people_by_name})
+        if relation == 'locations':
+            return ({locations[int(i)].pk for i in op.get('ids', [])} |
+                    {locations_by_name[n.strip()].pk for n in op.get('names', []) if n.strip() in locations_by_name})
+        return {tags[str(n).strip()].pk for n in op.get('values', []) + op.get('ids', []) if str(n).strip() in tags}
+
+    return targets
+
+
+def _validate_operation(op):
+    if not isinstance(op, dict):
+        raise ValueError('Each operation must be an object')
+    if op.get('type') not in RELATIONS + tuple(SCALAR_FIELDS):
+        raise ValueError(f'Unknown metadata type: {op.get("type")}')
+    if op.get('action') not in BATCH_ACTIONS:
+        raise ValueError(f'Unknown action: {op.get("action")}')
+    if op['type'] in SCALAR_FIELDS:
+        if op['action'] != 'set':
+            raise ValueError(f'{op["type"]} only supports the set action')
+        if op.get('films') and 'film' not in SCALAR_FIELDS[op['type']]:
+            raise ValueError(f'{op["type"]} can only be set on chapters')
+    for key in ('chapters', 'films', 'ids', 'names', 'values'):
+        if not isinstance(op.get(key, []), list):
+            raise ValueError(f'{key} must be a list')
+    if not op.get('chapters') and not op.get('films'):
+        raise ValueError('Each operation needs chapters and/or films')
+
+
+def apply_batch_operations(operations):
+    """
+    Apply a list of metadata operations across many chapters and films.
+    
+    Operations are applied in order to in-memory link sets, so later
+    operations see earlier ones; the net difference is then written with
+    one delete and one bulk_create per through table, and scalar fields
+    plus chapter flags with one bulk_update per model. Call inside a
+    transaction. Returns (film ids, chapter ids) that were touched.
+    """
+    if not isinstance(operations, list) or not operations:
+        raise ValueError('operations must be a non-empty list')
+    for op in operations:
+        _validate_operation(op)
+
+    chapter_ids = {int(i) for op in operations for i in op.get('chapters', [])}
+    film_keys = {str(key) for op in operations for key in op.get('films', [])}
+    chapters = Chapter.objects.in_bulk(chapter_ids)
+    if chapter_ids - chapters.keys():
+        raise ValueError(f'Unknown chapter id(s): {sorted(chapter_ids - chapters.keys())}')
+    films = {film.file_id: film for film in Film.objects.filter(file_id__in=film_keys)}
+    if film_keys - films.keys():
+        raise ValueError(f'Unknown film id(s): {sorted(film_keys - films.keys())}')
+
+    targets = _resolve_batch_targets(operations)
+
+    def owners(op):
+        yield from (('chapter', chapters[int(i)]) for i in op.get('chapters', []))
+        yield from (('film', films[str(key)]) for key in op.get('films', []))
+
+    # Load the current links once per through table that is touched
+    link_groups = {}
+    for op in operations:
+        if op['type'] in RELATIONS:
+            for owner_type, owner in owners(op):
+                link_groups.setdefault((owner_type, op['type']), set()).add(owner.pk)
+    initial = {key: current_links(key[0], key[1], owner_ids) for key, owner_ids in link_groups.items()}
+    final = {key: {owner_id: set(linked) for owner_id, linked in links.items()} for key, links in initial.items()}
+
+    dirty_fields = {'chapter': {}, 'film': {}}
+    for op in operations:
+        if op['type'] in SCALAR_FIELDS:
+            for owner_type, owner in owners(op):
+                field = SCALAR_FIELDS[op['type']][owner_type]
+                setattr(owner, field, str(op.get('value') or ''))
+                dirty_fields[owner_type].setdefault(owner.pk, set()).add(field)
+            continue
+        op_targets = targets(op)
+        for owner_type, owner in owners(op):
+            linked = final[(owner_type, op['type'])][owner.pk]
+            if op['action'] == 'add':
+                linked |= op_targets
+            elif op['action'] == 'remove':
+                linked -= op_targets
+            else:
+                linked.clear()
+                linked |= op_targets
+
+    for key, links in final.items():
+        owner_type, relation = key
+        additions, removals = [], []
+        for owner_id, linked in links.items():
+            before = initial[key][owner_id]
+            additions += [(owner_id, target_id) for target_id in linked - before]
+            removals += [(owner_id, target_id) for target_id in before - linked]
+        apply_link_changes(owner_type, relation, additions, removals)
+
+        if owner_type == 'chapter':
+            # Flags follow from the final sets, no exists() queries needed
+            flag = CHAPTER_FLAGS[relation]
+            for owner_id, linked in links.items():
+                setattr(chapters[owner_id], flag, bool(linked))
+                dirty_fields['chapter'].setdefault(owner_id, set()).add(flag)
+
+    for chapter_id, fields in dirty_fields['chapter'].items():
+        chapter = chapters[chapter_id]
+        chapter.has_years_metadata = bool(chapter.years and chapter.years.strip())
+        fields.add('has_years_metadata')
+
+    films_by_pk = {film.pk: film for film in films.values()}
+    entries = []
+    for owner_type, objects, model in (('chapter', chapters, Chapter), ('film', films_by_pk, Film)):
+        fields = set().union(*dirty_fields[owner_type].values()) if dirty_fields[owner_type] else set()
+        if fields:
+            model.objects.bulk_update([objects[pk] for pk in dirty_fields[owner_type]], sorted(fields))
+            entries += [journal.instance_entry(objects[pk], 'update', changed)
+                        for pk, changed in dirty_fields[owner_type].items()]
+    journal.record(entries)
+
+    touched_films = set(films_by_pk) | {chapter.film_id for chapter in chapters.values()}
+    return touched_films, set(chapters)
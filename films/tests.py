@@ -2,10 +2,20 @@ from django.test import TestCase, Client
 from django.contrib.auth.models import User
 from django.urls import reverse
 from django.core.exceptions import ValidationError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from datetime import timedelta
+from io import BytesIO
+from unittest import mock
+from PIL import Image
 import json
+import os
+import threading
+import time
 
-from main.models import Film, Chapter, Person, Location, Tag
+from main.models import Film, Chapter, Person, Location, Tag, ChapterPeople
+from main.resize_cache import ResizeCache, render_resized
+from main.testing import TempStaticMixin
 
 
 class MetadataEditingTestCase(TestCase):
@@ -441,3 +451,263 @@ class MetadataEditingTestCase(TestCase):
             content_type='application/json'
         )
         self.assertEqual(response.status_code, 404)
+
+
+class ChapterMetadataAPITestCase(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(username='editor', password='testpass123', is_staff=True)
+        self.client.login(username='editor', password='testpass123')
+        
+        self.film = Film.objects.create(
+            file_id='TEST-002',
+            title='Reunion Reel',
+            description='',
+            youtube_id='reunion_youtube_id',
+            thumbnail_url='https://example.com/thumb.jpg'
+        )
+        self.chapter = Chapter.objects.create(film=self.film, title='Picnic', start_time='01:00', order=1)
+        self.people = [Person.objects.create(first_name=f'Person{n}', last_name='Hayward') for n in range(15)]
+        self.location = Location.objects.create(name='Lake House')
+        self.url = reverse('films:chapter_metadata_api', kwargs={
+            'file_id': self.film.file_id, 'chapter_id': self.chapter.id
+        })
+    
+    def post(self, payload):
+        return self.client.post(self.url, data=json.dumps(payload), content_type='application/json')
+    
+    def test_set_difference_is_applied(self):
+        """Only changed links are written and flags follow the new sets"""
+        self.chapter.people.add(self.people[0], self.people[1])
+        
+        new_ids = [p.id for p in self.people[1:]]
+        with self.assertNumQueries(20):
+            response = self.post({
+                'people': new_ids,
+                'locations': [self.location.id],
+                'tags': ['picnic', 'summer'],
+                'years': '1965',
+            })
+        self.assertEqual(response.status_code, 200)
+        
+        self.assertEqual(set(self.chapter.people.values_list('id', flat=True)), set(new_ids))
+        self.assertEqual(list(self.chapter.locations.all()), [self.location])
+        self.assertEqual(set(self.chapter.tags.values_list('tag', flat=True)), {'picnic', 'summer'})
+        
+        self.chapter.refresh_from_db()
+        self.assertTrue(self.chapter.has_people_metadata)
+        self.assertTrue(self.chapter.has_location_metadata)
+        self.assertTrue(self.chapter.has_tags_metadata)
+        self.assertTrue(self.chapter.has_years_metadata)
+        self.assertEqual(self.chapter.years, '1965')
+        
+        data = json.loads(response.content)
+        self.assertEqual(len(data['updated_metadata']['people']), 14)
+        self.assertEqual(data['updated_metadata']['tags'], [{'id': 'picnic', 'tag': 'picnic'}, {'id': 'summer', 'tag': 'summer'}])
+    
+    def test_clearing_relation_resets_flag(self):
+        self.chapter.people.add(self.people[0])
+        self.chapter.update_metadata_flags()
+        response = self.post({'people': []})
+        self.assertEqual(response.status_code, 200)
+        self.chapter.refresh_from_db()
+        self.assertFalse(self.chapter.people.exists())
+        self.assertFalse(self.chapter.has_people_metadata)
+    
+    def test_unknown_ids_rejected_without_changes(self):
+        self.chapter.people.add(self.people[0])
+        response = self.post({'people': [self.people[1].id, 999999], 'tags': ['new-tag']})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(list(self.chapter.people.all()), [self.people[0]])
+        self.assertFalse(Tag.objects.filter(tag='new-tag').exists())
+
+
+class BatchMetadataAPITestCase(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(username='editor', password='testpass123', is_staff=True)
+        self.client.login(username='editor', password='testpass123')
+        
+        self.films = [
+            Film.objects.create(file_id=f'BATCH-{n}', title=f'Reel {n}', description='',
+                                youtube_id=f'batch{n}', thumbnail_url='https://example.com/thumb.jpg')
+            for n in range(2)
+        ]
+        self.chapters = [
+            Chapter.objects.create(film=self.films[n % 2], title=f'Chapter {n}', start_time=f'0{n}:00', order=n)
+            for n in range(6)
+        ]
+        self.person = Person.objects.create(first_name='Linda', last_name='Hayward')
+        self.url = reverse('films:batch_update_metadata')
+    
+    def post(self, operations):
+        return self.client.post(self.url, data=json.dumps({'operations': operations}),
+                                content_type='application/json')
+    
+    def test_batch_operations_across_chapters_and_films(self):
+        """Operations apply in order and the response carries fresh aggregates"""
+        chapter_ids = [c.id for c in self.chapters]
+        self.chapters[0].tags.add(Tag.objects.create(tag='old'))
+        response = self.post([
+            {'type': 'people', 'action': 'add', 'chapters': chapter_ids,
+             'ids': [self.person.id], 'names': ['John Hayward']},
+            {'type': 'tags', 'action': 'set', 'chapters': chapter_ids[:2], 'values': ['picnic']},
+            {'type': 'locations', 'action': 'add', 'films': [self.films[1].file_id], 'names': ['Lake House']},
+            {'type': 'years', 'action': 'set', 'chapters': chapter_ids[:3], 'value': '1965'},
+            {'type': 'people', 'action': 'remove', 'chapters': chapter_ids[5:], 'names': ['John Hayward']},
+        ])
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.content)
+        
+        john = Person.objects.get(first_name='John', last_name='Hayward')
+        self.assertEqual(set(self.chapters[0].people.all()), {self.person, john})
+        self.assertEqual(list(self.chapters[5].people.all()), [self.person])
+        self.assertEqual(list(self.chapters[0].tags.values_list('tag', flat=True)), ['picnic'])
+        self.assertEqual(self.films[1].locations.get().name, 'Lake House')
+        
+        self.chapters[2].refresh_from_db()
+        self.assertEqual(self.chapters[2].years, '1965')
+        self.assertTrue(self.chapters[2].has_years_metadata)
+        self.assertTrue(self.chapters[2].has_people_metadata)
+        self.assertFalse(self.chapters[2].has_tags_metadata)
+        
+        aggregate = data['films']['BATCH-0']
+        self.assertEqual([p['full_name'] for p in aggregate['people']], ['John Hayward', 'Linda Hayward'])
+        self.assertEqual(aggregate['years'], [1965])
+        self.assertEqual([l['name'] for l in data['films']['BATCH-1']['locations']], ['Lake House'])
+        self.assertTrue(data['chapters'][str(self.chapters[0].id)]['has_tags_metadata'])
+    
+    def test_query_count_does_not_grow_with_targets(self):
+        """Touching more chapters does not add queries"""
+        with CaptureQueriesContext(connection) as few:
+            self.post([{'type': 'people', 'action': 'add', 'chapters': [self.chapters[0].id], 'ids': [self.person.id]}])
+        with CaptureQueriesContext(connection) as many:
+            self.post([{'type': 'people', 'action': 'add',
+                        'chapters': [c.id for c in self.chapters[1:]], 'ids': [self.person.id]}])
+        self.assertEqual(len(few), len(many))
+        self.assertEqual(ChapterPeople.objects.filter(person=self.person).count(), 6)
+    
+    def test_new_tags_sent_as_ids_are_created(self):
+        """The tag autocomplete sends names as ids, so unknown ones are new tags"""
+        response = self.post([
+            {'type': 'tags', 'action': 'add', 'chapters': [self.chapters[0].id], 'ids': ['brand new']},
+        ])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(self.chapters[0].tags.values_list('tag', flat=True)), ['brand new'])
+        
+        response = self.post([
+            {'type': 'tags', 'action': 'remove', 'chapters': [self.chapters[1].id], 'ids': ['never used']},
+        ])
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(Tag.objects.filter(tag='never used').exists())
+    
+    def test_invalid_batches_are_rejected_atomically(self):
+        response = self.post([
+            {'type': 'tags', 'action': 'add', 'chapters': [self.chapters[0].id], 'values': ['kept-out']},
+            {'type': 'people', 'action': 'add', 'chapters': [self.chapters[0].id], 'ids': [99999]},
+        ])
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Tag.objects.filter(tag='kept-out').exists())
+        
+        response = self.post([{'type': 'notes', 'action': 'set', 'films': ['BATCH-0'], 'value': 'x'}])
+        self.assertEqual(response.status_code, 400)
+        response = self.post([{'type': 'tags', 'action': 'add', 'chapters': [99999], 'values': ['x']}])
+        self.assertEqual(response.status_code, 400)
+
+
+class ResizedThumbnailTestCase(TempStaticMixin, TestCase):
+    def extra_settings(self):
+        self.cache_dir = os.path.join(self.base_dir, 'cache')
+        return {'THUMBNAIL_RESIZE_CACHE_DIR': self.cache_dir}
+    
+    def setUp(self):
+        super().setUp()
+        Image.new('RGB', (1200, 900), 'olive').save(os.path.join(self.root, 'chapters', 'RESIZE-1 ch1.jpg'), 'JPEG')
+        self.film = Film.objects.create(
+            file_id='RESIZE-1', youtube_id='resize1', title='Resize', description='', summary='',
+            thumbnail_url='https://img.youtube.com/vi/resize1/maxresdefault.jpg'
+        )
+        self.chapter = Chapter.objects.create(
+            film=self.film, title='One', start_time='00:00', start_time_seconds=0, order=1,
+            thumbnail_url='/static/thumbnails/chapters/RESIZE-1%20ch1.jpg'
+        )
+    
+    def get(self, width, **headers):
+        return self.client.get(self.chapter.get_resized_thumbnail_url(width), **headers)
+    
+    def test_thumbnail_is_resized_with_immutable_cache_headers(self):
+        response = self.get(160)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+        self.assertEqual(response['Cache-Control'], 'public, max-age=31536000, immutable')
+        with Image.open(BytesIO(b''.join(response.streaming_content))) as image:
+            self.assertEqual(image.size, (160, 120))
+        self.assertTrue(response['ETag'].startswith('"') and not response['ETag'].startswith('W/'))
+    
+    def test_repeat_requests_are_served_from_the_cache(self):
+        with mock.patch('films.views.render_resized', wraps=render_resized) as render:
+            response = self.get(160)
+            etag = response['ETag']
+            response.close()
+            response = self.get(160)
+            self.assertEqual(response['ETag'], etag)
+            response.close()
+            # A matching ETag gets no body at all
+            self.assertEqual(self.get(160, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertEqual(render.call_count, 1)
+    
+    def test_webp_is_served_to_browsers_that_accept_it(self):
+        etag = self.get(160)['ETag']
+        response = self.get(160, HTTP_ACCEPT='image/avif,image/webp,*/*')
+        self.assertEqual(response['Content-Type'], 'image/webp')
+        self.assertNotEqual(response['ETag'], etag)
+        response.close()
+    
+    def test_unsupported_widths_are_not_found(self):
+        self.assertEqual(self.get(5000).status_code, 404)
+    
+    def test_youtube_thumbnails_are_redirected_to(self):
+        response = self.client.get(self.film.get_resized_thumbnail_url(160))
+        self.assertRedirects(response, self.film.thumbnail_url, fetch_redirect_response=False)
+    
+    def test_unreadable_thumbnails_are_not_found(self):
+        with open(os.path.join(self.root, 'chapters', 'bad.jpg'), 'wb') as f:
+            f.write(b'not an image')
+        self.chapter.thumbnail_url = '/static/thumbnails/chapters/bad.jpg'
+        self.chapter.save()
+        self.assertEqual(self.get(160).status_code, 404)
+    
+    def test_thumbnails_outside_static_are_not_served(self):
+        with open(os.path.join(self.base_dir, 'secret.jpg'), 'wb') as f:
+            f.write(b'outside static')
+        for url in ['/static/../secret.jpg', '/static/thumbnails/%2E%2E/%2E%2E/../secret.jpg']:
+            self.chapter.thumbnail_url = url
+            self.chapter.save()
+            with mock.patch('films.views.render_resized') as render:
+                self.assertEqual(self.get(160).status_code, 404)
+            render.assert_not_called()
+    
+    def test_cache_coalesces_requests_and_evicts_least_recently_used(self):
+        cache = ResizeCache(self.cache_dir, max_bytes=2500)
+        renders = []
+        
+        def slow_render():
+            renders.append(1)
+            time.sleep(0.05)
+            return b'x' * 1000
+        
+        threads = [threading.Thread(target=cache.get, args=('aa01', 'jpg', slow_render)) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(renders), 1)
+        
+        cache.get('bb02', 'jpg', lambda: b'y' * 1000)
+        # Touching the first entry makes the second the least recently used
+        os.utime(cache.path('bb02', 'jpg'), (1, 1))
+        self.assertEqual(cache.get('aa01', 'jpg', slow_render), (cache.path('aa01', 'jpg'), False))
+        cache.get('cc03', 'jpg', lambda: b'z' * 1000)
+        self.assertTrue(os.path.exists(cache.path('aa01', 'jpg')))
+        self.assertFalse(os.path.exists(cache.path('bb02', 'jpg')))
+        self.assertTrue(os.path.exists(cache.path('cc03', 'jpg')))
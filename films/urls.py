@@ -19,4 +19,9 @@ urlpatterns = [
     path('api/chapter/<int:chapter_id>/metadata/', views.get_chapter_metadata, name='get_chapter_metadata'),
     path('api/chapter/<int:chapter_id>/update/', views.update_chapter_metadata, name='update_chapter_metadata'),
     path('api/chapter/<int:chapter_id>/notes/', views.update_chapter_notes, name='update_chapter_notes'),
+    path('api/batch-metadata/', views.batch_update_metadata, name='batch_update_metadata'),
+    
+    # Thumbnails resized on demand
+    path('api/thumbnail/chapter/<int:chapter_id>/<int:width>/', views.chapter_thumbnail, name='chapter_thumbnail'),
+    path('api/thumbnail/film/<str:file_id>/<int:width>/', views.film_thumbnail, name='film_thumbnail'),
 ]
\ No newline at end of file
@@ -1,13 +1,26 @@
-from django.shortcuts import render, get_object_or_404
+from django.shortcuts import render, get_object_or_404, redirect
 from django.core.paginator import Paginator
+from django.conf import settings
 from django.db.models import Q, Count
-from django.http import JsonResponse
+from django.http import FileResponse, Http404, HttpResponseNotModified, JsonResponse
 # from django.contrib.postgres.search import SearchVector, SearchQuery, SearchRank
 from django.contrib.auth.decorators import login_required
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
+from django.db import transaction
 import json
+import os
+from PIL import Image
+from main import journal
+from main.derivatives import relative_to_root, static_file
+from main.importing.hashing import content_hash
+from main.resize_cache import MIME_TYPES, SAVE_OPTIONS, ResizeCache, render_resized
 from main.models import Film, Chapter, Person, Location, Tag
+from .metadata import (
+    RELATIONS, RESOLVERS, SERIALIZERS, CHAPTER_FLAGS, set_links,
+    film_aggregates, apply_batch_operations,
+)
+from genealogy.queries import filter_films_by_family, FAMILY_SCOPES, DESCENDANTS
 
 
 def film_catalog(request):
@@ -57,6 +70,12 @@ def film_catalog(request):
             Q(chapters__tags__tag=tag_filter)
         ).distinct()
     
+    family_filter = request.GET.get('family')
+    family_scope = request.GET.get('family_scope') or DESCENDANTS
+    if family_filter and family_filter.isdigit() and family_scope in dict(FAMILY_SCOPES):
+        # Films featuring anyone in the person's ancestors, descendants or branch
+        films = filter_films_by_family(films, int(family_filter), family_scope)
+    
     # Sorting
     sort_by = request.GET.get('sort', 'playlist')  # Default to playlist order
     sort_dir = request.GET.get('sort_dir', 'asc')
@@ -139,6 +158,12 @@ def film_catalog(request):
         film_count=Count('film', distinct=True) + Count('chapter__film', distinct=True)
     ).filter(film_count__gt=0).order_by('tag')
     
+    # People with recorded relatives can anchor a family filter
+    family_people = Person.objects.filter(
+        Q(father__isnull=False) | Q(mother__isnull=False) |
+        Q(children_as_father__isnull=False) | Q(children_as_mother__isnull=False)
+    ).distinct().order_by('last_name', 'first_name')
+    
     context = {
         'page_obj': page_obj,
         'films': page_obj,
@@ -148,6 +173,8 @@ def film_catalog(request):
             'person': person_filter,
             'location': location_filter,
             'tag': tag_filter,
+            'family': family_filter,
+            'family_scope': family_scope,
             'sort': sort_by,
             'sort_dir': sort_dir,
         },
@@ -156,6 +183,8 @@ def film_catalog(request):
             'people': people,
             'locations': locations,
             'tags': tags,
+            'family_people': family_people,
+            'family_scopes': FAMILY_SCOPES,
         }
     }
     return render(request, 'films/catalog.html', context)
@@ -237,46 +266,41 @@ def chapter_metadata_api(request, file_id, chapter_id):
         return JsonResponse(data)
     
     elif request.method == 'POST':
-        # Update metadata
-        import json
-        data = json.loads(request.body)
-        
-        # Update people
-        if 'people' in data:
-            chapter.people.clear()
-            for person_id in data['people']:
-                person = Person.objects.get(id=person_id)
-                chapter.people.add(person)
-        
-        # Update locations
-        if 'locations' in data:
-            chapter.locations.clear()
-            for location_id in data['locations']:
-                location = Location.objects.get(id=location_id)
-                chapter.locations.add(location)
-        
-        # Update tags
-        if 'tags' in data:
-            chapter.tags.clear()
-            for tag_name in data['tags']:
-                tag, created = Tag.objects.get_or_create(tag=tag_name)
-                chapter.tags.add(tag)
-        
-        # Update years
-        if 'years' in data:
-            chapter.years = data['years']
-            chapter.save()
-        
-        # Update metadata flags
-        chapter.update_metadata_flags()
+        # Update metadata by applying only the difference to each through table
+        try:
+            data = json.loads(request.body)
+            with transaction.atomic(), journal.batched():
+                # One in_bulk per relation validates every requested id
+                requested = {
+                    relation: RESOLVERS[relation](data[relation])
+                    for relation in RELATIONS if relation in data
+                }
+                update_fields = []
+                for relation, objects in requested.items():
+                    set_links('chapter', relation, chapter.id, objects.keys())
+                    # Flags follow from the new sets; untouched relations keep theirs
+                    setattr(chapter, CHAPTER_FLAGS[relation], bool(objects))
+                    update_fields.append(CHAPTER_FLAGS[relation])
+                
+                if 'years' in data:
+                    chapter.years = data['years']
+                    update_fields.append('years')
+                chapter.has_years_metadata = bool(chapter.years and chapter.years.strip())
+                update_fields.append('has_years_metadata')
+                
+                chapter.save(update_fields=update_fields)
+        except (ValueError, TypeError) as e:
+            return JsonResponse({'error': str(e)}, status=400)
         
         # Return updated metadata for UI refresh
         updated_metadata = {
-            'people': [{'id': p.id, 'full_name': p.full_name()} for p in chapter.people.all()],
-            'locations': [{'id': l.id, 'name': l.name} for l in chapter.locations.all()],
-            'tags': [{'id': t.tag, 'tag': t.tag} for t in chapter.tags.all()],
-            'years': chapter.years or '',
+            relation: SERIALIZERS[relation](objects.values())
+            for relation, objects in requested.items()
         }
+        for relation in RELATIONS:
+            if relation not in updated_metadata:
+                updated_metadata[relation] = SERIALIZERS[relation](getattr(chapter, relation).all())
+        updated_metadata['years'] = chapter.years or ''
         
         return JsonResponse({'success': True, 'updated_metadata': updated_metadata})
     
@@ -293,6 +317,9 @@ def animated_thumbnail_data(request, file_id):
     data = {
         'animated': True,
         'sprite_url': film.preview_sprite_url,
+        'fallback_url': film.preview_sprite_fallback_url(),
+        'animation_url': film.preview_animation_url(),
+        'columns': film.preview_sprite_columns(),
         'frame_count': film.preview_frame_count,
         'frame_interval': film.preview_frame_interval,
         'sprite_width': film.preview_sprite_width,
@@ -301,6 +328,77 @@ def animated_thumbnail_data(request, file_id):
     return JsonResponse(data)
 
 
+# Widths the resize endpoint renders; anything else is a 404 so the cache cannot be flooded
+RESIZE_WIDTHS = range(16, 1281)
+RESIZE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+_resize_cache = {}
+
+
+def resize_cache():
+    """The process's ResizeCache for the configured directory and size"""
+    key = (settings.THUMBNAIL_RESIZE_CACHE_DIR, settings.THUMBNAIL_RESIZE_CACHE_BYTES)
+    if key not in _resize_cache:
+        _resize_cache[key] = ResizeCache(*key)
+    return _resize_cache[key]
+
+
+def resized_thumbnail(request, thumbnail_url, width):
+    """
+    A thumbnail scaled to width, from the resize cache. Thumbnails that are
+    not static files (YouTube URLs) are redirected to unchanged.
+    """
+    if width not in RESIZE_WIDTHS:
+        raise Http404('Unsupported width')
+    static_dir = os.path.join(settings.BASE_DIR, 'static')
+    source = static_file(thumbnail_url, settings.STATIC_URL, static_dir)
+    if source is None:
+        if not thumbnail_url:
+            raise Http404('No thumbnail')
+        return redirect(thumbnail_url)
+    # Only files under static are served, whatever ../ the URL holds
+    if relative_to_root(source, static_dir) is None:
+        raise Http404('Thumbnail outside static')
+    try:
+        stat = os.stat(source)
+    except FileNotFoundError:
+        raise Http404('Thumbnail file not found')
+    
+    ext = 'webp' if 'image/webp' in request.headers.get('Accept', '') else 'jpg'
+    # The same source bytes, width and encoder settings always give the same output
+    etag = '"%s"' % content_hash([thumbnail_url, stat.st_size, stat.st_mtime_ns, width, ext, SAVE_OPTIONS[ext]])
+    headers = {'ETag': etag, 'Cache-Control': RESIZE_CACHE_CONTROL, 'Vary': 'Accept'}
+    if etag in [tag.strip() for tag in request.headers.get('If-None-Match', '').split(',')]:
+        return HttpResponseNotModified(headers=headers)
+    
+    cache = resize_cache()
+    for attempt in range(2):
+        try:
+            path, _ = cache.get(etag.strip('"'), ext, lambda: render_resized(source, width, ext))
+        except (OSError, SyntaxError, ValueError, Image.DecompressionBombError):
+            raise Http404('Thumbnail is not a readable image')
+        try:
+            # FileResponse hands the open file to the server's file wrapper (sendfile under gunicorn)
+            return FileResponse(open(path, 'rb'), content_type=MIME_TYPES[ext], headers=headers)
+        except FileNotFoundError:
+            # Evicted by another process between the lookup and the open
+            continue
+    raise Http404('Thumbnail could not be cached')
+
+
+@require_http_methods(["GET", "HEAD"])
+def chapter_thumbnail(request, chapter_id, width):
+    """Chapter thumbnail resized to width pixels"""
+    chapter = get_object_or_404(Chapter, id=chapter_id)
+    return resized_thumbnail(request, chapter.thumbnail_url, width)
+
+
+@require_http_methods(["GET", "HEAD"])
+def film_thumbnail(request, file_id, width):
+    """Film thumbnail resized to width pixels"""
+    film = get_object_or_404(Film, file_id=file_id)
+    return resized_thumbnail(request, film.thumbnail_url, width)
+
+
 # New API endpoints for metadata editing
 
 @require_http_methods(["GET"])
@@ -520,40 +618,32 @@ def update_film_years(request, file_id):
 def get_film_aggregated_metadata(request, file_id):
     """Get aggregated metadata for film (union of film and chapter metadata)"""
     film = get_object_or_404(Film, file_id=file_id)
-    
-    from main.models import Person, Location, Tag
-    
-    # Get aggregated metadata (same logic as in film_detail view)
-    all_people = Person.objects.filter(
-        Q(filmpeople__film=film) | Q(chapterpeople__chapter__film=film)
-    ).distinct().order_by('last_name', 'first_name')
-    
-    all_locations = Location.objects.filter(
-        Q(filmlocations__film=film) | Q(chapterlocations__chapter__film=film)
-    ).distinct().order_by('name')
-    
-    all_tags = Tag.objects.filter(
-        Q(filmtags__film=film) | Q(chaptertags__chapter__film=film)
-    ).distinct().order_by('tag')
-    
-    # Aggregate years: union of film years and chapter years
-    chapters = film.chapters.all()
-    all_years_set = set()
-    if film.years:
-        all_years_set.update(film.get_year_list())
-    for chapter in chapters:
-        if chapter.years:
-            # Parse chapter years similar to how film years are parsed
-            chapter_years = [int(year.strip()) for year in chapter.years.replace(',', ' ').split() if year.strip().isdigit()]
-            all_years_set.update(chapter_years)
-    all_years = sorted(all_years_set)
-    
+    return JsonResponse({'success': True, **film_aggregates([film.id])[film.id]})
+
+
+@login_required
+@csrf_exempt
+@require_http_methods(["POST"])
+def batch_update_metadata(request):
+    """
+    Apply people/locations/tags/years/notes operations to many chapters and
+    films in one transaction and return the refreshed film aggregates.
+    """
+    try:
+        with transaction.atomic(), journal.batched():
+            data = json.loads(request.body)
+            film_ids, chapter_ids = apply_batch_operations(data.get('operations'))
+    except (ValueError, TypeError, AttributeError) as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=400)
+
+    films = dict(Film.objects.filter(id__in=film_ids).values_list('id', 'file_id'))
+    chapters = Chapter.objects.filter(id__in=chapter_ids).values(
+        'id', 'years', 'description', *CHAPTER_FLAGS.values(), 'has_years_metadata'
+    )
     return JsonResponse({
         'success': True,
-        'people': [{'id': p.id, 'full_name': p.full_name()} for p in all_people],
-        'locations': [{'id': l.id, 'name': l.name} for l in all_locations],
-        'tags': [{'id': t.tag, 'tag': t.tag} for t in all_tags],
-        'years': all_years,
+        'films': {films[film_id]: aggregate for film_id, aggregate in film_aggregates(film_ids).items()},
+        'chapters': {chapter['id']: chapter for chapter in chapters},
     })
 
 
@@ -0,0 +1,58 @@
+"""
+Versioned caching helpers for genealogy data.
+
+Anything derived from the family graph (tree layouts, expanded family
+sets) is cached under a key that embeds the current genealogy version.
+Bumping the version whenever a Person changes makes every cached entry
+unreachable at once, so callers never have to track individual keys.
+Saves bump it from a signal; bulk writes, which mute the signals, are
+picked up from the change journal by consume_journal().
+"""
+from django.core.cache import cache
+from main import journal
+
+GENEALOGY_VERSION_KEY = 'genealogy:version'
+
+# Upper bound on how long derived data may live; limits staleness when the
+# cache backend is per-process (LocMemCache) and a bump happens elsewhere.
+GENEALOGY_CACHE_TIMEOUT = 60 * 60
+
+JOURNAL_CONSUMER = 'genealogy-cache'
+
+
+def get_genealogy_version():
+    """Return the current genealogy version, initialising it if needed"""
+    version = cache.get(GENEALOGY_VERSION_KEY)
+    if version is None:
+        cache.add(GENEALOGY_VERSION_KEY, 1, timeout=None)
+        version = cache.get(GENEALOGY_VERSION_KEY, 1)
+    return version
+
+
+def bump_genealogy_version():
+    """Invalidate all cached genealogy data by advancing the version"""
+    try:
+        return cache.incr(GENEALOGY_VERSION_KEY)
+    except ValueError:
+        # Key was missing (cold or evicted cache); start a fresh series
+        cache.set(GENEALOGY_VERSION_KEY, 2, timeout=None)
+        return 2
+
+
+def genealogy_cache_key(prefix, *parts):
+    """Build a cache key scoped to the current genealogy version"""
+    suffix = ':'.join(str(part) for part in parts)
+    return f'genealogy:{prefix}:v{get_genealogy_version()}:{suffix}'
+
+
+def consume_journal():
+    """
+    Bump the version if any person changed since the last call, reading
+    the change journal from the genealogy cache's cursor. Returns the
+    number of entries read.
+    """
+    def handler(entries):
+        if any(entry.model == 'person' for entry in entries):
+            bump_genealogy_version()
+
+    return journal.consume(JOURNAL_CONSUMER, handler)
@@ -0,0 +1,324 @@
+"""
+Server-side tidy tree layout for multi-generation family charts.
+
+Implements the Walker algorithm with Buchheim's linear-time improvements
+("Improving Walker's Algorithm to Run in Linear Time", 2002). People are
+loaded one generation per query, laid out in abstract units, then scaled
+to pixel coordinates with ready-to-draw SVG edge paths. Results are cached
+per (root person, depth, direction) and invalidated by the genealogy
+version, so the browser only has to draw boxes and lines.
+"""
+from django.core.cache import cache
+from django.db.models import Q
+from main.models import Person
+from .cache import genealogy_cache_key, GENEALOGY_CACHE_TIMEOUT
+
+ANCESTORS = 'ancestors'
+DESCENDANTS = 'descendants'
+DIRECTIONS = (ANCESTORS, DESCENDANTS)
+
+DEFAULT_DEPTH = 4
+MAX_DEPTH = 10
+
+# Pixel geometry of the rendered chart
+NODE_WIDTH = 160
+NODE_HEIGHT = 56
+SIBLING_GAP = 24
+LEVEL_HEIGHT = 120
+MARGIN = 20
+
+PERSON_FIELDS = ('id', 'first_name', 'last_name', 'birth_date', 'death_date', 'father_id', 'mother_id')
+
+
+class LayoutNode:
+    """A person's position in the tree being laid out"""
+
+    def __init__(self, person, parent=None, number=1, relation=None):
+        self.person = person
+        self.parent = parent
+        self.number = number  # 1-based position among siblings
+        self.relation = relation
+        self.children = []
+        self.x = 0.0
+        self.y = 0
+        self.mod = 0.0
+        self.thread = None
+        self.ancestor = self
+        self.change = 0.0
+        self.shift = 0.0
+        self._lmost_sibling = None
+
+    def add_child(self, person, relation=None):
+        child = LayoutNode(person, parent=self, number=len(self.children) + 1, relation=relation)
+        self.children.append(child)
+        return child
+
+    def left(self):
+        return self.thread or (self.children[0] if self.children else None)
+
+    def right(self):
+        return self.thread or (self.children[-1] if self.children else None)
+
+    def left_brother(self):
+        if self.parent and self.number > 1:
+            return self.parent.children[self.number - 2]
+        return None
+
+    @property
+    def leftmost_sibling(self):
+        if self._lmost_sibling is None and self.parent and self is not self.parent.children[0]:
+            self._lmost_sibling = self.parent.children[0]
+        return self._lmost_sibling
+
+    def walk(self):
+        """Yield this node and all descendants in pre-order"""
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            yield node
+            stack.extend(reversed(node.children))
+
+
+def buchheim(root, distance=1.0):
+    """Assign tidy x/y coordinates (in node units) to every node under root"""
+    _first_walk(root, distance)
+    min_x = _second_walk(root)
+    if min_x < 0:
+        for node in root.walk():
+            node.x -= min_x
+    return root
+
+
+def _first_walk(v, distance):
+    if not v.children:
+        brother = v.left_brother()
+        v.x = brother.x + distance if brother else 0.0
+        return
+
+    default_ancestor = v.children[0]
+    for w in v.children:
+        _first_walk(w, distance)
+        default_ancestor = _apportion(w, default_ancestor, distance)
+    _execute_shifts(v)
+
+    midpoint = (v.children[0].x + v.children[-1].x) / 2
+    brother = v.left_brother()
+    if brother:
+        v.x = brother.x + distance
+        v.mod = v.x - midpoint
+    else:
+        v.x = midpoint
+
+
+def _apportion(v, default_ancestor, distance):
+    w = v.left_brother()
+    if w is None:
+        return default_ancestor
+
+    # i = inner, o = outer, r = right contour, l = left contour
+    vir = vor = v
+    vil = w
+    vol = v.leftmost_sibling
+    sir = sor = v.mod
+    sil = vil.mod
+    sol = vol.mod
+    while vil.right() and vir.left():
+        vil = vil.right()
+        vir = vir.left()
+        vol = vol.left()
+        vor = vor.right()
+        vor.ancestor = v
+        shift = (vil.x + sil) - (vir.x + sir) + distance
+        if shift > 0:
+            _move_subtree(_ancestor(vil, v, default_ancestor), v, shift)
+            sir += shift
+            sor += shift
+        sil += vil.mod
+        sir += vir.mod
+        sol += vol.mod
+        sor += vor.mod
+
+    if vil.right() and not vor.right():
+        vor.thread = vil.right()
+        vor.mod += sil - sor
+    if vir.left() and not vol.left():
+        vol.thread = vir.left()
+        vol.mod += sir - sol
+        default_ancestor = v
+    return default_ancestor
+
+
+def _move_subtree(wl, wr, shift):
+    subtrees = wr.number - wl.number
+    wr.change -= shift / subtrees
+    wr.shift += shift
+    wl.change += shift / subtrees
+    wr.x += shift
+    wr.mod += shift
+
+
+def _execute_shifts(v):
+    shift = change = 0.0
+    for w in reversed(v.children):
+        w.x += shift
+        w.mod += shift
+        change += w.change
+        shift += w.shift + change
+
+
+def _ancestor(vil, v, default_ancestor):
+    if vil.ancestor.parent is v.parent:
+        return vil.ancestor
+    return default_ancestor
+
+
+def _second_walk(root):
+    """Resolve modifiers into final x positions; return the minimum x"""
+    min_x = root.x
+    stack = [(root, 0.0, 0)]
+    while stack:
+        v, m, depth = stack.pop()
+        v.x += m
+        v.y = depth
+        min_x = min(min_x, v.x)
+        for w in v.children:
+            stack.append((w, m + v.mod, depth + 1))
+    return min_x
+
+
+def _load_people(ids):
+    return {p['id']: p for p in Person.objects.filter(id__in=ids).values(*PERSON_FIELDS)}
+
+
+def build_ancestor_tree(person_id, depth):
+    """Build a pedigree tree: each node's children are its father and mother"""
+    people = _load_people([person_id])
+    if person_id not in people:
+        raise Person.DoesNotExist(f'Person {person_id} not found')
+
+    root = LayoutNode(people[person_id])
+    frontier = [root]
+    for _ in range(depth):
+        parent_ids = {pid for node in frontier
+                      for pid in (node.person['father_id'], node.person['mother_id']) if pid}
+        if not parent_ids:
+            break
+        people = _load_people(parent_ids)
+        next_frontier = []
+        for node in frontier:
+            for relation in ('father', 'mother'):
+                parent = people.get(node.person[f'{relation}_id'])
+                if parent:
+                    next_frontier.append(node.add_child(parent, relation=relation))
+        frontier = next_frontier
+    return root
+
+
+def build_descendant_tree(person_id, depth):
+    """Build a descendant tree; each person appears once even if both parents are present"""
+    people = _load_people([person_id])
+    if person_id not in people:
+        raise Person.DoesNotExist(f'Person {person_id} not found')
+
+    root = LayoutNode(people[person_id])
+    seen = {person_id}
+    frontier = {person_id: root}
+    for _ in range(depth):
+        if not frontier:
+            break
+        children = Person.objects.filter(
+            Q(father_id__in=frontier.keys()) | Q(mother_id__in=frontier.keys())
+        ).order_by('birth_date', 'first_name').values(*PERSON_FIELDS)
+        next_frontier = {}
+        for child in children:
+            if child['id'] in seen:
+                continue
+            parent_node = frontier.get(child['father_id']) or frontier.get(child['mother_id'])
+            seen.add(child['id'])
+            next_frontier[child['id']] = parent_node.add_child(child, relation='child')
+        frontier = next_frontier
+    return root
+
+
+def _year(value):
+    return value.year if value else None
+
+
+def _edge_path(top, bottom):
+    """Elbow connector from the bottom edge of one box to the top of another"""
+    x1, y1 = top['x'], top['y'] + NODE_HEIGHT
+    x2, y2 = bottom['x'], bottom['y']
+    mid = (y1 + y2) / 2
+    return f'M{x1:g},{y1:g} V{mid:g} H{x2:g} V{y2:g}'
+
+
+def compute_tree_layout(person_id, depth=DEFAULT_DEPTH, direction=DESCENDANTS):
+    """Lay out a pedigree or descendant chart and return it as JSON-ready data"""
+    if direction not in DIRECTIONS:
+        raise ValueError(f'Unknown tree direction: {direction}')
+    depth = max(1, min(int(depth), MAX_DEPTH))
+
+    if direction == ANCESTORS:
+        root = build_ancestor_tree(person_id, depth)
+    else:
+        root = build_descendant_tree(person_id, depth)
+    buchheim(root)
+
+    nodes = list(root.walk())
+    generations = max(node.y for node in nodes)
+    max_x = max(node.x for node in nodes)
+
+    keys = {}
+    node_data = []
+    for key, node in enumerate(nodes):
+        keys[id(node)] = key
+        # Pedigree charts grow upwards so the root sits at the bottom
+        level = generations - node.y if direction == ANCESTORS else node.y
+        person = node.person
+        node_data.append({
+            'key': key,
+            'id': person['id'],
+            'name': f"{person['first_name']} {person['last_name']}",
+            'birth_year': _year(person['birth_date']),
+            'death_year': _year(person['death_date']),
+            'relation': node.relation,
+            'generation': node.y,
+            'x': MARGIN + NODE_WIDTH / 2 + node.x * (NODE_WIDTH + SIBLING_GAP),
+            'y': MARGIN + level * LEVEL_HEIGHT,
+        })
+
+    edges = []
+    for node in nodes:
+        for child in node.children:
+            source = node_data[keys[id(node)]]
+            target = node_data[keys[id(child)]]
+            top, bottom = (source, target) if source['y'] < target['y'] else (target, source)
+            edges.append({
+                'source': source['key'],
+                'target': target['key'],
+                'path': _edge_path(top, bottom),
+            })
+
+    return {
+        'root': person_id,
+        'direction': direction,
+        'depth': depth,
+        'generations': generations + 1,
+        'node_width': NODE_WIDTH,
+        'node_height': NODE_HEIGHT,
+        'width': 2 * MARGIN + NODE_WIDTH + max_x * (NODE_WIDTH + SIBLING_GAP),
+        'height': 2 * MARGIN + NODE_HEIGHT + generations * LEVEL_HEIGHT,
+        'nodes': node_data,
+        'edges': edges,
+    }
+
+
+def get_tree_layout(person_id, depth=DEFAULT_DEPTH, direction=DESCENDANTS):
+    """Return a cached layout, computing it on a miss"""
+    depth = max(1, min(int(depth), MAX_DEPTH))
+    key = genealogy_cache_key('layout', person_id, depth, direction)
+    layout = cache.get(key)
+    if layout is None:
+        layout = compute_tree_layout(person_id, depth, direction)
+        cache.set(key, layout, GENEALOGY_CACHE_TIMEOUT)
+    return layout
@@ -1,107 +1,126 @@
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from main import journal
 from main.models import Person
+from genealogy.cache import consume_journal
+from itertools import islice
 import json
+import sys
+import time
+
+RELATION_FIELDS = ('father', 'mother', 'spouse')
+
 
 class Command(BaseCommand):
     help = 'Sync genealogy data to production database'
 
     def add_arguments(self, parser):
+        parser.add_argument(
+            '--file',
+            type=str,
+            default='-',
+            help='NDJSON file with one person per line, or "-" to read stdin (default)'
+        )
         parser.add_argument(
             '--data',
             type=str,
-            help='JSON string containing genealogy data',
-            required=True
+            help='JSON string containing genealogy data (legacy; limited by argv size)'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Number of people resolved and written per transaction'
         )
 
     def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        if batch_size < 1:
+            raise CommandError('--batch-size must be at least 1')
+
+        if options['data']:
+            try:
+                records = iter(json.loads(options['data']))
+            except json.JSONDecodeError as e:
+                self.stdout.write(self.style.ERROR(f'Invalid JSON data: {e}'))
+                return
+            self.sync(records, batch_size, options['verbosity'])
+            return
+
+        if options['file'] == '-':
+            self.sync(self.read_records(sys.stdin), batch_size, options['verbosity'])
+        else:
+            try:
+                with open(options['file'], 'r') as f:
+                    self.sync(self.read_records(f), batch_size, options['verbosity'])
+            except FileNotFoundError:
+                raise CommandError(f'Data file not found: {options["file"]}')
+
+    def read_records(self, stream):
+        """Yield person records from NDJSON, falling back to a legacy JSON array"""
+        lines = enumerate(stream, start=1)
+        for line_number, line in lines:
+            if line.strip():
+                break
+        else:
+            return
+
+        if line.lstrip().startswith('['):
+            # Older exports (backups/genealogy_sync_data.json) are one JSON array
+            yield from json.loads(line + stream.read())
+            return
+
+        yield self.parse_line(line, line_number)
+        for line_number, line in lines:
+            if line.strip():
+                yield self.parse_line(line, line_number)
+
+    def parse_line(self, line, line_number):
         try:
-            genealogy_data = json.loads(options['data'])
+            return json.loads(line)
         except json.JSONDecodeError as e:
-            self.stdout.write(self.style.ERROR(f'Invalid JSON data: {e}'))
-            return
+            raise CommandError(f'Invalid JSON on line {line_number}: {e}')
 
+    def sync(self, records, batch_size, verbosity):
         self.stdout.write('=== SYNCING GENEALOGY DATA TO PRODUCTION ===')
-        self.stdout.write(f'Processing {len(genealogy_data)} people...')
-        
-        stats = {
+
+        self.verbosity = verbosity
+        self.stats = {
+            'processed': 0,
             'found': 0,
             'updated': 0,
             'relationships_added': 0,
             'notes_added': 0,
             'not_found': 0
         }
-        
-        for person_data in genealogy_data:
-            pk = person_data['pk']
-            
-            try:
-                # Find matching person in production
-                person = Person.objects.get(pk=pk)
-                stats['found'] += 1
-                
-                updated = False
-                
-                # Update father relationship
-                father_pk = person_data['father_pk']
-                if father_pk and not person.father:
-                    try:
-                        father = Person.objects.get(pk=father_pk)
-                        person.father = father
-                        updated = True
-                        stats['relationships_added'] += 1
-                        self.stdout.write(f'  ✓ Added father {father.full_name()} to {person.full_name()}')
-                    except Person.DoesNotExist:
-                        self.stdout.write(f'  ⚠ Father pk:{father_pk} not found for {person.full_name()}')
-                
-                # Update mother relationship  
-                mother_pk = person_data['mother_pk']
-                if mother_pk and not person.mother:
-                    try:
-                        mother = Person.objects.get(pk=mother_pk)
-                        person.mother = mother
-                        updated = True
-                        stats['relationships_added'] += 1
-                        self.stdout.write(f'  ✓ Added mother {mother.full_name()} to {person.full_name()}')
-                    except Person.DoesNotExist:
-                        self.stdout.write(f'  ⚠ Mother pk:{mother_pk} not found for {person.full_name()}')
-                
-                # Update spouse relationship
-                spouse_pk = person_data['spouse_pk']
-                if spouse_pk and not person.spouse:
-                    try:
-                        spouse = Person.objects.get(pk=spouse_pk)
-                        person.spouse = spouse
-                        updated = True
-                        stats['relationships_added'] += 1
-                        self.stdout.write(f'  ✓ Added spouse {spouse.full_name()} to {person.full_name()}')
-                    except Person.DoesNotExist:
-                        self.stdout.write(f'  ⚠ Spouse pk:{spouse_pk} not found for {person.full_name()}')
-                
-                # Update notes/biography
-                notes = person_data.get('notes', '')
-                if notes and not person.notes:
-                    person.notes = notes
-                    updated = True
-                    stats['notes_added'] += 1
-                    self.stdout.write(f'  ✓ Added biography notes to {person.full_name()}')
-                
-                # Save if updated
-                if updated:
-                    person.save()
-                    stats['updated'] += 1
-                    
-            except Person.DoesNotExist:
-                stats['not_found'] += 1
-                self.stdout.write(f'  ⚠ Person pk:{pk} not found in production')
-        
+
+        start = time.monotonic()
+        while True:
+            chunk = list(islice(records, batch_size))
+            if not chunk:
+                break
+            with transaction.atomic():
+                self.sync_chunk(chunk, batch_size)
+            elapsed = time.monotonic() - start
+            rate = self.stats['processed'] / elapsed if elapsed else 0
+            self.stdout.write(f'  Processed {self.stats["processed"]} people '
+                              f'({self.stats["updated"]} updated, {rate:.0f} people/s)')
+        elapsed = time.monotonic() - start
+
+        # bulk_update bypasses Person.save(), so signals never fired; the
+        # journal entries it recorded invalidate cached layouts instead
+        consume_journal()
+
+        stats = self.stats
         self.stdout.write('')
         self.stdout.write('=== SYNC COMPLETE ===')
+        self.stdout.write(f'People processed: {stats["processed"]} in {elapsed:.2f}s')
         self.stdout.write(f'People found in production: {stats["found"]}')
         self.stdout.write(f'People updated: {stats["updated"]}')
         self.stdout.write(f'Relationships added: {stats["relationships_added"]}')
         self.stdout.write(f'Biographies added: {stats["notes_added"]}')
         self.stdout.write(f'People not found: {stats["not_found"]}')
-        
+
         # Final verification
         self.stdout.write('')
         self.stdout.write('=== FINAL VERIFICATION ===')
@@ -109,8 +128,70 @@ class Command(BaseCommand):
         people_with_mother = Person.objects.filter(mother__isnull=False).count()
         people_with_spouse = Person.objects.filter(spouse__isnull=False).count()
         people_with_notes = Person.objects.filter(notes__isnull=False).exclude(notes='').count()
-        
+
         self.stdout.write(f'People with father: {people_with_father}')
         self.stdout.write(f'People with mother: {people_with_mother}')
         self.stdout.write(f'People with spouse: {people_with_spouse}')
-        self.stdout.write(f'People with biography notes: {people_with_notes}')
\ No newline at end of file
+        self.stdout.write(f'People with biography notes: {people_with_notes}')
+
+    def log(self, message):
+        if self.verbosity >= 2:
+            self.stdout.write(message)
+
+    def sync_chunk(self, chunk, batch_size):
+        """Resolve every referenced person in one query and write changes in bulk"""
+        ids = set()
+        for person_data in chunk:
+            ids.add(person_data['pk'])
+            for relation in RELATION_FIELDS:
+                if person_data.get(f'{relation}_pk'):
+                    ids.add(person_data[f'{relation}_pk'])
+        people = Person.objects.in_bulk(ids)
+
+        changed = {}
+        for person_data in chunk:
+            self.stats['processed'] += 1
+            pk = person_data['pk']
+            person = people.get(pk)
+            if person is None:
+                self.stats['not_found'] += 1
+                self.log(f'  ⚠ Person pk:{pk} not found in production')
+                continue
+            self.stats['found'] += 1
+
+            updated = False
+            for relation in RELATION_FIELDS:
+                related_pk = person_data.get(f'{relation}_pk')
+                if not related_pk or getattr(person, f'{relation}_id'):
+                    continue
+                related = people.get(related_pk)
+                if related is None:
+                    self.log(f'  ⚠ {relation.title()} pk:{related_pk} not found for {person.full_name()}')
+                    continue
+                setattr(person, f'{relation}_id', related.pk)
+                updated = True
+                self.stats['relationships_added'] += 1
+                self.log(f'  ✓ Added {relation} {related.full_name()} to {person.full_name()}')
+
+                if relation == 'spouse' and related.spouse_id != person.pk:
+                    # Mirror Person.save(), which keeps spouses bidirectional
+                    related.spouse_id = person.pk
+                    changed[related.pk] = related
+
+            # Update notes/biography
+            notes = person_data.get('notes', '')
+            if notes and not person.notes:
+                person.notes = notes
+                updated = True
+                self.stats['notes_added'] += 1
+                self.log(f'  ✓ Added biography notes to {person.full_name()}')
+
+            if updated:
+                changed[person.pk] = person
+                self.stats['updated'] += 1
+
+        if changed:
+            Person.objects.bulk_update(
+                changed.values(), ['father', 'mother', 'spouse', 'notes'], batch_size=batch_size
+            )
+            journal.record(journal.update_entries(Person, changed, ['father', 'mother', 'spouse', 'notes']))
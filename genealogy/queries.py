@@ -0,0 +1,89 @@
+"""
+Genealogy-scoped film queries.
+
+Expands a person to their ancestors, descendants or branch with a
+recursive CTE and joins the result straight onto film- and chapter-level
+appearances, so "every film featuring any descendant of Grandpa Joe" is a
+single SQL subquery that can be filtered, counted and paginated like any
+other Film queryset.
+"""
+from django.db.models.expressions import RawSQL
+from main.models import Person, Film, Chapter, FilmPeople, ChapterPeople
+from .layout import ANCESTORS, DESCENDANTS
+
+BRANCH = 'branch'
+FAMILY_SCOPES = (
+    (DESCENDANTS, 'Descendants'),
+    (ANCESTORS, 'Ancestors'),
+    (BRANCH, 'Branch (descendants and spouses)'),
+)
+
+# Generations to follow; also guards against cycles in bad data
+MAX_FAMILY_DEPTH = 20
+
+
+def _family_cte(scope):
+    """Return the WITH RECURSIVE clause defining the `family` relation"""
+    person = Person._meta.db_table
+    if scope == ANCESTORS:
+        step = 'JOIN family f ON (p.id = f.father_id OR p.id = f.mother_id)'
+    elif scope in (DESCENDANTS, BRANCH):
+        step = 'JOIN family f ON (p.father_id = f.id OR p.mother_id = f.id)'
+    else:
+        raise ValueError(f'Unknown family scope: {scope}')
+
+    cte = (
+        f'WITH RECURSIVE family (id, father_id, mother_id, depth) AS ('
+        f'SELECT id, father_id, mother_id, 0 FROM {person} WHERE id = %s '
+        f'UNION '
+        f'SELECT p.id, p.father_id, p.mother_id, f.depth + 1 FROM {person} p {step} '
+        f'WHERE f.depth < %s)'
+    )
+    if scope == BRANCH:
+        # Spouses who married into the line belong to the branch too
+        cte += (
+            f', members (id) AS ('
+            f'SELECT id FROM family '
+            f'UNION SELECT spouse_id FROM {person} WHERE id IN (SELECT id FROM family) AND spouse_id IS NOT NULL '
+            f'UNION SELECT id FROM {person} WHERE spouse_id IN (SELECT id FROM family))'
+        )
+    else:
+        cte += ', members (id) AS (SELECT id FROM family)'
+    return cte
+
+
+def family_member_ids_sql(person_id, scope, depth=MAX_FAMILY_DEPTH):
+    """SQL and params selecting the ids of everyone in a person's family scope"""
+    return f'{_family_cte(scope)} SELECT DISTINCT id FROM members', [person_id, depth]
+
+
+def family_member_ids(person_id, scope, depth=MAX_FAMILY_DEPTH):
+    """Return the set of person ids in a family scope (including the person)"""
+    sql, params = family_member_ids_sql(person_id, scope, depth)
+    return set(Person.objects.filter(id__in=RawSQL(sql, params)).values_list('id', flat=True))
+
+
+def family_film_ids_sql(person_id, scope, depth=MAX_FAMILY_DEPTH):
+    """SQL and params selecting films where anyone in the family scope appears"""
+    film_people = FilmPeople._meta.db_table
+    chapter_people = ChapterPeople._meta.db_table
+    chapter = Chapter._meta.db_table
+    sql = (
+        f'{_family_cte(scope)} '
+        f'SELECT fp.film_id FROM {film_people} fp WHERE fp.person_id IN (SELECT id FROM members) '
+        f'UNION '
+        f'SELECT c.film_id FROM {chapter} c JOIN {chapter_people} cp ON cp.chapter_id = c.id '
+        f'WHERE cp.person_id IN (SELECT id FROM members)'
+    )
+    return sql, [person_id, depth]
+
+
+def filter_films_by_family(films, person_id, scope, depth=MAX_FAMILY_DEPTH):
+    """Restrict a Film queryset to films featuring the person's family"""
+    sql, params = family_film_ids_sql(person_id, scope, depth)
+    return films.filter(id__in=RawSQL(sql, params))
+
+
+def films_featuring_family(person_id, scope=DESCENDANTS, depth=MAX_FAMILY_DEPTH):
+    """Films in which any member of the person's family scope appears"""
+    return filter_films_by_family(Film.objects.all(), person_id, scope, depth).order_by('playlist_order', 'title')
@@ -0,0 +1,11 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from main.models import Person
+from .cache import bump_genealogy_version
+
+
+@receiver(post_save, sender=Person)
+@receiver(post_delete, sender=Person)
+def invalidate_genealogy_cache(sender, **kwargs):
+    """Any change to a person may change names, dates or relationships"""
+    bump_genealogy_version()
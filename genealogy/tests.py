@@ -1,3 +1,197 @@
-from django.test import TestCase
+from django.test import TestCase, Client
+from django.core.cache import cache
+from django.core.management import call_command
+from django.urls import reverse
+from io import StringIO
+import json
+import tempfile
 
-# Create your tests here.
+from main import journal
+from main.models import Person, Film, Chapter, JournalCursor
+from .cache import consume_journal, get_genealogy_version, JOURNAL_CONSUMER
+from .layout import compute_tree_layout, get_tree_layout, NODE_WIDTH, ANCESTORS, DESCENDANTS
+from .queries import films_featuring_family, family_member_ids, BRANCH
+
+
+class TreeLayoutTestCase(TestCase):
+    def setUp(self):
+        """Three generations: grandparents, their three children, and grandchildren"""
+        cache.clear()
+        self.grandpa = Person.objects.create(first_name='Joe', last_name='Hayward')
+        self.grandma = Person.objects.create(first_name='Ann', last_name='Hayward')
+        self.children = [
+            Person.objects.create(first_name=name, last_name='Hayward',
+                                  father=self.grandpa, mother=self.grandma)
+            for name in ('Amy', 'Bob', 'Cal')
+        ]
+        self.grandchildren = [
+            Person.objects.create(first_name=name, last_name='Hayward', father=self.children[1])
+            for name in ('Dee', 'Eve', 'Fay', 'Gus')
+        ]
+
+    def assert_no_overlaps(self, layout):
+        rows = {}
+        for node in layout['nodes']:
+            rows.setdefault(node['y'], []).append(node['x'])
+        for xs in rows.values():
+            xs.sort()
+            for left, right in zip(xs, xs[1:]):
+                self.assertGreaterEqual(right - left, NODE_WIDTH)
+
+    def test_descendant_layout(self):
+        """Every descendant appears once, parents are centred over their children"""
+        layout = compute_tree_layout(self.grandpa.pk, depth=3, direction=DESCENDANTS)
+        self.assertEqual(len(layout['nodes']), 8)
+        self.assertEqual(len(layout['edges']), 7)
+        self.assertEqual(layout['generations'], 3)
+        self.assert_no_overlaps(layout)
+
+        by_id = {node['id']: node for node in layout['nodes']}
+        bob = by_id[self.children[1].pk]
+        kids = [by_id[p.pk]['x'] for p in self.grandchildren]
+        self.assertAlmostEqual(bob['x'], (min(kids) + max(kids)) / 2)
+        self.assertLess(by_id[self.grandpa.pk]['y'], bob['y'])
+
+    def test_ancestor_layout(self):
+        """Pedigree charts put the root at the bottom with both parents above"""
+        layout = compute_tree_layout(self.grandchildren[0].pk, depth=3, direction=ANCESTORS)
+        by_id = {node['id']: node for node in layout['nodes']}
+        self.assertEqual(set(by_id), {self.grandchildren[0].pk, self.children[1].pk,
+                                      self.grandpa.pk, self.grandma.pk})
+        root = by_id[self.grandchildren[0].pk]
+        self.assertGreater(root['y'], by_id[self.children[1].pk]['y'])
+        self.assert_no_overlaps(layout)
+
+    def test_layout_cache_invalidated_by_person_change(self):
+        """Cached layouts are reused until a person is saved"""
+        first = get_tree_layout(self.grandpa.pk, 2, DESCENDANTS)
+        with self.assertNumQueries(0):
+            self.assertEqual(get_tree_layout(self.grandpa.pk, 2, DESCENDANTS), first)
+
+        Person.objects.create(first_name='Hal', last_name='Hayward', mother=self.grandma, father=self.grandpa)
+        updated = get_tree_layout(self.grandpa.pk, 2, DESCENDANTS)
+        self.assertEqual(len(updated['nodes']), len(first['nodes']) + 1)
+
+    def test_layout_cache_invalidated_from_journal(self):
+        """Bulk updates that mute the signals invalidate layouts once the journal is consumed"""
+        consume_journal()
+        first = get_tree_layout(self.grandpa.pk, 2, DESCENDANTS)
+        version = get_genealogy_version()
+
+        with journal.muted():
+            Person.objects.filter(pk=self.children[0].pk).update(father=None, mother=None)
+            journal.record(journal.update_entries(Person, [self.children[0].pk], ['father', 'mother']))
+        self.assertEqual(get_tree_layout(self.grandpa.pk, 2, DESCENDANTS), first)
+
+        self.assertEqual(consume_journal(), 1)
+        self.assertEqual(get_genealogy_version(), version + 1)
+        self.assertEqual(JournalCursor.objects.get(name=JOURNAL_CONSUMER).sequence, journal.latest_sequence())
+        self.assertLess(len(get_tree_layout(self.grandpa.pk, 2, DESCENDANTS)['nodes']), len(first['nodes']))
+
+        self.assertEqual(consume_journal(), 0)
+        self.assertEqual(get_genealogy_version(), version + 1)
+
+    def test_layout_api(self):
+        """The layout endpoint validates direction and returns JSON"""
+        client = Client()
+        url = reverse('genealogy:api_tree_layout', kwargs={'pk': self.grandpa.pk})
+        response = client.get(url, {'direction': 'descendants', 'depth': 1})
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.content)
+        self.assertEqual(data['root'], self.grandpa.pk)
+        self.assertEqual(len(data['nodes']), 4)
+
+        response = client.get(url, {'direction': 'sideways'})
+        self.assertEqual(response.status_code, 400)
+
+
+class SyncGenealogyCommandTestCase(TestCase):
+    def setUp(self):
+        self.father = Person.objects.create(first_name='Joe', last_name='Hayward')
+        self.mother = Person.objects.create(first_name='Ann', last_name='Smith')
+        self.child = Person.objects.create(first_name='Amy', last_name='Hayward')
+
+    def run_sync(self, records, *args):
+        with tempfile.NamedTemporaryFile('w', suffix='.ndjson') as f:
+            f.write('\n'.join(json.dumps(record) for record in records) + '\n')
+            f.flush()
+            out = StringIO()
+            call_command('sync_genealogy', '--file', f.name, *args, stdout=out)
+        return out.getvalue()
+
+    def test_ndjson_sync_in_batches(self):
+        """Relationships and notes are filled in; spouses are linked both ways"""
+        records = [
+            {'pk': self.child.pk, 'father_pk': self.father.pk, 'mother_pk': self.mother.pk,
+             'spouse_pk': None, 'notes': 'Loved sailing'},
+            {'pk': self.father.pk, 'father_pk': None, 'mother_pk': None,
+             'spouse_pk': self.mother.pk, 'notes': ''},
+            {'pk': 99999, 'father_pk': None, 'mother_pk': None, 'spouse_pk': None, 'notes': ''},
+        ]
+        output = self.run_sync(records, '--batch-size', '2')
+
+        self.child.refresh_from_db()
+        self.mother.refresh_from_db()
+        self.assertEqual(self.child.father, self.father)
+        self.assertEqual(self.child.mother, self.mother)
+        self.assertEqual(self.child.notes, 'Loved sailing')
+        self.assertEqual(self.mother.spouse, self.father)
+        self.assertIn('People updated: 2', output)
+        self.assertIn('People not found: 1', output)
+
+    def test_existing_relationships_are_kept(self):
+        """Sync only fills blanks, it never overwrites"""
+        other = Person.objects.create(first_name='Max', last_name='Jones')
+        self.child.father = other
+        self.child.save()
+        self.run_sync([{'pk': self.child.pk, 'father_pk': self.father.pk,
+                        'mother_pk': None, 'spouse_pk': None, 'notes': ''}])
+        self.child.refresh_from_db()
+        self.assertEqual(self.child.father, other)
+
+
+class FamilyFilmQueryTestCase(TestCase):
+    def setUp(self):
+        self.grandpa = Person.objects.create(first_name='Joe', last_name='Hayward')
+        self.son = Person.objects.create(first_name='Bob', last_name='Hayward', father=self.grandpa)
+        self.daughter_in_law = Person.objects.create(first_name='Sue', last_name='Hayward', spouse=self.son)
+        self.grandson = Person.objects.create(first_name='Tim', last_name='Hayward', father=self.son)
+        self.stranger = Person.objects.create(first_name='Max', last_name='Jones')
+
+        self.films = {}
+        for n, person in enumerate([self.grandson, self.daughter_in_law, self.stranger], start=1):
+            film = Film.objects.create(file_id=f'FAM-{n}', youtube_id=f'fam{n}', title=f'Film {n}',
+                                       description='', summary='', thumbnail_url='https://example.com/t.jpg',
+                                       playlist_order=n)
+            self.films[person.pk] = film
+        # Grandson appears at chapter level, daughter-in-law at film level
+        chapter = Chapter.objects.create(film=self.films[self.grandson.pk], title='Picnic', start_time='00:10', order=1)
+        chapter.people.add(self.grandson)
+        self.films[self.daughter_in_law.pk].people.add(self.daughter_in_law)
+        self.films[self.stranger.pk].people.add(self.stranger)
+
+    def test_family_member_expansion(self):
+        self.assertEqual(family_member_ids(self.grandpa.pk, DESCENDANTS),
+                         {self.grandpa.pk, self.son.pk, self.grandson.pk})
+        self.assertEqual(family_member_ids(self.grandson.pk, ANCESTORS),
+                         {self.grandson.pk, self.son.pk, self.grandpa.pk})
+        self.assertIn(self.daughter_in_law.pk, family_member_ids(self.grandpa.pk, BRANCH))
+
+    def test_films_featuring_descendants(self):
+        """Chapter-level appearances count, unrelated people do not"""
+        films = films_featuring_family(self.grandpa.pk, DESCENDANTS)
+        self.assertEqual(list(films), [self.films[self.grandson.pk]])
+        self.assertEqual(films.count(), 1)
+
+        branch = films_featuring_family(self.grandpa.pk, BRANCH)
+        self.assertEqual(set(branch), {self.films[self.grandson.pk], self.films[self.daughter_in_law.pk]})
+
+    def test_catalog_family_filter(self):
+        response = Client().get(reverse('films:catalog'), {'family': self.grandpa.pk, 'family_scope': 'descendants'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(response.context['page_obj']), [self.films[self.grandson.pk]])
+
+    def test_tree_page_lists_family_films(self):
+        response = Client().get(reverse('genealogy:tree', kwargs={'pk': self.grandpa.pk}), {'films_scope': 'branch'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['family_films'].paginator.count, 2)
@@ -16,5 +16,6 @@ urlpatterns = [
     
     # API endpoints
     path('api/tree/<int:pk>/', views.FamilyTreeAPIView.as_view(), name='api_tree'),
+    path('api/tree/<int:pk>/layout/', views.FamilyTreeLayoutAPIView.as_view(), name='api_tree_layout'),
     path('api/search-people/', views.search_people_api, name='api_search_people'),
 ]
\ No newline at end of file
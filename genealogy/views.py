@@ -5,9 +5,12 @@ from django.contrib import messages
 from django.http import JsonResponse
 from django.urls import reverse_lazy
 from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
 from django.db import models
 from main.models import Person
 from .forms import PersonRelationshipForm, PersonBiographyForm
+from .layout import get_tree_layout, DIRECTIONS, DESCENDANTS, DEFAULT_DEPTH
+from .queries import films_featuring_family, FAMILY_SCOPES
 
 
 class GenealogyHomeView(TemplateView):
@@ -35,6 +38,17 @@ class FamilyTreeView(DetailView):
         context = super().get_context_data(**kwargs)
         # Add tree data for initial load
         context['tree_data'] = self.object.get_family_tree_data()
+        context['layout_directions'] = DIRECTIONS
+        context['default_layout_depth'] = DEFAULT_DEPTH
+        
+        # Films featuring this person's family, counted and paginated in SQL
+        films_scope = self.request.GET.get('films_scope', DESCENDANTS)
+        if films_scope not in dict(FAMILY_SCOPES):
+            films_scope = DESCENDANTS
+        paginator = Paginator(films_featuring_family(self.object.pk, films_scope), 12)
+        context['family_films'] = paginator.get_page(self.request.GET.get('films_page'))
+        context['films_scope'] = films_scope
+        context['family_scopes'] = FAMILY_SCOPES
         return context
 
 
@@ -87,6 +101,24 @@ class FamilyTreeAPIView(DetailView):
         return JsonResponse(tree_data)
 
 
+class FamilyTreeLayoutAPIView(DetailView):
+    """JSON API for a pre-computed multi-generation tree layout"""
+    model = Person
+    
+    def get(self, request, *args, **kwargs):
+        person = self.get_object()
+        direction = request.GET.get('direction', DESCENDANTS)
+        if direction not in DIRECTIONS:
+            return JsonResponse({'error': f'Invalid direction: {direction}'}, status=400)
+        try:
+            depth = int(request.GET.get('depth', DEFAULT_DEPTH))
+        except ValueError:
+            return JsonResponse({'error': 'Depth must be an integer'}, status=400)
+        
+        layout = get_tree_layout(person.pk, depth, direction)
+        return JsonResponse(layout)
+
+
 def search_people_api(request):
     """API endpoint for person search (for relationship forms)"""
     query = request.GET.get('q', '')
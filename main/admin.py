@@ -4,7 +4,8 @@ from .models import (
     Person, Location, Tag, DigitalReel, Film, Chapter,
     FilmPeople, FilmLocations, FilmTags,
     ChapterPeople, ChapterLocations, ChapterTags,
-    Sequence, SequencePeople, SequenceLocations, SequenceTags
+    Sequence, SequencePeople, SequenceLocations, SequenceTags,
+    JournalEntry, JournalCursor
 )
 
 
@@ -173,4 +174,23 @@ admin.site.register(FilmLocations)
 admin.site.register(FilmTags)
 admin.site.register(ChapterPeople)
 admin.site.register(ChapterLocations)
-admin.site.register(ChapterTags)
\ No newline at end of file
+admin.site.register(ChapterTags)
+
+@admin.register(JournalEntry)
+class JournalEntryAdmin(admin.ModelAdmin):
+    list_display = ['id', 'created_at', 'action', 'model', 'object_id', 'film_id', 'chapter_id']
+    list_filter = ['action', 'model']
+    search_fields = ['object_id']
+    readonly_fields = ['id', 'created_at', 'model', 'object_id', 'action', 'film_id', 'chapter_id', 'data']
+    
+    # The journal is append-only; entries are written by signals and bulk paths
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(JournalCursor)
+class JournalCursorAdmin(admin.ModelAdmin):
+    list_display = ['name', 'sequence', 'updated_at']
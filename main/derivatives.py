@@ -0,0 +1,226 @@
+"""
+Width-stepped derivatives of the static thumbnails.
+
+Each source image under the thumbnail root gets one variant per width in
+WIDTHS, never wider than the source, in every format Pillow can encode:
+AVIF, WebP and JPEG. Variants are written as
+<output>/<source path without extension>-<width>w.<ext>, with EXIF, ICC
+and other metadata stripped. AVIF needs Pillow 11.2+ or the
+pillow-avif-plugin package and is left out without them.
+
+manifest.json in the output directory maps each source path, relative to
+the thumbnail root, to the hash of its bytes and settings, its size and
+its variants. Templates build srcset/<picture> markup from it, and a
+source whose hash is unchanged is skipped on the next run.
+"""
+import json
+import os
+import time
+from pathlib import PurePosixPath
+from urllib.parse import quote, unquote
+
+from PIL import Image, ImageOps
+
+from main.importing.hashing import content_hash, file_hash
+from main.rendering import render_all, save_atomically
+
+try:
+    import pillow_avif  # noqa: F401 - registers an AVIF encoder on Pillow < 11.2
+except ImportError:
+    pass
+
+WIDTHS = (160, 320, 640)
+# Smallest encodings first, so <picture> offers them before the fallbacks
+FORMATS = ('avif', 'webp', 'jpg')
+PIL_FORMATS = {'avif': 'AVIF', 'webp': 'WEBP', 'jpg': 'JPEG'}
+MIME_TYPES = {'avif': 'image/avif', 'webp': 'image/webp', 'jpg': 'image/jpeg'}
+SAVE_OPTIONS = {
+    'avif': {'quality': 50},
+    'webp': {'quality': 80, 'method': 6},
+    'jpg': {'quality': 82, 'optimize': True, 'progressive': True},
+}
+SOURCE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.webp'}
+# Sprite sheets are stepped through by background-position, not shown through <img>
+SKIP_DIRS = {'previews'}
+MANIFEST_NAME = 'manifest.json'
+
+
+def available_formats():
+    Image.init()
+    return tuple(ext for ext in FORMATS if PIL_FORMATS[ext] in Image.SAVE)
+
+
+def variant_widths(source_width, widths=WIDTHS):
+    """Widths to render; sources narrower than a step get one variant at their own width"""
+    return sorted({min(width, source_width) for width in widths})
+
+
+def variant_path(relative, width, ext):
+    path = PurePosixPath(relative)
+    return str(path.with_name(f'{path.stem}-{width}w.{ext}'))
+
+
+def find_sources(root, output_dir):
+    """Source images under root as sorted relative POSIX paths, leaving out output_dir"""
+    root, output_dir = os.path.abspath(root), os.path.abspath(output_dir)
+    sources = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = [
+            name for name in dirnames
+            if name not in SKIP_DIRS and os.path.join(dirpath, name) != output_dir
+        ]
+        for name in filenames:
+            if os.path.splitext(name)[1].lower() in SOURCE_EXTENSIONS:
+                sources.append(PurePosixPath(os.path.relpath(os.path.join(dirpath, name), root)).as_posix())
+    return sorted(sources)
+
+
+def render_derivatives(job):
+    """
+    Write every variant of one source; runs in a worker process. Returns
+    the source's manifest entry plus relative, seconds and error.
+    """
+    start = time.monotonic()
+    result = {'relative': job['relative'], 'hash': job['hash'], 'error': None}
+    try:
+        with Image.open(job['source']) as source:
+            # Apply the EXIF orientation before the metadata is dropped
+            image = ImageOps.exif_transpose(source).convert('RGB')
+        image.info = {}
+        width, height = image.size
+        variants = {ext: [] for ext in job['formats']}
+        for step in variant_widths(width, job['widths']):
+            step_height = max(1, round(height * step / width))
+            resized = image if step == width else image.resize((step, step_height), Image.Resampling.LANCZOS, reducing_gap=3.0)
+            for ext in job['formats']:
+                relative = variant_path(job['relative'], step, ext)
+                path = os.path.join(job['output_dir'], relative)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                save_atomically(resized, path, PIL_FORMATS[ext], **SAVE_OPTIONS[ext])
+                variants[ext].append({'width': step, 'height': step_height, 'file': relative, 'bytes': os.path.getsize(path)})
+        result.update(width=width, height=height, bytes=job['bytes'], variants=variants)
+    except Exception as e:
+        result['error'] = str(e)
+    result['seconds'] = time.monotonic() - start
+    return result
+
+
+class DerivativeManifest:
+    """Variants of every source, as recorded in <output>/manifest.json"""
+    def __init__(self, output_dir):
+        self.output_dir = output_dir
+        self.path = os.path.join(output_dir, MANIFEST_NAME)
+        self.sources = {}
+        if os.path.exists(self.path):
+            with open(self.path) as f:
+                self.sources = json.load(f)['sources']
+
+    def files(self, relative):
+        entry = self.sources.get(relative, {})
+        return [variant['file'] for variants in entry.get('variants', {}).values() for variant in variants]
+
+    def unchanged(self, relative, digest):
+        entry = self.sources.get(relative)
+        return bool(entry) and entry['hash'] == digest and all(
+            os.path.exists(os.path.join(self.output_dir, file)) for file in self.files(relative)
+        )
+
+    def delete(self, files):
+        for file in files:
+            try:
+                os.remove(os.path.join(self.output_dir, file))
+            except FileNotFoundError:
+                pass
+
+    def record(self, result):
+        relative = result['relative']
+        old_files = set(self.files(relative))
+        self.sources[relative] = {key: result[key] for key in ('hash', 'width', 'height', 'bytes', 'variants')}
+        # Variants of an earlier, wider version of the source would be left behind
+        self.delete(old_files - set(self.files(relative)))
+
+    def remove(self, relative):
+        """Forget a deleted source and delete its variants"""
+        self.delete(self.files(relative))
+        self.sources.pop(relative, None)
+
+    def save(self):
+        os.makedirs(self.output_dir, exist_ok=True)
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump({'sources': self.sources}, f, indent=1, sort_keys=True)
+        os.replace(temp_path, self.path)
+
+    def savings(self):
+        """(source bytes, {format: bytes of the smallest variants}) over every recorded source"""
+        source_bytes = sum(entry['bytes'] for entry in self.sources.values())
+        smallest = {}
+        for entry in self.sources.values():
+            for ext, variants in entry['variants'].items():
+                smallest[ext] = smallest.get(ext, 0) + variants[0]['bytes']
+        return source_bytes, smallest
+
+
+def source_job(root, relative, output_dir, widths, formats):
+    source = os.path.join(root, relative)
+    return {
+        'source': source, 'relative': relative, 'output_dir': output_dir, 'bytes': os.path.getsize(source),
+        'widths': list(widths), 'formats': list(formats),
+        # Changing the widths, formats or encoder settings brings every source back
+        'hash': content_hash([file_hash(source), list(widths), list(formats), SAVE_OPTIONS]),
+    }
+
+
+def update_derivatives(root, output_dir, relatives=None, force=False, workers=1, widths=WIDTHS, on_result=None):
+    """
+    Render the variants of new or changed sources and save the manifest.
+
+    relatives limits the run to those sources; without it every source
+    under root is considered and entries for deleted sources are removed.
+    on_result(result) is called as each source finishes. Returns
+    (manifest, results, skipped).
+    """
+    manifest = DerivativeManifest(output_dir)
+    formats = available_formats()
+    if relatives is None:
+        relatives = find_sources(root, output_dir)
+        for relative in set(manifest.sources) - set(relatives):
+            manifest.remove(relative)
+
+    jobs, skipped = [], 0
+    for relative in relatives:
+        job = source_job(root, relative, output_dir, widths, formats)
+        if not force and manifest.unchanged(relative, job['hash']):
+            skipped += 1
+            continue
+        jobs.append(job)
+
+    results = []
+    for result in render_all(render_derivatives, jobs, workers):
+        if not result['error']:
+            manifest.record(result)
+        results.append(result)
+        if on_result:
+            on_result(result)
+    manifest.save()
+    return manifest, results, skipped
+
+
+def relative_to_root(path, root):
+    """path relative to root as a POSIX path, None if it is outside root"""
+    relative = os.path.relpath(os.path.abspath(path), os.path.abspath(root))
+    return None if relative.startswith(os.pardir) else PurePosixPath(relative).as_posix()
+
+
+def static_file(url, static_url, static_dir):
+    """File behind a static URL such as a thumbnail_url, None for other URLs"""
+    if not url or not url.startswith(static_url):
+        return None
+    return os.path.join(static_dir, unquote(url[len(static_url):]))
+
+
+def srcset(entry, ext, base_url):
+    """srcset attribute value for one format of a manifest entry"""
+    return ', '.join(
+        f"{base_url}{quote(variant['file'])} {variant['width']}w" for variant in entry['variants'][ext]
+    )
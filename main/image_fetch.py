@@ -0,0 +1,137 @@
+"""
+Per-run cache for images fetched over HTTP by the thumbnail scripts.
+
+The same few source images are asked for over and over (every chapter of
+a film tries the same YouTube thumbnail candidates), so each URL is
+fetched at most once per run over one pooled requests.Session. Fetched
+bytes are kept in a cache directory rather than in memory and failed
+URLs are remembered too. Each distinct image is decoded and resized once
+per size; callers get copies to draw on.
+"""
+import hashlib
+import io
+import os
+import shutil
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from PIL import Image
+from requests.adapters import HTTPAdapter
+
+YOUTUBE_THUMBNAIL_URL = 'https://img.youtube.com/vi/{video_id}/{source}'
+# Tried in order; the first one YouTube serves is used
+YOUTUBE_SOURCES = ('1.jpg', '2.jpg', '3.jpg', 'hqdefault.jpg', 'mqdefault.jpg', 'default.jpg')
+FETCH_WORKERS = 8
+
+
+def youtube_thumbnail_urls(video_id, sources=YOUTUBE_SOURCES, url_template=YOUTUBE_THUMBNAIL_URL):
+    return [url_template.format(video_id=video_id, source=source) for source in sources]
+
+
+class ImageFetchCache:
+    """
+    Fetched image bytes on disk by URL hash, plus the decoded, resized
+    images in memory. Use as a context manager so the session is closed
+    and a temporary cache directory removed.
+    """
+    def __init__(self, cache_dir=None, workers=FETCH_WORKERS, timeout=10, session=None):
+        self.owns_dir = cache_dir is None
+        self.cache_dir = cache_dir or tempfile.mkdtemp(prefix='image-fetch-')
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self.workers = workers
+        self.timeout = timeout
+        self.session = session or requests.Session()
+        # One connection per worker, reused for every request to the same host
+        adapter = HTTPAdapter(pool_connections=workers, pool_maxsize=workers)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.missing = {}  # url -> reason it could not be used
+        self.images = {}  # (url, size, prepare) -> decoded and resized image
+        self.lock = threading.Lock()
+        self.url_locks = {}
+        self.requests = self.hits = self.decoded = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.session.close()
+        if self.owns_dir:
+            shutil.rmtree(self.cache_dir, ignore_errors=True)
+
+    def path(self, url):
+        return os.path.join(self.cache_dir, hashlib.sha256(url.encode()).hexdigest())
+
+    def url_lock(self, url):
+        # Threads asking for the same URL wait for the first fetch instead of repeating it
+        with self.lock:
+            return self.url_locks.setdefault(url, threading.Lock())
+
+    def fetch(self, url):
+        """The bytes at url, None if it could not be fetched"""
+        with self.url_lock(url):
+            path = self.path(url)
+            if url in self.missing:
+                self.hits += 1
+                return None
+            if os.path.exists(path):
+                self.hits += 1
+                with open(path, 'rb') as f:
+                    return f.read()
+            self.requests += 1
+            try:
+                response = self.session.get(url, timeout=self.timeout)
+            except requests.RequestException as e:
+                self.missing[url] = str(e)
+                return None
+            if response.status_code != 200:
+                self.missing[url] = f'HTTP {response.status_code}'
+                return None
+            temp_path = path + '.tmp'
+            with open(temp_path, 'wb') as f:
+                f.write(response.content)
+            os.replace(temp_path, path)
+            return response.content
+
+    def first_available(self, urls):
+        """First of urls that can be fetched, None if none can"""
+        return next((url for url in urls if self.fetch(url) is not None), None)
+
+    def prefetch(self, url_lists):
+        """Find the first available URL of each list concurrently, so later lookups are cache hits"""
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            return list(executor.map(self.first_available, url_lists))
+
+    def image(self, url, size, prepare=None):
+        """
+        A copy of the image at url resized to size and passed through
+        prepare(image), decoded once per run; None if it is unavailable
+        or not an image.
+        """
+        key = (url, size, prepare)
+        if key not in self.images:
+            data = self.fetch(url)
+            if data is None:
+                return None
+            try:
+                with Image.open(io.BytesIO(data)) as source:
+                    image = source.convert('RGB').resize(size, Image.Resampling.LANCZOS)
+            except (OSError, SyntaxError) as e:
+                self.missing[url] = f'Not a valid image: {e}'
+                return None
+            self.decoded += 1
+            self.images[key] = prepare(image) if prepare else image
+        return self.images[key].copy()
+
+    def first_image(self, urls, size, prepare=None):
+        """(url, image copy) for the first of urls that is a usable image, (None, None) otherwise"""
+        for url in urls:
+            image = self.image(url, size, prepare)
+            if image is not None:
+                return url, image
+        return None, None
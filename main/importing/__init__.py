@@ -0,0 +1 @@
+"""Shared helpers for the spreadsheet and CSV import commands and scripts."""
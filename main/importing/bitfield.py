@@ -0,0 +1,87 @@
+"""
+Vectorized decoding of the "Haywards Present" bitfield column.
+
+Chapter sheets record which Hayward family members appear in a chapter
+as a string of 0/1 characters, one position per person listed in the
+sheet's "Bitfield:" key. Rather than walking each string and querying
+per set bit, a whole sheet column is decoded in one NumPy pass and
+turned into (chapter_id, person_id) pairs for a single bulk insert.
+"""
+import numpy as np
+from main import journal
+from main.models import Person, ChapterPeople, Chapter
+
+
+def decode_bitfield_column(values, width):
+    """
+    Decode a column of '0110'-style strings into a (rows, width) bool matrix.
+    
+    Values that are missing or the wrong length decode to an all-False row,
+    matching how the importers skip them; only '1' characters count as set.
+    """
+    if width <= 0 or not values:
+        return np.zeros((len(values), max(width, 0)), dtype=bool)
+    
+    cleaned = []
+    for value in values:
+        text = '' if value is None else str(value).strip()
+        if len(text) != width:
+            text = '0' * width
+        cleaned.append(text.encode('ascii', 'replace'))
+    
+    # View the fixed-width byte strings as a uint8 matrix and compare to '1'
+    chars = np.array(cleaned, dtype=f'S{width}').view(np.uint8).reshape(len(cleaned), width)
+    return chars == ord('1')
+
+
+def load_hayward_index_map():
+    """Return {hayward_index: person_id}, loaded once per import run"""
+    index_map = {}
+    # Meta ordering (last, first name) decides between duplicate indexes,
+    # as .filter(hayward_index=...).first() always did
+    for hayward_index, person_id in Person.objects.filter(
+        hayward_index__isnull=False
+    ).values_list('hayward_index', 'id'):
+        index_map.setdefault(hayward_index, person_id)
+    return index_map
+
+
+def bitfield_chapter_people(chapter_ids, bitfields, width, resolve_person_id):
+    """
+    Decode a sheet's bitfields and return (chapter_id, person_id) pairs.
+    
+    resolve_person_id(position) is only called for bit positions that are
+    set in at least one row, so unused key entries never create people.
+    """
+    matrix = decode_bitfield_column(bitfields, width)
+    used_positions = np.flatnonzero(matrix.any(axis=0))
+    person_ids = {int(position): resolve_person_id(int(position)) for position in used_positions}
+    
+    rows, positions = np.nonzero(matrix)
+    pairs = []
+    for row, position in zip(rows.tolist(), positions.tolist()):
+        person_id = person_ids[position]
+        if person_id is not None:
+            pairs.append((chapter_ids[row], person_id))
+    return pairs
+
+
+def write_chapter_people(pairs, is_primary=False):
+    """Insert chapter-person pairs in one statement, skipping existing links"""
+    pairs = list(dict.fromkeys(pairs))
+    if not pairs:
+        return 0
+    ChapterPeople.objects.bulk_create(
+        [ChapterPeople(chapter_id=chapter_id, person_id=person_id, is_primary=is_primary)
+         for chapter_id, person_id in pairs],
+        ignore_conflicts=True,
+    )
+    # Rows were added outside Chapter.update_metadata_flags(), so set the flag here
+    chapter_ids = {chapter_id for chapter_id, _ in pairs}
+    Chapter.objects.filter(id__in=chapter_ids).update(has_people_metadata=True)
+    # Pairs that already existed are journalled too; consumers treat entries as "may have changed"
+    journal.record(
+        [journal.association_entry(ChapterPeople, chapter_id, person_id, 'create') for chapter_id, person_id in pairs] +
+        journal.update_entries(Chapter, chapter_ids, ['has_people_metadata'])
+    )
+    return len(pairs)
@@ -0,0 +1,201 @@
+"""
+Parse stage for the chapter metadata import.
+
+parse_sheet() turns one chapter spreadsheet into plain Python records:
+the film ID prefix, the bitfield key, one dict per chapter row and the
+thumbnail belonging to each row. It never touches the database, so sheets
+can be parsed in a process pool while a single writer applies the records.
+"""
+import io
+import re
+import time
+from pathlib import Path
+
+import openpyxl
+from openpyxl_image_loader import SheetImageLoader
+from PIL import Image as PILImage
+
+from .hashing import bytes_hash, content_hash
+from .image_store import validate_image
+from .sheet_reader import ChapterSheet, is_blank
+from .xls_images import iter_images
+
+# Picture kinds saved as they are, by file extension
+THUMBNAIL_EXTENSIONS = {'jpeg': 'jpg', 'png': 'png'}
+
+LIST_SEPARATOR = r'[,;/]|\sand\s'
+
+# Start columns in the order new chapters take their start time from
+START_SECONDS_COLUMNS = ('18fps start seconds', '16fps start seconds')
+START_TIMECODE_COLUMNS = ('18fps start timecode', '16fps start timecode')
+
+
+def cell_text(row, header_map, column):
+    """Return a cell as stripped text, or '' if the column is missing or empty"""
+    if column not in header_map or is_blank(row[header_map[column]]):
+        return ''
+    return str(row[header_map[column]]).strip()
+
+
+def split_list(text):
+    """Split a locations/tags/people cell on the separators editors use"""
+    return [item.strip() for item in re.split(LIST_SEPARATOR, text) if item.strip()]
+
+
+def parse_start_seconds(row, header_map):
+    """Chapter start in seconds from the first filled start column, 0 if none parses"""
+    for column in START_SECONDS_COLUMNS:
+        if column in header_map and not is_blank(row[header_map[column]]):
+            try:
+                return int(float(row[header_map[column]]))
+            except (TypeError, ValueError):
+                pass
+    for column in START_TIMECODE_COLUMNS:
+        text = cell_text(row, header_map, column)
+        if text:
+            parts = text.split(':')
+            try:
+                if len(parts) == 2:
+                    return int(parts[0]) * 60 + int(parts[1])
+                if len(parts) == 3:
+                    return int(parts[0]) * 3600 + int(parts[1]) * 60 + int(parts[2])
+            except ValueError:
+                pass
+    return 0
+
+
+def xls_thumbnails(file_path, column):
+    """
+    {row index: (extension, bytes)} for the valid pictures anchored in one
+    column of an .xls sheet, and the number of pictures on the sheet
+    """
+    thumbnails, total = {}, 0
+    for image in iter_images(file_path):
+        total += 1
+        if image.column != column or image.row in thumbnails:
+            continue
+        try:
+            validate_image(image.data)
+        except ValueError:
+            continue
+        if image.kind in THUMBNAIL_EXTENSIONS:
+            thumbnails[image.row] = (THUMBNAIL_EXTENSIONS[image.kind], bytes(image.data))
+        elif image.kind in ('bmp', 'tiff'):
+            buffer = io.BytesIO()
+            PILImage.open(io.BytesIO(image.data)).save(buffer, format='PNG')
+            thumbnails[image.row] = ('png', buffer.getvalue())
+    return thumbnails, total
+
+
+def parse_sheet(file_path):
+    """
+    Parse one chapter sheet into a picklable dict.
+
+    Keys: file, prefix, bitfield_key, header_row, rows, messages, errors,
+    seconds, and exception if the sheet could not be read at all.
+    Each row holds the Excel row number, title, timecode, start_seconds,
+    description, years, bitfield, locations, tags, other_people and a
+    thumbnail, which is (file extension, bytes): the picture anchored in the
+    row's Start cell.
+    Rows carry a content hash of their values and of their thumbnail so the
+    writer can skip what was already imported. Messages and errors are
+    replayed by the writer in sheet order, so the log reads the same however
+    many workers parsed the sheets.
+    """
+    start = time.monotonic()
+    file_path = Path(file_path)
+    sheet = {
+        'file': file_path.name, 'prefix': '', 'bitfield_key': [], 'header_row': None, 'rows': [],
+        'messages': [], 'errors': [], 'seconds': 0.0,
+    }
+    try:
+        _parse_sheet(file_path, sheet)
+    except Exception as e:
+        sheet['exception'] = f"Error processing {file_path.name}: {str(e)}"
+    sheet['seconds'] = time.monotonic() - start
+    return sheet
+
+
+def _parse_sheet(file_path, sheet):
+    with ChapterSheet(file_path) as source:
+        _parse_rows(file_path, sheet, source)
+
+
+def _parse_rows(file_path, sheet, source):
+    # Film ID from cell A3
+    sheet['prefix'] = source.prefix
+    if not sheet['prefix']:
+        sheet['errors'].append(f"No film ID found in cell A3 of {file_path.name}")
+        return
+
+    sheet['bitfield_key'] = source.bitfield_key
+
+    header_row_idx = sheet['header_row'] = source.header_row
+    if header_row_idx is None:
+        sheet['errors'].append("Could not find header row")
+        return
+    header_map = source.header_map
+
+    extracted_images = None
+    image_loader = None
+    if file_path.suffix.lower() == '.xls' and 'start' in header_map:
+        try:
+            # Pictures are matched to rows by the cell they are anchored to
+            extracted_images, total = xls_thumbnails(file_path, header_map['start'])
+            if extracted_images:
+                sheet['messages'].append(
+                    f"Extracted {total} images total, using {len(extracted_images)} from Start column"
+                )
+        except Exception as e:
+            sheet['messages'].append(f"Note: Could not extract images from .xls file: {str(e)}")
+    elif file_path.suffix.lower() == '.xlsx':
+        try:
+            image_loader = SheetImageLoader(openpyxl.load_workbook(file_path).active)
+        except Exception as e:
+            sheet['messages'].append(f"Note: Could not load images from Excel file: {str(e)}")
+
+    title_col = header_map.get('title', 0)
+    for idx, row in source.rows():
+        if is_blank(row[title_col]):
+            continue
+        excel_row_num = idx + 1
+
+        description = '\n'.join(filter(None, [
+            cell_text(row, header_map, 'description'), cell_text(row, header_map, 'technical notes'),
+        ]))
+        record = {
+            'excel_row': excel_row_num,
+            'raw_title': str(row[title_col]),
+            'title': str(row[title_col]).strip(),
+            'timecode': cell_text(row, header_map, '16fps start timecode'),
+            'start_seconds': parse_start_seconds(row, header_map),
+            'description': description,
+            'years': cell_text(row, header_map, 'year'),
+            'bitfield': cell_text(row, header_map, 'haywards present'),
+            'locations': split_list(cell_text(row, header_map, 'locations')),
+            'tags': [tag.lower() for tag in split_list(cell_text(row, header_map, 'tags'))],
+            'other_people': split_list(cell_text(row, header_map, 'other people')),
+            'thumbnail': None,
+        }
+
+        # Hash the row before the thumbnail is attached, so images are tracked separately
+        record['hash'] = content_hash(record)
+        record['thumbnail_hash'] = None
+
+        if 'start' in header_map:
+            if image_loader:
+                column = openpyxl.utils.get_column_letter(header_map['start'] + 1)
+                cell_coord = f"{column}{excel_row_num}"
+                if image_loader.image_in(cell_coord):
+                    try:
+                        buffer = io.BytesIO()
+                        image_loader.get(cell_coord).save(buffer, format='PNG')
+                        record['thumbnail'] = ('png', buffer.getvalue())
+                        record['thumbnail_hash'] = bytes_hash(record['thumbnail'][1])
+                    except Exception as e:
+                        record['thumbnail_error'] = f"  Failed to extract thumbnail: {str(e)}"
+            elif extracted_images and idx in extracted_images:
+                record['thumbnail'] = extracted_images[idx]
+                record['thumbnail_hash'] = bytes_hash(record['thumbnail'][1])
+
+        sheet['rows'].append(record)
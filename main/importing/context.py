@@ -0,0 +1,245 @@
+"""
+Preloaded lookups shared by every sheet of a chapter metadata import.
+
+An ImportContext loads the person, location, tag and Hayward index maps
+once per run, and a ChapterIndex holds one film's chapters keyed by
+normalized title and start second. Matching a row and resolving the names
+in it are then dictionary lookups; names not seen before are queued and
+created with one insert per model when the sheet is flushed.
+"""
+from contextlib import contextmanager
+from main import journal
+from main.models import (
+    Person, Location, Tag, Chapter,
+    FilmPeople, FilmLocations, ChapterPeople, ChapterLocations, ChapterTags,
+)
+from .bitfield import load_hayward_index_map
+
+# A row's timecode may be this many seconds off the chapter's start
+TIMECODE_TOLERANCE = 2
+
+# Chapter fields the sheet importers may change
+CHAPTER_FIELDS = [
+    'description', 'years', 'thumbnail_url',
+    'has_people_metadata', 'has_location_metadata', 'has_tags_metadata', 'has_years_metadata',
+]
+
+
+def split_person_name(name):
+    """Split 'First Last Names' into (first, rest); single words have no last name"""
+    parts = name.strip().split()
+    if len(parts) >= 2:
+        return parts[0], ' '.join(parts[1:])
+    return name, ''
+
+
+def person_key(name):
+    first_name, last_name = split_person_name(name)
+    return first_name.lower(), last_name.lower()
+
+
+def apply_metadata_flags(chapters, linked):
+    """Same result as Chapter.update_metadata_flags(), without three queries per chapter"""
+    for chapter in chapters:
+        chapter.has_people_metadata = chapter.id in linked['people']
+        chapter.has_location_metadata = chapter.id in linked['locations']
+        chapter.has_tags_metadata = chapter.id in linked['tags']
+        chapter.has_years_metadata = bool(chapter.years and chapter.years.strip())
+
+
+def insert_links(model, owner_field, target_field, pairs, owners=None):
+    """
+    Bulk insert (owner id, target id) association rows that do not exist yet.
+    Returns every pair the owners are now linked to.
+    """
+    if owners is None:
+        owners = {owner_id for owner_id, _ in pairs}
+    existing = set(model.objects.filter(**{f'{owner_field}__in': owners}).values_list(owner_field, target_field))
+    missing = sorted(set(pairs) - existing)
+    model.objects.bulk_create(
+        [model(**{owner_field: owner_id, target_field: target_id}) for owner_id, target_id in missing],
+        ignore_conflicts=True,
+    )
+    journal.record(journal.association_entry(model, owner_id, target_id, 'create') for owner_id, target_id in missing)
+    return existing | set(pairs)
+
+
+class ChapterIndex:
+    """One film's chapters, keyed for matching spreadsheet rows"""
+    def __init__(self, chapters):
+        self.chapters = list(chapters)
+        self.by_title = {}
+        self.by_second = {}
+        for position, chapter in enumerate(self.chapters):
+            self.by_title.setdefault(chapter.title.lower(), chapter)
+            self.by_second.setdefault(chapter.start_time_seconds, []).append((position, chapter))
+        self.words = [set(chapter.title.lower().split()) for chapter in self.chapters]
+
+    def match(self, title, timecode):
+        """Find chapter by title, then timecode, then shared title words; None if nothing fits"""
+        exact_match = self.by_title.get(title.lower())
+        if exact_match:
+            return exact_match
+
+        if timecode:
+            try:
+                seconds = Chapter.parse_time_to_seconds(timecode)
+            except (ValueError, TypeError, AttributeError):
+                seconds = None
+            if seconds is not None:
+                # The earliest chapter in film order wins, as with a linear scan
+                candidates = [
+                    candidate
+                    for second in range(seconds - TIMECODE_TOLERANCE, seconds + TIMECODE_TOLERANCE + 1)
+                    for candidate in self.by_second.get(second, ())
+                ]
+                if candidates:
+                    return min(candidates, key=lambda candidate: candidate[0])[1]
+
+        # If significant overlap in words, consider it a match
+        title_words = title.lower().split()
+        wanted = set(title_words)
+        threshold = min(3, len(title_words) // 2)
+        for chapter, chapter_words in zip(self.chapters, self.words):
+            if len(wanted & chapter_words) >= threshold:
+                return chapter
+        return None
+
+
+class ImportContext:
+    """Name -> id maps for people, locations and tags, loaded once per import"""
+    def __init__(self):
+        self.people = {}      # (first, last) lowercased -> person id
+        self.locations = {}   # lowercased name -> location id
+        self.tags = set(Tag.objects.values_list('tag', flat=True))
+        # Meta ordering decides between people whose names differ only in case
+        for pk, first_name, last_name in Person.objects.order_by('last_name', 'first_name', 'id').values_list(
+            'id', 'first_name', 'last_name'
+        ):
+            self.people.setdefault((first_name.lower(), last_name.lower()), pk)
+        for pk, name in Location.objects.order_by('id').values_list('id', 'name'):
+            self.locations.setdefault(name.lower(), pk)
+        self.hayward_index_map = load_hayward_index_map()
+
+        self.new_people = {}
+        self.new_locations = {}
+        self.new_tags = set()
+        self.created = []     # (map, key) added during the current sheet
+
+    def chapter_index(self, film):
+        return ChapterIndex(film.chapters.all())
+
+    def add_people(self, names):
+        for name in names:
+            key = person_key(name)
+            if key not in self.people:
+                self.new_people.setdefault(key, split_person_name(name))
+
+    def add_locations(self, names):
+        for name in names:
+            if name.lower() not in self.locations:
+                self.new_locations.setdefault(name.lower(), name)
+
+    def add_tags(self, names):
+        self.new_tags.update(name for name in names if name not in self.tags)
+
+    def flush(self):
+        """Create every queued person, location and tag with one insert per model"""
+        entries = []
+        if self.new_people:
+            people = [Person(first_name=first, last_name=last) for first, last in self.new_people.values()]
+            Person.objects.bulk_create(people)
+            entries += people
+            self._remember(self.people, {key: person.id for key, person in zip(self.new_people, people)})
+        if self.new_locations:
+            locations = [Location(name=name) for name in self.new_locations.values()]
+            Location.objects.bulk_create(locations)
+            entries += locations
+            self._remember(self.locations, {key: loc.id for key, loc in zip(self.new_locations, locations)})
+        if self.new_tags:
+            tags = [Tag(tag=name) for name in sorted(self.new_tags)]
+            Tag.objects.bulk_create(tags, ignore_conflicts=True)
+            entries += tags
+            self.tags.update(self.new_tags)
+            self.created += [(self.tags, name) for name in self.new_tags]
+        journal.record(journal.instance_entry(obj, 'create') for obj in entries)
+        self.new_people, self.new_locations, self.new_tags = {}, {}, set()
+
+    def _remember(self, mapping, created):
+        mapping.update(created)
+        self.created += [(mapping, key) for key in created]
+
+    def person_id(self, name):
+        return self.people[person_key(name)]
+
+    def location_id(self, name):
+        return self.locations[name.lower()]
+
+    def link_chapters(self, links, chapter_ids):
+        """
+        Link chapters to locations, tags and people by name, creating unknown names first.
+        
+        links maps 'locations', 'tags' and 'people' to {chapter_id: [names]}.
+        Returns {relation: ids of chapter_ids with at least one link}.
+        """
+        self.add_locations(name for names in links['locations'].values() for name in names)
+        self.add_tags(name for names in links['tags'].values() for name in names)
+        self.add_people(name for names in links['people'].values() for name in names)
+        self.flush()
+        
+        linked = {}
+        for relation, model, target_field, lookup in (
+            ('locations', ChapterLocations, 'location_id', self.location_id),
+            ('tags', ChapterTags, 'tag_id', str),
+            ('people', ChapterPeople, 'person_id', self.person_id),
+        ):
+            wanted = {(chapter_id, lookup(name)) for chapter_id, names in links[relation].items() for name in names}
+            pairs = insert_links(model, 'chapter_id', target_field, wanted, owners=chapter_ids)
+            linked[relation] = {chapter_id for chapter_id, _ in pairs}
+        return linked
+    
+    def link_film(self, film_id, people, locations):
+        """Link a film to people and locations by name, creating unknown names first"""
+        self.add_people(people)
+        self.add_locations(locations)
+        self.flush()
+        insert_links(FilmPeople, 'film_id', 'person_id', {(film_id, self.person_id(name)) for name in people})
+        insert_links(FilmLocations, 'film_id', 'location_id', {(film_id, self.location_id(name)) for name in locations})
+    
+    def hayward_person_id(self, idx, name):
+        """Person for a bitfield position: by Hayward index, then by name, else created"""
+        if idx in self.hayward_index_map:
+            return self.hayward_index_map[idx]
+        first_name, last_name = split_person_name(name)
+        if not last_name:
+            # Hayward family members listed by first name only
+            last_name = 'Hayward'
+        key = (first_name.lower(), last_name.lower())
+        if key in self.people:
+            person = Person.objects.get(pk=self.people[key])
+            if person.hayward_index is None:
+                person.hayward_index = idx
+                person.save()
+        else:
+            person = Person.objects.create(first_name=first_name, last_name=last_name, hayward_index=idx)
+            self._remember(self.people, {key: person.id})
+        self.hayward_index_map[idx] = person.id
+        self.created.append((self.hayward_index_map, idx))
+        return person.id
+
+    @contextmanager
+    def sheet(self):
+        """Wrap one sheet's transaction; ids created by a sheet that fails are forgotten"""
+        self.created = []
+        try:
+            yield self
+        except BaseException:
+            for mapping, key in self.created:
+                if isinstance(mapping, set):
+                    mapping.discard(key)
+                else:
+                    mapping.pop(key, None)
+            self.new_people, self.new_locations, self.new_tags = {}, {}, set()
+            raise
+        finally:
+            self.created = []
@@ -0,0 +1,22 @@
+"""Content hashes shared by the importers."""
+import hashlib
+import json
+
+
+def content_hash(value):
+    """SHA-256 of any JSON-serialisable value, independent of dict ordering"""
+    encoded = json.dumps(value, sort_keys=True, default=str, separators=(',', ':')).encode('utf-8')
+    return hashlib.sha256(encoded).hexdigest()
+
+
+def bytes_hash(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def file_hash(path, chunk_size=1 << 20):
+    """SHA-256 of a file's bytes"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
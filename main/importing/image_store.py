@@ -0,0 +1,110 @@
+"""
+Content-addressed store for pictures extracted from chapter sheets.
+
+Each picture is validated in memory, keyed by the SHA-256 of its bytes
+and written once as <hash[:2]>/<hash>.<extension>, however many sheets or
+rows it appears in. A manifest.json in the store maps every sheet to the
+(row, column, hash) of its pictures and the hash of the sheet file it was
+read from, so a sheet that has not changed is not extracted again.
+"""
+import io
+import json
+import os
+from pathlib import Path
+
+from PIL import Image
+
+from .hashing import bytes_hash, file_hash
+from .xls_images import iter_images
+
+# File extension per picture kind
+EXTENSIONS = {'jpeg': 'jpg'}
+
+
+def validate_image(data):
+    """(format, width, height) from the image header; ValueError if it is not a readable image"""
+    try:
+        # Image.open only parses the header; pixel data is decoded on first use
+        with Image.open(io.BytesIO(data)) as image:
+            return image.format, image.width, image.height
+    except (OSError, SyntaxError) as e:
+        raise ValueError(f"Not a valid image: {e}") from e
+
+
+class ImageStore:
+    """Pictures on disk by content hash, and the manifest of where they were found"""
+    def __init__(self, root):
+        self.root = Path(root)
+        self.manifest_path = self.root / 'manifest.json'
+        self.manifest = {'sheets': {}}
+        if self.manifest_path.exists():
+            with open(self.manifest_path) as f:
+                self.manifest = json.load(f)
+        self.written = self.reused = 0
+
+    def relative_path(self, digest, extension):
+        return f"{digest[:2]}/{digest}.{extension}"
+
+    def put(self, data, extension):
+        """Store picture bytes unless the same content is already stored; returns the relative path"""
+        digest = bytes_hash(data)
+        relative = self.relative_path(digest, extension)
+        path = self.root / relative
+        if path.exists():
+            self.reused += 1
+            return relative
+        path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = path.with_name(path.name + '.tmp')
+        temp_path.write_bytes(data)
+        os.replace(temp_path, path)
+        self.written += 1
+        return relative
+
+    def sheet_unchanged(self, name, sheet_hash):
+        entry = self.manifest['sheets'].get(name)
+        return bool(entry) and entry['hash'] == sheet_hash and all(
+            (self.root / image['file']).exists() for image in entry['images']
+        )
+
+    def images(self, name):
+        return self.manifest['sheets'].get(name, {}).get('images', [])
+
+    def record(self, name, sheet_hash, images):
+        self.manifest['sheets'][name] = {'hash': sheet_hash, 'images': images}
+
+    def save(self):
+        self.root.mkdir(parents=True, exist_ok=True)
+        temp_path = self.manifest_path.with_name(self.manifest_path.name + '.tmp')
+        with open(temp_path, 'w') as f:
+            json.dump(self.manifest, f, indent=1, sort_keys=True)
+        os.replace(temp_path, self.manifest_path)
+
+
+def store_xls_images(xls_file, store, force=False):
+    """
+    Extract an .xls sheet's pictures into the store and record them in the
+    manifest as {row, column, hash, file}, with 1-based rows and columns.
+
+    Returns (images, skipped, rejected): skipped is True when the sheet is
+    unchanged since it was last extracted, rejected lists the
+    (row, column, reason) of pictures that are not valid images.
+    """
+    name = Path(xls_file).name
+    sheet_hash = file_hash(xls_file)
+    if not force and store.sheet_unchanged(name, sheet_hash):
+        return store.images(name), True, []
+
+    images, rejected = [], []
+    for image in sorted(iter_images(xls_file), key=lambda image: (image.row, image.column)):
+        try:
+            validate_image(image.data)
+        except ValueError as e:
+            rejected.append((image.row + 1, image.column + 1, str(e)))
+            continue
+        relative = store.put(image.data, EXTENSIONS.get(image.kind, image.kind))
+        images.append({
+            'row': image.row + 1, 'column': image.column + 1,
+            'hash': Path(relative).stem, 'file': relative,
+        })
+    store.record(name, sheet_hash, images)
+    return images, False, rejected
@@ -0,0 +1,340 @@
+"""
+Staged ingestion of new films: read sources, parse, extract thumbnails,
+map YouTube, resolve entities and write.
+
+Stages are generators chained item by item (one item per film), so a film
+is written as soon as its sources are parsed rather than after the whole
+batch. Parsing and thumbnail extraction run in a process pool while the
+writer works on earlier films, and every stage that can be replayed
+records its output in a JSON checkpoint file; a run that stops part way
+resumes with the first film that was not written.
+
+Nothing here touches the database, so parse workers can import it freely.
+"""
+import csv
+import json
+import os
+import queue
+import re
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+
+from .chapter_sheets import parse_sheet
+
+STAGES = ('read', 'parse', 'thumbnails', 'youtube', 'resolve', 'write')
+
+BATCH_COLUMN = 'Scan Batch (A, B, or C)'
+DURATION_COLUMNS = ('Duration at 23.97 fps (most of this was shot at 16 or 18 FPS)', 'Duration at 23.97 fps')
+PLAYLIST_URL = 'https://www.youtube.com/playlist?list=PLK3iapm6jnkkDIa9IzKV7eP17HS4vdlCm'
+
+
+class Checkpoint:
+    """Stage outputs and finished films of one run, rewritten atomically on every change"""
+    def __init__(self, path, fingerprint):
+        self.path = Path(path)
+        self.lock = threading.Lock()
+        self.data = {'fingerprint': fingerprint, 'stages': {}, 'done': []}
+        self.resumed = False
+        if self.path.exists():
+            with open(self.path) as f:
+                stored = json.load(f)
+            # A checkpoint from different sources or options is not resumed
+            if stored.get('fingerprint') == fingerprint:
+                self.data = stored
+                self.resumed = True
+        self.done = set(self.data['done'])
+
+    def get(self, stage, key):
+        with self.lock:
+            return self.data['stages'].get(stage, {}).get(key)
+
+    def put(self, stage, key, value):
+        with self.lock:
+            self.data['stages'].setdefault(stage, {})[key] = value
+            self._save()
+
+    def finish(self, key):
+        """Mark a film written; its stage outputs are no longer needed"""
+        with self.lock:
+            self.done.add(key)
+            self.data['done'].append(key)
+            for outputs in self.data['stages'].values():
+                outputs.pop(key, None)
+            self._save()
+
+    def clear(self):
+        self.path.unlink(missing_ok=True)
+
+    def _save(self):
+        temp_path = self.path.with_name(self.path.name + '.tmp')
+        with open(temp_path, 'w') as f:
+            json.dump(self.data, f)
+        os.replace(temp_path, self.path)
+
+
+class StageTimings:
+    """Seconds spent and films handled per stage"""
+    def __init__(self):
+        self.seconds = dict.fromkeys(STAGES, 0.0)
+        self.items = dict.fromkeys(STAGES, 0)
+        self.lock = threading.Lock()
+
+    def add(self, stage, seconds, items=1):
+        with self.lock:
+            self.seconds[stage] += seconds
+            self.items[stage] += items
+
+    @contextmanager
+    def timed(self, stage):
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.add(stage, time.monotonic() - start)
+
+    def timed_iter(self, stage, items):
+        """Time how long an upstream generator takes to produce each item"""
+        items = iter(items)
+        while True:
+            start = time.monotonic()
+            try:
+                item = next(items)
+            except StopIteration:
+                return
+            self.add(stage, time.monotonic() - start)
+            yield item
+
+
+def prefetch(items, size=4):
+    """Run an iterator in a background thread, keeping up to size items ready"""
+    ready = queue.Queue(maxsize=size)
+    finished = object()
+
+    def produce():
+        try:
+            for item in items:
+                ready.put((item, None))
+        except BaseException as e:
+            ready.put((None, e))
+            return
+        ready.put((finished, None))
+
+    thread = threading.Thread(target=produce, daemon=True)
+    thread.start()
+    while True:
+        item, error = ready.get()
+        if error is not None:
+            raise error
+        if item is finished:
+            break
+        yield item
+    thread.join()
+
+
+def read_sources(csv_file, sheet_dir, batch=None):
+    """
+    Yield {'key', 'row', 'sheet'} per film row of the CSV, with the chapter
+    sheet whose name starts with the film's file ID, if there is one.
+    """
+    sheets = sorted(str(path) for path in Path(sheet_dir).glob('*.xls*')) if sheet_dir else []
+    with open(csv_file, 'r', encoding='utf-8') as f:
+        lines = f.readlines()
+    # Front matter may precede the header row
+    header_index = next((i for i, line in enumerate(lines) if 'Filenames' in line), 0)
+    for row in csv.DictReader(lines[header_index:]):
+        if batch and row.get(BATCH_COLUMN) != batch:
+            continue
+        key = (row.get('Filenames') or '').strip()
+        if not key:
+            continue
+        sheet = next((path for path in sheets if Path(path).name.startswith(key)), None)
+        yield {'key': key, 'row': row, 'sheet': sheet}
+
+
+def split_names(text):
+    return [name.strip() for name in (text or '').split(',') if name.strip()]
+
+
+def parse_duration_seconds(text):
+    """'0:09:26' -> 566; None if the text is not H:MM:SS"""
+    parts = (text or '').strip().split(':')
+    if len(parts) != 3:
+        return None
+    try:
+        hours, minutes, seconds = map(int, parts)
+    except ValueError:
+        return None
+    return hours * 3600 + minutes * 60 + seconds
+
+
+def parse_film_row(row):
+    """Film fields and names from one CSV row"""
+    duration = next((row[column] for column in DURATION_COLUMNS if row.get(column)), '')
+    return {
+        'title': (row.get('Title') or '').strip(),
+        'description': (row.get('Description') or '').strip(),
+        'summary': (row.get('Summary') or '').strip(),
+        'years': (row.get('Years') or '').strip(),
+        'technical_notes': (row.get('Tech Notes') or '').strip(),
+        'workflow_state': (row.get('Workflow State') or '').strip(),
+        'duration_seconds': parse_duration_seconds(duration),
+        'people': split_names(row.get('People')),
+        'locations': split_names(row.get('Location')),
+    }
+
+
+def parse_item(item, staging_dir):
+    """
+    Parse and thumbnails stages for one film; runs in a worker process.
+
+    Thumbnails read from the sheet are written to the staging directory so
+    every row's thumbnail becomes a file path and the result can be
+    checkpointed as JSON.
+    """
+    start = time.monotonic()
+    item = dict(item, film=parse_film_row(item['row']), sheet_data=None)
+    if item['sheet']:
+        item['sheet_data'] = parse_sheet(item['sheet'])
+    parse_seconds = time.monotonic() - start
+
+    start = time.monotonic()
+    if item['sheet_data']:
+        Path(staging_dir).mkdir(parents=True, exist_ok=True)
+        for row in item['sheet_data']['rows']:
+            if row['thumbnail']:
+                path = Path(staging_dir) / f"{item['key']}_row{row['excel_row']:03d}.{row['thumbnail'][0]}"
+                path.write_bytes(row['thumbnail'][1])
+                row['thumbnail'] = ('path', str(path))
+    item['timings'] = {'parse': parse_seconds, 'thumbnails': time.monotonic() - start}
+    return item
+
+
+def parse_items(items, staging_dir, workers, checkpoint, timings):
+    """
+    Yield parsed items in input order, replaying checkpointed ones and
+    keeping up to two per worker in flight in the pool.
+    """
+    def collect(entry):
+        if not isinstance(entry, Future):
+            return entry
+        item = entry.result()
+        for stage, seconds in item.pop('timings').items():
+            timings.add(stage, seconds)
+        checkpoint.put('thumbnails', item['key'], item)
+        return item
+
+    executor = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    try:
+        window = deque()
+        for item in items:
+            stored = checkpoint.get('thumbnails', item['key'])
+            if stored:
+                window.append(stored)
+            elif executor:
+                window.append(executor.submit(parse_item, item, staging_dir))
+            else:
+                future = Future()
+                future.set_result(parse_item(item, staging_dir))
+                window.append(future)
+            while len(window) > 2 * workers:
+                yield collect(window.popleft())
+        while window:
+            yield collect(window.popleft())
+    finally:
+        if executor:
+            executor.shutdown(cancel_futures=True)
+
+
+def load_youtube_index(mapping_file=None, videos_file=None):
+    """
+    {file_id: video} from the verified file ID mapping, falling back to
+    cached playlist videos whose description names the file ID.
+    """
+    index = {}
+    if videos_file and os.path.exists(videos_file):
+        with open(videos_file) as f:
+            for video in json.load(f):
+                match = re.search(r'File ID:\s*(\S+)', video.get('description') or '')
+                if match:
+                    index.setdefault(match.group(1), {
+                        'youtube_id': video.get('id') or video.get('video_id', ''),
+                        'title': video.get('title', ''),
+                        'description': video.get('description', ''),
+                        'thumbnail_url': video.get('thumbnail', ''),
+                    })
+    if mapping_file and os.path.exists(mapping_file):
+        with open(mapping_file) as f:
+            for mapping in json.load(f):
+                video = index.setdefault(mapping['file_id'], {'description': '', 'thumbnail_url': ''})
+                video.update(youtube_id=mapping['youtube_id'], title=mapping.get('title', ''))
+    return index
+
+
+def map_youtube(item, index):
+    """YouTube stage: the film's video, or a placeholder that needs manual mapping"""
+    key = item['key']
+    video = index.get(key)
+    if video and video.get('youtube_id'):
+        youtube_id = video['youtube_id']
+        return dict(item, youtube={
+            'youtube_id': youtube_id,
+            'youtube_url': f"https://www.youtube.com/watch?v={youtube_id}",
+            'title': video.get('title') or f"Family Film {key}",
+            'thumbnail_url': video.get('thumbnail_url') or f"https://img.youtube.com/vi/{youtube_id}/maxresdefault.jpg",
+            'metadata': parse_youtube_description(video.get('description', '')),
+            'needs_manual_mapping': False,
+        })
+    youtube_id = f"placeholder_{key.replace('-', '_')}"
+    return dict(item, youtube={
+        'youtube_id': youtube_id,
+        'youtube_url': PLAYLIST_URL,
+        'title': f"[NEEDS MANUAL MAPPING] {key}",
+        'thumbnail_url': f"https://img.youtube.com/vi/{youtube_id}/maxresdefault.jpg",
+        'metadata': parse_youtube_description(''),
+        'needs_manual_mapping': True,
+    })
+
+
+YOUTUBE_SECTIONS = {
+    'chapters:': 'chapters', 'people:': 'people', 'years:': 'years',
+    'locations:': 'locations', 'technical notes:': 'technical_notes',
+}
+
+
+def parse_youtube_description(description):
+    """Split a playlist video description into its description, chapter, people, years and location sections"""
+    metadata = {
+        'description': '', 'chapters': [], 'people': [], 'years': [],
+        'locations': [], 'technical_notes': '', 'file_id': '',
+    }
+    section = 'description'
+    for line in description.split('\n'):
+        line = line.strip()
+        if not line:
+            continue
+        header = next((header for header in YOUTUBE_SECTIONS if line.lower().startswith(header)), None)
+        if header:
+            section = YOUTUBE_SECTIONS[header]
+            continue
+        if line.startswith('File ID:'):
+            metadata['file_id'] = line.replace('File ID:', '').strip()
+            continue
+
+        if section in ('description', 'technical_notes'):
+            metadata[section] += line + ' '
+        elif section == 'chapters':
+            # Parse chapter format: MM:SS Title
+            match = re.match(r'^(\d{1,2}:\d{2})\s+(.+)$', line)
+            if match:
+                timestamp, title = match.groups()
+                metadata['chapters'].append({'start_time': timestamp, 'title': title.strip()})
+        else:
+            metadata[section].extend(split_names(line))
+
+    metadata['description'] = metadata['description'].strip()
+    metadata['technical_notes'] = metadata['technical_notes'].strip()
+    return metadata
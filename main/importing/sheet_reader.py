@@ -0,0 +1,163 @@
+"""
+Row-streaming spreadsheet reader for the chapter sheet importers.
+
+Reads the first worksheet of an .xls (xlrd) or .xlsx (openpyxl read-only)
+file as lists of plain Python values, without building a DataFrame.
+Values are typed the way pd.read_excel(header=None) typed them, so the
+importers see the same cells as before: empty cells and pandas' default
+NA strings are None, whole-number floats are ints and .xls date cells
+are datetimes (or times, for cells holding only a time of day).
+"""
+import re
+from datetime import time as datetime_time
+from pathlib import Path
+
+import openpyxl
+import xlrd
+
+# pandas' default na_values; a cell holding exactly one of these was NaN
+NA_VALUES = frozenset([
+    '', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan', '1.#IND', '1.#QNAN',
+    '<NA>', 'N/A', 'NA', 'NULL', 'NaN', 'None', 'n/a', 'nan', 'null',
+])
+
+# Rows searched for the header, and the row holding the "Bitfield:" key
+HEADER_SEARCH_ROWS = range(5, 15)
+BITFIELD_ROW_INDEX = 7
+
+
+def is_blank(value):
+    return value is None
+
+
+def normalize(value):
+    """Type one cell value like pandas did"""
+    if isinstance(value, float):
+        if value != value:  # NaN
+            return None
+        return int(value) if value.is_integer() else value
+    if isinstance(value, str) and value in NA_VALUES:
+        return None
+    return value
+
+
+def iter_xlsx_rows(path):
+    workbook = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    try:
+        for row in workbook.worksheets[0].iter_rows(values_only=True):
+            yield [normalize(value) for value in row]
+    finally:
+        workbook.close()
+
+
+def iter_xls_rows(path):
+    # xlrd parses a BIFF sheet in one go; on_demand at least skips the other sheets
+    book = xlrd.open_workbook(path, on_demand=True)
+    try:
+        sheet = book.sheet_by_index(0)
+        for index in range(sheet.nrows):
+            yield [xls_value(cell, book.datemode) for cell in sheet.row(index)]
+    finally:
+        book.release_resources()
+
+
+def xls_value(cell, datemode):
+    if cell.ctype == xlrd.XL_CELL_DATE:
+        try:
+            value = xlrd.xldate.xldate_as_datetime(cell.value, datemode)
+        except OverflowError:
+            return cell.value
+        # A date on the epoch day is a time of day, as pandas reads it
+        if value.timetuple()[:3] in ((1899, 12, 31), (1904, 1, 1)):
+            return datetime_time(value.hour, value.minute, value.second, value.microsecond)
+        return value
+    if cell.ctype in (xlrd.XL_CELL_EMPTY, xlrd.XL_CELL_BLANK, xlrd.XL_CELL_ERROR):
+        return None
+    if cell.ctype == xlrd.XL_CELL_BOOLEAN:
+        return bool(cell.value)
+    return normalize(cell.value)
+
+
+def iter_rows(path):
+    """Yield the first worksheet's rows as lists of typed values"""
+    if Path(path).suffix.lower() == '.xls':
+        return iter_xls_rows(path)
+    return iter_xlsx_rows(path)
+
+
+def pad(row, width):
+    return row + [None] * (width - len(row)) if len(row) < width else row
+
+
+class ChapterSheet:
+    """
+    A chapter sheet's front matter plus a stream of its chapter rows.
+
+    Only the rows up to the header and the bitfield key are held in memory
+    (head); rows() reads the rest one at a time. Use as a context manager
+    so the file is closed.
+    """
+    def __init__(self, path):
+        self.path = Path(path)
+        self.stream = iter_rows(self.path)
+        self.head = []
+        self.header_row = None
+        self.header_map = {}
+        for index, row in enumerate(self.stream):
+            self.head.append(row)
+            if self.header_row is None and index in HEADER_SEARCH_ROWS and self.is_header(row):
+                self.header_row = index
+                # Non-text header cells are ignored, as .str.lower() turned them into NaN
+                self.header_map = {
+                    value.lower().strip(): column for column, value in enumerate(row) if isinstance(value, str)
+                }
+            done_searching = self.header_row is not None or index >= HEADER_SEARCH_ROWS[-1]
+            if done_searching and index >= BITFIELD_ROW_INDEX:
+                break
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.stream.close()
+
+    @staticmethod
+    def is_header(row):
+        text = ' '.join(str(cell).lower() for cell in row if not is_blank(cell))
+        return 'start' in text and 'title' in text
+
+    def cell(self, row_index, column):
+        """A cell from the head rows, None if it is outside the sheet"""
+        if row_index >= len(self.head) or column >= len(self.head[row_index]):
+            return None
+        return self.head[row_index][column]
+
+    @property
+    def prefix(self):
+        """Film ID prefix from cell A3"""
+        value = self.cell(2, 0)
+        return '' if is_blank(value) else str(value).strip()
+
+    @property
+    def bitfield_key(self):
+        """Names from the "Bitfield: John Sr, Josephine, ..." cell on row 8"""
+        if BITFIELD_ROW_INDEX >= len(self.head):
+            return []
+        for value in self.head[BITFIELD_ROW_INDEX]:
+            if not is_blank(value) and 'bitfield:' in str(value).lower():
+                match = re.search(r'Bitfield:\s*(.+)', str(value), re.IGNORECASE)
+                return [name.strip() for name in match.group(1).split(',')] if match else []
+        return []
+
+    def rows(self, width=0):
+        """Yield (row index, row) after the header, padded to at least width cells"""
+        if self.header_row is None:
+            return
+        width = max(width, len(self.head[self.header_row]))
+        for index in range(self.header_row + 1, len(self.head)):
+            yield index, pad(self.head[index], width)
+        for index, row in enumerate(self.stream, start=len(self.head)):
+            yield index, pad(row, width)
@@ -0,0 +1,336 @@
+"""
+Images embedded in an Excel 97-2003 (.xls) workbook, with their cell anchors.
+
+An .xls file is an OLE2 compound file whose "Workbook" stream is a run of
+BIFF8 records. Pictures live in Office Drawing (Escher) records: the
+MSODRAWINGGROUP records of the workbook globals hold the BLIP store with
+every picture's bytes, and the MSODRAWING records of each worksheet hold
+one shape per picture, naming its BLIP and the cells it is anchored to.
+
+The file is memory-mapped and streams and records are read as views over
+the mapping, so nothing is copied except the pieces of a picture that
+straddle OLE sectors or BIFF records.
+"""
+import mmap
+import struct
+import zlib
+from bisect import bisect_right
+from collections import namedtuple
+
+OLE_SIGNATURE = b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1'
+END_OF_CHAIN = 0xFFFFFFFE
+FREE_SECTOR = 0xFFFFFFFF
+STREAM_ENTRY = 2
+
+# BIFF8 record types
+BOF, EOF, BOUNDSHEET, CONTINUE = 0x0809, 0x000A, 0x0085, 0x003C
+MSODRAWINGGROUP, MSODRAWING = 0x00EB, 0x00EC
+
+# Office Drawing record types
+SP_CONTAINER, FBSE, FOPT, CLIENT_ANCHOR = 0xF004, 0xF007, 0xF00B, 0xF010
+BLIP_PROPERTY = 0x0104
+
+# BLIP record type -> (kind, instance values that carry a second 16-byte UID)
+BITMAP_BLIPS = {
+    0xF01D: ('jpeg', (0x46B, 0x6E3)), 0xF02A: ('jpeg', (0x46B, 0x6E3)),
+    0xF01E: ('png', (0x6E1,)), 0xF01F: ('dib', (0x7A9,)), 0xF029: ('tiff', (0x6E5,)),
+}
+METAFILE_BLIPS = {
+    0xF01A: ('emf', (0x3D5,)), 0xF01B: ('wmf', (0x217,)), 0xF01C: ('pict', (0x543,)),
+}
+
+XlsImage = namedtuple('XlsImage', 'row column last_row last_column kind data')
+
+
+class Segments:
+    """
+    A byte range made of (offset, length) extents of a source, read as one.
+
+    Reads inside one extent are views of the source; only reads that cross
+    extents are joined into new bytes.
+    """
+    def __init__(self, source, extents):
+        self.source = source
+        self.offsets = []
+        for offset, length in extents:
+            # Adjacent sectors are read as one extent
+            if self.offsets and sum(self.offsets[-1]) == offset:
+                self.offsets[-1] = (self.offsets[-1][0], self.offsets[-1][1] + length)
+            else:
+                self.offsets.append((offset, length))
+        self.starts = []
+        self.size = 0
+        for _, length in self.offsets:
+            self.starts.append(self.size)
+            self.size += length
+
+    def read(self, position, size):
+        if position < 0 or position + size > self.size:
+            raise ValueError(f"Read of {size} bytes at {position} is past the end ({self.size} bytes)")
+        pieces = []
+        index = bisect_right(self.starts, position) - 1
+        while size > 0:
+            offset, length = self.offsets[index]
+            skip = position - self.starts[index]
+            take = min(size, length - skip)
+            pieces.append(read_source(self.source, offset + skip, take))
+            position += take
+            size -= take
+            index += 1
+        if len(pieces) == 1:
+            return pieces[0]
+        return b''.join(pieces)
+
+    def slice(self, size):
+        """The first size bytes of these segments"""
+        extents, remaining = [], size
+        for offset, length in self.offsets:
+            if remaining <= 0:
+                break
+            extents.append((offset, min(length, remaining)))
+            remaining -= length
+        if remaining > 0:
+            raise ValueError(f"Stream is shorter than its directory entry ({size} bytes)")
+        return Segments(self.source, extents)
+
+
+def read_source(source, position, size):
+    if isinstance(source, Segments):
+        return source.read(position, size)
+    return source[position:position + size]
+
+
+class OleFile:
+    """Just enough of an OLE2 compound file reader to find a stream's sectors"""
+    def __init__(self, buffer):
+        self.buffer = buffer
+        if bytes(buffer[:8]) != OLE_SIGNATURE:
+            raise ValueError('Not an OLE2 compound file')
+        (sector_shift, mini_sector_shift) = struct.unpack_from('<HH', buffer, 0x1E)
+        (fat_sectors, directory_start, _, self.mini_cutoff,
+         minifat_start, _, difat_start, difat_sectors) = struct.unpack_from('<8I', buffer, 0x2C)
+        self.sector_size = 1 << sector_shift
+        self.mini_sector_size = 1 << mini_sector_shift
+
+        fat_locations = list(struct.unpack_from('<109I', buffer, 0x4C))
+        per_sector = self.sector_size // 4 - 1
+        sector = difat_start
+        for _ in range(difat_sectors):
+            entries = struct.unpack_from(f'<{per_sector + 1}I', buffer, self.offset(sector))
+            fat_locations += entries[:per_sector]
+            sector = entries[per_sector]
+        self.fat = self.table(fat_locations[:fat_sectors])
+
+        directory = self.chain_bytes(directory_start)
+        self.entries = {}
+        for position in range(0, len(directory), 128):
+            name_size, entry_type = struct.unpack_from('<HB', directory, position + 64)
+            if entry_type == 0:
+                continue
+            name = bytes(directory[position:position + max(name_size - 2, 0)]).decode('utf-16-le')
+            start, size = struct.unpack_from('<II', directory, position + 116)
+            self.entries.setdefault(name, (entry_type, start, size))
+        root = directory[:128]
+        self.root_start, self.root_size = struct.unpack_from('<II', root, 116)
+        self.minifat_start = minifat_start
+
+    def offset(self, sector):
+        return (sector + 1) * self.sector_size
+
+    def table(self, sectors):
+        entries = []
+        for sector in sectors:
+            if sector in (END_OF_CHAIN, FREE_SECTOR):
+                break
+            entries += struct.unpack_from(f'<{self.sector_size // 4}I', self.buffer, self.offset(sector))
+        return entries
+
+    def chain(self, table, start):
+        sectors, seen = [], set()
+        sector = start
+        while sector < len(table) and sector not in seen:
+            seen.add(sector)
+            sectors.append(sector)
+            sector = table[sector]
+        return sectors
+
+    def chain_bytes(self, start):
+        sectors = self.chain(self.fat, start)
+        return Segments(self.buffer, [(self.offset(s), self.sector_size) for s in sectors]).read(
+            0, len(sectors) * self.sector_size
+        )
+
+    def stream(self, *names):
+        """The first of the named streams as Segments over the file"""
+        for name in names:
+            if name in self.entries and self.entries[name][0] == STREAM_ENTRY:
+                break
+        else:
+            raise ValueError(f"No {' or '.join(names)} stream in the compound file")
+        _, start, size = self.entries[name]
+        if size < self.mini_cutoff:
+            # Small streams live in mini sectors inside the root entry's stream
+            mini_stream = Segments(
+                self.buffer, [(self.offset(s), self.sector_size) for s in self.chain(self.fat, self.root_start)]
+            )
+            minifat = self.table(self.chain(self.fat, self.minifat_start))
+            extents = [(s * self.mini_sector_size, self.mini_sector_size) for s in self.chain(minifat, start)]
+            return Segments(mini_stream, extents).slice(size)
+        extents = [(self.offset(s), self.sector_size) for s in self.chain(self.fat, start)]
+        return Segments(self.buffer, extents).slice(size)
+
+
+
+def biff_records(stream, position=0):
+    """Yield (record type, payload position, payload length) from a BIFF stream"""
+    while position + 4 <= stream.size:
+        record_type, length = struct.unpack('<HH', stream.read(position, 4))
+        yield record_type, position + 4, length
+        position += 4 + length
+
+
+def drawing_extents(stream, position, record_type):
+    """
+    Payload extents of the drawing records of one BIFF substream, with the
+    CONTINUE records that carry on each of them. Together they make one
+    Office Drawing record stream.
+    """
+    extents, continuing = [], False
+    for found, payload, length in biff_records(stream, position):
+        if found == record_type or (found == CONTINUE and continuing):
+            extents.append((payload, length))
+            continuing = True
+        else:
+            continuing = False
+        if found == EOF:
+            break
+    return extents
+
+
+def first_worksheet(stream):
+    """Stream position of the first worksheet's BOF record"""
+    for record_type, payload, length in biff_records(stream):
+        if record_type == BOUNDSHEET:
+            offset, _, sheet_type = struct.unpack('<IBB', stream.read(payload, 6))
+            if sheet_type == 0:
+                return offset
+        elif record_type == EOF:
+            break
+    return None
+
+
+def art_records(drawing, position, end):
+    """Yield (type, instance, version, payload position, length) of the Office Drawing records in a range"""
+    while position + 8 <= end:
+        version_instance, record_type, length = struct.unpack('<HHI', drawing.read(position, 8))
+        yield record_type, version_instance >> 4, version_instance & 0xF, position + 8, length
+        position += 8 + length
+
+
+def blip_store(drawing):
+    """List of (record type, instance, payload position, length) per BLIP store entry; None for empty entries"""
+    blips = []
+
+    def walk(position, end):
+        for record_type, instance, version, payload, length in art_records(drawing, position, end):
+            if record_type == FBSE:
+                name_length = drawing.read(payload + 33, 1)[0]
+                blip_position = payload + 36 + name_length
+                if length > 36 + name_length:
+                    # The picture is embedded after the entry; delayed pictures are not used by Excel
+                    blips.append(next(
+                        (entry[0], entry[1], entry[3], entry[4])
+                        for entry in art_records(drawing, blip_position, payload + length)
+                    ))
+                else:
+                    blips.append(None)
+            elif version == 0xF:
+                walk(payload, payload + length)
+    walk(0, drawing.size)
+    return blips
+
+
+def picture_shapes(drawing):
+    """Yield (BLIP index, anchor) per picture shape; anchor is (row, column, last row, last column)"""
+    def walk(position, end):
+        for record_type, instance, version, payload, length in art_records(drawing, position, end):
+            if record_type == SP_CONTAINER:
+                blip_index, anchor = None, None
+                for child_type, child_instance, _, child_payload, child_length in art_records(
+                    drawing, payload, payload + length
+                ):
+                    if child_type == FOPT:
+                        properties = drawing.read(child_payload, 6 * child_instance)
+                        for index in range(child_instance):
+                            property_id, value = struct.unpack_from('<HI', properties, 6 * index)
+                            if property_id & 0x3FFF == BLIP_PROPERTY:
+                                blip_index = value
+                    elif child_type == CLIENT_ANCHOR and child_length >= 18:
+                        column, _, row, _, last_column, _, last_row, _ = struct.unpack(
+                            '<8H', drawing.read(child_payload + 2, 16)
+                        )
+                        anchor = (row, column, last_row, last_column)
+                if blip_index and anchor:
+                    yield blip_index, anchor
+            elif version == 0xF:
+                yield from walk(payload, payload + length)
+    yield from walk(0, drawing.size)
+
+
+def blip_data(drawing, record_type, instance, position, length):
+    """(kind, picture bytes) for one BLIP; None for unknown BLIP types"""
+    if record_type in BITMAP_BLIPS:
+        kind, two_uids = BITMAP_BLIPS[record_type]
+        header = 16 + (16 if instance in two_uids else 0) + 1
+        data = drawing.read(position + header, length - header)
+        if kind == 'dib':
+            # A DIB is a BMP file without its 14-byte file header
+            info_size = struct.unpack_from('<I', data, 0)[0]
+            bit_count, _, _, _, _, colors_used = struct.unpack_from('<HIIiiI', data, 14)
+            palette = colors_used or (1 << bit_count if bit_count <= 8 else 0)
+            file_header = b'BM' + struct.pack('<IHHI', 14 + len(data), 0, 0, 14 + info_size + 4 * palette)
+            return 'bmp', file_header + bytes(data)
+        return kind, data
+    if record_type in METAFILE_BLIPS:
+        kind, two_uids = METAFILE_BLIPS[record_type]
+        header = 16 + (16 if instance in two_uids else 0) + 34
+        compression = drawing.read(position + header - 2, 1)[0]
+        data = drawing.read(position + header, length - header)
+        return kind, zlib.decompress(data) if compression == 0 else data
+    return None
+
+
+def iter_images(path):
+    """
+    Yield an XlsImage for each picture anchored on the first worksheet, in
+    shape order. Anchors are 0-based, like the reader's row indexes.
+
+    JPEG and PNG data are memoryviews into the mapped file where the picture
+    sits in one piece, and bytes where it straddles sectors or records.
+    """
+    with open(path, 'rb') as f:
+        mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    buffer = memoryview(mapping)
+    try:
+        workbook = OleFile(buffer).stream('Workbook', 'Book')
+        store = Segments(workbook, drawing_extents(workbook, 0, MSODRAWINGGROUP))
+        blips = blip_store(store)
+        sheet_position = first_worksheet(workbook)
+        if sheet_position is None:
+            return
+        drawing = Segments(workbook, drawing_extents(workbook, sheet_position, MSODRAWING))
+        for blip_index, (row, column, last_row, last_column) in picture_shapes(drawing):
+            if blip_index > len(blips) or blips[blip_index - 1] is None:
+                continue
+            picture = blip_data(store, *blips[blip_index - 1])
+            if picture is None:
+                continue
+            kind, data = picture
+            yield XlsImage(row, column, last_row, last_column, kind, data)
+    finally:
+        buffer.release()
+        try:
+            mapping.close()
+        except BufferError:
+            # A caller still holds a picture view; the mapping closes when the last one is collected
+            pass
@@ -0,0 +1,214 @@
+"""
+Append-only change journal for film metadata.
+
+Every save or delete of a person, location, tag, film, chapter or
+association row appends a JournalEntry in the same transaction, so the
+entry id doubles as a monotonically increasing sequence number. Bulk code
+paths (bulk_create, bulk_update, queryset updates) record their own entries
+with one extra insert, muting the per-row signal receivers while they run;
+request handlers wrap their work in batched() so a whole edit costs one insert.
+
+Caches, aggregate tables and search indexes keep a JournalCursor and read
+forward from it with consume(), instead of rebuilding wholesale.
+"""
+import contextvars
+from contextlib import contextmanager
+from datetime import timedelta
+from django.db import transaction
+from django.db.models import Max, Min
+from django.utils import timezone
+from .models import (
+    Person, Location, Tag, Film, Chapter,
+    FilmPeople, FilmLocations, FilmTags,
+    ChapterPeople, ChapterLocations, ChapterTags,
+    JournalEntry, JournalCursor,
+)
+
+# association model -> (owner column, target column)
+ASSOCIATIONS = {
+    FilmPeople: ('film_id', 'person_id'),
+    FilmLocations: ('film_id', 'location_id'),
+    FilmTags: ('film_id', 'tag_id'),
+    ChapterPeople: ('chapter_id', 'person_id'),
+    ChapterLocations: ('chapter_id', 'location_id'),
+    ChapterTags: ('chapter_id', 'tag_id'),
+}
+TRACKED_MODELS = (Person, Location, Tag, Film, Chapter) + tuple(ASSOCIATIONS)
+
+_muted = contextvars.ContextVar('journal_muted', default=False)
+_buffer = contextvars.ContextVar('journal_buffer', default=None)
+
+
+@contextmanager
+def muted():
+    """Silence the signal receivers while a bulk path records its own entries"""
+    token = _muted.set(True)
+    try:
+        yield
+    finally:
+        _muted.reset(token)
+
+
+def is_muted():
+    return _muted.get()
+
+
+@contextmanager
+def batched():
+    """Collect entries recorded inside the block and write them with one insert on exit"""
+    if _buffer.get() is not None:
+        yield
+        return
+    buffer = []
+    token = _buffer.set(buffer)
+    try:
+        yield
+    finally:
+        _buffer.reset(token)
+    record(buffer)
+
+
+def association_entry(model, owner_id, target_id, action):
+    """Journal entry for an association row, keyed owner:target"""
+    owner_field, target_field = ASSOCIATIONS[model]
+    entry = JournalEntry(
+        model=model._meta.model_name,
+        object_id=f'{owner_id}:{target_id}',
+        action=action,
+        data={owner_field: owner_id, target_field: target_id},
+    )
+    if owner_field == 'film_id':
+        entry.film_id = owner_id
+    else:
+        entry.chapter_id = owner_id
+    return entry
+
+
+def instance_entry(instance, action, fields=None):
+    """Journal entry for a saved or deleted model instance"""
+    model = type(instance)
+    if model in ASSOCIATIONS:
+        owner_field, target_field = ASSOCIATIONS[model]
+        entry = association_entry(model, getattr(instance, owner_field), getattr(instance, target_field), action)
+        if owner_field == 'chapter_id' and model._meta.get_field('chapter').is_cached(instance):
+            # Admin inlines and chapter.people.add() already hold the chapter
+            entry.film_id = instance.chapter.film_id
+        return entry
+
+    entry = JournalEntry(model=model._meta.model_name, object_id=str(instance.pk), action=action)
+    if model is Film:
+        entry.film_id = instance.pk
+    elif model is Chapter:
+        entry.chapter_id = instance.pk
+        entry.film_id = instance.film_id
+    if fields:
+        entry.data = {'fields': sorted(fields)}
+    return entry
+
+
+def update_entries(model, pks, fields, film_ids=None):
+    """Entries for rows changed by bulk_update or a queryset update"""
+    film_ids = film_ids or {}
+    entries = []
+    for pk in pks:
+        entry = JournalEntry(model=model._meta.model_name, object_id=str(pk), action='update',
+                             data={'fields': sorted(fields)})
+        if model is Film:
+            entry.film_id = pk
+        elif model is Chapter:
+            entry.chapter_id = pk
+            entry.film_id = film_ids.get(pk)
+        entries.append(entry)
+    return entries
+
+
+def record(entries):
+    """Append entries with one insert; returns how many were written"""
+    entries = list(entries)
+    buffer = _buffer.get()
+    if buffer is not None:
+        buffer.extend(entries)
+    elif entries:
+        JournalEntry.objects.bulk_create(entries)
+    return len(entries)
+
+
+def latest_sequence():
+    return JournalEntry.objects.aggregate(Max('id'))['id__max'] or 0
+
+
+def pending_changes(after, limit=1000, settle_seconds=0):
+    """
+    Entries with a sequence number above `after`, oldest first.
+
+    Ids are allocated when a row is inserted, so a long transaction can
+    commit an entry below a sequence another consumer has already passed.
+    Consumers that cannot tolerate that pass settle_seconds to stay behind
+    the newest writes.
+    """
+    entries = JournalEntry.objects.filter(id__gt=after)
+    if settle_seconds:
+        entries = entries.filter(created_at__lte=timezone.now() - timedelta(seconds=settle_seconds))
+    return list(entries[:limit])
+
+
+def consume(consumer, handler, batch_size=1000, settle_seconds=0):
+    """
+    Feed unseen entries to handler(entries) in batches, advancing the
+    consumer's cursor in the same transaction as each batch.
+
+    Returns the number of entries processed. If the handler raises, the
+    cursor stays where it was and the batch is delivered again next time.
+    """
+    processed = 0
+    while True:
+        with transaction.atomic():
+            JournalCursor.objects.get_or_create(name=consumer)
+            cursor = JournalCursor.objects.select_for_update().get(name=consumer)
+            entries = pending_changes(cursor.sequence, batch_size, settle_seconds)
+            if not entries:
+                return processed
+            handler(entries)
+            cursor.sequence = entries[-1].id
+            cursor.save(update_fields=['sequence', 'updated_at'])
+        processed += len(entries)
+
+
+def affected_film_ids(entries):
+    """Films touched by a batch of entries, resolving chapter-only entries in one query"""
+    film_ids = {entry.film_id for entry in entries if entry.film_id}
+    chapter_ids = {entry.chapter_id for entry in entries if entry.chapter_id and not entry.film_id}
+    if chapter_ids:
+        film_ids.update(Chapter.objects.filter(id__in=chapter_ids).values_list('film_id', flat=True))
+    return film_ids
+
+
+def compact(keep_days=30, collapse=False, dry_run=False):
+    """
+    Remove journal entries no consumer still needs.
+
+    Entries older than keep_days that every cursor has passed are deleted.
+    With collapse, unread entries are reduced to the newest one per object:
+    consumers only need to know an object changed, and the newest entry
+    sits at or after any sequence number a cursor could be waiting on.
+    Returns (deleted, collapsed) counts.
+    """
+    horizon = JournalCursor.objects.aggregate(Min('sequence'))['sequence__min']
+    expired = JournalEntry.objects.filter(created_at__lt=timezone.now() - timedelta(days=keep_days))
+    if horizon is not None:
+        expired = expired.filter(id__lte=horizon)
+
+    superseded = JournalEntry.objects.none()
+    if collapse:
+        newest = (
+            JournalEntry.objects.filter(id__gt=horizon or 0)
+            .values('model', 'object_id').annotate(newest=Max('id')).values('newest')
+        )
+        superseded = JournalEntry.objects.filter(id__gt=horizon or 0).exclude(id__in=newest)
+
+    if dry_run:
+        return expired.count(), superseded.count()
+    with transaction.atomic():
+        deleted = expired.delete()[0]
+        collapsed = superseded.delete()[0] if collapse else 0
+    return deleted, collapsed
@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand, CommandError
+from main.journal import compact, latest_sequence
+from main.models import JournalEntry, JournalCursor
+
+
+class Command(BaseCommand):
+    help = 'Remove change journal entries that every consumer has already processed'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--keep-days',
+            type=int,
+            default=30,
+            help='Keep entries newer than this many days even if all consumers have read them (default 30)'
+        )
+        parser.add_argument(
+            '--collapse',
+            action='store_true',
+            help='Also reduce unread entries to the newest one per object'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Report what would be removed without deleting anything'
+        )
+
+    def handle(self, *args, **options):
+        if options['keep_days'] < 0:
+            raise CommandError('--keep-days cannot be negative')
+
+        self.stdout.write(f'Journal entries: {JournalEntry.objects.count()} (latest sequence {latest_sequence()})')
+        for cursor in JournalCursor.objects.all():
+            self.stdout.write(f'  Consumer {cursor.name} at sequence {cursor.sequence}')
+
+        deleted, collapsed = compact(
+            keep_days=options['keep_days'],
+            collapse=options['collapse'],
+            dry_run=options['dry_run'],
+        )
+
+        prefix = 'Would remove' if options['dry_run'] else 'Removed'
+        self.stdout.write(self.style.SUCCESS(f'{prefix} {deleted} processed entries'))
+        if options['collapse']:
+            self.stdout.write(self.style.SUCCESS(f'{prefix} {collapsed} superseded entries'))
@@ -1,11 +1,15 @@
 import json
+import os
 import re
 import subprocess
+from urllib.parse import parse_qs, urlparse
 from django.core.management.base import BaseCommand, CommandError
+from django.conf import settings
+from main.youtube_api import API_URL, API_WORKERS, YouTubeAPIError, YouTubeClient, parse_duration
 
 
 class Command(BaseCommand):
-    help = 'Fetch YouTube video descriptions using yt-dlp (no API key required)'
+    help = 'Fetch YouTube video descriptions using yt-dlp, or the YouTube Data API when given a key'
 
     def add_arguments(self, parser):
         parser.add_argument(
@@ -31,6 +35,29 @@ class Command(BaseCommand):
             default='youtube_descriptions.json',
             help='Output file for video descriptions'
         )
+        parser.add_argument(
+            '--api-key',
+            type=str,
+            help='YouTube Data API key (or set YOUTUBE_API_KEY); without one, yt-dlp is used'
+        )
+        parser.add_argument(
+            '--api-url',
+            type=str,
+            default=API_URL,
+            help='Base URL of the YouTube Data API (default: %(default)s)'
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=API_WORKERS,
+            help='Concurrent videos.list requests when using the API (default: %(default)s)'
+        )
+        parser.add_argument(
+            '--cache',
+            type=str,
+            default=os.path.join(settings.BASE_DIR, 'cache', 'youtube_api.json'),
+            help='API responses are kept with their ETags and only downloaded again if they changed'
+        )
 
     def handle(self, *args, **options):
         video_ids = options['video_ids']
@@ -38,6 +65,17 @@ class Command(BaseCommand):
         fetch_all = options['fetch_all']
         output_file = options['output_file']
 
+        api_key = options['api_key'] or os.environ.get('YOUTUBE_API_KEY')
+
+        if not fetch_all and not video_ids:
+            raise CommandError('Provide video IDs/URLs or use --fetch-all')
+
+        if api_key:
+            videos_data = self.fetch_with_api(api_key, video_ids, playlist_url, fetch_all, options)
+            self.process_videos(videos_data)
+            self.save(videos_data, output_file)
+            return
+
         # Check if yt-dlp is available
         if not self.check_ytdlp():
             return
@@ -61,13 +99,12 @@ class Command(BaseCommand):
                 video_info = self.fetch_video_metadata(video_url)
                 if video_info:
                     videos_data.append(video_info)
-        else:
-            raise CommandError('Provide video IDs/URLs or use --fetch-all')
 
         # Process and display results
         self.process_videos(videos_data)
+        self.save(videos_data, output_file)
 
-        # Save to file
+    def save(self, videos_data, output_file):
         with open(output_file, 'w', encoding='utf-8') as f:
             json.dump(videos_data, f, indent=2, ensure_ascii=False)
 
@@ -75,6 +112,53 @@ class Command(BaseCommand):
             f'\nSaved metadata for {len(videos_data)} videos to {output_file}'
         ))
 
+    def fetch_with_api(self, api_key, video_ids, playlist_url, fetch_all, options):
+        """Fetch metadata through the YouTube Data API, 50 videos to a request"""
+        if options['workers'] < 1:
+            raise CommandError('--workers must be at least 1')
+        client = YouTubeClient(api_key, api_url=options['api_url'], workers=options['workers'],
+                               cache_path=options['cache'])
+        with client:
+            try:
+                if fetch_all:
+                    playlist_id = parse_qs(urlparse(playlist_url).query).get('list', [playlist_url])[0]
+                    self.stdout.write(f'Fetching all videos from playlist {playlist_id}...')
+                    video_ids = client.playlist_video_ids(playlist_id)
+                else:
+                    video_ids = [self.video_id(video) for video in video_ids]
+                items = client.videos(video_ids, part='snippet,contentDetails,statistics')
+            except YouTubeAPIError as e:
+                raise CommandError(f'API request failed: {e}')
+        self.stdout.write(client.summary())
+        return [self.api_video_info(item) for item in items]
+
+    def video_id(self, video):
+        """Video ID of an ID or a watch/youtu.be URL"""
+        if not video.startswith('http'):
+            return video
+        url = urlparse(video)
+        if url.netloc.endswith('youtu.be'):
+            return url.path.lstrip('/')
+        return parse_qs(url.query).get('v', [video])[0]
+
+    def api_video_info(self, item):
+        """The same fields as fetch_video_metadata reads from yt-dlp, from an API video resource"""
+        snippet = item['snippet']
+        duration = parse_duration(item.get('contentDetails', {}).get('duration'))
+        view_count = item.get('statistics', {}).get('viewCount')
+        video_info = {
+            'video_id': item['id'],
+            'title': snippet.get('title'),
+            'description': snippet.get('description', ''),
+            'duration': int(duration.total_seconds()) if duration else None,
+            'upload_date': snippet.get('publishedAt', '')[:10].replace('-', '') or None,
+            'uploader': snippet.get('channelTitle'),
+            'view_count': int(view_count) if view_count else None,
+            'url': f'https://www.youtube.com/watch?v={item["id"]}'
+        }
+        self.add_description_fields(video_info)
+        return video_info
+
     def check_ytdlp(self):
         """Check if yt-dlp is available"""
         try:
@@ -124,18 +208,7 @@ class Command(BaseCommand):
                 'url': data.get('webpage_url')
             }
             
-            # Extract File ID from description
-            file_id_match = re.search(r'File ID:\s*([^\s\n]+)', 
-                                    video_info['description'], re.IGNORECASE)
-            if file_id_match:
-                video_info['file_id'] = file_id_match.group(1).strip()
-            
-            # Extract other metadata
-            video_info['chapters'] = self.extract_chapters(video_info['description'])
-            video_info['people'] = self.extract_field(video_info['description'], 'People')
-            video_info['years'] = self.extract_field(video_info['description'], 'Years')
-            video_info['locations'] = self.extract_field(video_info['description'], 'Locations')
-            
+            self.add_description_fields(video_info)
             return video_info
             
         except subprocess.CalledProcessError as e:
@@ -145,6 +218,20 @@ class Command(BaseCommand):
             self.stdout.write(self.style.ERROR(f'Failed to parse JSON: {e}'))
             return None
 
+    def add_description_fields(self, video_info):
+        """File ID, chapters, people, years and locations parsed from the description"""
+        # Extract File ID from description
+        file_id_match = re.search(r'File ID:\s*([^\s\n]+)', 
+                                video_info['description'], re.IGNORECASE)
+        if file_id_match:
+            video_info['file_id'] = file_id_match.group(1).strip()
+        
+        # Extract other metadata
+        video_info['chapters'] = self.extract_chapters(video_info['description'])
+        video_info['people'] = self.extract_field(video_info['description'], 'People')
+        video_info['years'] = self.extract_field(video_info['description'], 'Years')
+        video_info['locations'] = self.extract_field(video_info['description'], 'Locations')
+
     def fetch_playlist_metadata(self, playlist_url):
         """Fetch metadata for all videos in a playlist"""
         try:
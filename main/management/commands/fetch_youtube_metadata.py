@@ -1,9 +1,9 @@
 import os
 import json
 import re
-import requests
 from django.core.management.base import BaseCommand, CommandError
 from django.conf import settings
+from main.youtube_api import API_URL, API_WORKERS, YouTubeAPIError, YouTubeClient
 
 
 class Command(BaseCommand):
@@ -38,6 +38,29 @@ class Command(BaseCommand):
             default='youtube_metadata.json',
             help='Output file for video metadata'
         )
+        parser.add_argument(
+            '--api-url',
+            type=str,
+            default=API_URL,
+            help='Base URL of the YouTube Data API (default: %(default)s)'
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=API_WORKERS,
+            help='Concurrent videos.list requests (default: %(default)s)'
+        )
+        parser.add_argument(
+            '--cache',
+            type=str,
+            default=os.path.join(settings.BASE_DIR, 'cache', 'youtube_api.json'),
+            help='Responses are kept with their ETags and only downloaded again if they changed'
+        )
+        parser.add_argument(
+            '--quota-budget',
+            type=int,
+            help='Stop before spending more than this many API quota units'
+        )
 
     def handle(self, *args, **options):
         video_ids = options['video_ids']
@@ -53,17 +76,26 @@ class Command(BaseCommand):
             ))
             return
 
-        if fetch_all:
-            # Fetch all videos from playlist
-            videos_data = self.fetch_playlist_videos(playlist_id, api_key)
-        elif video_ids:
-            # Fetch specific videos
-            videos_data = self.fetch_videos_by_id(video_ids, api_key)
-        else:
+        if not fetch_all and not video_ids:
             raise CommandError('Provide video IDs or use --fetch-all to get entire playlist')
+        if options['workers'] < 1:
+            raise CommandError('--workers must be at least 1')
+
+        client = YouTubeClient(
+            api_key, api_url=options['api_url'], workers=options['workers'],
+            cache_path=options['cache'], quota_budget=options['quota_budget'],
+        )
+        with client:
+            if fetch_all:
+                # Fetch all videos from playlist
+                videos_data = self.fetch_playlist_videos(client, playlist_id)
+            else:
+                # Fetch specific videos
+                videos_data = self.fetch_videos_by_id(client, video_ids)
 
         # Extract File IDs from descriptions
         self.process_video_metadata(videos_data)
+        self.stdout.write(f'\n{client.summary()}')
 
         # Save to file
         with open(output_file, 'w', encoding='utf-8') as f:
@@ -73,84 +105,34 @@ class Command(BaseCommand):
             f'Saved metadata for {len(videos_data)} videos to {output_file}'
         ))
 
-    def fetch_videos_by_id(self, video_ids, api_key):
-        """Fetch video metadata for specific video IDs"""
+    def fetch_videos_by_id(self, client, video_ids):
+        """Fetch video metadata for specific video IDs, 50 to a request"""
         videos_data = []
-        
-        # YouTube API allows up to 50 video IDs per request
-        chunk_size = 50
-        for i in range(0, len(video_ids), chunk_size):
-            chunk = video_ids[i:i + chunk_size]
-            
-            url = 'https://www.googleapis.com/youtube/v3/videos'
-            params = {
-                'part': 'snippet,contentDetails,statistics',
-                'id': ','.join(chunk),
-                'key': api_key
-            }
-            
-            try:
-                response = requests.get(url, params=params)
-                response.raise_for_status()
-                data = response.json()
-                
-                for item in data.get('items', []):
-                    video_info = self.extract_video_info(item)
-                    videos_data.append(video_info)
-                    
-                    # Display progress
-                    self.stdout.write(f'Fetched: {video_info["video_id"]} - {video_info["title"][:60]}...')
-                    if video_info.get('file_id'):
-                        self.stdout.write(self.style.SUCCESS(f'  File ID: {video_info["file_id"]}'))
-                    else:
-                        self.stdout.write(self.style.WARNING('  No File ID found in description'))
-                    
-            except requests.RequestException as e:
-                raise CommandError(f'API request failed: {e}')
-        
+        try:
+            items = client.videos(video_ids)
+        except YouTubeAPIError as e:
+            raise CommandError(f'API request failed: {e}')
+
+        for item in items:
+            video_info = self.extract_video_info(item)
+            videos_data.append(video_info)
+
+            # Display progress
+            self.stdout.write(f'Fetched: {video_info["video_id"]} - {video_info["title"][:60]}...')
+            if video_info.get('file_id'):
+                self.stdout.write(self.style.SUCCESS(f'  File ID: {video_info["file_id"]}'))
+            else:
+                self.stdout.write(self.style.WARNING('  No File ID found in description'))
+
         return videos_data
 
-    def fetch_playlist_videos(self, playlist_id, api_key):
+    def fetch_playlist_videos(self, client, playlist_id):
         """Fetch all videos from a playlist"""
-        videos_data = []
-        next_page_token = None
-        
-        while True:
-            url = 'https://www.googleapis.com/youtube/v3/playlistItems'
-            params = {
-                'part': 'snippet',
-                'playlistId': playlist_id,
-                'key': api_key,
-                'maxResults': 50
-            }
-            
-            if next_page_token:
-                params['pageToken'] = next_page_token
-            
-            try:
-                response = requests.get(url, params=params)
-                response.raise_for_status()
-                data = response.json()
-                
-                # Get video IDs from playlist items
-                video_ids = []
-                for item in data.get('items', []):
-                    video_id = item['snippet']['resourceId']['videoId']
-                    video_ids.append(video_id)
-                
-                # Fetch full video details
-                if video_ids:
-                    batch_data = self.fetch_videos_by_id(video_ids, api_key)
-                    videos_data.extend(batch_data)
-                
-                next_page_token = data.get('nextPageToken')
-                if not next_page_token:
-                    break
-                    
-            except requests.RequestException as e:
-                raise CommandError(f'API request failed: {e}')
-        
-        return videos_data
+        try:
+            video_ids = client.playlist_video_ids(playlist_id)
+        except YouTubeAPIError as e:
+            raise CommandError(f'API request failed: {e}')
+        return self.fetch_videos_by_id(client, video_ids)
 
     def extract_video_info(self, item):
         """Extract relevant information from video data"""
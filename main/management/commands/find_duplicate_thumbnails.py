@@ -0,0 +1,171 @@
+import os
+import time
+from itertools import combinations, product
+from django.core.management.base import BaseCommand, CommandError
+from django.conf import settings
+from main.derivatives import static_file
+from main.importing.image_store import ImageStore
+from main.models import Film, Chapter
+from main.perceptual_hash import (
+    MAX_DISTANCE, PHASH_MAX_DISTANCE, BKTree, HashCache, hamming, hash_paths, near_duplicate_pairs,
+)
+
+
+def label(chapter):
+    return f'{chapter.film.file_id} #{chapter.order} "{chapter.title}"'
+
+
+def sheet_film(name, file_ids):
+    """File ID of the film a chapter sheet belongs to: the longest one its name starts with"""
+    return next((file_id for file_id in file_ids if name.startswith(file_id)), None)
+
+
+class Command(BaseCommand):
+    help = 'Report chapter thumbnails that look like duplicates or belong to another film, by perceptual hash'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--threshold',
+            type=int,
+            default=MAX_DISTANCE,
+            help='Bits of the 64-bit dHash that may differ between copies of one picture (default: %(default)s)'
+        )
+        parser.add_argument(
+            '--store',
+            type=str,
+            help='Image store of pictures extracted from the chapter sheets (xls_image_extractor.py --store); '
+                 'reports chapters whose thumbnail is on another film\'s sheet'
+        )
+        parser.add_argument(
+            '--cache',
+            type=str,
+            default=os.path.join(settings.BASE_DIR, 'cache', 'perceptual_hashes.json'),
+            help='File hashes are kept in between runs'
+        )
+        parser.add_argument(
+            '--rehash',
+            action='store_true',
+            help='Hash every image again instead of using the cache'
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=os.cpu_count() or 1,
+            help='Processes used to hash images (default: CPU count; 1 hashes in-process)'
+        )
+
+    def handle(self, *args, **options):
+        if options['workers'] < 1:
+            raise CommandError('--workers must be at least 1')
+        threshold = options['threshold']
+        static_dir = os.path.join(settings.BASE_DIR, 'static')
+
+        # Chapters by the file their thumbnail is served from; YouTube thumbnails are not ours to check
+        files, remote = {}, 0
+        chapters = Chapter.objects.select_related('film').exclude(thumbnail_url='').order_by('film__file_id', 'order', 'id')
+        for chapter in chapters:
+            path = static_file(chapter.thumbnail_url, settings.STATIC_URL, static_dir)
+            if path is None:
+                remote += 1
+            else:
+                files.setdefault(path, []).append(chapter)
+
+        pictures = self.sheet_pictures(options['store']) if options['store'] else {}
+
+        start = time.monotonic()
+        cache = HashCache(options['cache'])
+        if options['rehash']:
+            cache.entries.clear()
+        hashes, cached = hash_paths(sorted(set(files) | set(pictures)), cache, options['workers'])
+        cache.save()
+        self.stdout.write(
+            f'Hashed {len(hashes) - cached} images ({cached} from the cache) in {time.monotonic() - start:.2f}s'
+        )
+
+        unreadable = [path for path in files if 'error' in hashes[path]]
+        usable = [path for path in sorted(files) if 'error' not in hashes[path] and not hashes[path]['flat']]
+        flat = sum(1 for path in files if 'error' not in hashes[path] and hashes[path]['flat'])
+
+        # One file on several chapters, then different files showing the same picture
+        same_film, other_film = [], []
+        for path, path_chapters in files.items():
+            for a, b in combinations(path_chapters, 2):
+                (same_film if a.film_id == b.film_id else other_film).append((a, b, 'same file'))
+        for i, j, distance in near_duplicate_pairs([hashes[path] for path in usable], threshold):
+            for pair in product(files[usable[i]], files[usable[j]]):
+                a, b = sorted(pair, key=lambda chapter: (chapter.film.file_id, chapter.order, chapter.id))
+                (same_film if a.film_id == b.film_id else other_film).append((a, b, f'{distance} bits apart'))
+
+        self.report('Same picture on chapters of different films', other_film)
+        self.report('Same picture on different chapters of one film', same_film)
+
+        wrong_sheet = self.match_sheets(files, usable, hashes, pictures, threshold) if pictures else []
+        if wrong_sheet:
+            self.stdout.write(f"\n=== Chapter thumbnails found only on another film's sheet ({len(wrong_sheet)}) ===")
+            for chapter, distance, picture in wrong_sheet:
+                self.stdout.write(
+                    f"  {label(chapter)}: {picture['sheet']} row {picture['row']} "
+                    f"(film {picture['film']}), {distance} bits apart"
+                )
+        if unreadable:
+            self.stdout.write(f'\n=== Unreadable thumbnails ({len(unreadable)}) ===')
+            for path in unreadable:
+                self.stdout.write(f"  {os.path.relpath(path, static_dir)}: {hashes[path]['error']}")
+
+        self.stdout.write('\n=== SUMMARY ===')
+        self.stdout.write(f'Thumbnail files: {len(files)} on {sum(map(len, files.values()))} chapters')
+        self.stdout.write(f'Not under static (skipped): {remote}')
+        self.stdout.write(f'Flat images (not compared): {flat}')
+        self.stdout.write(f'Unreadable: {len(unreadable)}')
+        if pictures:
+            self.stdout.write(f'Sheet pictures indexed: {len(pictures)}')
+        self.stdout.write(f'Pairs across films: {len(other_film)}')
+        self.stdout.write(f'Pairs within a film: {len(same_film)}')
+        if pictures:
+            self.stdout.write(f"Chapters matching only another film's sheet: {len(wrong_sheet)}")
+
+    def report(self, title, pairs):
+        if not pairs:
+            return
+        self.stdout.write(f'\n=== {title} ({len(pairs)}) ===')
+        for a, b, how in pairs:
+            self.stdout.write(f'  {label(a)} <-> {label(b)}: {how}')
+
+    def sheet_pictures(self, store_dir):
+        """{path: [{sheet, row, film}]} for the pictures of every sheet in the store"""
+        store = ImageStore(store_dir)
+        file_ids = sorted(Film.objects.values_list('file_id', flat=True), key=len, reverse=True)
+        pictures = {}
+        for name, sheet in sorted(store.manifest['sheets'].items()):
+            film = sheet_film(name, file_ids)
+            for image in sheet['images']:
+                pictures.setdefault(str(store.root / image['file']), []).append(
+                    {'sheet': name, 'row': image['row'], 'film': film}
+                )
+        return pictures
+
+    def match_sheets(self, files, usable, hashes, pictures, threshold):
+        """
+        (chapter, distance, picture) for chapters whose thumbnail matches
+        pictures on other films' sheets but none on their own film's
+        """
+        tree = BKTree()
+        for path in sorted(pictures):
+            if 'error' not in hashes[path] and not hashes[path]['flat']:
+                tree.add(hashes[path]['dhash'], path)
+
+        matches = []
+        for path in usable:
+            found = [
+                (distance, picture)
+                for distance, match in tree.search(hashes[path]['dhash'], threshold)
+                if hamming(hashes[path]['phash'], hashes[match]['phash']) <= PHASH_MAX_DISTANCE
+                for picture in pictures[match]
+            ]
+            for chapter in files[path]:
+                own = [picture for _, picture in found if picture['film'] == chapter.film.file_id]
+                other = [(distance, picture) for distance, picture in found
+                         if picture['film'] not in (None, chapter.film.file_id)]
+                if other and not own:
+                    matches.append((chapter, *other[0]))
+        return matches
@@ -1,11 +1,20 @@
 import os
-import tempfile
-from datetime import timedelta
-from django.core.management.base import BaseCommand
+import time
+from functools import partial
+from django.core.management.base import BaseCommand, CommandError
 from django.conf import settings
+from django.db import transaction
+from django.db.models import Prefetch
+from main import journal
 from main.models import Film, Chapter
-from PIL import Image, ImageDraw, ImageFont
-import textwrap
+from main.importing.state import FILE_KEY, ImportStateTracker
+from main.rendering import render_all
+from main.sprites import job_hash, render_sprite, sprite_exists, sprite_job
+
+SPRITE_FIELDS = [
+    'preview_sprite_url', 'preview_frame_count', 'preview_frame_interval',
+    'preview_sprite_width', 'preview_sprite_height',
+]
 
 
 class Command(BaseCommand):
@@ -21,241 +30,136 @@ class Command(BaseCommand):
         parser.add_argument(
             '--force',
             action='store_true',
-            help='Regenerate thumbnails even if they already exist'
+            help='Regenerate thumbnails even if their chapters, palette and size are unchanged'
         )
         parser.add_argument(
             '--cleanup-old',
             action='store_true',
             help='Remove old individual chapter thumbnails'
         )
+        parser.add_argument(
+            '--output-dir',
+            type=str,
+            default=os.path.join(settings.BASE_DIR, 'static', 'thumbnails', 'previews'),
+            help='Directory the per-film sprite sheets are written to'
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=os.cpu_count() or 1,
+            help='Processes used to render frames (default: CPU count; 1 renders in-process)'
+        )
 
     def handle(self, *args, **options):
-        # Create thumbnails directory if it doesn't exist
-        previews_dir = os.path.join(settings.BASE_DIR, 'static', 'thumbnails', 'previews')
+        if options['workers'] < 1:
+            raise CommandError('--workers must be at least 1')
+        previews_dir = options['output_dir']
         os.makedirs(previews_dir, exist_ok=True)
 
         # Cleanup old chapter thumbnails if requested
         if options['cleanup_old']:
             self.cleanup_old_thumbnails()
 
-        # Get films to process
+        # Get films to process, with their chapters in one extra query
+        films = Film.objects.prefetch_related(Prefetch('chapters', queryset=Chapter.objects.order_by('order')))
         if options['file_ids']:
-            films = Film.objects.filter(file_id__in=options['file_ids'])
-        else:
-            films = Film.objects.all()
+            films = films.filter(file_id__in=options['file_ids'])
+        films = {film.file_id: film for film in films}
+        self.stdout.write(f'Processing {len(films)} films...')
 
-        self.stdout.write(f'Processing {films.count()} films...')
+        # A film is redrawn only when the hash of everything its frames are drawn from changed
+        state = ImportStateTracker('sprites', options['force'])
+        state.load(*films)
+        jobs, skipped = [], 0
+        for film in films.values():
+            chapters = film.chapters.all()
+            job = sprite_job(film.file_id, film.title, [
+                (chapter.title, chapter.start_time, chapter.order) for chapter in chapters
+            ], self.chapter_images(chapters))
+            digest = job_hash(job)
+            if not state.changed(film.file_id, FILE_KEY, digest, count=False) and sprite_exists(job, previews_dir):
+                skipped += 1
+                continue
+            jobs.append((job, digest))
 
-        # Define color palette for text thumbnails (same as generate_text_thumbnails)
-        self.colors = [
-            '#FF6B6B',  # Soft red
-            '#4ECDC4',  # Teal
-            '#45B7D1',  # Sky blue
-            '#96CEB4',  # Mint green
-            '#F7DC6F',  # Soft yellow
-            '#BB8FCE',  # Lavender
-            '#85C1E9',  # Light blue
-            '#F8B500',  # Orange
-            '#6C5CE7',  # Purple
-            '#A8E6CF',  # Pale green
-            '#FFD93D',  # Golden yellow
-            '#FF8B94',  # Coral
-        ]
+        start = time.monotonic()
+        results = []
+        for result in self.render(jobs, previews_dir, options['workers']):
+            film, digest = films[result['file_id']], result.pop('digest')
+            if result['error']:
+                self.stdout.write(f'  ✗ Failed to generate frames for {film.file_id}: {result["error"]}')
+                continue
+            self.stdout.write(
+                f'  ✓ Packed {result["frame_count"]} frames into a {result["columns"]}-column sprite sheet '
+                f'for {film.file_id} in {result["seconds"]:.2f}s'
+            )
+            # The JPEG fallback sits next to the WebP sheet; Film.preview_sprite_columns gives the grid
+            film.preview_sprite_url = f'/static/thumbnails/previews/{film.file_id}_sprite.webp'
+            film.preview_frame_count = result['frame_count']
+            film.preview_frame_interval = result['interval']
+            film.preview_sprite_width = result['width']
+            film.preview_sprite_height = result['height']
+            state.mark(film.file_id, FILE_KEY, digest)
+            results.append(result)
+        elapsed = time.monotonic() - start
 
-        success_count = 0
-        error_count = 0
-
-        for film in films:
-            self.stdout.write(f'Processing film: {film.title} ({film.file_id})')
-            
-            try:
-                success = self.generate_sprite_thumbnail(film, previews_dir, options['force'])
-                if success:
-                    success_count += 1
-                else:
-                    error_count += 1
-            except Exception as e:
-                error_count += 1
-                self.stdout.write(f'  Error generating sprite for {film.file_id}: {e}')
+        rendered = [films[result['file_id']] for result in results]
+        with transaction.atomic():
+            Film.objects.bulk_update(rendered, SPRITE_FIELDS)
+            journal.record(journal.instance_entry(film, 'update', SPRITE_FIELDS) for film in rendered)
+            state.save()
 
+        error_count = len(jobs) - len(results)
         self.stdout.write('\n=== SUMMARY ===')
-        self.stdout.write(f'Successfully generated: {success_count} sprite thumbnails')
+        self.stdout.write(f'Successfully generated: {len(results)} sprite thumbnails')
+        self.stdout.write(f'Unchanged and skipped: {skipped}')
         if error_count > 0:
             self.stdout.write(self.style.WARNING(f'Errors: {error_count}'))
+        render_seconds = sum(result['seconds'] for result in results)
+        self.stdout.write(
+            f'Rendered {len(results)} films in {elapsed:.2f}s with {options["workers"]} worker(s); '
+            f'render {render_seconds:.2f}s (summed over workers)'
+        )
+        if results:
+            self.compare_previews(results)
 
-    def generate_sprite_thumbnail(self, film, previews_dir, force=False):
-        """Generate individual frame images for a film using text-based frames"""
-        # Create film-specific directory for frames
-        film_frames_dir = os.path.join(previews_dir, film.file_id)
-        os.makedirs(film_frames_dir, exist_ok=True)
-        
-        # Check if frames already exist unless force is True
-        if not force:
-            existing_frames = [f for f in os.listdir(film_frames_dir) if f.endswith('.jpg')]
-            if existing_frames:
-                self.stdout.write(f'  ⏭ Frames already exist for {film.file_id}')
-                return True
-        
-        chapters = film.chapters.all().order_by('order')
-        
-        # Determine content for frame generation
-        if chapters.exists():
-            # Use chapters for frames
-            frame_data = []
-            for chapter in chapters:
-                frame_data.append({
-                    'title': chapter.title,
-                    'timestamp': chapter.start_time,
-                    'subtitle': f"Chapter {chapter.order}",
-                    'color_index': chapter.order - 1
-                })
-            frame_count = len(frame_data)
-            
-            # If we have many chapters, limit to key ones
-            if frame_count > 8:
-                # Take every nth chapter to get around 6-8 frames
-                step = max(1, frame_count // 6)
-                frame_data = [frame_data[i] for i in range(0, len(frame_data), step)]
-                frame_count = len(frame_data)
-        else:
-            # No chapters - use film title with different time markers
-            frame_data = []
-            for i in range(4):  # Generate 4 frames for films without chapters
-                frame_data.append({
-                    'title': film.title,
-                    'timestamp': f"Part {i+1}",
-                    'subtitle': "Film Preview",
-                    'color_index': i
-                })
-            frame_count = len(frame_data)
-        
-        try:
-            # Generate individual frame images
-            frame_width, frame_height = 160, 90
-            frame_paths = []
-            
-            for i, data in enumerate(frame_data):
-                frame_image = self.create_text_thumbnail(
-                    data['title'],
-                    data['timestamp'],
-                    data['subtitle'],
-                    data['color_index'],
-                    frame_width,
-                    frame_height
-                )
-                
-                # Save individual frame
-                frame_filename = f'frame_{i:02d}.jpg'
-                frame_path = os.path.join(film_frames_dir, frame_filename)
-                frame_image.save(frame_path, 'JPEG', quality=85)
-                frame_image.close()
-                
-                # Store relative path for web serving
-                relative_frame_path = f'/static/thumbnails/previews/{film.file_id}/{frame_filename}'
-                frame_paths.append(relative_frame_path)
-            
-            # Update film with frame info (store as JSON in a text field or use the existing sprite URL field)
-            film.preview_sprite_url = f'/static/thumbnails/previews/{film.file_id}/'  # Directory path
-            film.preview_frame_count = frame_count
-            film.preview_frame_interval = 0.8  # 800ms between frames
-            film.preview_sprite_width = frame_width
-            film.preview_sprite_height = frame_height
-            film.save()
-            
-            self.stdout.write(f'  ✓ Generated {frame_count} individual frames for {film.file_id}')
-            return True
-            
-        except Exception as e:
-            self.stdout.write(f'  ✗ Failed to generate frames for {film.file_id}: {e}')
-            return False
+    def compare_previews(self, results):
+        """Bytes and requests of each way a card can animate its preview, over the films just rendered"""
+        def total(key, films):
+            return f'{sum(result[key] for result in films) / 1024:.0f} KB'
+
+        self.stdout.write(
+            f'Hover previews of {len(results)} films: sprite sheets {total("sheet_bytes", results)}, '
+            f'animated WebP {total("animation_bytes", results)}, one request per film each'
+        )
+        # Only chapter thumbnail frames exist as files a card could load one by one
+        framed = [result for result in results if result['frame_bytes']]
+        if framed:
+            requests = sum(result['frame_count'] for result in framed)
+            self.stdout.write(
+                f'  {len(framed)} films with chapter thumbnail frames: individual frames {total("frame_bytes", framed)} '
+                f'in {requests} requests, sprite sheets {total("sheet_bytes", framed)} '
+                f'and animated WebP {total("animation_bytes", framed)} in {len(framed)} requests each'
+            )
+
+    def render(self, jobs, previews_dir, workers):
+        """Yield render results as films finish, rendering in a process pool"""
+        digests = {job['file_id']: (job, digest) for job, digest in jobs}
+        render = partial(render_sprite, previews_dir=previews_dir)
+        for result in render_all(render, [job for job, _ in jobs], workers):
+            job, digest = digests[result['file_id']]
+            yield dict(result, digest=digest, width=job['width'], height=job['height'], interval=job['interval'])
 
-    def create_text_thumbnail(self, title, timestamp, subtitle="", color_index=0, width=160, height=90):
-        """Create a text-based thumbnail image for sprite frames"""
-        # Select background color
-        bg_color = self.colors[color_index % len(self.colors)]
-        
-        # Create image with colored background
-        img = Image.new('RGB', (width, height), bg_color)
-        draw = ImageDraw.Draw(img)
-        
-        # Try to load a nice font, fall back to default
-        try:
-            # Try common font paths
-            font_paths = [
-                '/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf',
-                '/usr/share/fonts/truetype/liberation/LiberationSans-Bold.ttf',
-                '/System/Library/Fonts/Helvetica.ttc',
-                'C:\\Windows\\Fonts\\Arial.ttf'
-            ]
-            title_font = None
-            for font_path in font_paths:
-                if os.path.exists(font_path):
-                    title_font = ImageFont.truetype(font_path, 12)  # Smaller font for sprite
-                    time_font = ImageFont.truetype(font_path, 14)
-                    subtitle_font = ImageFont.truetype(font_path, 10)
-                    break
-            
-            if not title_font:
-                # Fall back to default font
-                title_font = ImageFont.load_default()
-                time_font = ImageFont.load_default()
-                subtitle_font = ImageFont.load_default()
-        except:
-            title_font = ImageFont.load_default()
-            time_font = ImageFont.load_default()
-            subtitle_font = ImageFont.load_default()
-        
-        # Draw timestamp at the top
-        timestamp_text = str(timestamp)
-        if hasattr(time_font, 'getbbox'):
-            bbox = draw.textbbox((0, 0), timestamp_text, font=time_font)
-            time_width = bbox[2] - bbox[0]
-        else:
-            time_width, _ = draw.textsize(timestamp_text, font=time_font)
-        time_x = (width - time_width) // 2
-        draw.text((time_x, 5), timestamp_text, fill='white', font=time_font)
-        
-        # Draw subtitle if provided
-        if subtitle:
-            if hasattr(subtitle_font, 'getbbox'):
-                bbox = draw.textbbox((0, 0), subtitle, font=subtitle_font)
-                subtitle_width = bbox[2] - bbox[0]
-            else:
-                subtitle_width, _ = draw.textsize(subtitle, font=subtitle_font)
-            subtitle_x = (width - subtitle_width) // 2
-            draw.text((subtitle_x, 25), subtitle, fill='white', font=subtitle_font)
-        
-        # Wrap and draw title text (more aggressively wrapped for small size)
-        wrapped_text = textwrap.fill(title, width=15)
-        lines = wrapped_text.split('\n')
-        
-        # Limit to 2-3 lines for sprite frames
-        if len(lines) > 3:
-            lines = lines[:3]
-            lines[2] = lines[2][:12] + '...' if len(lines[2]) > 12 else lines[2]
-        
-        # Calculate starting Y position to center the text block
-        line_height = 12
-        text_block_height = len(lines) * line_height
-        start_y = (height - text_block_height) // 2 + 10
-        
-        # Draw each line of wrapped text
-        for i, line in enumerate(lines):
-            if hasattr(title_font, 'getbbox'):
-                bbox = draw.textbbox((0, 0), line, font=title_font)
-                text_width = bbox[2] - bbox[0]
-            else:
-                text_width, _ = draw.textsize(line, font=title_font)
-            text_x = (width - text_width) // 2
-            text_y = start_y + i * line_height
-            
-            # Draw text with shadow for better readability
-            shadow_offset = 1
-            draw.text((text_x + shadow_offset, text_y + shadow_offset), line, 
-                     fill='black', font=title_font)
-            draw.text((text_x, text_y), line, fill='white', font=title_font)
-        
-        return img
+    def chapter_images(self, chapters):
+        """Paths of the chapter thumbnails served from the static directory"""
+        static_dir = os.path.join(settings.BASE_DIR, 'static')
+        paths = []
+        for chapter in chapters:
+            if chapter.thumbnail_url.startswith(settings.STATIC_URL):
+                path = os.path.join(static_dir, chapter.thumbnail_url[len(settings.STATIC_URL):])
+                if os.path.isfile(path):
+                    paths.append(path)
+        return paths
 
     def cleanup_old_thumbnails(self):
         """Remove old individual chapter thumbnails"""
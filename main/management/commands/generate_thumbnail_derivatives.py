@@ -0,0 +1,97 @@
+import os
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.conf import settings
+from main.derivatives import FORMATS, WIDTHS, available_formats, relative_to_root, update_derivatives
+
+
+def megabytes(size):
+    return f'{size / (1 << 20):.1f} MB'
+
+
+class Command(BaseCommand):
+    help = 'Write width-stepped AVIF/WebP/JPEG variants of the static thumbnails for srcset and <picture>'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--files',
+            type=str,
+            nargs='+',
+            help='Only these thumbnail files (as written by the extractors and generators)'
+        )
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Rewrite variants even if their source and settings are unchanged'
+        )
+        parser.add_argument(
+            '--widths',
+            type=int,
+            nargs='+',
+            default=list(WIDTHS),
+            help='Variant widths in pixels (default: %(default)s)'
+        )
+        parser.add_argument(
+            '--source-dir',
+            type=str,
+            default=settings.THUMBNAIL_ROOT,
+            help='Directory of source thumbnails'
+        )
+        parser.add_argument(
+            '--output-dir',
+            type=str,
+            default=settings.THUMBNAIL_DERIVATIVES_DIR,
+            help='Directory the variants and manifest.json are written to'
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=os.cpu_count() or 1,
+            help='Processes used to encode variants (default: CPU count; 1 encodes in-process)'
+        )
+
+    def handle(self, *args, **options):
+        if options['workers'] < 1:
+            raise CommandError('--workers must be at least 1')
+        source_dir, output_dir = options['source_dir'], options['output_dir']
+
+        relatives = None
+        if options['files']:
+            # Files outside the thumbnail directory are not served from it
+            relatives = [relative for relative in (relative_to_root(path, source_dir) for path in options['files'])
+                         if relative]
+            if not relatives:
+                self.stdout.write(f'No thumbnails under {source_dir} to derive')
+                return
+        self.stdout.write(f'Formats: {", ".join(available_formats())}; widths: {options["widths"]}')
+
+        def report(result):
+            if result['error']:
+                self.stdout.write(f'  ✗ {result["relative"]}: {result["error"]}')
+            else:
+                variants = sum(len(variants) for variants in result['variants'].values())
+                self.stdout.write(f'  ✓ {result["relative"]}: {variants} variants in {result["seconds"]:.2f}s')
+
+        start = time.monotonic()
+        manifest, results, skipped = update_derivatives(
+            source_dir, output_dir, relatives, force=options['force'], workers=options['workers'],
+            widths=options['widths'], on_result=report,
+        )
+        elapsed = time.monotonic() - start
+
+        errors = [result for result in results if result['error']]
+        self.stdout.write('\n=== SUMMARY ===')
+        self.stdout.write(f'Sources derived: {len(results) - len(errors)}')
+        self.stdout.write(f'Unchanged and skipped: {skipped}')
+        if errors:
+            self.stdout.write(self.style.WARNING(f'Errors: {len(errors)}'))
+        self.stdout.write(f'Processed {len(results)} sources in {elapsed:.2f}s with {options["workers"]} worker(s)')
+
+        # Cards and chapter lists show the smallest variant instead of the source
+        source_bytes, smallest = manifest.savings()
+        self.stdout.write(f'{len(manifest.sources)} sources, {megabytes(source_bytes)} as originals')
+        for ext in (ext for ext in FORMATS if ext in smallest):
+            size = smallest[ext]
+            saved = source_bytes - size
+            percent = saved / source_bytes * 100 if source_bytes else 0
+            self.stdout.write(f'  {ext:4} at the smallest width: {megabytes(size)}, saving {megabytes(saved)} ({percent:.0f}%)')
@@ -0,0 +1,142 @@
+import os
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Prefetch
+from main import journal
+from main.derivatives import static_file
+from main.image_fetch import FETCH_WORKERS, ImageFetchCache
+from main.importing.hashing import content_hash
+from main.importing.state import ImportStateTracker
+from main.models import Film, Chapter
+from main.placeholders import SETTINGS, render_placeholder
+from main.rendering import render_all
+
+PLACEHOLDER_FIELDS = ['thumbnail_placeholder', 'thumbnail_color']
+
+
+class Command(BaseCommand):
+    help = 'Store a tiny inline placeholder and dominant colour for every film and chapter thumbnail'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--file-ids',
+            type=str,
+            nargs='*',
+            help='Specific file IDs to process (if not provided, processes all)'
+        )
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Redraw placeholders even if their thumbnail is unchanged'
+        )
+        parser.add_argument(
+            '--no-fetch',
+            action='store_true',
+            help='Leave out thumbnails that are not served from static, such as YouTube URLs'
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=os.cpu_count() or 1,
+            help='Processes used to draw placeholders (default: CPU count; 1 draws in-process)'
+        )
+        parser.add_argument(
+            '--fetch-workers',
+            type=int,
+            default=FETCH_WORKERS,
+            help='Concurrent downloads of remote thumbnails (default: %(default)s)'
+        )
+
+    def handle(self, *args, **options):
+        if options['workers'] < 1:
+            raise CommandError('--workers must be at least 1')
+        films = Film.objects.prefetch_related(Prefetch('chapters', queryset=Chapter.objects.order_by('order')))
+        if options['file_ids']:
+            films = films.filter(file_id__in=options['file_ids'])
+        films = list(films)
+        self.stdout.write(f'Processing {len(films)} films...')
+
+        # A placeholder is redrawn only when its thumbnail's URL, or a local file's size or mtime, changed
+        state = ImportStateTracker('placeholders', options['force'])
+        state.load(*(film.file_id for film in films))
+        items, jobs, remote, cleared = {}, [], [], []
+        static_dir = os.path.join(settings.BASE_DIR, 'static')
+        missing = skipped = 0
+        for film in films:
+            entries = [(('film', film.id), film)] + [(('chapter', chapter.id), chapter) for chapter in film.chapters.all()]
+            for key, item in entries:
+                url = item.thumbnail_url
+                if not url:
+                    if item.thumbnail_placeholder or item.thumbnail_color:
+                        item.thumbnail_placeholder = item.thumbnail_color = ''
+                        cleared.append(item)
+                    continue
+                path = static_file(url, settings.STATIC_URL, static_dir)
+                if path is None and options['no_fetch']:
+                    continue
+                if path is not None:
+                    try:
+                        stat = os.stat(path)
+                    except FileNotFoundError:
+                        missing += 1
+                        continue
+                    digest = content_hash([url, stat.st_size, stat.st_mtime_ns, SETTINGS])
+                else:
+                    digest = content_hash([url, SETTINGS])
+                state_key = f'{key[0]}:{key[1]}'
+                if not state.changed(film.file_id, state_key, digest, count=False) and item.thumbnail_placeholder:
+                    skipped += 1
+                    continue
+                items[key] = (film.file_id, state_key, digest, item)
+                if path is None:
+                    remote.append((key, url))
+                else:
+                    jobs.append({'key': key, 'path': path})
+
+        start = time.monotonic()
+        with ImageFetchCache(workers=options['fetch_workers']) as fetcher:
+            if remote:
+                self.stdout.write(f'Fetching {len(remote)} remote thumbnails with {fetcher.workers} workers...')
+                fetched = fetcher.prefetch([[url] for _, url in remote])
+                for (key, url), found in zip(remote, fetched):
+                    if found:
+                        jobs.append({'key': key, 'path': fetcher.path(url)})
+                    else:
+                        self.stdout.write(f'  ✗ {url}: {fetcher.missing[url]}')
+            results = []
+            for result in render_all(render_placeholder, jobs, options['workers']):
+                file_id, state_key, digest, item = items[result['key']]
+                if result['error']:
+                    self.stdout.write(f'  ✗ {file_id} {state_key}: {result["error"]}')
+                    continue
+                item.thumbnail_placeholder, item.thumbnail_color = result['placeholder'], result['color']
+                state.mark(file_id, state_key, digest)
+                results.append(result)
+        elapsed = time.monotonic() - start
+
+        drawn = [items[result['key']][3] for result in results] + cleared
+        with transaction.atomic():
+            for model in (Film, Chapter):
+                updated = [item for item in drawn if isinstance(item, model)]
+                model.objects.bulk_update(updated, PLACEHOLDER_FIELDS)
+                journal.record(journal.instance_entry(item, 'update', PLACEHOLDER_FIELDS) for item in updated)
+            state.save()
+
+        errors = len(items) - len(results)
+        self.stdout.write('\n=== SUMMARY ===')
+        self.stdout.write(f'Placeholders drawn: {len(results)}')
+        self.stdout.write(f'Unchanged and skipped: {skipped}')
+        if cleared:
+            self.stdout.write(f'Cleared for removed thumbnails: {len(cleared)}')
+        if missing:
+            self.stdout.write(self.style.WARNING(f'Thumbnail files missing: {missing}'))
+        if errors:
+            self.stdout.write(self.style.WARNING(f'Errors: {errors}'))
+        if results:
+            average = sum(len(result['placeholder']) for result in results) / len(results)
+            self.stdout.write(
+                f'Drew {len(results)} placeholders in {elapsed:.2f}s with {options["workers"]} worker(s), '
+                f'{average:.0f} bytes inline on average'
+            )
@@ -1,16 +1,20 @@
 import os
 import re
-import subprocess
-import shutil
-from django.core.management.base import BaseCommand
+import time
+from concurrent.futures import ProcessPoolExecutor
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
 from django.db import transaction
-from main.models import Film, Chapter, Person, Location, Tag, ChapterPeople, ChapterLocations, ChapterTags
-import pandas as pd
-import openpyxl
-from openpyxl_image_loader import SheetImageLoader
-from datetime import timedelta
+from main import journal
+from main.models import Film, Chapter
+from main.importing.bitfield import bitfield_chapter_people, write_chapter_people
+from main.importing.chapter_sheets import parse_sheet
+from main.importing.context import CHAPTER_FIELDS, ImportContext, apply_metadata_flags
+from main.importing.state import FILE_KEY, ImportStateTracker
 from pathlib import Path
 
+SHEET_DIR = '/home/viblio/family_films/chapter_sheets'
+
 
 class Command(BaseCommand):
     help = 'Import chapter metadata from Excel spreadsheets in chapter_sheets directory'
@@ -19,7 +23,8 @@ class Command(BaseCommand):
         parser.add_argument(
             '--file',
             type=str,
-            help='Process only a specific Excel file (filename only, not path)',
+            nargs='+',
+            help='Process only specific Excel files (filenames only, not paths)',
         )
         parser.add_argument(
             '--dry-run',
@@ -32,433 +37,243 @@ class Command(BaseCommand):
             default='static/thumbnails/chapters',
             help='Directory to save extracted thumbnail images',
         )
+        parser.add_argument(
+            '--sheet-dir',
+            type=str,
+            default=SHEET_DIR,
+            help='Directory containing the chapter spreadsheets',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=os.cpu_count() or 1,
+            help='Processes used to parse sheets and extract images (default: CPU count; 1 parses in-process)',
+        )
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Re-apply every sheet, row and thumbnail, even if unchanged since the last import',
+        )
 
     def handle(self, *args, **options):
-        sheet_dir = Path('/home/viblio/family_films/chapter_sheets')
+        sheet_dir = Path(options['sheet_dir'])
+        if options['workers'] < 1:
+            raise CommandError('--workers must be at least 1')
         
         if options['file']:
-            files = [sheet_dir / options['file']]
+            files = [sheet_dir / name for name in options['file']]
         else:
-            files = list(sheet_dir.glob('*.xls'))
+            files = sorted(sheet_dir.glob('*.xls'))
         
         self.stdout.write(f"Found {len(files)} Excel files to process")
+        files = [file_path for file_path in files if file_path.name != 'README.txt.docx']
         
+        # Sheets whose bytes match the last import are not even parsed
+        self.state = ImportStateTracker('chapter_metadata', force=options['force'])
+        self.state.load(*(file_path.name for file_path in files))
+        self.file_hashes = {}
+        changed_files = []
         for file_path in files:
-            if file_path.name == 'README.txt.docx':
-                continue
-                
-            self.stdout.write(f"\nProcessing: {file_path.name}")
+            if file_path.exists():
+                changed, self.file_hashes[file_path.name] = self.state.file_changed(file_path.name, file_path)
+                if not changed:
+                    self.stdout.write(f"Skipping unchanged: {file_path.name}")
+                    continue
+            changed_files.append(file_path)
+        files = changed_files
+        
+        # People, locations, tags and Hayward indexes are loaded once for every sheet
+        self.context = ImportContext()
+        self.saved_thumbnails = []
+        self.thumbnail_film_ids = set()
+        
+        start = time.monotonic()
+        parse_seconds = write_seconds = 0.0
+        rows = 0
+        for sheet in self.parse_sheets(files, options['workers']):
+            parse_seconds += sheet['seconds']
+            rows += len(sheet['rows'])
+            self.stdout.write(f"\nProcessing: {sheet['file']}")
+            write_start = time.monotonic()
             try:
-                self.process_excel_file(file_path, options['dry_run'], options['save_thumbnails'])
+                self.apply_sheet(sheet, options['dry_run'], options['save_thumbnails'])
             except Exception as e:
-                self.stderr.write(f"Error processing {file_path.name}: {str(e)}")
+                self.stderr.write(f"Error processing {sheet['file']}: {str(e)}")
+            write_seconds += time.monotonic() - write_start
+        
+        elapsed = time.monotonic() - start
+        rate = len(files) / elapsed if elapsed else 0
+        self.stdout.write(
+            f"\nParsed {len(files)} sheets ({rows} rows) in {elapsed:.2f}s with {options['workers']} worker(s): "
+            f"{rate:.1f} sheets/s; parse {parse_seconds:.2f}s (summed over workers), write {write_seconds:.2f}s"
+        )
+        self.stdout.write(self.state.summary())
+        
+        # Resized variants of the new thumbnails, for srcset
+        if self.saved_thumbnails:
+            call_command('generate_thumbnail_derivatives', '--files', *self.saved_thumbnails,
+                         '--workers', str(options['workers']), stdout=self.stdout)
+            # Inline placeholders of the new thumbnails; the films' remote thumbnails are not fetched here
+            call_command('generate_thumbnail_placeholders', '--file-ids', *sorted(self.thumbnail_film_ids), '--no-fetch',
+                         '--workers', str(options['workers']), stdout=self.stdout)
     
-    def process_excel_file(self, file_path, dry_run, thumbnail_dir):
-        # Read Excel file
-        df = pd.read_excel(file_path, header=None)
-        
-        # Extract film ID from cell A3
-        film_id_cell = str(df.iloc[2, 0]) if not pd.isna(df.iloc[2, 0]) else ''
-        film_id_prefix = film_id_cell.strip()
+    def parse_sheets(self, files, workers):
+        """Yield parsed sheets in file order, parsing ahead in a process pool"""
+        if workers == 1 or len(files) <= 1:
+            for file_path in files:
+                yield parse_sheet(file_path)
+            return
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            yield from executor.map(parse_sheet, files)
+    
+    def apply_sheet(self, sheet, dry_run, thumbnail_dir):
+        """Writer stage: apply one parsed sheet to its film"""
+        if 'exception' in sheet:
+            self.stderr.write(sheet['exception'])
+            return
         
+        film_id_prefix = sheet['prefix']
         if not film_id_prefix:
-            self.stderr.write(f"No film ID found in cell A3 of {file_path.name}")
+            for error in sheet['errors']:
+                self.stderr.write(error)
             return
         
         # Find matching film in database
-        films = Film.objects.filter(file_id__startswith=film_id_prefix)
-        if not films.exists():
+        films = list(Film.objects.filter(file_id__startswith=film_id_prefix))
+        if not films:
             self.stderr.write(f"No film found with ID starting with '{film_id_prefix}'")
             return
-        elif films.count() > 1:
-            self.stderr.write(f"Multiple films found with ID starting with '{film_id_prefix}': {list(films.values_list('file_id', flat=True))}")
+        elif len(films) > 1:
+            self.stderr.write(f"Multiple films found with ID starting with '{film_id_prefix}': {[f.file_id for f in films]}")
             return
         
-        film = films.first()
+        film = films[0]
         self.stdout.write(f"Found film: {film.file_id} - {film.title}")
         
-        # Extract bitfield key from row 8
-        bitfield_key = self.extract_bitfield_key(df)
-        
-        # Find header row (typically around row 9)
-        header_row_idx = self.find_header_row(df)
-        if header_row_idx is None:
-            self.stderr.write("Could not find header row")
-            return
-        
-        # Process data rows
-        headers = df.iloc[header_row_idx].str.lower().str.strip()
-        header_map = {col: idx for idx, col in enumerate(headers) if pd.notna(col)}
-        
-        # Extract images from Excel file
-        extracted_images = None
-        image_loader = None
-        
-        if file_path.suffix.lower() == '.xls':
-            # Extract images using binary parsing for .xls files
-            try:
-                all_extracted_images = self.extract_images_from_xls(file_path, thumbnail_dir)
-                # Filter to only use Start column images (every other image, starting from index 0)
-                extracted_images = [img for i, img in enumerate(all_extracted_images) if i % 2 == 0]
-                if extracted_images:
-                    self.stdout.write(f"Extracted {len(all_extracted_images)} images total, using {len(extracted_images)} from Start column")
-            except Exception as e:
-                self.stdout.write(f"Note: Could not extract images from .xls file: {str(e)}")
-        
-        elif file_path.suffix.lower() == '.xlsx':
-            try:
-                wb = openpyxl.load_workbook(file_path)
-                sheet = wb.active
-                image_loader = SheetImageLoader(sheet)
-            except Exception as e:
-                self.stdout.write(f"Note: Could not load images from Excel file: {str(e)}")
-        
-        processed_count = 0
-        for idx in range(header_row_idx + 1, len(df)):
-            row = df.iloc[idx]
-            
-            # Skip empty rows
-            if pd.isna(row[header_map.get('title', 0)]):
-                continue
-            
-            if not dry_run:
-                with transaction.atomic():
-                    self.process_chapter_row(
-                        film, row, header_map, bitfield_key, 
-                        image_loader, idx + 1, thumbnail_dir, extracted_images  # +1 for Excel row number
-                    )
-            else:
-                self.stdout.write(f"[DRY RUN] Would process chapter: {row[header_map.get('title', 0)]}")
-            
-            processed_count += 1
-        
-        self.stdout.write(f"Processed {processed_count} chapters for {film.file_id}")
-    
-    def extract_bitfield_key(self, df):
-        """Extract bitfield key from row 8, typically in column 5"""
-        bitfield_info = None
-        for col in range(len(df.columns)):
-            cell_value = str(df.iloc[7, col]) if not pd.isna(df.iloc[7, col]) else ''
-            if 'bitfield:' in cell_value.lower():
-                bitfield_info = cell_value
-                break
-        
-        if not bitfield_info:
-            return []
-        
-        # Extract names from "Bitfield: John Sr, Josephine, ..."
-        match = re.search(r'Bitfield:\s*(.+)', bitfield_info, re.IGNORECASE)
-        if match:
-            names = [name.strip() for name in match.group(1).split(',')]
-            return names
-        
-        return []
-    
-    def find_header_row(self, df):
-        """Find the row containing headers like 'Start', 'End', 'Title', etc."""
-        for idx in range(5, min(15, len(df))):  # Check rows 6-15
-            row = df.iloc[idx]
-            row_str = ' '.join(str(cell).lower() for cell in row if pd.notna(cell))
-            if 'start' in row_str and 'title' in row_str:
-                return idx
-        return None
-    
-    def process_chapter_row(self, film, row, header_map, bitfield_key, image_loader, excel_row_num, thumbnail_dir, extracted_images=None):
-        """Process a single chapter row from the Excel file"""
-        
-        # Extract data from row
-        title = str(row[header_map.get('title', 0)]).strip() if not pd.isna(row[header_map.get('title', 0)]) else ''
-        if not title:
-            return
-        
-        # Get 16fps start timecode for matching
-        fps16_timecode = str(row[header_map.get('16fps start timecode', 0)]).strip() if '16fps start timecode' in header_map else ''
-        
-        # Find matching chapter by title and/or timecode
-        chapter = self.find_matching_chapter(film, title, fps16_timecode)
-        if not chapter:
-            self.stderr.write(f"No matching chapter found for '{title}' at {fps16_timecode}")
+        for error in sheet['errors']:
+            self.stderr.write(error)
+        if sheet['header_row'] is None:
             return
+        for message in sheet['messages']:
+            self.stdout.write(message)
         
-        self.stdout.write(f"Updating chapter: {chapter.title}")
-        
-        # Update description
-        description = str(row[header_map.get('description', 0)]).strip() if 'description' in header_map and not pd.isna(row[header_map.get('description', 0)]) else ''
-        technical_notes = str(row[header_map.get('technical notes', 0)]).strip() if 'technical notes' in header_map and not pd.isna(row[header_map.get('technical notes', 0)]) else ''
-        
-        if description or technical_notes:
-            combined_description = '\n'.join(filter(None, [description, technical_notes]))
-            chapter.description = combined_description
-            chapter.save()
-        
-        # Update year
-        year_data = str(row[header_map.get('year', 0)]).strip() if 'year' in header_map and not pd.isna(row[header_map.get('year', 0)]) else ''
-        if year_data:
-            chapter.years = year_data
-            chapter.save()
-        
-        # Process Haywards Present bitfield
-        if 'haywards present' in header_map and bitfield_key:
-            bitfield = str(row[header_map['haywards present']]).strip()
-            if bitfield and len(bitfield) == len(bitfield_key):
-                self.process_haywards_bitfield(chapter, bitfield, bitfield_key)
-        
-        # Process locations
-        if 'locations' in header_map:
-            locations_str = str(row[header_map['locations']]).strip() if not pd.isna(row[header_map['locations']]) else ''
-            if locations_str:
-                self.process_locations(chapter, locations_str)
-        
-        # Process tags
-        if 'tags' in header_map:
-            tags_str = str(row[header_map['tags']]).strip() if not pd.isna(row[header_map['tags']]) else ''
-            if tags_str:
-                self.process_tags(chapter, tags_str)
-        
-        # Process other people
-        if 'other people' in header_map:
-            other_people_str = str(row[header_map['other people']]).strip() if not pd.isna(row[header_map['other people']]) else ''
-            if other_people_str:
-                self.process_other_people(chapter, other_people_str)
-        
-        # Extract thumbnail image from Start column
-        if 'start' in header_map:
-            chapter_row_index = excel_row_num - (self.find_header_row_index(film) + 2)  # Adjust for header offset
-            
-            if image_loader:  # .xlsx file
-                start_col_letter = openpyxl.utils.get_column_letter(header_map['start'] + 1)
-                cell_coord = f"{start_col_letter}{excel_row_num}"
-                
-                if image_loader.image_in(cell_coord):
-                    self.extract_thumbnail_xlsx(chapter, image_loader, cell_coord, thumbnail_dir)
-            
-            elif extracted_images and chapter_row_index < len(extracted_images):  # .xls file
-                # Use the extracted image for this chapter
-                image_path = extracted_images[chapter_row_index]
-                self.assign_extracted_thumbnail(chapter, image_path, thumbnail_dir)
-        
-        # Update metadata flags
-        chapter.update_metadata_flags()
-    
-    def find_matching_chapter(self, film, title, timecode):
-        """Find chapter by title similarity and/or timecode match"""
-        chapters = film.chapters.all()
-        
-        # First try exact title match
-        exact_match = chapters.filter(title__iexact=title).first()
-        if exact_match:
-            return exact_match
-        
-        # Try timecode match (convert MM:SS or HH:MM:SS to seconds)
-        if timecode:
-            try:
-                seconds = Chapter.parse_time_to_seconds(timecode)
-                # Allow 2 second tolerance
-                timecode_match = chapters.filter(
-                    start_time_seconds__gte=seconds-2,
-                    start_time_seconds__lte=seconds+2
-                ).first()
-                if timecode_match:
-                    return timecode_match
-            except:
-                pass
-        
-        # Try partial title match
-        title_words = title.lower().split()
-        for chapter in chapters:
-            chapter_words = chapter.title.lower().split()
-            # If significant overlap in words, consider it a match
-            common_words = set(title_words) & set(chapter_words)
-            if len(common_words) >= min(3, len(title_words) // 2):
-                return chapter
-        
-        return None
-    
-    def process_haywards_bitfield(self, chapter, bitfield, bitfield_key):
-        """Process the Haywards Present bitfield and add people to chapter"""
-        for idx, (bit, name) in enumerate(zip(bitfield, bitfield_key)):
-            if bit == '1':
-                # Find or create person
-                person = self.find_or_create_person(name, hayward_index=idx)
-                ChapterPeople.objects.get_or_create(
-                    chapter=chapter,
-                    person=person,
-                    defaults={'is_primary': False}
-                )
-    
-    def find_or_create_person(self, name, hayward_index=None):
-        """Find existing person or create new one"""
-        # Parse name (handle "John Sr", "John Jr", etc.)
-        parts = name.strip().split()
-        if len(parts) >= 2:
-            first_name = parts[0]
-            last_name = ' '.join(parts[1:])
+        if dry_run:
+            for row in sheet['rows']:
+                if self.state.changed(sheet['file'], f"row:{row['excel_row']}", row['hash']):
+                    self.stdout.write(f"[DRY RUN] Would process chapter: {row['raw_title']}")
         else:
-            first_name = name
-            # For Hayward family members without last name in bitfield, default to Hayward
-            last_name = 'Hayward' if hayward_index is not None else ''
-        
-        # Try to find existing person
-        if hayward_index is not None:
-            person = Person.objects.filter(hayward_index=hayward_index).first()
-            if person:
-                return person
-        
-        # Try by name
-        person = Person.objects.filter(
-            first_name__iexact=first_name,
-            last_name__iexact=last_name
-        ).first()
-        
-        if person:
-            # Update hayward_index if not set
-            if hayward_index is not None and person.hayward_index is None:
-                person.hayward_index = hayward_index
-                person.save()
-            return person
-        
-        # Create new person
-        return Person.objects.create(
-            first_name=first_name,
-            last_name=last_name,
-            hayward_index=hayward_index
-        )
+            with transaction.atomic(), journal.batched(), self.context.sheet():
+                complete = self.write_sheet(film, sheet, thumbnail_dir)
+                # Sheets with unmatched rows or failed thumbnails are parsed again next time
+                if complete and not sheet['errors'] and sheet['file'] in self.file_hashes:
+                    self.state.mark(sheet['file'], FILE_KEY, self.file_hashes[sheet['file']])
+                self.state.save(sheet['file'])
+        
+        self.stdout.write(f"Processed {len(sheet['rows'])} chapters for {film.file_id}")
     
-    def process_locations(self, chapter, locations_str):
-        """Process locations string and add to chapter"""
-        # Split by common delimiters
-        locations = re.split(r'[,;/]|\sand\s', locations_str)
-        
-        for location_name in locations:
-            location_name = location_name.strip()
-            if not location_name:
+    def write_sheet(self, film, sheet, thumbnail_dir):
+        """
+        Match rows to chapters, then write every change for the film in bulk.
+        
+        Rows and thumbnails whose hash matches the last import are skipped.
+        Returns False if any row could not be applied.
+        """
+        chapters = self.context.chapter_index(film)
+        bitfield_key = sheet['bitfield_key']
+        source = sheet['file']
+        complete = True
+        
+        # Rows are applied in order, so a chapter matched twice keeps the last values
+        updated = {}
+        links = {'locations': {}, 'tags': {}, 'people': {}}
+        sheet_bitfields = []
+        for row in sheet['rows']:
+            if not row['title']:
                 continue
-            
-            # Find or create location
-            location, created = Location.objects.get_or_create(
-                name__iexact=location_name,
-                defaults={'name': location_name}
-            )
-            
-            ChapterLocations.objects.get_or_create(
-                chapter=chapter,
-                location=location,
-                defaults={'is_primary': False}
-            )
-    
-    def process_tags(self, chapter, tags_str):
-        """Process tags string and add to chapter"""
-        # Split by common delimiters
-        tags = re.split(r'[,;/]|\sand\s', tags_str)
-        
-        for tag_name in tags:
-            tag_name = tag_name.strip().lower()
-            if not tag_name:
+            row_key, image_key = f"row:{row['excel_row']}", f"image:{row['excel_row']}"
+            row_changed = self.state.changed(source, row_key, row['hash'])
+            image_changed = bool(row['thumbnail_hash']) and self.state.changed(source, image_key, row['thumbnail_hash'])
+            if not (row_changed or image_changed or row.get('thumbnail_error')):
+                continue
+            chapter = chapters.match(row['title'], row['timecode'])
+            if not chapter:
+                self.stderr.write(f"No matching chapter found for '{row['title']}' at {row['timecode']}")
+                complete = False
                 continue
             
-            # Find or create tag
-            tag, created = Tag.objects.get_or_create(
-                tag=tag_name
-            )
-            
-            ChapterTags.objects.get_or_create(
-                chapter=chapter,
-                tag=tag,
-                defaults={'is_auto': False}
-            )
-    
-    def process_other_people(self, chapter, other_people_str):
-        """Process other people string and add to chapter"""
-        # Split by common delimiters
-        people = re.split(r'[,;/]|\sand\s', other_people_str)
-        
-        for person_name in people:
-            person_name = person_name.strip()
-            if not person_name:
+            self.stdout.write(f"Updating chapter: {chapter.title}")
+            updated[chapter.id] = chapter
+            if image_changed or row.get('thumbnail_error'):
+                if row.get('thumbnail_error'):
+                    self.stderr.write(row['thumbnail_error'])
+                    complete = False
+                else:
+                    extension, image_bytes = row['thumbnail']
+                    if self.save_thumbnail(film, chapter, extension, image_bytes, thumbnail_dir):
+                        self.state.mark(source, image_key, row['thumbnail_hash'])
+                    else:
+                        complete = False
+            if not row_changed:
                 continue
             
-            person = self.find_or_create_person(person_name)
-            ChapterPeople.objects.get_or_create(
-                chapter=chapter,
-                person=person,
-                defaults={'is_primary': False}
-            )
-    
-    def extract_images_from_xls(self, xls_file, output_dir):
-        """Extract images from .xls file using binary parsing"""
-        try:
-            # Use the existing XLS image extractor script
-            script_path = Path(__file__).parent.parent.parent.parent / 'xls_image_extractor.py'
+            self.state.mark(source, row_key, row['hash'])
+            if row['description']:
+                chapter.description = row['description']
+            if row['years']:
+                chapter.years = row['years']
             
-            result = subprocess.run([
-                'python', str(script_path), str(xls_file), '-o', output_dir
-            ], capture_output=True, text=True)
+            # Haywards Present bitfields are decoded for the whole sheet at the end
+            if bitfield_key and row['bitfield'] and len(row['bitfield']) == len(bitfield_key):
+                sheet_bitfields.append((chapter.id, row['bitfield']))
             
-            if result.returncode == 0:
-                # Parse the output to find extracted image paths
-                extracted_files = []
-                base_name = xls_file.stem
-                output_path = Path(output_dir)
-                
-                # Look for extracted images with the expected naming pattern
-                for i in range(20):  # Check up to 20 images
-                    image_path = output_path / f"{base_name}_image_{i:03d}.jpg"
-                    if image_path.exists():
-                        extracted_files.append(str(image_path))
-                
-                return extracted_files
-            else:
-                self.stderr.write(f"XLS extraction failed: {result.stderr}")
-                return []
-        except Exception as e:
-            self.stderr.write(f"Error extracting images from XLS: {str(e)}")
-            return []
+            links['locations'].setdefault(chapter.id, []).extend(row['locations'])
+            links['tags'].setdefault(chapter.id, []).extend(row['tags'])
+            links['people'].setdefault(chapter.id, []).extend(row['other_people'])
+        
+        if not updated:
+            return complete
+        
+        # Names new to the database are created together, then every lookup is a dict hit
+        linked = self.context.link_chapters(links, list(updated))
+        apply_metadata_flags(updated.values(), linked)
+        Chapter.objects.bulk_update(updated.values(), CHAPTER_FIELDS)
+        journal.record(journal.instance_entry(chapter, 'update', CHAPTER_FIELDS) for chapter in updated.values())
+        
+        if sheet_bitfields:
+            self.process_haywards_bitfields(sheet_bitfields, bitfield_key)
+        return complete
+    
+    def process_haywards_bitfields(self, sheet_bitfields, bitfield_key):
+        """Decode every Haywards Present bitfield of a sheet and add people in bulk"""
+        chapter_ids = [chapter_id for chapter_id, _ in sheet_bitfields]
+        bitfields = [bitfield for _, bitfield in sheet_bitfields]
+        
+        def resolve_person_id(idx):
+            return self.context.hayward_person_id(idx, bitfield_key[idx])
+        
+        pairs = bitfield_chapter_people(chapter_ids, bitfields, len(bitfield_key), resolve_person_id)
+        added = write_chapter_people(pairs, is_primary=False)
+        self.stdout.write(f"Added {added} Hayward appearances from {len(sheet_bitfields)} bitfields")
     
-    def find_header_row_index(self, film):
-        """Find the header row index for this film (helper method)"""
-        # This would need to be stored or recalculated - for now return a default
-        return 8  # Most Excel files have headers around row 9 (0-indexed as 8)
+    def thumbnail_filename(self, film, chapter, extension):
+        return f"{film.file_id}_ch{chapter.order:02d}_{chapter.start_time_seconds}s.{extension}"
     
-    def extract_thumbnail_xlsx(self, chapter, image_loader, cell_coord, thumbnail_dir):
-        """Extract thumbnail image from XLSX Excel cell and save"""
+    def save_thumbnail(self, film, chapter, extension, image_bytes, thumbnail_dir):
+        """Save a thumbnail read from the row's Start cell"""
         try:
-            image = image_loader.get(cell_coord)
-            
             # Create thumbnail directory if needed
             thumb_path = Path(thumbnail_dir)
             thumb_path.mkdir(parents=True, exist_ok=True)
             
-            # Save image with meaningful filename
-            filename = f"{chapter.film.file_id}_ch{chapter.order:02d}_{chapter.start_time_seconds}s.png"
-            filepath = thumb_path / filename
-            
-            image.save(filepath)
+            filename = self.thumbnail_filename(film, chapter, extension)
+            (thumb_path / filename).write_bytes(image_bytes)
+            self.saved_thumbnails.append(str(thumb_path / filename))
+            self.thumbnail_film_ids.add(film.file_id)
             
             # Update chapter thumbnail URL (relative to static root)
             chapter.thumbnail_url = f"/static/thumbnails/chapters/{filename}"
-            chapter.save()
-            
             self.stdout.write(f"  Saved thumbnail: {filename}")
+            return True
         except Exception as e:
             self.stderr.write(f"  Failed to extract thumbnail: {str(e)}")
-    
-    def assign_extracted_thumbnail(self, chapter, image_path, thumbnail_dir):
-        """Assign an extracted image as chapter thumbnail"""
-        try:
-            # Create thumbnail directory if needed
-            thumb_path = Path(thumbnail_dir)
-            thumb_path.mkdir(parents=True, exist_ok=True)
-            
-            # Copy image to thumbnail directory with meaningful filename
-            filename = f"{chapter.film.file_id}_ch{chapter.order:02d}_{chapter.start_time_seconds}s.jpg"
-            dest_path = thumb_path / filename
-            
-            shutil.copy2(image_path, dest_path)
-            
-            # Update chapter thumbnail URL (relative to static root)
-            chapter.thumbnail_url = f"/static/thumbnails/chapters/{filename}"
-            chapter.save()
-            
-            self.stdout.write(f"  Assigned thumbnail: {filename}")
-        except Exception as e:
-            self.stderr.write(f"  Failed to assign thumbnail: {str(e)}")
\ No newline at end of file
+            return False
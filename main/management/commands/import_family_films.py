@@ -1,16 +1,58 @@
 import csv
 import re
 import os
+import time
+from contextlib import contextmanager
 from datetime import datetime, timedelta
 from urllib.parse import urlparse, parse_qs
 from django.core.management.base import BaseCommand, CommandError
-from django.db import transaction
+from django.db import connection, transaction
+from main import journal
+from main.importing.state import FILE_KEY, ImportStateTracker, content_hash
 from main.models import (
     Film, Chapter, Person, Location, Tag, DigitalReel,
     FilmPeople, FilmLocations, FilmTags,
     ChapterPeople, ChapterLocations, ChapterTags
 )
 
+# Film fields written from the CSV, compared when deciding what to update
+FILM_FIELDS = (
+    'title', 'description', 'summary', 'years', 'technical_notes', 'workflow_state',
+    'youtube_url', 'youtube_id', 'thumbnail_url', 'duration',
+)
+
+# plan attribute -> (through model, target column)
+FILM_LINKS = {
+    'film_people': (FilmPeople, 'person_id'),
+    'film_locations': (FilmLocations, 'location_id'),
+    'film_tags': (FilmTags, 'tag_id'),
+}
+
+
+class ImportPlan:
+    """Everything the CSV describes, keyed by natural identity"""
+    def __init__(self):
+        self.films = {}              # file_id -> field values (last row wins)
+        self.people = {}             # (first_name, last_name) -> full name as written
+        self.locations = {}          # name -> (city, state)
+        self.tags = {}               # tag -> category
+        self.film_people = set()     # (file_id, (first_name, last_name))
+        self.film_locations = set()  # (file_id, location name)
+        self.film_tags = set()       # (file_id, tag)
+        self.chapters = {}           # (file_id, order) -> (start_time, title)
+
+
+class Resolution:
+    """Rows from the database matching an ImportPlan's identities"""
+    def __init__(self):
+        self.films = {}          # file_id -> Film
+        self.film_changes = {}   # file_id -> {field: (old, new)}
+        self.people = {}         # (first_name, last_name) -> id
+        self.locations = {}      # name -> id
+        self.tags = set()        # existing tag names
+        self.links = {}          # plan attribute -> {(film_id, target_id)}
+        self.chapters = set()    # (film_id, order)
+
 
 class Command(BaseCommand):
     help = 'Import family films data from CSV file'
@@ -32,6 +74,11 @@ class Command(BaseCommand):
             action='store_true',
             help='Show what would be imported without actually importing'
         )
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Re-import every row, even if the file and rows are unchanged since the last import'
+        )
 
     def handle(self, *args, **options):
         csv_file = options['csv_file']
@@ -50,16 +97,56 @@ class Command(BaseCommand):
         playlist_id = self.extract_playlist_id(youtube_playlist)
         self.stdout.write(f'YouTube Playlist ID: {playlist_id}')
 
-        # Import data
-        with transaction.atomic():
-            stats = self.import_csv_data(csv_file, playlist_id, dry_run)
-            
-            if dry_run:
-                # Rollback the transaction for dry run
-                transaction.set_rollback(True)
+        self.timings = []
+        self.verbosity = options['verbosity']
+
+        # Skip the whole file if neither it nor the playlist changed since the last import
+        self.state = ImportStateTracker('family_films', force=options['force'])
+        self.source = os.path.abspath(csv_file)
+        file_changed, file_digest = self.state.file_changed(self.source, csv_file, playlist_id)
+        if not file_changed:
+            self.stdout.write(self.style.SUCCESS('CSV file unchanged since the last import; use --force to re-import'))
+            self.stdout.write(self.state.summary())
+            return
+
+        # Phase 1: parse every row into identity maps, no queries
+        with self.timed('Parse CSV'):
+            plan, stats = self.import_csv_data(csv_file, playlist_id)
+
+        # Phase 2: resolve existing rows with one query per table
+        with self.timed('Resolve existing rows'):
+            resolution = self.resolve(plan)
+
+        if dry_run:
+            self.print_diff(plan, resolution)
+        else:
+            with self.timed('Write changes'):
+                with transaction.atomic(), journal.batched():
+                    self.write(plan, resolution, stats)
+                    # A file with failed rows is re-read next time; its good rows are skipped by hash
+                    if not stats['errors']:
+                        self.state.mark(self.source, FILE_KEY, file_digest)
+                    self.state.save()
 
         # Print statistics
         self.print_import_stats(stats)
+        self.stdout.write(self.state.summary())
+        self.print_timings()
+
+    @contextmanager
+    def timed(self, label):
+        """Record wall time and query count for one import phase"""
+        start = time.monotonic()
+        queries = 0
+
+        def count(execute, sql, params, many, context):
+            nonlocal queries
+            queries += 1
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(count):
+            yield
+        self.timings.append((label, time.monotonic() - start, queries))
 
     def extract_playlist_id(self, url):
         """Extract playlist ID from YouTube URL"""
@@ -67,8 +154,9 @@ class Command(BaseCommand):
         query_params = parse_qs(parsed.query)
         return query_params.get('list', [''])[0]
 
-    def import_csv_data(self, csv_file, playlist_id, dry_run):
-        """Import data from CSV file"""
+    def import_csv_data(self, csv_file, playlist_id):
+        """Parse the CSV into an ImportPlan, leaving out films whose rows are unchanged"""
+        plan = ImportPlan()
         stats = {
             'films': 0,
             'chapters': 0,
@@ -89,22 +177,31 @@ class Command(BaseCommand):
             
             reader = csv.DictReader(file)
             
+            # Group rows by file ID: a film's hash covers every row that describes it
+            films = {}
             for row_num, row in enumerate(reader, start=header_row_index + 2):
+                if self.is_valid_film_row(row):
+                    films.setdefault(row['Filenames'].strip(), []).append((row_num, row))
+        
+        for file_id, rows in films.items():
+            digest = content_hash([playlist_id, [row for _, row in rows]])
+            if not self.state.changed(self.source, file_id, digest):
+                continue
+            failed = False
+            for row_num, row in rows:
                 try:
-                    if self.is_valid_film_row(row):
-                        film_stats = self.process_film_row(row, playlist_id, dry_run)
-                        self.merge_stats(stats, film_stats)
-                        stats['films'] += 1
-                        
-                        if stats['films'] % 10 == 0:
-                            self.stdout.write(f'Processed {stats["films"]} films...')
-                            
+                    film_stats = self.process_film_row(plan, row, playlist_id)
+                    self.merge_stats(stats, film_stats)
+                    stats['films'] += 1
                 except Exception as e:
+                    failed = True
                     error_msg = f'Error processing row {row_num}: {str(e)}'
                     stats['errors'].append(error_msg)
                     self.stdout.write(self.style.ERROR(error_msg))
+            if not failed:
+                self.state.mark(self.source, file_id, digest)
 
-        return stats
+        return plan, stats
 
     def find_header_row(self, file):
         """Find the row index that contains the column headers"""
@@ -119,40 +216,44 @@ class Command(BaseCommand):
         return (row.get('Filenames', '').strip() and 
                 row.get('Title', '').strip())
 
-    def process_film_row(self, row, playlist_id, dry_run):
-        """Process a single film row from CSV"""
+    def process_film_row(self, plan, row, playlist_id):
+        """Add a single film row from the CSV to the plan"""
         stats = {'chapters': 0, 'people': 0, 'locations': 0, 'tags': 0}
         
         file_id = row['Filenames'].strip()
         title = row['Title'].strip()
         
-        self.stdout.write(f'Processing: {file_id} - {title}')
+        if self.verbosity >= 2:
+            self.stdout.write(f'Processing: {file_id} - {title}')
         
-        if not dry_run:
-            # Create or get film
-            film, created = Film.objects.get_or_create(
-                file_id=file_id,
-                defaults=self.get_film_defaults(row, playlist_id)
-            )
-            
-            if not created:
-                # Update existing film
-                for key, value in self.get_film_defaults(row, playlist_id).items():
-                    setattr(film, key, value)
-                film.save()
-            
-            # Process related data
-            stats['people'] += self.process_people(film, row['People'])
-            stats['locations'] += self.process_locations(film, row['Location'])
-            stats['tags'] += self.process_tags(film, row)
-            stats['chapters'] += self.process_chapters(film, row['Chapters'])
-            
-        else:
-            # Dry run - just count what would be processed
-            stats['people'] += len(self.parse_people_list(row['People']))
-            stats['locations'] += len(self.parse_locations_list(row['Location']))
-            stats['tags'] += len(self.extract_tags(row))
-            stats['chapters'] += len(self.parse_chapters(row['Chapters']))
+        # A repeated file ID updates the same film, as get_or_create + save did
+        plan.films[file_id] = self.get_film_defaults(row, playlist_id)
+        
+        for full_name in self.parse_people_list(row['People']):
+            key = self.parse_person_name(full_name)
+            if key:
+                plan.people.setdefault(key, full_name)
+                plan.film_people.add((file_id, key))
+                stats['people'] += 1
+        
+        for location_name in self.parse_locations_list(row['Location']):
+            location = self.parse_location(location_name)
+            if location:
+                name, city, state = location
+                plan.locations.setdefault(name, (city, state))
+                plan.film_locations.add((file_id, name))
+                stats['locations'] += 1
+        
+        for tag_name, category in self.extract_tags(row):
+            if tag_name.strip():
+                plan.tags.setdefault(tag_name.lower(), category)
+                plan.film_tags.add((file_id, tag_name.lower()))
+                stats['tags'] += 1
+        
+        for order, (start_time, chapter_title) in enumerate(self.parse_chapters(row['Chapters']), start=1):
+            # Existing chapters are never overwritten, so the first row wins
+            plan.chapters.setdefault((file_id, order), (start_time, chapter_title[:500]))
+            stats['chapters'] += 1
 
         return stats
 
@@ -196,19 +297,6 @@ class Command(BaseCommand):
         
         return None
 
-    def process_people(self, film, people_str):
-        """Process people mentioned in the film"""
-        people_list = self.parse_people_list(people_str)
-        count = 0
-        
-        for person_name in people_list:
-            person = self.get_or_create_person(person_name)
-            if person:
-                FilmPeople.objects.get_or_create(film=film, person=person)
-                count += 1
-        
-        return count
-
     def parse_people_list(self, people_str):
         """Parse people string into list of names"""
         if not people_str.strip():
@@ -223,8 +311,8 @@ class Command(BaseCommand):
         
         return people
 
-    def get_or_create_person(self, full_name):
-        """Create or get a Person object from full name"""
+    def parse_person_name(self, full_name):
+        """Split a full name into the (first_name, last_name) identity key"""
         if not full_name.strip():
             return None
         
@@ -240,26 +328,7 @@ class Command(BaseCommand):
         # Handle special cases like "(nee Myre)"
         last_name = re.sub(r'\(nee [^)]+\)', '', last_name).strip()
         
-        person, created = Person.objects.get_or_create(
-            first_name=first_name,
-            last_name=last_name,
-            defaults={'notes': f'Imported from CSV: {full_name}'}
-        )
-        
-        return person
-
-    def process_locations(self, film, locations_str):
-        """Process locations mentioned in the film"""
-        locations_list = self.parse_locations_list(locations_str)
-        count = 0
-        
-        for location_name in locations_list:
-            location = self.get_or_create_location(location_name)
-            if location:
-                FilmLocations.objects.get_or_create(film=film, location=location)
-                count += 1
-        
-        return count
+        return first_name, last_name
 
     def parse_locations_list(self, locations_str):
         """Parse locations string into list of locations"""
@@ -279,8 +348,8 @@ class Command(BaseCommand):
         
         return cleaned
 
-    def get_or_create_location(self, location_name):
-        """Create or get a Location object"""
+    def parse_location(self, location_name):
+        """Return (name, city, state) for a location string"""
         if not location_name.strip():
             return None
         
@@ -296,29 +365,7 @@ class Command(BaseCommand):
                 city, state = parts
                 name = f"{city}, {state}"
         
-        location, created = Location.objects.get_or_create(
-            name=name,
-            defaults={
-                'city': city,
-                'state': state,
-                'description': f'Imported from CSV'
-            }
-        )
-        
-        return location
-
-    def process_tags(self, film, row):
-        """Process tags from the row"""
-        tags = self.extract_tags(row)
-        count = 0
-        
-        for tag_name, category in tags:
-            tag = self.get_or_create_tag(tag_name, category)
-            if tag:
-                FilmTags.objects.get_or_create(film=film, tag=tag)
-                count += 1
-        
-        return count
+        return name, city, state
 
     def extract_tags(self, row):
         """Extract tags from row columns"""
@@ -345,40 +392,6 @@ class Command(BaseCommand):
         
         return tags
 
-    def get_or_create_tag(self, tag_name, category):
-        """Create or get a Tag object"""
-        if not tag_name.strip():
-            return None
-        
-        tag, created = Tag.objects.get_or_create(
-            tag=tag_name.lower(),
-            defaults={
-                'category': category,
-                'description': f'Imported from CSV'
-            }
-        )
-        
-        return tag
-
-    def process_chapters(self, film, chapters_str):
-        """Process chapters from the chapters string"""
-        chapters = self.parse_chapters(chapters_str)
-        count = 0
-        
-        for order, (start_time, title) in enumerate(chapters):
-            Chapter.objects.get_or_create(
-                film=film,
-                order=order + 1,
-                defaults={
-                    'start_time': start_time,
-                    'title': title[:500],  # Truncate if too long
-                    'start_time_seconds': self.parse_time_to_seconds(start_time)
-                }
-            )
-            count += 1
-        
-        return count
-
     def parse_chapters(self, chapters_str):
         """Parse chapters string into list of (time, title) tuples"""
         if not chapters_str.strip():
@@ -412,6 +425,164 @@ class Command(BaseCommand):
             pass
         return 0
 
+    def resolve(self, plan):
+        """Load the existing rows for every identity in the plan; reads only"""
+        resolution = Resolution()
+        
+        for film in Film.objects.filter(file_id__in=plan.films):
+            resolution.films[film.file_id] = film
+            changes = {
+                field: (getattr(film, field), value)
+                for field, value in plan.films[film.file_id].items()
+                if getattr(film, field) != value
+            }
+            if changes:
+                resolution.film_changes[film.file_id] = changes
+        
+        # One query for all names; the pairing is checked in Python
+        first_names = {first for first, _ in plan.people}
+        last_names = {last for _, last in plan.people}
+        for pk, first, last in Person.objects.filter(
+            first_name__in=first_names, last_name__in=last_names
+        ).values_list('id', 'first_name', 'last_name'):
+            if (first, last) in plan.people:
+                resolution.people[(first, last)] = pk
+        
+        # get_or_create(name=...) matched the oldest location with that name
+        for pk, name in Location.objects.filter(name__in=plan.locations).order_by('id').values_list('id', 'name'):
+            resolution.locations.setdefault(name, pk)
+        
+        resolution.tags = set(Tag.objects.in_bulk(plan.tags))
+        
+        film_ids = [film.id for film in resolution.films.values()]
+        for attribute, (model, target_field) in FILM_LINKS.items():
+            resolution.links[attribute] = set(
+                model.objects.filter(film_id__in=film_ids).values_list('film_id', target_field)
+            )
+        resolution.chapters = set(Chapter.objects.filter(film_id__in=film_ids).values_list('film_id', 'order'))
+        return resolution
+
+    def link_targets(self, plan, resolution, film_ids):
+        """Map each planned film link to (film_id, target_id)"""
+        targets = {
+            'film_people': resolution.people,
+            'film_locations': resolution.locations,
+            'film_tags': {tag: tag for tag in plan.tags},
+        }
+        return {
+            attribute: {
+                (film_ids[file_id], targets[attribute][key])
+                for file_id, key in getattr(plan, attribute)
+                if file_id in film_ids and key in targets[attribute]
+            }
+            for attribute in FILM_LINKS
+        }
+
+    def write(self, plan, resolution, stats):
+        """Apply the plan with bulk inserts and updates"""
+        entries = []
+        
+        new_films = [Film(file_id=file_id, **values)
+                     for file_id, values in plan.films.items() if file_id not in resolution.films]
+        Film.objects.bulk_create(new_films)
+        changed_films = []
+        for file_id, changes in resolution.film_changes.items():
+            film = resolution.films[file_id]
+            for field, (_, value) in changes.items():
+                setattr(film, field, value)
+            changed_films.append(film)
+        if changed_films:
+            Film.objects.bulk_update(changed_films, FILM_FIELDS)
+        entries += [journal.instance_entry(film, 'create') for film in new_films]
+        entries += [journal.instance_entry(film, 'update', resolution.film_changes[film.file_id])
+                    for film in changed_films]
+        film_ids = {film.file_id: film.id for film in list(resolution.films.values()) + new_films}
+        
+        new_people = [Person(first_name=first, last_name=last, notes=f'Imported from CSV: {full_name}')
+                      for (first, last), full_name in plan.people.items() if (first, last) not in resolution.people]
+        Person.objects.bulk_create(new_people)
+        resolution.people.update({(p.first_name, p.last_name): p.id for p in new_people})
+        
+        new_locations = [Location(name=name, city=city, state=state, description='Imported from CSV')
+                         for name, (city, state) in plan.locations.items() if name not in resolution.locations]
+        Location.objects.bulk_create(new_locations)
+        resolution.locations.update({location.name: location.id for location in new_locations})
+        
+        new_tags = [Tag(tag=name, category=category, description='Imported from CSV')
+                    for name, category in plan.tags.items() if name not in resolution.tags]
+        Tag.objects.bulk_create(new_tags)
+        entries += [journal.instance_entry(obj, 'create') for obj in new_people + new_locations + new_tags]
+        
+        for attribute, pairs in self.link_targets(plan, resolution, film_ids).items():
+            model, target_field = FILM_LINKS[attribute]
+            missing = pairs - resolution.links[attribute]
+            model.objects.bulk_create(
+                [model(film_id=film_id, **{target_field: target_id}) for film_id, target_id in missing],
+                ignore_conflicts=True,
+            )
+            entries += [journal.association_entry(model, film_id, target_id, 'create') for film_id, target_id in missing]
+        
+        new_chapters = [
+            Chapter(film_id=film_ids[file_id], order=order, start_time=start_time, title=title,
+                    start_time_seconds=self.parse_time_to_seconds(start_time))
+            for (file_id, order), (start_time, title) in plan.chapters.items()
+            if (film_ids[file_id], order) not in resolution.chapters
+        ]
+        Chapter.objects.bulk_create(new_chapters)
+        entries += [journal.instance_entry(chapter, 'create') for chapter in new_chapters]
+        
+        journal.record(entries)
+        stats.update({
+            'films_created': len(new_films),
+            'films_updated': len(changed_films),
+            'people_created': len(new_people),
+            'locations_created': len(new_locations),
+            'tags_created': len(new_tags),
+            'chapters_created': len(new_chapters),
+        })
+
+    def print_diff(self, plan, resolution):
+        """Show what an import would change, without writing anything"""
+        self.stdout.write(self.style.SUCCESS('\n=== Planned Changes ==='))
+        
+        new_films = [file_id for file_id in plan.films if file_id not in resolution.films]
+        unchanged = len(resolution.films) - len(resolution.film_changes)
+        self.stdout.write(f'Films: {len(new_films)} new, {len(resolution.film_changes)} updated, {unchanged} unchanged')
+        for file_id in new_films:
+            self.stdout.write(f'  + {file_id} {plan.films[file_id]["title"]}')
+        for file_id, changes in resolution.film_changes.items():
+            self.stdout.write(f'  ~ {file_id}')
+            for field, (old, new) in changes.items():
+                self.stdout.write(f'      {field}: {old!r} -> {new!r}')
+        
+        for label, names in (
+            ('People', [full_name for key, full_name in plan.people.items() if key not in resolution.people]),
+            ('Locations', [name for name in plan.locations if name not in resolution.locations]),
+            ('Tags', [name for name in plan.tags if name not in resolution.tags]),
+        ):
+            self.stdout.write(f'{label}: {len(names)} new')
+            for name in sorted(names):
+                self.stdout.write(f'  + {name}')
+        
+        # Links to rows that do not exist yet are always new
+        film_ids = {file_id: film.id for file_id, film in resolution.films.items()}
+        existing = self.link_targets(plan, resolution, film_ids)
+        for attribute in FILM_LINKS:
+            planned = len(getattr(plan, attribute))
+            already = len(existing[attribute] & resolution.links[attribute])
+            self.stdout.write(f'{attribute.replace("_", " ").capitalize()} links: {planned - already} new')
+        
+        new_chapters = [
+            key for key in plan.chapters
+            if key[0] not in film_ids or (film_ids[key[0]], key[1]) not in resolution.chapters
+        ]
+        self.stdout.write(f'Chapters: {len(new_chapters)} new')
+
+    def print_timings(self):
+        self.stdout.write(self.style.SUCCESS('\n=== Timing ==='))
+        for label, seconds, queries in self.timings:
+            self.stdout.write(f'{label}: {seconds:.2f}s, {queries} queries')
+
     def merge_stats(self, main_stats, sub_stats):
         """Merge sub-statistics into main statistics"""
         for key in ['chapters', 'people', 'locations', 'tags']:
@@ -425,6 +596,12 @@ class Command(BaseCommand):
         self.stdout.write(f'People processed: {stats["people"]}')
         self.stdout.write(f'Locations processed: {stats["locations"]}')
         self.stdout.write(f'Tags processed: {stats["tags"]}')
+        if 'films_created' in stats:
+            self.stdout.write(
+                f'Created {stats["films_created"]} films, {stats["people_created"]} people, '
+                f'{stats["locations_created"]} locations, {stats["tags_created"]} tags, '
+                f'{stats["chapters_created"]} chapters; updated {stats["films_updated"]} films'
+            )
         
         if stats['errors']:
             self.stdout.write(self.style.ERROR(f'\nErrors encountered: {len(stats["errors"])}'))
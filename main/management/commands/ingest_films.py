@@ -0,0 +1,281 @@
+import shutil
+from datetime import timedelta
+from pathlib import Path
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from main import journal
+from main.models import Film, Chapter
+from main.importing.bitfield import bitfield_chapter_people, write_chapter_people
+from main.importing.context import CHAPTER_FIELDS, ImportContext, apply_metadata_flags
+from main.importing.hashing import content_hash, file_hash
+from main.importing.pipeline import (
+    STAGES, Checkpoint, StageTimings, prefetch, read_sources, parse_items, load_youtube_index, map_youtube,
+)
+from .import_chapter_metadata import SHEET_DIR
+
+SCRIPTS_DIR = Path(settings.BASE_DIR) / 'scripts'
+
+
+class Command(BaseCommand):
+    help = 'Ingest new films from a CSV, their chapter sheets and the YouTube mapping in one resumable pipeline'
+
+    def add_arguments(self, parser):
+        parser.add_argument('csv_file', type=str, help='Film CSV (family_movies_batchd.csv layout)')
+        parser.add_argument(
+            '--batch',
+            type=str,
+            help='Only ingest rows whose "Scan Batch (A, B, or C)" column has this value, e.g. "Batch D"',
+        )
+        parser.add_argument('--sheet-dir', type=str, default=SHEET_DIR, help='Directory containing the chapter sheets')
+        parser.add_argument(
+            '--youtube-mapping',
+            type=str,
+            default=str(SCRIPTS_DIR / 'batch_d_video_mapping.json'),
+            help='JSON list of {file_id, youtube_id, title}',
+        )
+        parser.add_argument(
+            '--youtube-videos',
+            type=str,
+            default=str(SCRIPTS_DIR / 'youtube_videos_with_descriptions.json'),
+            help='Cached playlist videos; descriptions naming a File ID supply metadata and unmapped IDs',
+        )
+        parser.add_argument(
+            '--save-thumbnails',
+            type=str,
+            default='static/thumbnails/chapters',
+            help='Directory to save chapter thumbnails',
+        )
+        parser.add_argument(
+            '--state-file',
+            type=str,
+            default='ingest_state.json',
+            help='Checkpoint file; a failed run resumes from it (removed after a clean run)',
+        )
+        parser.add_argument('--restart', action='store_true', help='Ignore an existing checkpoint and start over')
+        parser.add_argument('--workers', type=int, default=2, help='Processes used to parse sheets (1 parses in-process)')
+
+    def handle(self, *args, **options):
+        csv_file = options['csv_file']
+        if not Path(csv_file).exists():
+            raise CommandError(f'CSV file not found: {csv_file}')
+        if options['workers'] < 1:
+            raise CommandError('--workers must be at least 1')
+
+        state_file = Path(options['state_file'])
+        staging_dir = state_file.with_name(state_file.stem + '_staging')
+        if options['restart']:
+            state_file.unlink(missing_ok=True)
+            shutil.rmtree(staging_dir, ignore_errors=True)
+        # YouTube lookups are kept per film, so a corrected descriptions file must not be resumed over
+        youtube_videos = options['youtube_videos']
+        fingerprint = content_hash([
+            file_hash(csv_file), options['batch'], options['sheet_dir'], options['youtube_mapping'],
+            file_hash(youtube_videos) if youtube_videos and Path(youtube_videos).is_file() else '',
+        ])
+        checkpoint = Checkpoint(state_file, fingerprint)
+        if checkpoint.resumed:
+            self.stdout.write(f"Resuming from {state_file}: {len(checkpoint.done)} films already written")
+
+        self.timings = StageTimings()
+        self.context = ImportContext()
+        self.thumbnail_dir = Path(options['save_thumbnails'])
+        self.copied_thumbnails = []
+        self.thumbnail_film_ids = set()
+        youtube_index = load_youtube_index(options['youtube_mapping'], options['youtube_videos'])
+
+        # read -> parse -> thumbnails run ahead of the writer in a background thread and worker processes
+        items = self.timings.timed_iter('read', read_sources(csv_file, options['sheet_dir'], options['batch']))
+        items = (item for item in items if item['key'] not in checkpoint.done)
+        items = prefetch(parse_items(items, str(staging_dir), options['workers'], checkpoint, self.timings))
+
+        written, errors = 0, []
+        for item in items:
+            key = item['key']
+            self.stdout.write(f"\nProcessing: {key}")
+            with self.timings.timed('youtube'):
+                youtube = checkpoint.get('youtube', key) or map_youtube(item, youtube_index)['youtube']
+                checkpoint.put('youtube', key, youtube)
+                item = dict(item, youtube=youtube)
+            if item['youtube']['needs_manual_mapping']:
+                self.stdout.write(self.style.WARNING(f"  No YouTube video found for {key}; using a placeholder"))
+            sheet = item['sheet_data']
+            if sheet:
+                for error in sheet['errors'] + ([sheet['exception']] if 'exception' in sheet else []):
+                    self.stderr.write(f"  {error}")
+
+            # Resolve and write share one transaction, so a failure leaves nothing half-written
+            try:
+                with transaction.atomic(), journal.batched(), self.context.sheet():
+                    with self.timings.timed('resolve'):
+                        self.resolve(item)
+                    with self.timings.timed('write'):
+                        self.write(item)
+            except Exception as e:
+                errors.append(key)
+                self.stderr.write(f"  Error writing {key}: {e}")
+                continue
+            checkpoint.finish(key)
+            written += 1
+
+        if errors:
+            self.stdout.write(self.style.WARNING(
+                f"\n{len(errors)} film(s) failed: {', '.join(errors)}. Run again to resume from {state_file}"
+            ))
+        else:
+            checkpoint.clear()
+            shutil.rmtree(staging_dir, ignore_errors=True)
+        self.stdout.write(self.style.SUCCESS(f"\nWrote {written} films"))
+        self.print_timings()
+
+        # Resized variants of the new thumbnails, for srcset
+        if self.copied_thumbnails:
+            call_command('generate_thumbnail_derivatives', '--files', *self.copied_thumbnails,
+                         '--workers', str(options['workers']), stdout=self.stdout)
+            # Inline placeholders of the new thumbnails; the films' remote thumbnails are not fetched here
+            call_command('generate_thumbnail_placeholders', '--file-ids', *sorted(self.thumbnail_film_ids), '--no-fetch',
+                         '--workers', str(options['workers']), stdout=self.stdout)
+
+    def film_names(self, item):
+        """People and locations for the film from the CSV and the YouTube description"""
+        metadata = item['youtube']['metadata']
+        people = list(dict.fromkeys(item['film']['people'] + metadata['people']))
+        locations = list(dict.fromkeys(item['film']['locations'] + metadata['locations']))
+        return people, locations
+
+    def chapter_rows(self, item):
+        """Sheet rows with a title, or the chapters listed in the YouTube description"""
+        if item['sheet_data']:
+            return [row for row in item['sheet_data']['rows'] if row['title']]
+        return [
+            {
+                'title': chapter['title'], 'timecode': chapter['start_time'],
+                'start_seconds': Chapter.parse_time_to_seconds(chapter['start_time']),
+                'description': '', 'years': '', 'bitfield': '', 'locations': [], 'tags': [],
+                'other_people': [], 'thumbnail': None,
+            }
+            for chapter in item['youtube']['metadata']['chapters']
+        ]
+
+    def resolve(self, item):
+        """Queue every name the film and its chapters use and create the new ones together"""
+        people, locations = self.film_names(item)
+        rows = self.chapter_rows(item)
+        self.context.add_people(people + [name for row in rows for name in row['other_people']])
+        self.context.add_locations(locations + [name for row in rows for name in row['locations']])
+        self.context.add_tags(tag for row in rows for tag in row['tags'])
+        self.context.flush()
+
+    def film_values(self, item):
+        film, youtube = item['film'], item['youtube']
+        metadata = youtube['metadata']
+        duration = film['duration_seconds']
+        return {
+            'title': film['title'] or youtube['title'],
+            'description': metadata['description'] or film['description'],
+            'summary': film['summary'],
+            'years': film['years'] or (metadata['years'][0] if metadata['years'] else ''),
+            'technical_notes': metadata['technical_notes'] or film['technical_notes'],
+            'workflow_state': film['workflow_state'],
+            'duration': timedelta(seconds=duration) if duration is not None else None,
+        }
+
+    def write(self, item):
+        """Create or update the film, its chapters, thumbnails and links"""
+        key, youtube = item['key'], item['youtube']
+        values = self.film_values(item)
+        film = Film.objects.filter(file_id=key).first()
+        if film is None:
+            film = Film.objects.create(
+                file_id=key, youtube_id=youtube['youtube_id'], youtube_url=youtube['youtube_url'],
+                thumbnail_url=youtube['thumbnail_url'], **values
+            )
+            self.stdout.write(f"  Created film: {film.title}")
+        else:
+            if film.youtube_id.startswith('placeholder_') and not youtube['needs_manual_mapping']:
+                values.update(youtube_id=youtube['youtube_id'], youtube_url=youtube['youtube_url'])
+            changed = [field for field, value in values.items() if value and getattr(film, field) != value]
+            for field in changed:
+                setattr(film, field, values[field])
+            if changed:
+                film.save(update_fields=changed)
+            self.stdout.write(f"  Updated film: {film.title} ({', '.join(changed) or 'no changes'})")
+
+        people, locations = self.film_names(item)
+        self.context.link_film(film.id, people, locations)
+        self.write_chapters(film, item)
+
+    def write_chapters(self, film, item):
+        """
+        Match chapter rows to the film's chapters; a film without chapters
+        gets one per row. Rows that match nothing on a film that has
+        chapters are reported, not added.
+        """
+        index = self.context.chapter_index(film)
+        next_order = max((chapter.order for chapter in index.chapters), default=0) + 1
+        matched, created = [], []
+        for row in self.chapter_rows(item):
+            if index.chapters:
+                chapter = index.match(row['title'], row['timecode'])
+                if not chapter:
+                    self.stderr.write(f"  No matching chapter found for '{row['title']}' at {row['timecode']}")
+                    continue
+            else:
+                seconds = row['start_seconds']
+                chapter = Chapter(
+                    film=film, title=row['title'][:500], order=next_order,
+                    start_time=f"{seconds // 60:02d}:{seconds % 60:02d}", start_time_seconds=seconds,
+                )
+                next_order += 1
+                created.append(chapter)
+            if row['description']:
+                chapter.description = row['description']
+            if row['years']:
+                chapter.years = row['years']
+            matched.append((chapter, row))
+        Chapter.objects.bulk_create(created)
+        journal.record(journal.instance_entry(chapter, 'create') for chapter in created)
+        if not matched:
+            return
+
+        chapters = {chapter.id: chapter for chapter, _ in matched}
+        links = {'locations': {}, 'tags': {}, 'people': {}}
+        sheet_bitfields = []
+        bitfield_key = item['sheet_data']['bitfield_key'] if item['sheet_data'] else []
+        for chapter, row in matched:
+            links['locations'].setdefault(chapter.id, []).extend(row['locations'])
+            links['tags'].setdefault(chapter.id, []).extend(row['tags'])
+            links['people'].setdefault(chapter.id, []).extend(row['other_people'])
+            if bitfield_key and row['bitfield'] and len(row['bitfield']) == len(bitfield_key):
+                sheet_bitfields.append((chapter.id, row['bitfield']))
+            if row.get('thumbnail_error'):
+                self.stderr.write(row['thumbnail_error'])
+            elif row['thumbnail']:
+                self.copy_thumbnail(film, chapter, row['thumbnail'][1])
+
+        apply_metadata_flags(chapters.values(), self.context.link_chapters(links, list(chapters)))
+        Chapter.objects.bulk_update(chapters.values(), CHAPTER_FIELDS)
+        journal.record(journal.instance_entry(chapter, 'update', CHAPTER_FIELDS) for chapter in chapters.values())
+
+        if sheet_bitfields:
+            pairs = bitfield_chapter_people(
+                [chapter_id for chapter_id, _ in sheet_bitfields], [bitfield for _, bitfield in sheet_bitfields],
+                len(bitfield_key), lambda idx: self.context.hayward_person_id(idx, bitfield_key[idx]),
+            )
+            write_chapter_people(pairs, is_primary=False)
+        self.stdout.write(f"  {len(created)} chapters created, {len(matched) - len(created)} updated")
+
+    def copy_thumbnail(self, film, chapter, staged_path):
+        """Copy a staged thumbnail to the chapter thumbnail directory; unsaved"""
+        self.thumbnail_dir.mkdir(parents=True, exist_ok=True)
+        filename = f"{film.file_id}_ch{chapter.order:02d}_{chapter.start_time_seconds}s{Path(staged_path).suffix}"
+        shutil.copy2(staged_path, self.thumbnail_dir / filename)
+        self.copied_thumbnails.append(str(self.thumbnail_dir / filename))
+        self.thumbnail_film_ids.add(film.file_id)
+        chapter.thumbnail_url = f"/static/thumbnails/chapters/{filename}"
+
+    def print_timings(self):
+        self.stdout.write(self.style.SUCCESS('\n=== Timing ==='))
+        for stage in STAGES:
+            self.stdout.write(f"{stage}: {self.timings.seconds[stage]:.2f}s over {self.timings.items[stage]} films")
@@ -0,0 +1,129 @@
+import os
+import time
+from django.core.management.base import BaseCommand
+from django.conf import settings
+from main.derivatives import relative_to_root, static_file
+from main.models import Film, Chapter
+from main.thumbnail_manifest import ThumbnailManifest, audit
+
+FILM_URL_FIELDS = ('thumbnail_url', 'thumbnail_high_url', 'thumbnail_medium_url', 'preview_sprite_url')
+
+
+class Command(BaseCommand):
+    help = 'Report missing, orphaned, oversized and unreadable thumbnail files against the database'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--source-dir',
+            type=str,
+            default=settings.THUMBNAIL_ROOT,
+            help='Directory of thumbnails to scan; the derivatives directory is left out'
+        )
+        parser.add_argument(
+            '--manifest',
+            type=str,
+            default=os.path.join(settings.BASE_DIR, 'cache', 'thumbnail_manifest.json'),
+            help='Manifest of the files found, refreshed by size and mtime on the next run'
+        )
+        parser.add_argument(
+            '--rescan',
+            action='store_true',
+            help='Decode and hash every file again, even if its size and mtime are unchanged'
+        )
+        parser.add_argument(
+            '--max-kb',
+            type=int,
+            default=500,
+            help='Files larger than this are reported as oversized (default: %(default)s)'
+        )
+        parser.add_argument(
+            '--max-width',
+            type=int,
+            default=1280,
+            help='Images wider than this, other than sprite sheets, are reported as oversized (default: %(default)s)'
+        )
+        parser.add_argument(
+            '--limit',
+            type=int,
+            default=10,
+            help='Files listed per problem; 0 lists them all (default: %(default)s)'
+        )
+
+    def handle(self, *args, **options):
+        root = options['source_dir']
+        start = time.monotonic()
+        manifest = ThumbnailManifest(root, options['manifest'], skip_dirs=[settings.THUMBNAIL_DERIVATIVES_DIR])
+        scanned, inspected, removed = manifest.refresh(options['rescan'])
+        manifest.save()
+        self.stdout.write(
+            f'Scanned {scanned} files in {time.monotonic() - start:.2f}s: '
+            f'{inspected} new or changed, {removed} gone since the last scan'
+        )
+
+        references, wide, outside = self.references(root)
+        problems = audit(manifest.files, references, options['max_kb'] * 1024, options['max_width'], wide)
+
+        self.report('Missing files', [f'{owner}: {relative}' for owner, relative in problems['missing']], options['limit'])
+        self.report('Unreadable files', [
+            f"{relative}: {manifest.files[relative]['error']}" for relative in problems['unreadable']
+        ], options['limit'])
+        self.report('Oversized files', [
+            f"{relative}: {manifest.files[relative]['size'] / 1024:.0f} KB, "
+            f"{manifest.files[relative]['width']}x{manifest.files[relative]['height']}"
+            for relative in problems['oversized']
+        ], options['limit'])
+        self.report('Orphaned files (not referenced by any film or chapter)', problems['orphaned'], options['limit'])
+
+        self.stdout.write('\n=== SUMMARY ===')
+        self.stdout.write(f'Files under {root}: {len(manifest.files)}')
+        self.stdout.write(f'References checked: {len(references)} ({outside} static URLs outside the thumbnail directory skipped)')
+        for problem in ('missing', 'unreadable', 'oversized', 'orphaned'):
+            self.stdout.write(f'{problem.capitalize()}: {len(problems[problem])}')
+
+    def references(self, root):
+        """
+        (owner, path relative to root) for every static thumbnail the films
+        and chapters refer to, the sprite sheet paths, and the number of
+        static URLs outside root
+        """
+        static_dir = os.path.join(settings.BASE_DIR, 'static')
+        references, wide, outside = [], set(), 0
+
+        def add(owner, url):
+            nonlocal outside
+            path = static_file(url, settings.STATIC_URL, static_dir)
+            if path is None:
+                return None
+            relative = relative_to_root(path, root)
+            if relative is None:
+                outside += 1
+                return None
+            # Older sprite generator runs pointed at a directory of frames
+            relative += '/' if url.endswith('/') else ''
+            references.append((owner, relative))
+            return relative
+
+        for film in Film.objects.only('file_id', 'preview_frame_count', *FILM_URL_FIELDS).order_by('file_id'):
+            for field in FILM_URL_FIELDS:
+                url = getattr(film, field)
+                relative = add(f'film {film.file_id} {field}', url)
+                if field == 'preview_sprite_url' and relative:
+                    wide.add(relative)
+                    if url.endswith('.webp'):
+                        # The JPEG fallback beside the WebP sheet
+                        wide.add(add(f'film {film.file_id} sprite fallback', url[:-len('.webp')] + '.jpg'))
+                    if film.preview_animation_url():
+                        wide.add(add(f'film {film.file_id} preview animation', film.preview_animation_url()))
+        chapters = Chapter.objects.exclude(thumbnail_url='').order_by('film__file_id', 'order')
+        for file_id, order, url in chapters.values_list('film__file_id', 'order', 'thumbnail_url'):
+            add(f'chapter {file_id} #{order}', url)
+        return references, wide, outside
+
+    def report(self, title, lines, limit):
+        if not lines:
+            return
+        self.stdout.write(f'\n=== {title} ({len(lines)}) ===')
+        for line in lines[:limit or None]:
+            self.stdout.write(f'  {line}')
+        if limit and len(lines) > limit:
+            self.stdout.write(f'  ... and {len(lines) - limit} more')
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.4 on 2026-10-19 03:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0008_add_person_name_unique_constraint'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='JournalCursor',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True)),
+                ('sequence', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'ordering': ['name'],
+            },
+        ),
+        migrations.CreateModel(
+            name='JournalEntry',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('model', models.CharField(help_text='Model name, e.g. chapterpeople', max_length=50)),
+                ('object_id', models.CharField(help_text='Primary key, or owner:target for association rows', max_length=100)),
+                ('action', models.CharField(choices=[('create', 'Create'), ('update', 'Update'), ('delete', 'Delete')], max_length=10)),
+                ('film_id', models.IntegerField(blank=True, help_text='Film affected by the change, if known', null=True)),
+                ('chapter_id', models.IntegerField(blank=True, help_text='Chapter affected by the change, if any', null=True)),
+                ('data', models.JSONField(blank=True, default=dict)),
+            ],
+            options={
+                'verbose_name_plural': 'Journal entries',
+                'ordering': ['id'],
+            },
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.4 on 2026-10-19 03:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0009_change_journal'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('importer', models.CharField(help_text='e.g. family_films, chapter_metadata, batch_d', max_length=50)),
+                ('source', models.CharField(help_text='Source file the row came from', max_length=500)),
+                ('key', models.CharField(blank=True, help_text='Row, film or image key; blank for the whole file', max_length=255)),
+                ('content_hash', models.CharField(max_length=64)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'ordering': ['importer', 'source', 'key'],
+                'unique_together': {('importer', 'source', 'key')},
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.4 on 2026-10-19 04:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0010_import_state'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chapter',
+            name='thumbnail_color',
+            field=models.CharField(blank=True, help_text='Dominant colour of the thumbnail (#rrggbb)', max_length=7),
+        ),
+        migrations.AddField(
+            model_name='chapter',
+            name='thumbnail_placeholder',
+            field=models.TextField(blank=True, help_text='Data URI of a tiny WebP shown while the thumbnail loads'),
+        ),
+        migrations.AddField(
+            model_name='film',
+            name='thumbnail_color',
+            field=models.CharField(blank=True, help_text='Dominant colour of the thumbnail (#rrggbb)', max_length=7),
+        ),
+        migrations.AddField(
+            model_name='film',
+            name='thumbnail_placeholder',
+            field=models.TextField(blank=True, help_text='Data URI of a tiny WebP shown while the thumbnail loads'),
+        ),
+    ]
@@ -232,17 +232,24 @@ class Person(models.Model):
         
         # If spouse changed, update relationships
         if original_spouse != current_spouse:
+            updated = []
             # Clear old spouse relationship (set their spouse to None)
             if original_spouse and original_spouse.spouse == self:
                 original_spouse.spouse = None
                 # Use update to avoid triggering save() recursion
                 Person.objects.filter(pk=original_spouse.pk).update(spouse=None)
+                updated.append(original_spouse.pk)
             
             # Set new spouse relationship (set their spouse to self)
             if current_spouse and current_spouse.spouse != self:
                 # Use update to avoid triggering save() recursion
                 Person.objects.filter(pk=current_spouse.pk).update(spouse=self.pk)
-
+                updated.append(current_spouse.pk)
+            
+            if updated:
+                # update() bypasses the journal signals, so record the change here
+                from .journal import record, update_entries
+                record(update_entries(Person, updated, ['spouse']))
 
 class Location(models.Model):
     name = models.CharField(max_length=200)
@@ -311,6 +318,15 @@ class DigitalReel(models.Model):
         return self.reel_id
 
 
+def placeholder_style(placeholder, color):
+    styles = []
+    if color:
+        styles.append(f"background-color: {color};")
+    if placeholder:
+        styles.append(f"background-image: url({placeholder}); background-size: cover; background-position: center;")
+    return ' '.join(styles)
+
+
 class Film(models.Model):
     file_id = models.CharField(max_length=50, unique=True, help_text="Unique identifier matching CSV file ID")
     youtube_url = models.URLField()
@@ -323,6 +339,8 @@ class Film(models.Model):
     thumbnail_url = models.URLField(help_text="YouTube thumbnail URL (maxresdefault)")
     thumbnail_high_url = models.URLField(blank=True, help_text="High quality thumbnail (hqdefault)")
     thumbnail_medium_url = models.URLField(blank=True, help_text="Medium quality thumbnail (mqdefault)")
+    thumbnail_placeholder = models.TextField(blank=True, help_text="Data URI of a tiny WebP shown while the thumbnail loads")
+    thumbnail_color = models.CharField(max_length=7, blank=True, help_text="Dominant colour of the thumbnail (#rrggbb)")
     
     # Animated thumbnail support
     preview_sprite_url = models.URLField(blank=True, help_text="Path to sprite sheet for hover animation")
@@ -374,6 +392,31 @@ class Film(models.Model):
         """Check if film has either sprite-based or chapter-based animation"""
         return bool(self.preview_sprite_url and self.preview_frame_count > 0) or self.has_chapter_thumbnails()
     
+    def get_resized_thumbnail_url(self, width):
+        """Thumbnail scaled to width pixels by the resize endpoint"""
+        return reverse('films:film_thumbnail', kwargs={'file_id': self.file_id, 'width': width})
+
+    def has_sprite_sheet(self):
+        """Check if film has a packed sprite sheet (older generator runs wrote a frame directory)"""
+        return bool(self.preview_frame_count and self.preview_sprite_url.endswith('.webp'))
+
+    def preview_sprite_columns(self):
+        """Columns of the sprite sheet grid; frame n is at column n % columns, row n // columns"""
+        from .sprites import sheet_columns
+        return sheet_columns(self.preview_frame_count)
+
+    def preview_sprite_fallback_url(self):
+        """JPEG copy of the sprite sheet for browsers without WebP"""
+        return self.preview_sprite_url[:-len('.webp')] + '.jpg' if self.has_sprite_sheet() else ''
+
+    def preview_animation_url(self):
+        """Animated WebP of the same frames, written next to the sprite sheet"""
+        return self.preview_sprite_url[:-len('_sprite.webp')] + '_preview.webp' if self.has_sprite_sheet() else ''
+
+    def placeholder_style(self):
+        """Inline CSS painting the thumbnail placeholder behind the image until it loads"""
+        return placeholder_style(self.thumbnail_placeholder, self.thumbnail_color)
+
     def has_chapter_thumbnails(self):
         """Check if film has chapter thumbnails for animation"""
         return self.chapters.exclude(thumbnail_url__isnull=True).exclude(thumbnail_url__exact="").count() >= 2
@@ -395,6 +438,8 @@ class Chapter(models.Model):
     
     # Chapter thumbnail
     thumbnail_url = models.URLField(blank=True, help_text="Thumbnail image URL for this chapter")
+    thumbnail_placeholder = models.TextField(blank=True, help_text="Data URI of a tiny WebP shown while the thumbnail loads")
+    thumbnail_color = models.CharField(max_length=7, blank=True, help_text="Dominant colour of the thumbnail (#rrggbb)")
     
     # Metadata indicators for UI
     has_people_metadata = models.BooleanField(default=False)
@@ -441,6 +486,16 @@ class Chapter(models.Model):
         self.has_years_metadata = bool(self.years and self.years.strip())
         self.save(update_fields=['has_people_metadata', 'has_location_metadata', 'has_tags_metadata', 'has_years_metadata'])
     
+    def get_resized_thumbnail_url(self, width):
+        """Chapter thumbnail scaled to width pixels by the resize endpoint"""
+        return reverse('films:chapter_thumbnail', kwargs={'chapter_id': self.id, 'width': width})
+    
+    def placeholder_style(self):
+        """Inline CSS for the placeholder of get_thumbnail_url(), falling back to the film's"""
+        if self.thumbnail_url:
+            return placeholder_style(self.thumbnail_placeholder, self.thumbnail_color)
+        return self.film.placeholder_style()
+    
     def get_thumbnail_url(self):
         """Get thumbnail URL with fallback to film thumbnail"""
         if self.thumbnail_url:
@@ -557,4 +612,59 @@ class SequenceTags(models.Model):
     is_auto = models.BooleanField(default=False)
     
     class Meta:
-        unique_together = ('sequence', 'tag')
\ No newline at end of file
+        unique_together = ('sequence', 'tag')
+
+# Change journal
+
+class JournalEntry(models.Model):
+    """Append-only record of a metadata change; the id is the sequence number"""
+    ACTION_CHOICES = [
+        ('create', 'Create'),
+        ('update', 'Update'),
+        ('delete', 'Delete'),
+    ]
+    
+    id = models.BigAutoField(primary_key=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    model = models.CharField(max_length=50, help_text="Model name, e.g. chapterpeople")
+    object_id = models.CharField(max_length=100, help_text="Primary key, or owner:target for association rows")
+    action = models.CharField(max_length=10, choices=ACTION_CHOICES)
+    film_id = models.IntegerField(null=True, blank=True, help_text="Film affected by the change, if known")
+    chapter_id = models.IntegerField(null=True, blank=True, help_text="Chapter affected by the change, if any")
+    data = models.JSONField(default=dict, blank=True)
+    
+    class Meta:
+        ordering = ['id']
+        verbose_name_plural = "Journal entries"
+    
+    def __str__(self):
+        return f"#{self.id} {self.action} {self.model} {self.object_id}"
+
+
+class JournalCursor(models.Model):
+    """Last journal sequence number processed by a consumer"""
+    name = models.CharField(max_length=100, unique=True)
+    sequence = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        ordering = ['name']
+    
+    def __str__(self):
+        return f"{self.name} @ {self.sequence}"
+
+
+class ImportState(models.Model):
+    """Content hash of a source file or one logical row of it, as last imported"""
+    importer = models.CharField(max_length=50, help_text="e.g. family_films, chapter_metadata, batch_d")
+    source = models.CharField(max_length=500, help_text="Source file the row came from")
+    key = models.CharField(max_length=255, blank=True, help_text="Row, film or image key; blank for the whole file")
+    content_hash = models.CharField(max_length=64)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        ordering = ['importer', 'source', 'key']
+        unique_together = ('importer', 'source', 'key')
+    
+    def __str__(self):
+        return f"{self.importer}: {self.source} {self.key}".strip()
@@ -0,0 +1,222 @@
+"""
+Perceptual hashes of thumbnails and an index for finding near duplicates.
+
+Each image gets two 64-bit hashes computed with NumPy over a batch of
+images at once: a difference hash (dHash, whether each pixel of a 9x8
+grayscale image is brighter than its left neighbour) and a DCT hash
+(pHash, whether each low-frequency DCT coefficient of a 32x32 image is
+above their median). Re-encoded, rescaled or slightly recropped copies
+of a picture stay within a few bits of each other.
+
+BKTree indexes hashes by Hamming distance, so looking up every hash
+within a few bits of another visits a small part of the tree instead of
+comparing against every image. Nearly uniform images (blank or black
+frames) hash alike whatever they show and are flagged as flat so callers
+can leave them out. HashCache keeps hashes on disk by path, size and
+mtime between runs.
+"""
+import json
+import os
+import numpy as np
+from PIL import Image
+
+from main.rendering import render_all
+
+HASH_SIZE = 8
+DCT_SIZE = 32
+# dHash bits that may differ between copies of one picture, and the pHash bits confirming it
+MAX_DISTANCE = 6
+PHASH_MAX_DISTANCE = 10
+# Grayscale standard deviation below which an image is treated as one flat colour
+FLAT_STDDEV = 3.0
+CHUNK_SIZE = 64
+
+
+def dct_matrix(size=DCT_SIZE):
+    k, n = np.meshgrid(np.arange(size), np.arange(size), indexing='ij')
+    return np.cos(np.pi * (2 * n + 1) * k / (2 * size))
+
+
+DCT = dct_matrix()
+
+
+def pack_bits(bits):
+    """One unsigned 64-bit int per row of a (N, 64) boolean array"""
+    packed = np.packbits(bits.reshape(len(bits), -1), axis=1)
+    return [int(value) for value in packed.view('>u8').ravel()]
+
+
+def dhash(pixels):
+    """dHashes of a (N, HASH_SIZE, HASH_SIZE + 1) grayscale batch"""
+    return pack_bits(pixels[:, :, 1:] > pixels[:, :, :-1])
+
+
+def phash(pixels):
+    """pHashes of a (N, DCT_SIZE, DCT_SIZE) grayscale batch"""
+    coefficients = (DCT @ pixels @ DCT.T)[:, :HASH_SIZE, :HASH_SIZE].reshape(len(pixels), -1)
+    # The DC term is the mean brightness, which says nothing about the picture
+    median = np.median(coefficients[:, 1:], axis=1, keepdims=True)
+    return pack_bits(coefficients > median)
+
+
+def hamming(a, b):
+    return (a ^ b).bit_count()
+
+
+def grayscale(path):
+    """(dHash pixels, pHash pixels) of one image file as float arrays"""
+    with Image.open(path) as image:
+        # JPEGs are decoded at a reduced scale; the hashes only need 32x32
+        image.draft('L', (DCT_SIZE * 2, DCT_SIZE * 2))
+        image = image.convert('L')
+        small = image.resize((HASH_SIZE + 1, HASH_SIZE), Image.Resampling.BOX)
+        large = image.resize((DCT_SIZE, DCT_SIZE), Image.Resampling.BOX)
+    return np.asarray(small, dtype=np.float64), np.asarray(large, dtype=np.float64)
+
+
+def hash_files(paths):
+    """
+    Hash a batch of image files; runs in a worker process. Returns one
+    {'path', 'dhash', 'phash', 'flat'} or {'path', 'error'} per path.
+    """
+    results, small, large = [], [], []
+    for path in paths:
+        try:
+            pixels = grayscale(path)
+        except (OSError, SyntaxError, ValueError) as e:
+            results.append({'path': path, 'error': str(e)})
+            continue
+        small.append(pixels[0])
+        large.append(pixels[1])
+        results.append({'path': path})
+    if small:
+        large = np.stack(large)
+        hashed = [result for result in results if 'error' not in result]
+        flat = large.reshape(len(large), -1).std(axis=1) < FLAT_STDDEV
+        for result, d, p, is_flat in zip(hashed, dhash(np.stack(small)), phash(large), flat):
+            result.update(dhash=d, phash=p, flat=bool(is_flat))
+    return results
+
+
+def hash_all(paths, workers=1, chunk_size=CHUNK_SIZE):
+    """Yield hash results in batches, hashing the batches in a process pool"""
+    chunks = [paths[i:i + chunk_size] for i in range(0, len(paths), chunk_size)]
+    for results in render_all(hash_files, chunks, workers):
+        yield from results
+
+
+class HashCache:
+    """Hashes of files by absolute path, reused while the file's size and mtime are unchanged"""
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        if path and os.path.exists(path):
+            with open(path) as f:
+                self.entries = json.load(f)['files']
+
+    def key(self, path):
+        stat = os.stat(path)
+        return [stat.st_size, stat.st_mtime_ns]
+
+    def get(self, path):
+        entry = self.entries.get(os.path.abspath(path))
+        try:
+            if entry and entry['stat'] == self.key(path):
+                return {'path': path, 'dhash': int(entry['dhash'], 16), 'phash': int(entry['phash'], 16),
+                        'flat': entry['flat']}
+        except FileNotFoundError:
+            pass
+        return None
+
+    def put(self, result):
+        if 'error' in result:
+            return
+        self.entries[os.path.abspath(result['path'])] = {
+            'stat': self.key(result['path']), 'flat': result['flat'],
+            'dhash': f"{result['dhash']:016x}", 'phash': f"{result['phash']:016x}",
+        }
+
+    def save(self):
+        if not self.path:
+            return
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump({'files': self.entries}, f, indent=1, sort_keys=True)
+        os.replace(temp_path, self.path)
+
+
+def hash_paths(paths, cache=None, workers=1):
+    """{path: hash result} for paths, hashing only those the cache does not hold. Returns (results, cached)"""
+    results, missing = {}, []
+    for path in paths:
+        cached = cache.get(path) if cache else None
+        if cached:
+            results[path] = cached
+        else:
+            missing.append(path)
+    for result in hash_all(missing, workers):
+        results[result['path']] = result
+        if cache:
+            cache.put(result)
+    return results, len(paths) - len(missing)
+
+
+class BKTree:
+    """
+    Burkhard-Keller tree over hashes by Hamming distance. Items with the
+    same hash share a node; a search only descends into children whose
+    distance from the node could hold a match, by the triangle inequality.
+    """
+    def __init__(self):
+        self.root = None  # [hash, items, {distance: child node}]
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def add(self, value, item):
+        self.size += 1
+        if self.root is None:
+            self.root = [value, [item], {}]
+            return
+        node = self.root
+        while True:
+            distance = hamming(value, node[0])
+            if distance == 0:
+                node[1].append(item)
+                return
+            if distance not in node[2]:
+                node[2][distance] = [value, [item], {}]
+                return
+            node = node[2][distance]
+
+    def search(self, value, max_distance):
+        """(distance, item) for every item within max_distance bits of value, nearest first"""
+        matches, nodes = [], [self.root] if self.root else []
+        while nodes:
+            node = nodes.pop()
+            distance = hamming(value, node[0])
+            if distance <= max_distance:
+                matches.extend((distance, item) for item in node[1])
+            nodes.extend(
+                child for child_distance, child in node[2].items()
+                if distance - max_distance <= child_distance <= distance + max_distance
+            )
+        return sorted(matches, key=lambda match: match[0])
+
+
+def near_duplicate_pairs(hashes, max_distance=MAX_DISTANCE, phash_max_distance=PHASH_MAX_DISTANCE):
+    """
+    (i, j, dHash distance) for every i < j whose hashes (dicts with dhash
+    and phash) are within max_distance bits by dHash and phash_max_distance
+    bits by pHash. Each hash is looked up before it is added, so every pair
+    is found once.
+    """
+    tree, pairs = BKTree(), []
+    for j, value in enumerate(hashes):
+        for distance, i in tree.search(value['dhash'], max_distance):
+            if hamming(value['phash'], hashes[i]['phash']) <= phash_max_distance:
+                pairs.append((i, j, distance))
+        tree.add(value['dhash'], j)
+    return sorted(pairs, key=lambda pair: (pair[2], pair[0], pair[1]))
@@ -0,0 +1,51 @@
+"""
+Tiny placeholders shown while film and chapter thumbnails load.
+
+Each thumbnail is reduced to a WebP of at most PLACEHOLDER_SIZE pixels
+on its longer side, usually 100-200 bytes, and inlined in pages as a
+data: URI behind the real image. The browser scales it up into a blur
+of the picture. The dominant colour is kept as well, for the moment
+before even the data URI is painted.
+"""
+import base64
+import io
+import time
+from PIL import Image, ImageOps
+
+PLACEHOLDER_SIZE = 16
+WEBP_QUALITY = 40
+# Part of each placeholder's state hash, so changing them redraws every placeholder
+SETTINGS = {'size': PLACEHOLDER_SIZE, 'quality': WEBP_QUALITY}
+
+
+def dominant_color(image):
+    """Most common colour of an RGB image after reducing it to a few colours, as #rrggbb"""
+    quantized = image.quantize(colors=4, method=Image.Quantize.MEDIANCUT)
+    _, index = max(quantized.getcolors())
+    red, green, blue = quantized.getpalette()[index * 3:index * 3 + 3]
+    return f'#{red:02x}{green:02x}{blue:02x}'
+
+
+def placeholder(source):
+    """(data: URI of a tiny WebP, dominant colour) for an image file or file object"""
+    with Image.open(source) as image:
+        # JPEGs are decoded at a reduced scale; only a few pixels are kept
+        image.draft('RGB', (PLACEHOLDER_SIZE * 4, PLACEHOLDER_SIZE * 4))
+        image = ImageOps.exif_transpose(image).convert('RGB')
+    image.thumbnail((PLACEHOLDER_SIZE, PLACEHOLDER_SIZE), Image.Resampling.LANCZOS)
+    output = io.BytesIO()
+    image.save(output, 'WEBP', quality=WEBP_QUALITY, method=6)
+    data_uri = 'data:image/webp;base64,' + base64.b64encode(output.getvalue()).decode('ascii')
+    return data_uri, dominant_color(image)
+
+
+def render_placeholder(job):
+    """Placeholder for one job ({key, path}); runs in a worker process"""
+    start = time.monotonic()
+    result = {'key': job['key'], 'error': None}
+    try:
+        result['placeholder'], result['color'] = placeholder(job['path'])
+    except (OSError, SyntaxError, ValueError) as e:
+        result['error'] = str(e)
+    result['seconds'] = time.monotonic() - start
+    return result
@@ -0,0 +1,30 @@
+"""
+Helpers shared by the modules that render or hash images in worker
+processes: the derivatives, sprite sheets, placeholders and perceptual
+hashes.
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+
+def render_all(func, jobs, workers):
+    """
+    Yield func(job) for each job as it finishes, in a process pool, or
+    in-process in job order with one worker. func must be picklable: a
+    module-level function or a functools.partial of one.
+    """
+    if workers == 1 or len(jobs) <= 1:
+        for job in jobs:
+            yield func(job)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(func, job) for job in jobs]
+        for future in as_completed(futures):
+            yield future.result()
+
+
+def save_atomically(image, path, image_format, **options):
+    """Save image to path through a temporary file, as the old file may be served while it is replaced"""
+    temp_path = path + '.tmp'
+    image.save(temp_path, image_format, **options)
+    os.replace(temp_path, path)
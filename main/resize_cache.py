@@ -0,0 +1,150 @@
+"""
+On-demand resizing of thumbnails into a size-bounded disk cache.
+
+render_resized() lets the JPEG decoder scale down while decoding
+(Image.draft) and shrinks by whole factors (Image.reduce) before the
+final Lanczos resize, so a 160px variant of a large photo never decodes
+every source pixel. ResizeCache keeps the output as
+<root>/<key[:2]>/<key>.<ext>. Each hit refreshes the file's mtime, and
+the least recently used files are removed once the cache outgrows its
+byte limit.
+
+Requests for the same key are coalesced: one thread or process renders
+while the others wait on a lock stripe, then they serve the file it
+wrote. Locks are threading locks plus, where fcntl exists, flock on one
+of 256 lock files, so gunicorn's worker processes coalesce too.
+"""
+import io
+import os
+import threading
+from contextlib import nullcontext
+
+from PIL import Image
+
+try:
+    import fcntl
+except ImportError:  # Windows: requests are only coalesced within a process
+    fcntl = None
+
+MIME_TYPES = {'jpg': 'image/jpeg', 'webp': 'image/webp'}
+PIL_FORMATS = {'jpg': 'JPEG', 'webp': 'WEBP'}
+SAVE_OPTIONS = {
+    'jpg': {'quality': 82, 'optimize': True, 'progressive': True},
+    'webp': {'quality': 80, 'method': 4},
+}
+# Eviction frees a little more than needed, so the next writes do not evict again
+EVICT_TO = 0.9
+LOCK_DIR = 'locks'
+
+
+def render_resized(source, width, ext):
+    """Encoded bytes of source scaled to width (never enlarged), keeping its aspect ratio"""
+    with Image.open(source) as image:
+        width = min(width, image.width)
+        height = max(1, round(image.height * width / image.width))
+        # JPEG only: decode at the smallest 1/2, 1/4 or 1/8 scale still at least the target size
+        image.draft('RGB', (width, height))
+        factor = min(image.width // width, image.height // height)
+        # Whole-factor box reduction is cheap; leave Lanczos at least 2x to work with
+        if factor >= 4:
+            image = image.reduce(factor // 2)
+        image = image.convert('RGB').resize((width, height), Image.Resampling.LANCZOS)
+    image.info = {}
+    output = io.BytesIO()
+    image.save(output, PIL_FORMATS[ext], **SAVE_OPTIONS[ext])
+    return output.getvalue()
+
+
+class ResizeCache:
+    def __init__(self, root, max_bytes):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.size = None  # bytes on disk, counted on the first write
+        self.size_lock = threading.Lock()
+        self.stripes = [threading.Lock() for _ in range(256)]
+
+    def path(self, key, ext):
+        return os.path.join(self.root, key[:2], f'{key}.{ext}')
+
+    def hit(self, path):
+        """Refresh a cached file's place in the LRU order; False if it is not cached"""
+        try:
+            os.utime(path)
+            return True
+        except FileNotFoundError:
+            return False
+
+    def get(self, key, ext, render):
+        """
+        Path of the cached variant for key, calling render() for its bytes
+        when it is not cached yet. Returns (path, rendered).
+        """
+        path = self.path(key, ext)
+        if self.hit(path):
+            return path, False
+        stripe = int(key[:2], 16)
+        with self.stripes[stripe], self.process_lock(stripe):
+            # Another request may have rendered it while this one waited
+            if self.hit(path):
+                return path, False
+            data = render()
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            temp_path = f'{path}.{os.getpid()}.tmp'
+            with open(temp_path, 'wb') as f:
+                f.write(data)
+            os.replace(temp_path, path)
+        self.added(len(data))
+        return path, True
+
+    def process_lock(self, stripe):
+        if fcntl is None:
+            return nullcontext()
+        return FileLock(os.path.join(self.root, LOCK_DIR, f'{stripe:02x}'))
+
+    def entries(self):
+        """(mtime, size, path) of every cached file"""
+        entries = []
+        for directory in os.scandir(self.root) if os.path.isdir(self.root) else ():
+            if not directory.is_dir() or directory.name == LOCK_DIR:
+                continue
+            for entry in os.scandir(directory.path):
+                if entry.is_file() and not entry.name.endswith('.tmp'):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return entries
+
+    def added(self, size):
+        with self.size_lock:
+            if self.size is None:
+                self.size = sum(entry_size for _, entry_size, _ in self.entries())
+            else:
+                self.size += size
+            if self.size > self.max_bytes:
+                self.evict()
+
+    def evict(self):
+        """Remove least recently used files until the cache is below EVICT_TO of its limit"""
+        entries = sorted(self.entries())
+        self.size = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if self.size <= self.max_bytes * EVICT_TO:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            self.size -= size
+
+
+class FileLock:
+    def __init__(self, path):
+        self.path = path
+
+    def __enter__(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.file = open(self.path, 'a')
+        fcntl.flock(self.file, fcntl.LOCK_EX)
+
+    def __exit__(self, *exc_info):
+        fcntl.flock(self.file, fcntl.LOCK_UN)
+        self.file.close()
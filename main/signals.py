@@ -0,0 +1,42 @@
+from django.db.models.signals import post_save, post_delete, m2m_changed
+from . import journal
+
+
+def journal_save(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    """Record single-object saves, including those made through the admin"""
+    if raw or journal.is_muted():
+        return
+    journal.record([journal.instance_entry(instance, 'create' if created else 'update', update_fields)])
+
+
+def journal_delete(sender, instance, **kwargs):
+    if journal.is_muted():
+        return
+    journal.record([journal.instance_entry(instance, 'delete')])
+
+
+def journal_m2m_add(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    film.people.add() and friends insert through rows with bulk_create, which
+    sends no post_save; removals go through a queryset delete and are caught
+    by journal_delete.
+    """
+    if action != 'post_add' or not pk_set or journal.is_muted():
+        return
+    owner_field, target_field = journal.ASSOCIATIONS[sender]
+    entries = []
+    for pk in pk_set:
+        owner_id, target_id = (pk, instance.pk) if reverse else (instance.pk, pk)
+        entry = journal.association_entry(sender, owner_id, target_id, 'create')
+        if not reverse and isinstance(instance, journal.Chapter):
+            entry.film_id = instance.film_id
+        entries.append(entry)
+    journal.record(entries)
+
+
+for model in journal.TRACKED_MODELS:
+    post_save.connect(journal_save, sender=model, dispatch_uid=f'journal_save_{model._meta.model_name}')
+    post_delete.connect(journal_delete, sender=model, dispatch_uid=f'journal_delete_{model._meta.model_name}')
+
+for model in journal.ASSOCIATIONS:
+    m2m_changed.connect(journal_m2m_add, sender=model, dispatch_uid=f'journal_m2m_{model._meta.model_name}')
@@ -0,0 +1,247 @@
+"""
+Rendering of the hover preview sprite sheets for films.
+
+Each film's frames are packed into one grid image, saved as
+<file_id>_sprite.webp with a <file_id>_sprite.jpg fallback, so a catalog
+card needs a single image request and the browser steps through the
+frames with background-position. Frame n sits at column n % columns and
+row n // columns, with sheet_columns() giving the grid width.
+
+The same frames are also encoded once as a looping animated WebP,
+<file_id>_preview.webp. Cards show it in a single <img>, which the
+browser decodes and animates off the main thread. The sprite sheet is
+the fallback for browsers that cannot play it.
+
+A sprite job is a plain dict holding everything a film's frames are drawn
+from (chapter thumbnail files, or frame titles, timestamps, order and
+palette, plus dimensions), so jobs can be rendered in worker processes
+and their hash says whether a film's sheet is out of date. Fonts and text
+measurements are cached per process, so a worker loads each TrueType font
+once for the whole run.
+"""
+import math
+import os
+import shutil
+import textwrap
+import time
+from functools import lru_cache
+
+from PIL import Image, ImageDraw, ImageFont, ImageOps
+
+from main.importing.hashing import content_hash
+from main.rendering import save_atomically
+
+FRAME_WIDTH, FRAME_HEIGHT = 160, 90
+FRAME_INTERVAL = 0.8  # 800ms between frames
+JPEG_QUALITY = 85
+WEBP_QUALITY = 80
+ANIMATION_QUALITY = 75
+
+# Films with at least two chapter thumbnails animate those instead
+CHAPTER_FRAME_WIDTH, CHAPTER_FRAME_HEIGHT = 320, 180
+CHAPTER_FRAME_INTERVAL = 1.0
+MIN_CHAPTER_IMAGES = 2
+
+# Films with more chapters show every nth one, for around 6-8 frames
+MAX_CHAPTER_FRAMES = 8
+
+# Background colours, shared with generate_text_thumbnails
+PALETTE = (
+    '#FF6B6B',  # Soft red
+    '#4ECDC4',  # Teal
+    '#45B7D1',  # Sky blue
+    '#96CEB4',  # Mint green
+    '#F7DC6F',  # Soft yellow
+    '#BB8FCE',  # Lavender
+    '#85C1E9',  # Light blue
+    '#F8B500',  # Orange
+    '#6C5CE7',  # Purple
+    '#A8E6CF',  # Pale green
+    '#FFD93D',  # Golden yellow
+    '#FF8B94',  # Coral
+)
+
+FONT_PATHS = (
+    '/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf',
+    '/usr/share/fonts/truetype/liberation/LiberationSans-Bold.ttf',
+    '/System/Library/Fonts/Helvetica.ttc',
+    'C:\\Windows\\Fonts\\Arial.ttf',
+)
+TITLE_FONT_SIZE, TIME_FONT_SIZE, SUBTITLE_FONT_SIZE = 12, 14, 10
+
+
+def sheet_columns(frame_count):
+    """Columns of a sprite sheet grid, as close to square as the frames allow"""
+    return max(1, math.ceil(math.sqrt(frame_count)))
+
+
+def sheet_rows(frame_count):
+    return max(1, math.ceil(frame_count / sheet_columns(frame_count)))
+
+
+def sheet_paths(file_id, previews_dir):
+    """(WebP, JPEG fallback) sprite sheet paths for a film"""
+    base = os.path.join(previews_dir, f'{file_id}_sprite')
+    return base + '.webp', base + '.jpg'
+
+
+def animation_path(file_id, previews_dir):
+    """Animated WebP preview path for a film"""
+    return os.path.join(previews_dir, f'{file_id}_preview.webp')
+
+
+def sprite_job(file_id, title, chapters, images=(), width=FRAME_WIDTH, height=FRAME_HEIGHT):
+    """
+    Frames to draw for one film; chapters are (title, start_time, order)
+    in film order and images the paths of its local chapter thumbnails.
+    Films with enough thumbnails show those, films without chapters get
+    four title frames.
+    """
+    if len(images) >= MIN_CHAPTER_IMAGES:
+        # Size and mtime stand in for the content, so unchanged runs do not read every thumbnail
+        frames = []
+        for path in images:
+            stat = os.stat(path)
+            frames.append({'image': path, 'size': stat.st_size, 'mtime': stat.st_mtime_ns})
+        return {
+            'file_id': file_id, 'frames': frames,
+            'width': CHAPTER_FRAME_WIDTH, 'height': CHAPTER_FRAME_HEIGHT, 'interval': CHAPTER_FRAME_INTERVAL,
+            'quality': JPEG_QUALITY, 'webp_quality': WEBP_QUALITY, 'animation_quality': ANIMATION_QUALITY,
+        }
+    if chapters:
+        frames = [
+            {'title': chapter_title, 'timestamp': start_time, 'subtitle': f"Chapter {order}", 'color_index': order - 1}
+            for chapter_title, start_time, order in chapters
+        ]
+        if len(frames) > MAX_CHAPTER_FRAMES:
+            step = max(1, len(frames) // 6)
+            frames = frames[::step]
+    else:
+        frames = [
+            {'title': title, 'timestamp': f"Part {i + 1}", 'subtitle': "Film Preview", 'color_index': i}
+            for i in range(4)
+        ]
+    return {
+        'file_id': file_id, 'frames': frames, 'width': width, 'height': height, 'interval': FRAME_INTERVAL,
+        'palette': list(PALETTE), 'quality': JPEG_QUALITY, 'webp_quality': WEBP_QUALITY,
+        'animation_quality': ANIMATION_QUALITY,
+    }
+
+
+def job_hash(job):
+    return content_hash(job)
+
+
+@lru_cache(maxsize=None)
+def font_path():
+    return next((path for path in FONT_PATHS if os.path.exists(path)), None)
+
+
+@lru_cache(maxsize=None)
+def load_font(size):
+    path = font_path()
+    if path:
+        try:
+            return ImageFont.truetype(path, size)
+        except OSError:
+            pass
+    return ImageFont.load_default()
+
+
+@lru_cache(maxsize=4096)
+def text_width(size, text):
+    """Rendered width of text at a font size; titles and timestamps repeat across frames"""
+    left, _, right, _ = load_font(size).getbbox(text)
+    return right - left
+
+
+def create_text_thumbnail(title, timestamp, subtitle='', color='#FF6B6B', width=FRAME_WIDTH, height=FRAME_HEIGHT):
+    """Create a text-based thumbnail image for sprite frames"""
+    img = Image.new('RGB', (width, height), color)
+    draw = ImageDraw.Draw(img)
+
+    # Draw timestamp at the top
+    timestamp_text = str(timestamp)
+    draw.text(((width - text_width(TIME_FONT_SIZE, timestamp_text)) // 2, 5), timestamp_text,
+              fill='white', font=load_font(TIME_FONT_SIZE))
+
+    if subtitle:
+        draw.text(((width - text_width(SUBTITLE_FONT_SIZE, subtitle)) // 2, 25), subtitle,
+                  fill='white', font=load_font(SUBTITLE_FONT_SIZE))
+
+    # Wrap title text aggressively for the small size, limited to 3 lines
+    lines = textwrap.fill(title, width=15).split('\n')
+    if len(lines) > 3:
+        lines = lines[:3]
+        lines[2] = lines[2][:12] + '...' if len(lines[2]) > 12 else lines[2]
+
+    # Centre the text block
+    line_height = 12
+    start_y = (height - len(lines) * line_height) // 2 + 10
+    title_font = load_font(TITLE_FONT_SIZE)
+    for i, line in enumerate(lines):
+        text_x = (width - text_width(TITLE_FONT_SIZE, line)) // 2
+        text_y = start_y + i * line_height
+        # Draw text with shadow for better readability
+        draw.text((text_x + 1, text_y + 1), line, fill='black', font=title_font)
+        draw.text((text_x, text_y), line, fill='white', font=title_font)
+    return img
+
+
+def draw_frame(job, frame):
+    if 'image' in frame:
+        with Image.open(frame['image']) as image:
+            return ImageOps.fit(image.convert('RGB'), (job['width'], job['height']))
+    palette = job['palette']
+    return create_text_thumbnail(
+        frame['title'], frame['timestamp'], frame['subtitle'],
+        palette[frame['color_index'] % len(palette)], job['width'], job['height'],
+    )
+
+
+def render_sprite(job, previews_dir):
+    """
+    Pack a job's frames into one sprite sheet, written as
+    previews_dir/<file_id>_sprite.webp and .jpg, and loop them as
+    previews_dir/<file_id>_preview.webp; runs in a worker process.
+    Returns {file_id, frame_count, columns, seconds, error} plus the bytes
+    of the sheet, the animation and, for chapter thumbnail frames, the
+    frame files a browser would otherwise load one by one.
+    """
+    start = time.monotonic()
+    frame_count = len(job['frames'])
+    columns = sheet_columns(frame_count)
+    result = {'file_id': job['file_id'], 'frame_count': frame_count, 'columns': columns, 'error': None}
+    try:
+        os.makedirs(previews_dir, exist_ok=True)
+        width, height = job['width'], job['height']
+        sheet = Image.new('RGB', (columns * width, sheet_rows(frame_count) * height))
+        images = [draw_frame(job, frame) for frame in job['frames']]
+        for i, image in enumerate(images):
+            sheet.paste(image, ((i % columns) * width, (i // columns) * height))
+        webp_path, jpeg_path = sheet_paths(job['file_id'], previews_dir)
+        save_atomically(sheet, webp_path, 'WEBP', quality=job['webp_quality'], method=6)
+        save_atomically(sheet, jpeg_path, 'JPEG', quality=job['quality'], optimize=True, progressive=True)
+        sheet.close()
+        path = animation_path(job['file_id'], previews_dir)
+        save_atomically(
+            images[0], path, 'WEBP', save_all=True, append_images=images[1:],
+            duration=round(job['interval'] * 1000), loop=0, quality=job['animation_quality'], method=6,
+        )
+        for image in images:
+            image.close()
+        result.update(
+            sheet_bytes=os.path.getsize(webp_path), animation_bytes=os.path.getsize(path),
+            frame_bytes=sum(frame.get('size', 0) for frame in job['frames']),
+        )
+        # Per-frame directory written by earlier versions of the generator
+        shutil.rmtree(os.path.join(previews_dir, job['file_id']), ignore_errors=True)
+    except Exception as e:
+        result['error'] = str(e)
+    result['seconds'] = time.monotonic() - start
+    return result
+
+
+def sprite_exists(job, previews_dir):
+    paths = [*sheet_paths(job['file_id'], previews_dir), animation_path(job['file_id'], previews_dir)]
+    return all(os.path.exists(path) for path in paths)
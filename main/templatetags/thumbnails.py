@@ -0,0 +1,55 @@
+"""srcset and <source> markup for thumbnails with variants from generate_thumbnail_derivatives"""
+import os
+
+from django import template
+from django.conf import settings
+from django.utils.html import format_html_join
+
+from main.derivatives import MANIFEST_NAME, MIME_TYPES, DerivativeManifest, relative_to_root, srcset, static_file
+
+register = template.Library()
+
+# Manifest entries, loaded again when the command rewrites manifest.json
+_manifest = {'key': None, 'sources': {}}
+
+
+def derivative_sources():
+    path = os.path.join(settings.THUMBNAIL_DERIVATIVES_DIR, MANIFEST_NAME)
+    try:
+        key = (path, os.stat(path).st_mtime_ns)
+    except FileNotFoundError:
+        return {}
+    if _manifest['key'] != key:
+        _manifest['sources'] = DerivativeManifest(settings.THUMBNAIL_DERIVATIVES_DIR).sources
+        _manifest['key'] = key
+    return _manifest['sources']
+
+
+def variants(url):
+    """(manifest entry, base URL of its variants) for a thumbnail URL, (None, None) without variants"""
+    path = static_file(url, settings.STATIC_URL, os.path.join(settings.BASE_DIR, 'static'))
+    relative = path and relative_to_root(path, settings.THUMBNAIL_ROOT)
+    entry = derivative_sources().get(relative) if relative else None
+    if not entry:
+        return None, None
+    derived = relative_to_root(settings.THUMBNAIL_DERIVATIVES_DIR, os.path.join(settings.BASE_DIR, 'static'))
+    return entry, f'{settings.STATIC_URL}{derived}/'
+
+
+@register.filter
+def thumbnail_srcset(url):
+    """JPEG srcset for an <img>; empty when the thumbnail has no variants"""
+    entry, base_url = variants(url)
+    return srcset(entry, 'jpg', base_url) if entry and 'jpg' in entry['variants'] else ''
+
+
+@register.simple_tag
+def thumbnail_sources(url, sizes):
+    """<source> elements for the AVIF and WebP variants, to precede the <img> in a <picture>"""
+    entry, base_url = variants(url)
+    if not entry:
+        return ''
+    return format_html_join('', '<source type="{}" srcset="{}" sizes="{}">', (
+        (MIME_TYPES[ext], srcset(entry, ext, base_url), sizes)
+        for ext in ('avif', 'webp') if ext in entry['variants']
+    ))
@@ -0,0 +1,38 @@
+"""Fixtures shared by the tests of the thumbnail commands and views."""
+import os
+import shutil
+import tempfile
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import override_settings
+
+
+class TempStaticMixin:
+    """
+    Runs each test with BASE_DIR in a temporary directory holding
+    static/thumbnails/chapters. Set command and command_args to have
+    run_command() call a management command and return its output;
+    extra_settings() can override more settings below the directory.
+    """
+    command = None
+    command_args = ()
+
+    def setUp(self):
+        super().setUp()
+        self.base_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.base_dir)
+        self.static_dir = os.path.join(self.base_dir, 'static')
+        self.root = os.path.join(self.static_dir, 'thumbnails')
+        os.makedirs(os.path.join(self.root, 'chapters'))
+        settings = override_settings(BASE_DIR=self.base_dir, **self.extra_settings())
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def extra_settings(self):
+        return {}
+
+    def run_command(self, *args):
+        out = StringIO()
+        call_command(self.command, *self.command_args, *args, stdout=out)
+        return out.getvalue()
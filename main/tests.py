@@ -1,3 +1,1234 @@
-from django.test import TestCase
+from django.contrib.auth.models import User
+from django.template import Context, Template
+from django.test import TestCase, override_settings
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO, StringIO
+from PIL import Image as PILImage
+import csv
+import json
+import numpy as np
+import openpyxl
+import os
+import shutil
+import struct
+import tempfile
+import threading
+from urllib.parse import parse_qs, urlparse
 
-# Create your tests here.
+from main import journal
+from main.image_fetch import ImageFetchCache, youtube_thumbnail_urls
+from main.models import (
+    Film, Chapter, Person, Tag, ChapterPeople, ChapterLocations, ChapterTags,
+    JournalEntry, JournalCursor,
+)
+from main.importing.bitfield import decode_bitfield_column, bitfield_chapter_people, write_chapter_people
+from main.importing.chapter_sheets import xls_thumbnails
+from main.importing.context import ChapterIndex, ImportContext
+from main.importing.hashing import bytes_hash
+from main.importing.image_store import ImageStore, store_xls_images
+from main.importing.sheet_reader import ChapterSheet
+from main.importing.xls_images import iter_images
+from main.perceptual_hash import BKTree, hamming
+from main.testing import TempStaticMixin
+from main.youtube_api import YouTubeAPIError, YouTubeClient, parse_duration
+
+
+class HaywardBitfieldTestCase(TestCase):
+    def setUp(self):
+        self.film = Film.objects.create(
+            file_id='BIT-001', youtube_id='bit001', title='Bitfield Film', description='', summary='',
+            duration=timedelta(minutes=5), thumbnail_url='https://example.com/thumb.jpg'
+        )
+        self.chapters = [
+            Chapter.objects.create(film=self.film, title=f'Chapter {n}', start_time=f'0{n}:00', order=n)
+            for n in range(1, 4)
+        ]
+        self.people = [Person.objects.create(first_name=name, last_name='Hayward') for name in ('John', 'Linda', 'Matt')]
+
+    def test_decode_bitfield_column(self):
+        """Rows of the wrong length or missing values decode as empty"""
+        matrix = decode_bitfield_column(['101', '011', None, '10', '1x1'], 3)
+        self.assertEqual(matrix.tolist(), [
+            [True, False, True],
+            [False, True, True],
+            [False, False, False],
+            [False, False, False],
+            [True, False, True],
+        ])
+
+    def test_bulk_chapter_people(self):
+        """Only positions set somewhere are resolved; existing links are kept"""
+        resolved = []
+
+        def resolve(position):
+            resolved.append(position)
+            return self.people[position].pk
+
+        ChapterPeople.objects.create(chapter=self.chapters[0], person=self.people[0])
+        chapter_ids = [chapter.id for chapter in self.chapters]
+        pairs = bitfield_chapter_people(chapter_ids, ['100', '110', '000'], 3, resolve)
+        self.assertEqual(sorted(resolved), [0, 1])
+
+        with self.assertNumQueries(3):
+            write_chapter_people(pairs)
+        self.assertEqual(ChapterPeople.objects.count(), 3)
+        self.chapters[1].refresh_from_db()
+        self.assertTrue(self.chapters[1].has_people_metadata)
+        self.assertEqual(set(self.chapters[1].people.all()), {self.people[0], self.people[1]})
+
+
+class ChangeJournalTestCase(TestCase):
+    def setUp(self):
+        self.film = Film.objects.create(
+            file_id='JRN-001', youtube_id='jrn001', title='Journal Film', description='', summary='',
+            duration=timedelta(minutes=5), thumbnail_url='https://example.com/thumb.jpg'
+        )
+        self.chapter = Chapter.objects.create(film=self.film, title='Picnic', start_time='00:10', order=1)
+        self.person = Person.objects.create(first_name='Linda', last_name='Hayward')
+    
+    def test_saves_and_deletes_are_journalled_in_order(self):
+        start = journal.latest_sequence()
+        self.chapter.people.add(self.person)
+        self.chapter.title = 'Lake picnic'
+        self.chapter.save(update_fields=['title'])
+        ChapterPeople.objects.filter(chapter=self.chapter).delete()
+        
+        entries = journal.pending_changes(start)
+        self.assertEqual([(e.model, e.action) for e in entries], [
+            ('chapterpeople', 'create'), ('chapter', 'update'), ('chapterpeople', 'delete'),
+        ])
+        self.assertEqual(entries[0].object_id, f'{self.chapter.id}:{self.person.id}')
+        self.assertEqual(entries[1].data, {'fields': ['title']})
+        self.assertEqual(entries[1].film_id, self.film.id)
+        self.assertEqual([e.id for e in entries], sorted(e.id for e in entries))
+        self.assertEqual(journal.affected_film_ids(entries), {self.film.id})
+    
+    def test_bulk_paths_record_one_insert(self):
+        """Bulk writers mute the per-row receivers and journal with a single insert"""
+        people = [Person.objects.create(first_name=f'P{n}', last_name='Hayward') for n in range(5)]
+        start = journal.latest_sequence()
+        pairs = [(self.chapter.id, person.id) for person in people]
+        with self.assertNumQueries(3):
+            write_chapter_people(pairs)
+        entries = journal.pending_changes(start)
+        self.assertEqual(len(entries), 6)
+        self.assertEqual(entries[-1].model, 'chapter')
+    
+    def test_consumers_read_incrementally(self):
+        seen = []
+        journal.consume('search-index', seen.extend)
+        self.assertTrue(seen)
+        
+        seen.clear()
+        self.assertEqual(journal.consume('search-index', seen.extend), 0)
+        Tag.objects.create(tag='summer')
+        self.assertEqual(journal.consume('search-index', seen.extend), 1)
+        self.assertEqual(seen[0].object_id, 'summer')
+        self.assertEqual(JournalCursor.objects.get(name='search-index').sequence, journal.latest_sequence())
+    
+    def test_failed_handler_leaves_cursor(self):
+        def fail(entries):
+            raise RuntimeError('index offline')
+        with self.assertRaises(RuntimeError):
+            journal.consume('search-index', fail)
+        self.assertFalse(JournalCursor.objects.filter(name='search-index', sequence__gt=0).exists())
+    
+    def test_compaction(self):
+        """Only entries every consumer has read are removed; collapse keeps the newest per object"""
+        JournalCursor.objects.create(name='aggregates', sequence=journal.latest_sequence())
+        for n in range(3):
+            self.chapter.title = f'Take {n}'
+            self.chapter.save()
+        unread = journal.latest_sequence()
+        
+        out = StringIO()
+        call_command('compact_change_journal', '--keep-days', '0', '--collapse', stdout=out)
+        self.assertIn('Removed 3 processed entries', out.getvalue())
+        self.assertIn('Removed 2 superseded entries', out.getvalue())
+        self.assertEqual(list(JournalEntry.objects.values_list('id', flat=True)), [unread])
+
+
+class ImportFamilyFilmsTestCase(TestCase):
+    HEADER = ['Filenames', 'Title', 'Description', 'Summary', 'Years', 'People', 'Location',
+              'Chapters', 'Duration at 23.97 fps', 'Format', 'Tag: Disney']
+    
+    def write_csv(self, rows, path=None):
+        if path:
+            f = open(path, 'w', newline='')
+        else:
+            f = tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False, newline='')
+            self.addCleanup(os.unlink, f.name)
+        writer = csv.writer(f)
+        writer.writerow(['Family Reunion Movies'])
+        writer.writerow(self.HEADER)
+        writer.writerows(rows)
+        f.close()
+        return f.name
+    
+    def film_row(self, n, people='John Hayward, Linda Hayward', location='Lake Tahoe; Reno'):
+        chapters = '\n'.join(f'0{c}:00 Scene {c}' for c in range(1, 4))
+        return [f'CSV-{n}', f'Film {n}', 'Home movie', 'Summary', '1965', people, location,
+                chapters, '0:09:26', '8mm', 'x' if n % 2 else '']
+    
+    def run_import(self, path, *args):
+        out = StringIO()
+        call_command('import_family_films', path, *args, stdout=out)
+        return out.getvalue()
+    
+    def test_bulk_import_creates_everything(self):
+        path = self.write_csv([self.film_row(n) for n in range(1, 4)])
+        output = self.run_import(path)
+        
+        self.assertEqual(Film.objects.filter(file_id__startswith='CSV-').count(), 3)
+        self.assertEqual(Chapter.objects.count(), 9)
+        self.assertEqual(Person.objects.filter(last_name='Hayward').count(), 2)
+        film = Film.objects.get(file_id='CSV-1')
+        self.assertEqual(film.duration, timedelta(minutes=9, seconds=26))
+        self.assertEqual(set(film.tags.values_list('tag', flat=True)), {'8mm', 'disney'})
+        self.assertEqual(list(film.locations.values_list('name', flat=True)), ['Lake Tahoe', 'Reno'])
+        self.assertEqual(film.chapters.get(order=2).start_time_seconds, 120)
+        self.assertIn('=== Timing ===', output)
+        self.assertRegex(output, r': \d+\.\d\ds, [1-9]\d* queries')
+        
+        # Re-running is idempotent
+        self.run_import(path)
+        self.assertEqual(Chapter.objects.count(), 9)
+        self.assertEqual(film.people.count(), 2)
+    
+    def test_query_count_is_independent_of_row_count(self):
+        small = self.write_csv([self.film_row(1)])
+        large = self.write_csv([self.film_row(n, people=f'Person{n} Hayward') for n in range(2, 30)])
+        with CaptureQueriesContext(connection) as first:
+            self.run_import(small)
+        with CaptureQueriesContext(connection) as second:
+            self.run_import(large)
+        self.assertEqual(len(first), len(second))
+    
+    def test_dry_run_reports_diff_without_writing(self):
+        self.run_import(self.write_csv([self.film_row(1)]))
+        changed = self.film_row(1, people='John Hayward, Matt Hayward')
+        changed[1] = 'Renamed Film'
+        
+        with CaptureQueriesContext(connection) as queries:
+            output = self.run_import(self.write_csv([changed, self.film_row(2)]), '--dry-run')
+        self.assertFalse([q for q in queries if not q['sql'].startswith('SELECT')])
+        self.assertIn('Films: 1 new, 1 updated, 0 unchanged', output)
+        self.assertIn("title: 'Film 1' -> 'Renamed Film'", output)
+        self.assertIn('+ Matt Hayward', output)
+        self.assertIn('People: 1 new', output)
+        self.assertIn('Chapters: 3 new', output)
+        self.assertFalse(Film.objects.filter(file_id='CSV-2').exists())
+    
+    def test_reimport_skips_unchanged_file_and_rows(self):
+        path = self.write_csv([self.film_row(1), self.film_row(2)])
+        self.assertIn('Import state: 2 applied, 0 unchanged', self.run_import(path))
+        self.assertIn('CSV file unchanged since the last import', self.run_import(path))
+        
+        changed = self.film_row(1)
+        changed[1] = 'Renamed Film'
+        self.write_csv([changed, self.film_row(2)], path)
+        output = self.run_import(path)
+        self.assertIn('Import state: 1 applied, 1 unchanged', output)
+        self.assertIn('Films imported: 1', output)
+        self.assertEqual(Film.objects.get(file_id='CSV-1').title, 'Renamed Film')
+        
+        Film.objects.filter(file_id='CSV-2').update(title='Edited by hand')
+        self.assertIn('Import state: 2 applied, 0 unchanged', self.run_import(path, '--force'))
+        self.assertEqual(Film.objects.get(file_id='CSV-2').title, 'Film 2')
+
+
+class IngestFilmsTestCase(TestCase):
+    HEADER = ['Filenames', 'Title', 'Description', 'Summary', 'Years', 'People', 'Location',
+              'Duration at 23.97 fps', 'Scan Batch (A, B, or C)']
+    SHEET_HEADER = ['Start', 'Title', '16fps Start Timecode', 'Description', 'Year', 'Haywards Present',
+                    'Locations', 'Tags', 'Other People']
+    
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.work_dir)
+        self.sheet_dir = os.path.join(self.work_dir, 'sheets')
+        self.thumbnail_dir = os.path.join(self.work_dir, 'thumbnails')
+        self.state_file = os.path.join(self.work_dir, 'ingest_state.json')
+        os.makedirs(self.sheet_dir)
+        
+        self.csv_file = os.path.join(self.work_dir, 'films.csv')
+        with open(self.csv_file, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(self.HEADER)
+            writer.writerow(['NEW-01_FROS', 'Lake Trip', 'At the lake', 'Summary', '1975', 'John Hayward, Max Jones',
+                             'Lake Tahoe', '0:09:26', 'Batch D'])
+            writer.writerow(['NEW-02_FROS', 'Parade', 'Rose Parade', '', '1976', 'Linda Hayward', 'Pasadena',
+                             '', 'Batch D'])
+            writer.writerow(['OLD-01', 'Older film', '', '', '1960', '', '', '', 'Batch A'])
+        
+        self.mapping_file = os.path.join(self.work_dir, 'mapping.json')
+        with open(self.mapping_file, 'w') as f:
+            json.dump([{'file_id': 'NEW-01_FROS', 'youtube_id': 'yt-new-01', 'title': 'Lake Trip 1975'}], f)
+        
+        workbook = openpyxl.Workbook()
+        sheet = workbook.active
+        sheet.cell(row=3, column=1, value='NEW-01_FROS')
+        sheet.cell(row=8, column=5, value='Bitfield: John, Linda')
+        for column, value in enumerate(self.SHEET_HEADER, start=1):
+            sheet.cell(row=9, column=column, value=value)
+        for row_number, row in enumerate([
+            ['', 'Arrival', '00:00', 'Cars pull in', '1975', '10', 'Lake Tahoe', 'summer', 'Max Jones'],
+            ['', 'Swimming', '01:30', '', '', '01', 'Lake Tahoe', '', ''],
+        ], start=10):
+            for column, value in enumerate(row, start=1):
+                if value:
+                    sheet.cell(row=row_number, column=column, value=value)
+        image_path = os.path.join(self.work_dir, 'frame.png')
+        PILImage.new('RGB', (8, 6), 'blue').save(image_path)
+        sheet.add_image(openpyxl.drawing.image.Image(image_path), 'A10')
+        workbook.save(os.path.join(self.sheet_dir, 'NEW-01_FROS - Lake Trip.xlsx'))
+        Person.objects.create(first_name='John', last_name='Hayward', hayward_index=0)
+    
+    def run_ingest(self, *args):
+        out, err = StringIO(), StringIO()
+        call_command('ingest_films', self.csv_file, '--batch', 'Batch D', '--sheet-dir', self.sheet_dir,
+                     '--youtube-mapping', self.mapping_file, '--youtube-videos', '',
+                     '--save-thumbnails', self.thumbnail_dir, '--state-file', self.state_file,
+                     '--workers', '1', *args, stdout=out, stderr=err)
+        return out.getvalue(), err.getvalue()
+    
+    def test_ingest_creates_films_chapters_and_links(self):
+        output, errors = self.run_ingest('--workers', '2')
+        self.assertEqual(errors, '')
+        self.assertFalse(Film.objects.filter(file_id='OLD-01').exists())
+        
+        film = Film.objects.get(file_id='NEW-01_FROS')
+        self.assertEqual(film.youtube_id, 'yt-new-01')
+        self.assertEqual(film.duration, timedelta(minutes=9, seconds=26))
+        self.assertEqual(sorted(film.people.values_list('first_name', flat=True)), ['John', 'Max'])
+        arrival, swimming = film.chapters.order_by('order')
+        self.assertEqual((arrival.title, arrival.description, arrival.years), ('Arrival', 'Cars pull in', '1975'))
+        self.assertEqual(swimming.start_time_seconds, 90)
+        self.assertTrue(arrival.thumbnail_url.endswith('NEW-01_FROS_ch01_0s.png'))
+        self.assertTrue(os.path.exists(os.path.join(self.thumbnail_dir, 'NEW-01_FROS_ch01_0s.png')))
+        self.assertEqual(sorted(arrival.people.values_list('first_name', flat=True)), ['John', 'Max'])
+        self.assertEqual(list(swimming.people.values_list('first_name', flat=True)), ['Linda'])
+        self.assertTrue(arrival.has_tags_metadata)
+        self.assertTrue(Film.objects.get(file_id='NEW-02_FROS').youtube_id.startswith('placeholder_'))
+        
+        self.assertIn('=== Timing ===', output)
+        self.assertIn('write: ', output)
+        self.assertFalse(os.path.exists(self.state_file))
+    
+    def test_failed_run_resumes_from_checkpoint(self):
+        # The second film collides with an existing YouTube ID, so its write fails
+        blocker = Film.objects.create(file_id='BLOCKER', youtube_id='placeholder_NEW_02_FROS', title='Blocker',
+                                      thumbnail_url='https://example.com/thumb.jpg')
+        output, errors = self.run_ingest()
+        self.assertIn('Error writing NEW-02_FROS', errors)
+        self.assertTrue(os.path.exists(self.state_file))
+        self.assertFalse(Film.objects.filter(file_id='NEW-02_FROS').exists())
+        
+        # Written films are not touched again on resume
+        Film.objects.filter(file_id='NEW-01_FROS').update(title='Edited after import')
+        blocker.delete()
+        output, errors = self.run_ingest()
+        self.assertIn('Resuming from', output)
+        self.assertIn('Wrote 1 films', output)
+        self.assertEqual(Film.objects.get(file_id='NEW-01_FROS').title, 'Edited after import')
+        self.assertTrue(Film.objects.filter(file_id='NEW-02_FROS').exists())
+        self.assertFalse(os.path.exists(self.state_file))
+    
+    def test_changed_youtube_videos_file_is_not_resumed(self):
+        Film.objects.create(file_id='BLOCKER', youtube_id='placeholder_NEW_02_FROS', title='Blocker',
+                            thumbnail_url='https://example.com/thumb.jpg')
+        self.run_ingest()
+        self.assertTrue(os.path.exists(self.state_file))
+        
+        videos_file = os.path.join(self.work_dir, 'videos.json')
+        with open(videos_file, 'w') as f:
+            json.dump([{'id': 'yt-new-02', 'title': 'Parade', 'description': 'File ID: NEW-02_FROS'}], f)
+        output, errors = self.run_ingest('--youtube-videos', videos_file)
+        self.assertNotIn('Resuming from', output)
+        self.assertEqual(errors, '')
+        self.assertEqual(Film.objects.get(file_id='NEW-02_FROS').youtube_id, 'yt-new-02')
+
+
+class ImportChapterMetadataTestCase(TestCase):
+    HEADER = ['Start', 'Title', '16fps Start Timecode', 'Description', 'Year',
+              'Haywards Present', 'Locations', 'Tags', 'Other People']
+    
+    def setUp(self):
+        self.sheet_dir = tempfile.mkdtemp()
+        self.thumbnail_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.sheet_dir)
+        self.addCleanup(shutil.rmtree, self.thumbnail_dir)
+        Person.objects.create(first_name='John', last_name='Hayward', hayward_index=0)
+        
+        for n in range(1, 4):
+            film = Film.objects.create(
+                file_id=f'SHEET-{n}-final', youtube_id=f'sheet{n}', title=f'Sheet Film {n}', description='',
+                summary='', thumbnail_url='https://example.com/thumb.jpg'
+            )
+            for order, title in enumerate(['Arrival at the lake', 'Picnic lunch', 'Fireworks'], start=1):
+                Chapter.objects.create(film=film, title=title, start_time=f'0{order}:00', order=order)
+            self.write_sheet(f'sheet{n}.xlsx', f'SHEET-{n}', [
+                ['', 'Arrival at the Lake', '', 'Cars pull in', '1965', '10', 'Lake Tahoe; Reno', 'Summer', 'Max Jones'],
+                ['', 'Lunch', '02:01', '', '', '11', 'lake tahoe', 'summer/picnic', 'max jones and Sue Hayward'],
+            ], image_row=10 if n == 1 else None)
+    
+    def write_sheet(self, name, prefix, rows, image_row=None):
+        workbook = openpyxl.Workbook()
+        sheet = workbook.active
+        sheet.cell(row=1, column=1, value='Chapter sheet')
+        sheet.cell(row=3, column=1, value=prefix)
+        sheet.cell(row=8, column=5, value='Bitfield: John, Linda')
+        for column, value in enumerate(self.HEADER, start=1):
+            sheet.cell(row=9, column=column, value=value)
+        for row_number, row in enumerate(rows, start=10):
+            for column, value in enumerate(row, start=1):
+                if value:
+                    sheet.cell(row=row_number, column=column, value=value)
+        if image_row:
+            image_path = os.path.join(self.sheet_dir, 'frame.png')
+            PILImage.new('RGB', (8, 6), 'red').save(image_path)
+            sheet.add_image(openpyxl.drawing.image.Image(image_path), f'A{image_row}')
+        workbook.save(os.path.join(self.sheet_dir, name))
+    
+    def run_import(self, names, workers):
+        """Import the sheets, returning the log and the resulting state, then roll back"""
+        out, err = StringIO(), StringIO()
+        with transaction.atomic():
+            call_command('import_chapter_metadata', '--file', *names, '--sheet-dir', self.sheet_dir,
+                         '--save-thumbnails', self.thumbnail_dir, '--workers', str(workers),
+                         stdout=out, stderr=err)
+            state = {
+                'chapters': list(Chapter.objects.order_by('id').values(
+                    'id', 'description', 'years', 'thumbnail_url', 'has_people_metadata',
+                    'has_location_metadata', 'has_tags_metadata', 'has_years_metadata')),
+                'people': sorted(ChapterPeople.objects.values_list('chapter_id', 'person__first_name', 'person__last_name')),
+                'locations': sorted(ChapterLocations.objects.values_list('chapter_id', 'location__name')),
+                'tags': sorted(ChapterTags.objects.values_list('chapter_id', 'tag_id')),
+            }
+            transaction.set_rollback(True)
+        log = [line for line in out.getvalue().splitlines() if not line.startswith('Parsed ')]
+        return log, err.getvalue(), state
+    
+    def test_sheet_is_applied(self):
+        log, errors, state = self.run_import(['sheet1.xlsx'], 1)
+        self.assertEqual(errors, '')
+        self.assertIn('Found film: SHEET-1-final - Sheet Film 1', log)
+        
+        arrival, picnic, fireworks = Film.objects.get(file_id='SHEET-1-final').chapters.order_by('order')
+        chapters = {c['id']: c for c in state['chapters']}
+        self.assertEqual(chapters[arrival.id]['description'], 'Cars pull in')
+        self.assertEqual(chapters[arrival.id]['years'], '1965')
+        self.assertTrue(chapters[arrival.id]['has_years_metadata'])
+        self.assertTrue(chapters[arrival.id]['thumbnail_url'].endswith('SHEET-1-final_ch01_60s.png'))
+        self.assertTrue(os.path.exists(os.path.join(self.thumbnail_dir, 'SHEET-1-final_ch01_60s.png')))
+        self.assertFalse(chapters[fireworks.id]['has_people_metadata'])
+        
+        # The timecode matches "Lunch" to "Picnic lunch"; names are reused case-insensitively
+        self.assertEqual([name for c, name in state['locations'] if c == picnic.id], ['Lake Tahoe'])
+        self.assertEqual([tag for c, tag in state['tags'] if c == picnic.id], ['picnic', 'summer'])
+        people = {(first, last) for c, first, last in state['people'] if c == picnic.id}
+        self.assertEqual(people, {('Max', 'Jones'), ('Sue', 'Hayward'), ('John', 'Hayward'), ('Linda', 'Hayward')})
+        self.assertTrue(chapters[picnic.id]['has_people_metadata'])
+    
+    def test_parallel_output_matches_serial(self):
+        sheets = ['sheet1.xlsx', 'sheet2.xlsx', 'sheet3.xlsx']
+        serial = self.run_import(sheets, 1)
+        parallel = self.run_import(sheets, 3)
+        self.assertEqual(serial, parallel)
+        self.assertEqual(len(serial[2]['locations']), 9)
+    
+    def test_chapter_index_matching(self):
+        chapters = ChapterIndex(Film.objects.get(file_id='SHEET-1-final').chapters.order_by('order'))
+        arrival, picnic, fireworks = chapters.chapters
+        with self.assertNumQueries(0):
+            self.assertEqual(chapters.match('ARRIVAL AT THE LAKE', ''), arrival)
+            self.assertEqual(chapters.match('Lunch', '02:01'), picnic)
+            self.assertEqual(chapters.match('Lunch', '0:02:02'), picnic)
+            self.assertEqual(chapters.match('Big fireworks show', ''), fireworks)
+            self.assertIsNone(chapters.match('Boat ride', '05:00'))
+    
+    def test_context_forgets_entities_of_failed_sheet(self):
+        context = ImportContext()
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            with context.sheet():
+                context.add_people(['Max Jones'])
+                context.add_locations(['Reno'])
+                context.flush()
+                self.assertIn(('max', 'jones'), context.people)
+                raise RuntimeError('sheet failed')
+        self.assertNotIn(('max', 'jones'), context.people)
+        self.assertNotIn('reno', context.locations)
+        self.assertFalse(Person.objects.filter(first_name='Max').exists())
+    
+    def test_reimport_skips_unchanged_sheets_and_rows(self):
+        def run(*args):
+            out = StringIO()
+            call_command('import_chapter_metadata', '--file', 'sheet1.xlsx', '--sheet-dir', self.sheet_dir,
+                         '--save-thumbnails', self.thumbnail_dir, '--workers', '1', *args,
+                         stdout=out, stderr=StringIO())
+            return out.getvalue()
+        
+        self.assertIn('Import state: 3 applied, 0 unchanged', run())
+        self.assertIn('Skipping unchanged: sheet1.xlsx', run())
+        
+        # Only the edited row is applied again; the first row and its thumbnail are left alone
+        self.write_sheet('sheet1.xlsx', 'SHEET-1', [
+            ['', 'Arrival at the Lake', '', 'Cars pull in', '1965', '10', 'Lake Tahoe; Reno', 'Summer', 'Max Jones'],
+            ['', 'Lunch', '02:01', 'Sandwiches', '', '11', 'lake tahoe', 'summer/picnic', 'max jones and Sue Hayward'],
+        ], image_row=10)
+        output = run()
+        self.assertIn('Import state: 1 applied, 2 unchanged', output)
+        self.assertNotIn('Saved thumbnail', output)
+        picnic = Chapter.objects.get(film__file_id='SHEET-1-final', order=2)
+        self.assertEqual(picnic.description, 'Sandwiches')
+        
+        self.assertIn('Import state: 3 applied, 0 unchanged', run('--force'))
+    
+    def test_sheet_reader_matches_pandas(self):
+        import pandas as pd
+        self.write_sheet('typed.xlsx', 'SHEET-9', [
+            ['', 'Lunch', '02:01', 'N/A', 1965.0, '0110', '', '', ''],
+            [],
+            ['', 'Fireworks', '', 'Sparklers', 1.5, '', '', '', 'nan'],
+        ])
+        path = os.path.join(self.sheet_dir, 'typed.xlsx')
+        df = pd.read_excel(path, header=None)
+        with ChapterSheet(path) as sheet:
+            self.assertEqual(sheet.prefix, 'SHEET-9')
+            self.assertEqual(sheet.bitfield_key, ['John', 'Linda'])
+            self.assertEqual(sheet.header_map['16fps start timecode'], 2)
+            rows = list(sheet.rows())
+        # Blank rows are kept so row indexes match the DataFrame's
+        self.assertEqual([index for index, _ in rows], [9, 10, 11])
+        for index, row in rows:
+            expected = [None if pd.isna(value) else value for value in df.iloc[index]]
+            self.assertEqual(row, expected)
+        self.assertEqual(rows[0][1][4], 1965)
+        self.assertIsInstance(rows[0][1][4], int)
+
+
+def office_art(record_type, payload=b'', instance=0, version=0):
+    return struct.pack('<HHI', (instance << 4) | version, record_type, len(payload)) + payload
+
+
+def biff(record_type, payload=b''):
+    return struct.pack('<HH', record_type, len(payload)) + payload
+
+
+def write_xls(path, pictures, filler=0):
+    """
+    Write a minimal .xls: an OLE2 file whose Workbook stream holds just the
+    records the picture extractor reads. pictures is a list of
+    (kind, bytes, row, column); sectors are stored in reverse order so
+    pictures straddle sector boundaries.
+    """
+    store = b''
+    for kind, data, _, _ in pictures:
+        blip_type, instance = {'jpeg': (0xF01D, 0x46A), 'png': (0xF01E, 0x6E0)}[kind]
+        blip = office_art(blip_type, b'\0' * 16 + b'\xff' + data, instance)
+        store += office_art(0xF007, struct.pack('<BB16sHIIIBBBB', 5, 5, b'\0' * 16, 0xFF, len(blip), 1, 0, 0, 0, 0, 0) + blip, 5, 2)
+    drawing_group = office_art(0xF000, office_art(0xF001, store, len(pictures), 0xF), 0, 0xF)
+    shapes = b''.join(
+        office_art(0xF004, b''.join([
+            office_art(0xF00A, struct.pack('<II', 1025 + index, 0xA00), 75, 2),
+            office_art(0xF00B, struct.pack('<HI', 0x4104, index + 1), 1, 3),
+            office_art(0xF010, struct.pack('<H8H', 0, column, 0, row, 0, column + 1, 0, row + 1, 0)),
+            office_art(0xF011),
+        ]), 0, 0xF)
+        for index, (_, _, row, column) in enumerate(pictures)
+    )
+    drawing = office_art(0xF002, office_art(0xF003, shapes, 0, 0xF), 1, 0xF)
+
+    # The drawing group is cut into MSODRAWINGGROUP + CONTINUE records, the sheet drawing into
+    # MSODRAWING records with an OBJ record between them, as Excel writes them
+    middle = len(drawing_group) // 2
+    globals_records = [biff(0xEB, drawing_group[:middle]), biff(0x3C, drawing_group[middle:])]
+    globals_records += [biff(0x00FC, b'\0' * 2000) for _ in range(filler)]
+    cut = len(drawing) // 2
+    sheet_records = [biff(0x0809, struct.pack('<HH12x', 0x600, 0x10)), biff(0xEC, drawing[:cut]),
+                     biff(0x5D, b'\0' * 26), biff(0xEC, drawing[cut:]), biff(0x0A)]
+    bof = biff(0x0809, struct.pack('<HH12x', 0x600, 0x5))
+    boundsheet_size = len(biff(0x85, b'\0' * 6 + b'\x06\x00Sheet1'))
+    sheet_offset = len(bof) + boundsheet_size + sum(map(len, globals_records)) + len(biff(0x0A))
+    boundsheet = biff(0x85, struct.pack('<IBB', sheet_offset, 0, 0) + b'\x06\x00Sheet1')
+    workbook = bof + boundsheet + b''.join(globals_records) + biff(0x0A) + b''.join(sheet_records)
+
+    sector = 512
+    chunks = [workbook[i:i + sector].ljust(sector, b'\0') for i in range(0, len(workbook), sector)]
+    count = len(chunks)
+    assert count + 2 <= sector // 4, 'test workbook needs a single FAT sector'
+    # Chunk i is written to sector count + 1 - i: the stream runs backwards through the file
+    fat = [0xFFFFFFFD, 0xFFFFFFFE] + [0xFFFFFFFF] * count
+    for i in range(count):
+        fat[count + 1 - i] = count - i if i < count - 1 else 0xFFFFFFFE
+    fat += [0xFFFFFFFF] * (sector // 4 - len(fat))
+
+    def entry(name, entry_type, start, size, child=0xFFFFFFFF):
+        encoded = (name + '\0').encode('utf-16-le')
+        return (encoded.ljust(64, b'\0') + struct.pack('<HBB3I', len(encoded), entry_type, 1, 0xFFFFFFFF, 0xFFFFFFFF, child)
+                + b'\0' * 36 + struct.pack('<3I', start, size, 0))
+    directory = entry('Root Entry', 5, 0xFFFFFFFE, 0, child=1) + entry('Workbook', 2, count + 1, len(workbook))
+    directory = directory.ljust(sector, b'\0')
+
+    header = (b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1' + b'\0' * 16 + struct.pack('<HHHHH', 0x3E, 3, 0xFFFE, 9, 6)
+              + b'\0' * 6 + struct.pack('<9I', 0, 1, 1, 0, 4096, 0xFFFFFFFE, 0, 0xFFFFFFFE, 0)
+              + struct.pack('<109I', 0, *[0xFFFFFFFF] * 108))
+    with open(path, 'wb') as f:
+        f.write(header + struct.pack(f'<{sector // 4}I', *fat) + directory + b''.join(reversed(chunks)))
+
+
+class XlsImagesTestCase(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+    
+    def jpeg(self):
+        # A comment segment holding an end-of-image marker, which cut the old byte-marker scan short
+        buffer = BytesIO()
+        PILImage.effect_noise((48, 32), 60).convert('RGB').save(buffer, format='JPEG', quality=95)
+        data = buffer.getvalue()
+        return data[:2] + b'\xff\xfe\x00\x06\xff\xd9\x00\x00' + data[2:]
+    
+    def test_pictures_come_with_their_anchor_cells(self):
+        png = BytesIO()
+        PILImage.new('RGB', (8, 6), 'blue').save(png, format='PNG')
+        pictures = [
+            ('jpeg', self.jpeg(), 9, 0), ('jpeg', self.jpeg(), 9, 1),
+            ('png', png.getvalue(), 11, 0),
+        ]
+        path = os.path.join(self.directory, 'sheet.xls')
+        write_xls(path, pictures, filler=3)
+        
+        images = [(image.kind, bytes(image.data), image.row, image.column) for image in iter_images(path)]
+        self.assertEqual(images, pictures)
+        with PILImage.open(BytesIO(images[0][1])) as decoded:
+            self.assertEqual(decoded.size, (48, 32))
+        
+        # Only the Start column is used, matched to rows by anchor rather than by position
+        thumbnails, total = xls_thumbnails(path, 0)
+        self.assertEqual(total, 3)
+        self.assertEqual(thumbnails, {9: ('jpg', pictures[0][1]), 11: ('png', pictures[2][1])})
+    
+    def test_store_writes_each_picture_once_and_skips_unchanged_sheets(self):
+        shared, other = self.jpeg(), self.jpeg()
+        first = os.path.join(self.directory, 'first.xls')
+        second = os.path.join(self.directory, 'second.xls')
+        write_xls(first, [('jpeg', shared, 9, 0), ('png', b'\x89PNG\r\n\x1a\n' + b'\0' * 64, 10, 0)], filler=3)
+        write_xls(second, [('jpeg', shared, 12, 0), ('jpeg', other, 13, 0)], filler=3)
+        
+        store = ImageStore(os.path.join(self.directory, 'store'))
+        images, skipped, rejected = store_xls_images(first, store)
+        self.assertFalse(skipped)
+        self.assertEqual([(row, column) for row, column, _ in rejected], [(11, 1)])
+        store_xls_images(second, store)
+        store.save()
+        self.assertEqual((store.written, store.reused), (2, 1))
+        self.assertEqual(images[0]['hash'], bytes_hash(shared))
+        self.assertEqual((store.root / images[0]['file']).read_bytes(), shared)
+        
+        # A new run reads the manifest and skips both sheets without extracting them
+        store = ImageStore(os.path.join(self.directory, 'store'))
+        images, skipped, _ = store_xls_images(second, store)
+        self.assertTrue(skipped)
+        self.assertEqual([(image['row'], image['hash']) for image in images],
+                         [(13, bytes_hash(shared)), (14, bytes_hash(other))])
+        self.assertEqual(store.written, 0)
+
+
+class SpriteThumbnailsTestCase(TestCase):
+    def setUp(self):
+        self.output_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.output_dir)
+        self.film = Film.objects.create(
+            file_id='SPRITE-1', youtube_id='sprite1', title='Lake Trip', description='', summary='',
+            thumbnail_url='https://example.com/thumb.jpg'
+        )
+        for order, title in enumerate(['Arrival at the lake', 'Picnic lunch', 'Fireworks'], start=1):
+            Chapter.objects.create(film=self.film, title=title, start_time=f'0{order}:00', order=order)
+        Film.objects.create(
+            file_id='SPRITE-2', youtube_id='sprite2', title='No Chapters', description='', summary='',
+            thumbnail_url='https://example.com/thumb.jpg'
+        )
+    
+    def run_command(self, *args):
+        out = StringIO()
+        call_command('generate_sprite_thumbnails', '--output-dir', self.output_dir, *args, stdout=out)
+        return out.getvalue()
+    
+    def sheet(self, file_id):
+        with PILImage.open(os.path.join(self.output_dir, f'{file_id}_sprite.webp')) as image:
+            return image.format, image.size
+    
+    def test_only_changed_films_are_redrawn(self):
+        output = self.run_command('--workers', '2')
+        self.assertIn('Successfully generated: 2 sprite thumbnails', output)
+        self.assertIn('Packed 3 frames into a 2-column sprite sheet for SPRITE-1 in', output)
+        # One packed sheet per film, WebP plus a JPEG fallback, in a grid of 160x90 frames, and the frames as one animation
+        self.assertEqual(sorted(os.listdir(self.output_dir)), [
+            'SPRITE-1_preview.webp', 'SPRITE-1_sprite.jpg', 'SPRITE-1_sprite.webp',
+            'SPRITE-2_preview.webp', 'SPRITE-2_sprite.jpg', 'SPRITE-2_sprite.webp',
+        ])
+        self.assertEqual(self.sheet('SPRITE-1'), ('WEBP', (320, 180)))
+        with PILImage.open(os.path.join(self.output_dir, 'SPRITE-1_preview.webp')) as animation:
+            animation.load()
+            self.assertEqual((animation.size, animation.n_frames, animation.info['duration']), ((160, 90), 3, 800))
+        self.assertIn('Hover previews of 2 films: sprite sheets ', output)
+        self.assertEqual(self.sheet('SPRITE-2'), ('WEBP', (320, 180)))
+        self.film.refresh_from_db()
+        self.assertEqual(self.film.preview_sprite_url, '/static/thumbnails/previews/SPRITE-1_sprite.webp')
+        self.assertEqual(self.film.preview_sprite_fallback_url(), '/static/thumbnails/previews/SPRITE-1_sprite.jpg')
+        self.assertEqual((self.film.preview_frame_count, self.film.preview_sprite_width), (3, 160))
+        self.assertEqual(self.film.preview_sprite_columns(), 2)
+        
+        output = self.run_command('--workers', '1')
+        self.assertIn('Successfully generated: 0 sprite thumbnails', output)
+        self.assertIn('Unchanged and skipped: 2', output)
+        
+        # A renamed chapter or a missing sheet brings a film back; a removed chapter drops its frame
+        Chapter.objects.filter(film=self.film, order=3).delete()
+        os.remove(os.path.join(self.output_dir, 'SPRITE-2_sprite.jpg'))
+        output = self.run_command('--workers', '1')
+        self.assertIn('Successfully generated: 2 sprite thumbnails', output)
+        self.assertEqual(self.sheet('SPRITE-1'), ('WEBP', (320, 90)))
+        self.assertIn('Unchanged and skipped: 2', self.run_command('--workers', '1'))
+    
+    def test_chapter_thumbnails_are_packed_and_catalog_cards_load_one_sheet(self):
+        static_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, static_root)
+        os.makedirs(os.path.join(static_root, 'static', 'thumbnails', 'chapters'))
+        for chapter in Chapter.objects.filter(film=self.film, order__lte=2):
+            name = f'thumbnails/chapters/{chapter.order}.jpg'
+            PILImage.new('RGB', (640, 360), 'blue').save(os.path.join(static_root, 'static', name))
+            chapter.thumbnail_url = f'/static/{name}'
+            chapter.save()
+        with override_settings(BASE_DIR=static_root):
+            output = self.run_command('--workers', '1', '--file-ids', 'SPRITE-1')
+        self.assertEqual(self.sheet('SPRITE-1'), ('WEBP', (640, 180)))
+        self.assertIn('1 films with chapter thumbnail frames: individual frames ', output)
+        self.assertIn(' in 2 requests, sprite sheets ', output)
+        self.film.refresh_from_db()
+        self.assertEqual((self.film.preview_frame_count, self.film.preview_frame_interval), (2, 1.0))
+        
+        response = self.client.get(reverse('films:catalog'))
+        self.assertContains(response, 'data-sprite-url="/static/thumbnails/previews/SPRITE-1_sprite.webp"')
+        self.assertContains(response, 'data-animation-url="/static/thumbnails/previews/SPRITE-1_preview.webp"')
+        self.assertContains(response, 'class="sprite-overlay"', count=1)
+        self.assertNotContains(response, 'frame-image')
+
+
+class ThumbnailServer(ThreadingHTTPServer):
+    """Local stand-in for img.youtube.com, counting the requests for each path"""
+    def __init__(self, images):
+        self.images = images
+        self.hits = {}
+        self.hits_lock = threading.Lock()
+
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                with server.hits_lock:
+                    server.hits[self.path] = server.hits.get(self.path, 0) + 1
+                body = server.images.get(self.path)
+                self.send_response(200 if body else 404)
+                self.send_header('Content-Length', str(len(body or b'')))
+                self.end_headers()
+                self.wfile.write(body or b'')
+
+            def log_message(self, *args):
+                pass
+
+        super().__init__(('127.0.0.1', 0), Handler)
+        self.url_template = f'http://127.0.0.1:{self.server_address[1]}/vi/{{video_id}}/{{source}}'
+
+
+class ImageFetchCacheTestCase(TestCase):
+    def setUp(self):
+        def jpeg(color):
+            buffer = BytesIO()
+            PILImage.new('RGB', (480, 360), color).save(buffer, 'JPEG')
+            return buffer.getvalue()
+
+        # vid1 has no 1.jpg, vid2 has every thumbnail, vid3 has only default.jpg
+        self.server = ThumbnailServer({
+            '/vi/vid1/2.jpg': jpeg('red'), '/vi/vid2/1.jpg': jpeg('green'), '/vi/vid2/hqdefault.jpg': jpeg('blue'),
+            '/vi/vid3/default.jpg': b'not a jpeg',
+        })
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+    def urls(self, video_id):
+        return youtube_thumbnail_urls(video_id, url_template=self.server.url_template)
+
+    def test_each_source_image_is_fetched_and_resized_once_per_run(self):
+        with ImageFetchCache(workers=4) as fetcher:
+            fetcher.prefetch([self.urls(video_id) for video_id in ('vid1', 'vid2', 'vid3', 'vid1')])
+            # 20 chapters of one film ask for the same candidates
+            frames = [fetcher.first_image(self.urls('vid1'), (160, 90)) for _ in range(20)]
+            url, frame = fetcher.first_image(self.urls('vid3'), (160, 90))
+            cache_dir = fetcher.cache_dir
+            self.assertEqual(len(os.listdir(cache_dir)), 3)
+
+        self.assertEqual({url for url, _ in frames}, {self.urls('vid1')[1]})
+        self.assertEqual(frames[0][1].size, (160, 90))
+        self.assertIsNot(frames[0][1], frames[1][1])
+        self.assertEqual(fetcher.decoded, 1)
+        # An unreadable image counts as unavailable
+        self.assertEqual((url, frame), (None, None))
+        # Every URL was requested at most once, however many films and chapters asked for it
+        self.assertEqual(self.server.hits, {
+            '/vi/vid1/1.jpg': 1, '/vi/vid1/2.jpg': 1, '/vi/vid2/1.jpg': 1,
+            '/vi/vid3/1.jpg': 1, '/vi/vid3/2.jpg': 1, '/vi/vid3/3.jpg': 1,
+            '/vi/vid3/hqdefault.jpg': 1, '/vi/vid3/mqdefault.jpg': 1, '/vi/vid3/default.jpg': 1,
+        })
+        self.assertEqual(fetcher.requests, 9)
+        self.assertFalse(os.path.exists(cache_dir))
+
+
+class ThumbnailDerivativesTestCase(TempStaticMixin, TestCase):
+    command = 'generate_thumbnail_derivatives'
+    command_args = ('--workers', '1')
+    
+    def extra_settings(self):
+        return {'THUMBNAIL_ROOT': self.root, 'THUMBNAIL_DERIVATIVES_DIR': os.path.join(self.root, 'derived')}
+    
+    def setUp(self):
+        super().setUp()
+        self.source = os.path.join(self.root, 'chapters', 'Lake Trip_image_000.jpg')
+        exif = PILImage.Exif()
+        exif[0x010E] = 'Scanned chapter sheet'  # ImageDescription
+        PILImage.new('RGB', (400, 300), 'navy').save(self.source, 'JPEG', exif=exif.tobytes())
+        PILImage.new('RGB', (100, 75), 'teal').save(os.path.join(self.root, 'chapters', 'small.png'))
+    
+    def derived(self):
+        return sorted(os.listdir(os.path.join(self.root, 'derived', 'chapters')))
+    
+    def test_variants_are_stepped_and_stripped(self):
+        output = self.run_command()
+        self.assertIn('Sources derived: 2', output)
+        self.assertIn('saving', output)
+        # Never wider than the source, and without the source's EXIF
+        self.assertEqual(self.derived(), [
+            'Lake Trip_image_000-160w.jpg', 'Lake Trip_image_000-160w.webp',
+            'Lake Trip_image_000-320w.jpg', 'Lake Trip_image_000-320w.webp',
+            'Lake Trip_image_000-400w.jpg', 'Lake Trip_image_000-400w.webp',
+            'small-100w.jpg', 'small-100w.webp',
+        ])
+        with PILImage.open(os.path.join(self.root, 'derived', 'chapters', 'Lake Trip_image_000-160w.webp')) as image:
+            self.assertEqual(image.size, (160, 120))
+            self.assertFalse(image.getexif())
+    
+    def test_unchanged_sources_are_skipped(self):
+        self.run_command()
+        self.assertIn('Unchanged and skipped: 2', self.run_command())
+    
+    def test_narrower_replacement_drops_the_variants_it_no_longer_has(self):
+        self.run_command()
+        PILImage.new('RGB', (200, 150), 'red').save(self.source, 'JPEG')
+        output = self.run_command('--files', self.source)
+        self.assertIn('Sources derived: 1', output)
+        self.assertEqual(self.derived(), [
+            'Lake Trip_image_000-160w.jpg', 'Lake Trip_image_000-160w.webp',
+            'Lake Trip_image_000-200w.jpg', 'Lake Trip_image_000-200w.webp',
+            'small-100w.jpg', 'small-100w.webp',
+        ])
+    
+    def test_template_tags_build_srcset_from_the_manifest(self):
+        self.run_command()
+        html = Template(
+            '{% load thumbnails %}<picture>{% thumbnail_sources url "80px" %}'
+            '<img src="{{ url }}" srcset="{{ url|thumbnail_srcset }}"></picture>'
+        ).render(Context({'url': '/static/thumbnails/chapters/Lake%20Trip_image_000.jpg'}))
+        base = '/static/thumbnails/derived/chapters/Lake%20Trip_image_000'
+        self.assertIn(
+            f'<source type="image/webp" srcset="{base}-160w.webp 160w, {base}-320w.webp 320w, '
+            f'{base}-400w.webp 400w" sizes="80px">', html
+        )
+        self.assertIn(f'srcset="{base}-160w.jpg 160w, {base}-320w.jpg 320w, {base}-400w.jpg 400w"', html)
+        self.assertNotIn('srcset', Template('{% load thumbnails %}{% thumbnail_sources url "80px" %}').render(
+            Context({'url': 'https://img.youtube.com/vi/abc/default.jpg'})
+        ))
+
+
+class DuplicateThumbnailsTestCase(TempStaticMixin, TestCase):
+    command = 'find_duplicate_thumbnails'
+    command_args = ('--workers', '1')
+    
+    def setUp(self):
+        super().setUp()
+        self.store = ImageStore(os.path.join(self.base_dir, 'store'))
+        self.lake, self.barn = self.picture(1), self.picture(2)
+        
+        self.home = Film.objects.create(file_id='A-FILM', youtube_id='home', title='Home', description='', summary='')
+        self.trip = Film.objects.create(file_id='B-FILM', youtube_id='trip', title='Trip', description='', summary='')
+        self.chapter(self.home, 1, 'lake.jpg', self.lake)
+        self.chapter(self.home, 2, 'barn.jpg', self.barn)
+        self.chapter(self.home, 3, 'barn.jpg')
+        self.chapter(self.home, 4, 'blank.jpg', PILImage.new('RGB', (400, 300), 'gray'))
+        # A smaller re-encoded copy of the lake picture
+        self.chapter(self.trip, 1, 'lake-copy.png', self.lake.resize((200, 150)))
+        self.chapter(self.trip, 2, 'also-blank.jpg', PILImage.new('RGB', (400, 300), 'gray'))
+        self.chapter(self.trip, 3, 'youtube', url='https://img.youtube.com/vi/trip/1.jpg')
+    
+    def picture(self, seed):
+        """A smooth random picture, like a film frame rather than noise"""
+        pixels = np.random.default_rng(seed).integers(0, 256, (6, 8, 3), dtype=np.uint8)
+        return PILImage.fromarray(pixels).resize((400, 300), PILImage.Resampling.BICUBIC)
+    
+    def chapter(self, film, order, name, image=None, url=None):
+        if image is not None:
+            image.save(os.path.join(self.root, 'chapters', name))
+        return Chapter.objects.create(
+            film=film, title=f'Chapter {order}', start_time='00:00', start_time_seconds=order, order=order,
+            thumbnail_url=url or f'/static/thumbnails/chapters/{name}'
+        )
+    
+    def sheet(self, name, image):
+        buffer = BytesIO()
+        image.save(buffer, 'JPEG')
+        relative = self.store.put(buffer.getvalue(), 'jpg')
+        self.store.record(name, 'sheet-hash', [{'row': 8, 'column': 2, 'hash': relative[3:-4], 'file': relative}])
+    
+    def test_copies_and_shared_files_are_paired(self):
+        output = self.run_command()
+        self.assertIn('A-FILM #1 "Chapter 1" <-> B-FILM #1 "Chapter 1": ', output)
+        self.assertIn('A-FILM #2 "Chapter 2" <-> A-FILM #3 "Chapter 3": same file', output)
+        self.assertIn('Not under static (skipped): 1', output)
+        self.assertIn('Pairs across films: 1', output)
+        self.assertIn('Pairs within a film: 1', output)
+    
+    def test_flat_images_are_not_compared(self):
+        output = self.run_command()
+        self.assertIn('Flat images (not compared): 2', output)
+        self.assertNotIn('#4', output)
+    
+    def test_pictures_only_on_another_films_sheet_are_reported(self):
+        self.sheet('A-FILM - Home.xls', self.lake)
+        self.sheet('B-FILM - Trip.xls', self.barn)
+        self.store.save()
+        
+        output = self.run_command('--store', self.store.root)
+        # The barn is only on the trip's sheet; the lake is on the home film's sheet
+        self.assertIn('A-FILM #2 "Chapter 2": B-FILM - Trip.xls row 8 (film B-FILM)', output)
+        self.assertIn('B-FILM #1 "Chapter 1": A-FILM - Home.xls row 8 (film A-FILM)', output)
+        self.assertIn("Chapters matching only another film's sheet: 3", output)
+    
+    def test_hashes_are_cached_between_runs(self):
+        self.assertIn('Hashed 5 images (0 from the cache)', self.run_command())
+        self.assertIn('Hashed 0 images (5 from the cache)', self.run_command())
+        self.assertIn('Hashed 5 images (0 from the cache)', self.run_command('--rehash'))
+    
+    def test_cache_can_be_a_bare_filename(self):
+        self.addCleanup(os.chdir, os.getcwd())
+        os.chdir(self.base_dir)
+        self.run_command('--cache', 'hashes.json')
+        self.assertTrue(os.path.exists(os.path.join(self.base_dir, 'hashes.json')))
+    
+    def test_bk_tree_search_matches_a_linear_scan(self):
+        rng = np.random.default_rng(7)
+        values = [int(value) for value in rng.integers(0, 1 << 63, 500, dtype=np.int64)]
+        # Near copies of a few values, a handful of bits apart
+        values += [value ^ (1 << 3) ^ (1 << 40) for value in values[:20]]
+        tree = BKTree()
+        for index, value in enumerate(values):
+            tree.add(value, index)
+        self.assertEqual(len(tree), len(values))
+        for value in values[::25]:
+            expected = sorted(i for i, other in enumerate(values) if hamming(value, other) <= 4)
+            self.assertEqual(sorted(index for _, index in tree.search(value, 4)), expected)
+
+
+class ScanThumbnailsTestCase(TempStaticMixin, TestCase):
+    command = 'scan_thumbnails'
+    command_args = ('--limit', '0')
+    
+    def extra_settings(self):
+        return {'THUMBNAIL_ROOT': self.root, 'THUMBNAIL_DERIVATIVES_DIR': os.path.join(self.root, 'derived')}
+    
+    def setUp(self):
+        super().setUp()
+        for relative, size in [
+            ('chapters/lake.jpg', (320, 180)), ('chapters/unused.jpg', (320, 180)),
+            ('films/poster.png', (2000, 40)), ('previews/SHEET_sprite.webp', (1600, 180)),
+            ('previews/SHEET_sprite.jpg', (1600, 180)), ('previews/SHEET_preview.webp', (1600, 180)),
+            ('previews/OLD/frame_000.jpg', (160, 90)),
+            ('derived/chapters/lake-160w.jpg', (160, 90)),
+        ]:
+            self.image(relative, size)
+        self.image('chapters/truncated.jpg', (320, 180))
+        with open(os.path.join(self.root, 'chapters', 'truncated.jpg'), 'r+b') as f:
+            f.truncate(400)
+        
+        sheet = Film.objects.create(
+            file_id='SHEET', youtube_id='sheet', title='Sheet', description='', summary='',
+            thumbnail_url='/static/thumbnails/films/poster.png',
+            preview_sprite_url='/static/thumbnails/previews/SHEET_sprite.webp', preview_frame_count=25,
+        )
+        Film.objects.create(
+            file_id='OLD', youtube_id='old', title='Old', description='', summary='',
+            thumbnail_url='https://img.youtube.com/vi/old/maxresdefault.jpg',
+            preview_sprite_url='/static/thumbnails/previews/OLD/',
+        )
+        for order, name in enumerate(['lake.jpg', 'gone.jpg', 'truncated.jpg'], 1):
+            Chapter.objects.create(
+                film=sheet, title=f'Chapter {order}', start_time='00:00', start_time_seconds=order, order=order,
+                thumbnail_url=f'/static/thumbnails/chapters/{name}'
+            )
+    
+    def image(self, relative, size):
+        path = os.path.join(self.root, relative)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Noise, so the JPEGs are big enough to truncate
+        PILImage.effect_noise(size, 64).convert('RGB').save(path)
+    
+    def test_missing_unreadable_and_oversized_files_are_reported(self):
+        output = self.run_command()
+        self.assertIn('chapter SHEET #2: chapters/gone.jpg', output)
+        self.assertIn('chapters/truncated.jpg: Truncated', output)
+        # Wider than --max-width, while the sprite sheets are allowed to be
+        self.assertIn('films/poster.png: ', output)
+        self.assertNotIn('SHEET_sprite.webp: ', output)
+        for line in ('Missing: 1', 'Unreadable: 1', 'Oversized: 1'):
+            self.assertIn(line, output)
+    
+    def test_files_no_film_or_chapter_refers_to_are_orphaned(self):
+        output = self.run_command()
+        # Sprite sheets, their fallbacks, animated previews and frame directories all count as referenced
+        self.assertIn('Orphaned files (not referenced by any film or chapter) (1) ===\n  chapters/unused.jpg\n', output)
+        self.assertNotIn('SHEET_preview.webp', output)
+        self.assertNotIn('derived', output.split('=== SUMMARY ===')[0])
+        self.assertIn('Orphaned: 1', output)
+    
+    def test_only_new_and_changed_files_are_inspected_again(self):
+        output = self.run_command()
+        self.assertIn('Scanned 8 files', output)
+        self.assertIn('8 new or changed, 0 gone', output)
+        self.assertIn('0 new or changed, 0 gone', self.run_command())
+        
+        os.remove(os.path.join(self.root, 'chapters', 'unused.jpg'))
+        self.image('chapters/lake.jpg', (640, 360))
+        output = self.run_command()
+        self.assertIn('1 new or changed, 1 gone', output)
+        self.assertIn('Orphaned: 0', output)
+        self.assertIn('7 new or changed, 0 gone', self.run_command('--rescan'))
+    
+    def test_manifest_can_be_a_bare_filename(self):
+        self.addCleanup(os.chdir, os.getcwd())
+        os.chdir(self.base_dir)
+        self.run_command('--manifest', 'manifest.json')
+        self.assertTrue(os.path.exists(os.path.join(self.base_dir, 'manifest.json')))
+
+
+class ThumbnailPlaceholdersTestCase(TempStaticMixin, TestCase):
+    command = 'generate_thumbnail_placeholders'
+    command_args = ('--workers', '1', '--no-fetch')
+    
+    def setUp(self):
+        super().setUp()
+        self.image('lake.png', 'red')
+        self.image('barn.png', 'blue')
+        self.film = Film.objects.create(
+            file_id='PLACE-1', youtube_id='place1', title='Placeholders', description='', summary='',
+            thumbnail_url='https://img.youtube.com/vi/place1/maxresdefault.jpg'
+        )
+        self.lake, self.barn, self.untitled = [
+            Chapter.objects.create(
+                film=self.film, title=f'Chapter {order}', start_time='00:00', start_time_seconds=order, order=order,
+                thumbnail_url=f'/static/thumbnails/chapters/{name}' if name else ''
+            )
+            for order, name in enumerate(['lake.png', 'barn.png', None], 1)
+        ]
+    
+    def image(self, name, color, size=(640, 360)):
+        PILImage.new('RGB', size, color).save(os.path.join(self.root, 'chapters', name))
+    
+    def test_placeholders_are_drawn_and_journaled(self):
+        self.assertIn('Placeholders drawn: 2', self.run_command())
+        self.lake.refresh_from_db()
+        self.assertTrue(self.lake.thumbnail_placeholder.startswith('data:image/webp;base64,'))
+        self.assertLess(len(self.lake.thumbnail_placeholder), 300)
+        self.assertEqual(self.lake.thumbnail_color, '#ff0000')
+        self.assertEqual(JournalEntry.objects.filter(model='chapter', object_id=str(self.lake.id), action='update').count(), 1)
+    
+    def test_unchanged_thumbnails_are_skipped(self):
+        self.run_command()
+        self.assertIn('Unchanged and skipped: 2', self.run_command())
+    
+    def test_replaced_thumbnails_are_redrawn_and_removed_ones_cleared(self):
+        self.run_command()
+        self.image('lake.png', 'green', (320, 180))
+        Chapter.objects.filter(id=self.barn.id).update(thumbnail_url='')
+        output = self.run_command()
+        self.assertIn('Placeholders drawn: 1', output)
+        self.assertIn('Cleared for removed thumbnails: 1', output)
+        self.lake.refresh_from_db()
+        self.barn.refresh_from_db()
+        self.assertEqual(self.lake.thumbnail_color, '#008000')
+        self.assertEqual((self.barn.thumbnail_placeholder, self.barn.thumbnail_color), ('', ''))
+    
+    def test_pages_paint_the_placeholder_behind_the_thumbnail(self):
+        self.run_command()
+        self.lake.refresh_from_db()
+        self.client.force_login(User.objects.create_user('viewer', password='testpass123'))
+        response = self.client.get(self.film.get_absolute_url())
+        self.assertContains(response, f'background-image: url({self.lake.thumbnail_placeholder})')
+
+
+class FakeYouTubeAPI(ThreadingHTTPServer):
+    """
+    Local stand-in for the YouTube Data API serving videos.list and one
+    playlist's playlistItems.list with ETags. errors are (status, reason)
+    replies given, in order, before any request is served.
+    """
+    def __init__(self, videos, playlist=(), errors=()):
+        self.videos = videos
+        self.playlist = list(playlist)
+        self.errors = list(errors)
+        self.calls = []
+        self.lock = threading.Lock()
+
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                url = urlparse(self.path)
+                params = {name: values[0] for name, values in parse_qs(url.query).items()}
+                with server.lock:
+                    server.calls.append((url.path.rsplit('/', 1)[-1], params, self.headers.get('If-None-Match')))
+                    error = server.errors.pop(0) if server.errors else None
+                if error is None and params.get('key') != 'test-key':
+                    error = (400, 'keyInvalid')
+                if error:
+                    status, reason = error
+                    return self.reply(status, {'error': {'code': status, 'message': reason, 'errors': [{'reason': reason}]}})
+                if url.path == '/youtube/v3/videos':
+                    ids = params['id'].split(',')
+                    if len(ids) > 50:
+                        return self.reply(400, {'error': {'code': 400, 'message': 'Too many IDs', 'errors': []}})
+                    return self.reply(200, {'items': [server.video(video_id) for video_id in ids if video_id in server.videos]})
+                start = int(params.get('pageToken', 0))
+                body = {'items': [{'contentDetails': {'videoId': video_id}} for video_id in server.playlist[start:start + 50]]}
+                if start + 50 < len(server.playlist):
+                    body['nextPageToken'] = str(start + 50)
+                self.reply(200, body)
+
+            def reply(self, status, body):
+                body = json.dumps(body).encode()
+                etag = f'"{bytes_hash(body)}"'
+                if status == 200 and self.headers.get('If-None-Match') == etag:
+                    status, body = 304, b''
+                self.send_response(status)
+                self.send_header('ETag', etag)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        super().__init__(('127.0.0.1', 0), Handler)
+        self.api_url = f'http://127.0.0.1:{self.server_address[1]}/youtube/v3'
+
+    def video(self, video_id):
+        return {
+            'id': video_id,
+            'snippet': {
+                'title': f'Video {video_id}', 'description': self.videos[video_id],
+                'publishedAt': '2025-07-01T12:00:00Z', 'channelTitle': 'Family Films',
+            },
+            'contentDetails': {'duration': 'PT1M5S'},
+            'statistics': {'viewCount': '12'},
+        }
+
+
+class YouTubeClientTestCase(TestCase):
+    def setUp(self):
+        self.video_ids = [f'vid{i:03d}' for i in range(120)]
+        self.videos = {video_id: f'File ID: FILM-{video_id}\nYears: 1950' for video_id in self.video_ids}
+        self.temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.temp_dir)
+
+    def serve(self, **kwargs):
+        server = FakeYouTubeAPI(self.videos, **kwargs)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        return server
+
+    def api_client(self, server, **kwargs):
+        return YouTubeClient('test-key', api_url=server.api_url, backoff=0, **kwargs)
+
+    def test_videos_are_batched_retried_and_revalidated_by_etag(self):
+        server = self.serve(errors=[(500, 'backendError'), (403, 'rateLimitExceeded')])
+        cache_path = os.path.join(self.temp_dir, 'youtube_api.json')
+        with self.api_client(server, workers=4, cache_path=cache_path) as client:
+            items = client.videos(self.video_ids + ['gone'] + self.video_ids[:3])
+            # 120 videos take 3 requests of at most 50 IDs, plus the 2 that were retried
+            self.assertEqual([item['id'] for item in items], self.video_ids)
+            self.assertEqual((client.requests, client.retries, client.quota_used), (5, 2, 5))
+            batches = sorted(len(params['id'].split(',')) for _, params, _ in server.calls[2:])
+            self.assertEqual(batches, [21, 50, 50])
+
+        # The next run sends the saved ETags and gets 304s back
+        server.calls.clear()
+        with self.api_client(server, workers=4, cache_path=cache_path) as client:
+            self.assertEqual(client.videos(self.video_ids + ['gone']), items)
+            self.assertEqual((client.requests, client.not_modified, client.quota_by_resource), (3, 3, {'videos': 3}))
+        self.assertTrue(all(etag for _, _, etag in server.calls))
+        self.assertIn('3 API requests (3 not modified, 0 retried), 3 quota units used', client.summary())
+
+    def test_quota_errors_are_not_retried_and_the_budget_is_kept(self):
+        server = self.serve(errors=[(403, 'quotaExceeded')])
+        with self.api_client(server) as client:
+            with self.assertRaises(YouTubeAPIError) as raised:
+                client.videos(['vid000'])
+        self.assertEqual((raised.exception.status, raised.exception.reason), (403, 'quotaExceeded'))
+        self.assertEqual(len(server.calls), 1)
+
+        with self.api_client(server, workers=1, quota_budget=2) as client:
+            with self.assertRaises(YouTubeAPIError) as raised:
+                client.videos(self.video_ids)
+        self.assertEqual(raised.exception.reason, 'quotaBudget')
+        self.assertEqual((client.quota_used, len(server.calls)), (2, 3))
+
+        self.assertEqual(parse_duration('PT1H2M3S'), timedelta(hours=1, minutes=2, seconds=3))
+        self.assertEqual(parse_duration('P1DT5S'), timedelta(days=1, seconds=5))
+        self.assertIsNone(parse_duration('1:02:03'))
+
+    def test_fetch_commands_use_the_client(self):
+        server = self.serve(playlist=self.video_ids[:60])
+        output_file = os.path.join(self.temp_dir, 'metadata.json')
+        common = ['--api-key', 'test-key', '--api-url', server.api_url, '--output-file', output_file,
+                  '--cache', os.path.join(self.temp_dir, 'cache.json'), '--workers', '2']
+
+        out = StringIO()
+        call_command('fetch_youtube_metadata', '--fetch-all', '--playlist-id', 'PL1', *common, stdout=out)
+        with open(output_file) as f:
+            videos = json.load(f)
+        self.assertEqual([video['video_id'] for video in videos], self.video_ids[:60])
+        self.assertEqual((videos[0]['file_id'], videos[0]['years'], videos[0]['duration']), ('FILM-vid000', '1950', 'PT1M5S'))
+        # 2 pages of the playlist, then its 60 videos in 2 batches
+        self.assertEqual([resource for resource, _, _ in server.calls], ['playlistItems'] * 2 + ['videos'] * 2)
+        self.assertIn('4 API requests (0 not modified, 0 retried), 4 quota units used', out.getvalue())
+
+        out = StringIO()
+        call_command(
+            'fetch_youtube_descriptions', 'vid001', 'https://www.youtube.com/watch?v=vid002', 'https://youtu.be/vid003',
+            *common, stdout=out,
+        )
+        with open(output_file) as f:
+            videos = json.load(f)
+        self.assertEqual([video['video_id'] for video in videos], ['vid001', 'vid002', 'vid003'])
+        self.assertEqual((videos[0]['file_id'], videos[0]['duration'], videos[0]['upload_date']), ('FILM-vid001', 65, '20250701'))
+        self.assertIn('1 API requests', out.getvalue())
+
+        with self.assertRaises(CommandError):
+            call_command('fetch_youtube_metadata', 'vid001', *common[2:], '--api-key', 'wrong', stdout=StringIO())
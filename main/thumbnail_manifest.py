@@ -0,0 +1,117 @@
+"""
+Manifest of the image files under the thumbnail root, for coverage checks.
+
+One os.scandir walk lists every image with its size and mtime. Files
+whose size and mtime match the saved manifest keep their entry; new and
+changed files are decoded in full, so truncated or corrupt images are
+caught, and get their dimensions and SHA-256 recorded. The manifest is
+saved as JSON mapping each path, relative to the root, to
+{size, mtime_ns, width, height, hash} or {size, mtime_ns, error}.
+
+audit() joins the manifest with the thumbnail paths the database refers
+to in memory and reports missing, orphaned, oversized and unreadable
+files in one pass.
+"""
+import json
+import os
+import posixpath
+
+from PIL import Image
+
+from main.importing.hashing import file_hash
+
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.webp', '.gif', '.avif'}
+
+
+def scan_tree(root, skip_dirs=()):
+    """{relative POSIX path: (size, mtime_ns)} of the images under root, walking each directory once"""
+    skip_dirs = {os.path.abspath(path) for path in skip_dirs}
+    files, pending = {}, [('', os.path.abspath(root))]
+    while pending:
+        prefix, directory = pending.pop()
+        try:
+            entries = list(os.scandir(directory))
+        except FileNotFoundError:
+            continue
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                if entry.path not in skip_dirs:
+                    pending.append((f'{prefix}{entry.name}/', entry.path))
+            elif os.path.splitext(entry.name)[1].lower() in IMAGE_EXTENSIONS:
+                stat = entry.stat()
+                files[prefix + entry.name] = (stat.st_size, stat.st_mtime_ns)
+    return files
+
+
+def inspect_image(path):
+    """{width, height, hash} of an image file, or {error} if it does not decode in full"""
+    try:
+        with Image.open(path) as image:
+            image.load()
+            width, height = image.size
+    except (OSError, SyntaxError, ValueError) as e:
+        return {'error': str(e)}
+    return {'width': width, 'height': height, 'hash': file_hash(path)}
+
+
+class ThumbnailManifest:
+    def __init__(self, root, path, skip_dirs=()):
+        self.root = root
+        self.path = path
+        self.skip_dirs = skip_dirs
+        self.files = {}
+        if path and os.path.exists(path):
+            with open(path) as f:
+                self.files = json.load(f)['files']
+
+    def refresh(self, rescan=False):
+        """
+        Bring the manifest up to date with the files on disk, inspecting
+        only new and changed files unless rescan. Returns (scanned, inspected, removed).
+        """
+        on_disk = scan_tree(self.root, self.skip_dirs)
+        removed = len(set(self.files) - set(on_disk))
+        files, inspected = {}, 0
+        for relative, (size, mtime_ns) in on_disk.items():
+            entry = self.files.get(relative)
+            if rescan or not entry or entry['size'] != size or entry['mtime_ns'] != mtime_ns:
+                entry = {'size': size, 'mtime_ns': mtime_ns, **inspect_image(os.path.join(self.root, relative))}
+                inspected += 1
+            files[relative] = entry
+        self.files = files
+        return len(on_disk), inspected, removed
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump({'root': self.root, 'files': self.files}, f, indent=1, sort_keys=True)
+        os.replace(temp_path, self.path)
+
+
+def audit(files, references, max_bytes, max_width, wide=()):
+    """
+    Join manifest files with references, a list of (owner, relative path)
+    where a path ending in / refers to a directory of frames.
+
+    Returns {missing: [(owner, path)], orphaned: [path], oversized: [path],
+    unreadable: [path]}. A file is oversized above max_bytes, or wider than
+    max_width unless its path is in wide (sprite sheets are wide by design).
+    """
+    directories = {posixpath.dirname(relative) + '/' for relative in files}
+    missing, referenced = [], set()
+    for owner, relative in references:
+        if relative in files or relative in directories:
+            referenced.add(relative)
+        else:
+            missing.append((owner, relative))
+
+    orphaned, oversized, unreadable = [], [], []
+    for relative, entry in sorted(files.items()):
+        if relative not in referenced and posixpath.dirname(relative) + '/' not in referenced:
+            orphaned.append(relative)
+        if 'error' in entry:
+            unreadable.append(relative)
+        elif entry['size'] > max_bytes or (entry['width'] > max_width and relative not in wide):
+            oversized.append(relative)
+    return {'missing': missing, 'orphaned': orphaned, 'oversized': oversized, 'unreadable': unreadable}
@@ -0,0 +1,208 @@
+"""
+Client for the YouTube Data API v3, shared by the commands and scripts
+that look up our videos.
+
+One pooled requests.Session serves every call. videos.list is asked for
+at most MAX_IDS videos per request and the batches run concurrently on a
+few threads. Rate limits, server errors and dropped connections are
+retried with exponential backoff and full jitter; quotaExceeded is not,
+as the daily quota does not come back within a run. Responses are kept
+with their ETag and asked for again with If-None-Match, so an unchanged
+playlist page or batch of videos comes back as an empty 304. The units
+each call costs are added up so runs can report, and cap, what they
+spent.
+"""
+import json
+import os
+import random
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from urllib.parse import urlencode
+
+import requests
+from requests.adapters import HTTPAdapter
+
+API_URL = 'https://www.googleapis.com/youtube/v3'
+MAX_IDS = 50
+API_WORKERS = 4
+# Units each list call is charged against the project's daily quota (10,000 by default)
+QUOTA_COSTS = {'videos': 1, 'playlistItems': 1, 'playlists': 1, 'channels': 1, 'search': 100}
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+RETRY_REASONS = {'rateLimitExceeded', 'userRateLimitExceeded', 'backendError'}
+
+DURATION_PATTERN = re.compile(r'P(?:(\d+)D)?(?:T(?:(\d+)H)?(?:(\d+)M)?(?:(\d+)S)?)?$')
+
+
+def parse_duration(value):
+    """timedelta for an ISO 8601 duration such as PT1H2M3S, None if it is not one"""
+    match = DURATION_PATTERN.match(value or '')
+    if not match or value == 'P':
+        return None
+    days, hours, minutes, seconds = (int(part or 0) for part in match.groups())
+    return timedelta(days=days, hours=hours, minutes=minutes, seconds=seconds)
+
+
+class YouTubeAPIError(Exception):
+    def __init__(self, message, status=None, reason=None):
+        super().__init__(message)
+        self.status = status
+        self.reason = reason
+
+
+class YouTubeClient:
+    """
+    Use as a context manager so the session is closed and the ETag cache
+    saved. cache_path keeps responses between runs; quota_budget stops
+    the client before it spends more units than that.
+    """
+    def __init__(self, api_key, api_url=API_URL, workers=API_WORKERS, timeout=10, max_retries=5,
+                 backoff=1.0, max_backoff=32.0, cache_path=None, quota_budget=None, session=None):
+        self.api_key = api_key
+        self.api_url = api_url.rstrip('/')
+        self.workers = workers
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.cache_path = cache_path
+        self.quota_budget = quota_budget
+        self.session = session or requests.Session()
+        adapter = HTTPAdapter(pool_connections=workers, pool_maxsize=workers)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.cache = {}  # request key -> {etag, data}
+        if cache_path and os.path.exists(cache_path):
+            with open(cache_path) as f:
+                self.cache = json.load(f)['responses']
+        self.lock = threading.Lock()
+        self.quota_used = 0
+        self.quota_by_resource = {}
+        self.requests = self.not_modified = self.retries = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.session.close()
+        self.save()
+
+    def save(self):
+        if not self.cache_path:
+            return
+        os.makedirs(os.path.dirname(self.cache_path) or '.', exist_ok=True)
+        temp_path = self.cache_path + '.tmp'
+        with self.lock, open(temp_path, 'w') as f:
+            json.dump({'responses': self.cache}, f)
+        os.replace(temp_path, self.cache_path)
+
+    def charge(self, resource):
+        cost = QUOTA_COSTS.get(resource, 1)
+        with self.lock:
+            if self.quota_budget is not None and self.quota_used + cost > self.quota_budget:
+                raise YouTubeAPIError(
+                    f'{resource}.list would take the run past its quota budget of {self.quota_budget} units',
+                    reason='quotaBudget',
+                )
+            self.quota_used += cost
+            self.quota_by_resource[resource] = self.quota_by_resource.get(resource, 0) + cost
+            self.requests += 1
+
+    def delay(self, attempt, response=None):
+        """Seconds to wait before retry number attempt: Retry-After if given, else full jitter"""
+        retry_after = response.headers.get('Retry-After') if response is not None else None
+        if retry_after and retry_after.isdigit():
+            return min(int(retry_after), self.max_backoff)
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+
+    def get(self, resource, **params):
+        """The JSON response of resource.list with params, from the cache if it is unchanged"""
+        key = f'{resource}?{urlencode(sorted(params.items()))}'
+        with self.lock:
+            cached = self.cache.get(key)
+        headers = {'If-None-Match': cached['etag']} if cached else {}
+        url = f'{self.api_url}/{resource}'
+        for attempt in range(self.max_retries + 1):
+            # Every call is charged, including retries and 304s
+            self.charge(resource)
+            try:
+                response = self.session.get(
+                    url, params={**params, 'key': self.api_key}, headers=headers, timeout=self.timeout
+                )
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if attempt == self.max_retries:
+                    raise YouTubeAPIError(f'{resource}.list failed: {e}') from e
+                self.retry(attempt)
+                continue
+            if response.status_code == 304 and cached:
+                with self.lock:
+                    self.not_modified += 1
+                return cached['data']
+            if response.status_code == 200:
+                data = response.json()
+                if response.headers.get('ETag'):
+                    with self.lock:
+                        self.cache[key] = {'etag': response.headers['ETag'], 'data': data}
+                return data
+            reason, message = self.error_reason(response)
+            if attempt < self.max_retries and (response.status_code in RETRY_STATUSES or reason in RETRY_REASONS):
+                self.retry(attempt, response)
+                continue
+            raise YouTubeAPIError(
+                f'{resource}.list failed with HTTP {response.status_code}: {message}',
+                status=response.status_code, reason=reason,
+            )
+
+    def retry(self, attempt, response=None):
+        with self.lock:
+            self.retries += 1
+        time.sleep(self.delay(attempt, response))
+
+    def error_reason(self, response):
+        """(reason, message) from an API error body, e.g. ('quotaExceeded', ...)"""
+        try:
+            error = response.json()['error']
+            return error['errors'][0].get('reason'), error.get('message', '')
+        except (ValueError, KeyError, IndexError, TypeError):
+            return None, response.reason
+
+    def videos(self, video_ids, part='snippet,contentDetails,statistics'):
+        """Video resources for video_ids in the order given; videos YouTube does not return are left out"""
+        video_ids = list(dict.fromkeys(video_ids))
+        batches = [video_ids[i:i + MAX_IDS] for i in range(0, len(video_ids), MAX_IDS)]
+
+        def fetch(batch):
+            return self.get('videos', part=part, id=','.join(batch), maxResults=MAX_IDS).get('items', [])
+
+        if len(batches) <= 1 or self.workers == 1:
+            pages = [fetch(batch) for batch in batches]
+        else:
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                pages = list(executor.map(fetch, batches))
+        found = {item['id']: item for page in pages for item in page}
+        return [found[video_id] for video_id in video_ids if video_id in found]
+
+    def playlist_video_ids(self, playlist_id):
+        """IDs of the videos in a playlist, in playlist order"""
+        video_ids, page_token = [], None
+        while True:
+            params = {'part': 'contentDetails', 'playlistId': playlist_id, 'maxResults': MAX_IDS}
+            if page_token:
+                params['pageToken'] = page_token
+            data = self.get('playlistItems', **params)
+            video_ids.extend(item['contentDetails']['videoId'] for item in data.get('items', []))
+            page_token = data.get('nextPageToken')
+            if not page_token:
+                return video_ids
+
+    def summary(self):
+        """One line on the requests made and the quota they used"""
+        return (
+            f'{self.requests} API requests ({self.not_modified} not modified, {self.retries} retried), '
+            f'{self.quota_used} quota units used'
+        )
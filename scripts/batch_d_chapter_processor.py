@@ -8,14 +8,17 @@ Creates chapters for Batch D films from Excel files and processes all metadata:
 - Location relationships
 - Year relationships
 - Chapter thumbnail extraction and processing
+
+Replaced by the parse and write stages of
+`python manage.py ingest_films <csv> --batch "Batch D"`: each sheet is
+parsed in a worker process, then its chapters and their bitfield people,
+other people, locations and tags are written one film at a time.
 """
 
 import os
 import sys
 import django
-import pandas as pd
 import re
-import subprocess
 from pathlib import Path
 from datetime import timedelta
 
@@ -25,6 +28,9 @@ os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'family_films.settings')
 django.setup()
 
 from main.models import Film, Chapter, Person, Location, Tag, ChapterPeople, ChapterLocations, ChapterTags
+from main.importing.bitfield import bitfield_chapter_people, write_chapter_people
+from main.importing.chapter_sheets import xls_thumbnails
+from main.importing.sheet_reader import ChapterSheet, is_blank
 from django.db import transaction
 
 class BatchDChapterProcessor:
@@ -41,6 +47,9 @@ class BatchDChapterProcessor:
             3: "Matthew Hayward"
         }
         
+        # Bitfield names resolved to person ids once per run
+        self.bitfield_person_ids = {}
+        
         self.stats = {
             'files_processed': 0,
             'chapters_created': 0,
@@ -99,14 +108,11 @@ class BatchDChapterProcessor:
     def extract_film_id_from_file(self, file_path):
         """Extract film ID from Excel file"""
         try:
-            df = pd.read_excel(file_path, header=None)
-            
-            # Check row 3 (index 2) for film ID
-            if len(df) > 2:
-                cell_value = str(df.iloc[2, 0]).strip()
-                # Extract just the film ID part before any dash or description
-                film_id = cell_value.split(' - ')[0].strip()
-                return film_id
+            with ChapterSheet(file_path) as sheet:
+                # Check row 3 (index 2) for film ID
+                if sheet.prefix:
+                    # Extract just the film ID part before any dash or description
+                    return sheet.prefix.split(' - ')[0].strip()
         except Exception:
             pass
         
@@ -118,20 +124,12 @@ class BatchDChapterProcessor:
         
         return None
 
-    def find_header_row(self, df):
-        """Find the row containing headers like 'Start', 'End', 'Title', etc."""
-        for idx in range(5, min(15, len(df))):
-            row = df.iloc[idx]
-            row_str = ' '.join(str(cell).lower() for cell in row if pd.notna(cell))
-            if 'start' in row_str and 'title' in row_str:
-                return idx
-        return None
-
-    def extract_bitfield_key(self, df):
+    def extract_bitfield_key(self, sheet):
         """Extract bitfield key from row around index 7"""
-        for idx in range(5, min(10, len(df))):
-            for col in range(min(10, len(df.columns))):
-                cell_value = str(df.iloc[idx, col]).strip() if not pd.isna(df.iloc[idx, col]) else ''
+        for idx in range(5, 10):
+            for col in range(10):
+                cell_value = sheet.cell(idx, col)
+                cell_value = str(cell_value).strip() if not is_blank(cell_value) else ''
                 if 'bitfield:' in cell_value.lower():
                     # Extract names after "Bitfield:"
                     match = re.search(r'Bitfield:\s*(.+)', cell_value, re.IGNORECASE)
@@ -196,9 +194,9 @@ class BatchDChapterProcessor:
         # Create new location
         return Location.objects.create(name=location_name)
 
-    def process_hayward_bitfield(self, chapter, bitfield, bitfield_key=None):
-        """Process Hayward family bitfield (e.g., '0110') and add people to chapter"""
-        if not bitfield or len(bitfield) != 4:
+    def process_hayward_bitfields(self, sheet_bitfields, bitfield_key=None):
+        """Decode a file's Hayward bitfields (e.g., '0110') and add people in bulk"""
+        if not sheet_bitfields:
             return
         
         # Use provided bitfield key or default mapping
@@ -207,16 +205,20 @@ class BatchDChapterProcessor:
         else:
             name_mapping = self.hayward_bitfield_map
         
-        for idx, bit in enumerate(bitfield):
-            if bit == '1' and idx in name_mapping:
-                person = self.find_or_create_person(name_mapping[idx])
-                if person:
-                    ChapterPeople.objects.get_or_create(
-                        chapter=chapter,
-                        person=person,
-                        defaults={'is_primary': True}
-                    )
-                    self.stats['people_relationships'] += 1
+        def resolve_person_id(idx):
+            name = name_mapping.get(idx)
+            if name is None:
+                return None
+            if name not in self.bitfield_person_ids:
+                person = self.find_or_create_person(name)
+                self.bitfield_person_ids[name] = person.pk if person else None
+            return self.bitfield_person_ids[name]
+        
+        chapter_ids = [chapter_id for chapter_id, _ in sheet_bitfields]
+        bitfields = [bitfield for _, bitfield in sheet_bitfields]
+        pairs = bitfield_chapter_people(chapter_ids, bitfields, 4, resolve_person_id)
+        with transaction.atomic():
+            self.stats['people_relationships'] += write_chapter_people(pairs, is_primary=True)
 
     def process_other_people(self, chapter, people_str):
         """Process comma-separated list of other people"""
@@ -254,41 +256,16 @@ class BatchDChapterProcessor:
                     )
                     self.stats['location_relationships'] += 1
 
-    def extract_images_from_excel(self, excel_file, film_id):
-        """Extract images from Excel file using the XLS image extractor"""
+    def extract_images_from_excel(self, excel_file, column):
+        """Start column thumbnails of an Excel file, keyed by the row they are anchored to"""
         try:
-            # Create output directory for this film
-            output_dir = self.thumbnail_dir / film_id
-            output_dir.mkdir(exist_ok=True)
-            
-            # Use the existing XLS image extractor
-            extractor_path = Path('/home/viblio/family_films/xls_image_extractor.py')
-            if not extractor_path.exists():
-                print(f"    ⚠️ XLS image extractor not found at {extractor_path}")
-                return []
-            
-            result = subprocess.run([
-                'python', str(extractor_path), str(excel_file), '-o', str(output_dir)
-            ], capture_output=True, text=True)
-            
-            if result.returncode == 0:
-                # Find extracted images
-                extracted_files = []
-                for i in range(50):  # Check up to 50 images
-                    image_path = output_dir / f"{excel_file.stem}_image_{i:03d}.jpg"
-                    if image_path.exists():
-                        extracted_files.append(image_path)
-                
-                print(f"    📷 Extracted {len(extracted_files)} images")
-                self.stats['thumbnails_extracted'] += len(extracted_files)
-                return extracted_files
-            else:
-                print(f"    ❌ Image extraction failed: {result.stderr}")
-                return []
-                
+            thumbnails, total = xls_thumbnails(excel_file, column)
+            print(f"    📷 Extracted {len(thumbnails)} Start column images of {total}")
+            self.stats['thumbnails_extracted'] += len(thumbnails)
+            return thumbnails
         except Exception as e:
             print(f"    ❌ Error extracting images: {e}")
-            return []
+            return {}
 
     def process_excel_file(self, file_path):
         """Process a single Excel file and create chapters"""
@@ -311,56 +288,58 @@ class BatchDChapterProcessor:
                 self.stats['errors'] += 1
                 return
             
-            # Read Excel file
-            df = pd.read_excel(file_path, header=None)
-            
-            # Extract bitfield key
-            bitfield_key = self.extract_bitfield_key(df)
-            print(f"    🔑 Bitfield key: {bitfield_key}")
-            
-            # Find header row
-            header_row_idx = self.find_header_row(df)
-            if header_row_idx is None:
-                print(f"    ❌ Could not find header row")
-                self.stats['errors'] += 1
-                return
-            
-            # Extract images first (all images should be from Start column A)
-            extracted_images = self.extract_images_from_excel(file_path, film_id)
-            # Use all extracted images since they should be from column A (Start column)
-            start_column_images = extracted_images
-            
-            # Process data rows
-            headers = df.iloc[header_row_idx].str.lower().str.strip()
-            header_map = {col: idx for idx, col in enumerate(headers) if pd.notna(col)}
-            
-            print(f"    📋 Headers found: {list(header_map.keys())}")
-            
-            chapters_created = 0
-            
-            # Process each chapter row
-            for row_idx in range(header_row_idx + 1, len(df)):
-                row = df.iloc[row_idx]
-                
-                # Skip empty rows
-                title_col = header_map.get('title', 2)  # Default to column 2
-                if pd.isna(row[title_col]) or not str(row[title_col]).strip():
-                    continue
-                
-                with transaction.atomic():
-                    chapter = self.create_chapter_from_row(film, row, header_map, bitfield_key, start_column_images, chapters_created)
-                    if chapter:
-                        chapters_created += 1
-            
-            print(f"    ✅ Created {chapters_created} chapters")
-            self.stats['chapters_created'] += chapters_created
-            self.stats['files_processed'] += 1
+            # Stream the Excel file; only the rows up to the header are kept
+            with ChapterSheet(file_path) as sheet:
+                self.process_sheet_rows(file_path, film, film_id, sheet)
             
         except Exception as e:
             print(f"    ❌ Error processing file: {e}")
             self.stats['errors'] += 1
 
-    def create_chapter_from_row(self, film, row, header_map, bitfield_key, extracted_images, chapter_index):
+    def process_sheet_rows(self, file_path, film, film_id, sheet):
+        """Create chapters for every titled row of an open chapter sheet"""
+        # Extract bitfield key
+        bitfield_key = self.extract_bitfield_key(sheet)
+        print(f"    🔑 Bitfield key: {bitfield_key}")
+        
+        # Find header row
+        header_row_idx = sheet.header_row
+        if header_row_idx is None:
+            print(f"    ❌ Could not find header row")
+            self.stats['errors'] += 1
+            return
+        
+        # Process data rows
+        header_map = sheet.header_map
+        
+        # Extract the images anchored in the Start column (column A unless the header says otherwise)
+        start_column_images = self.extract_images_from_excel(file_path, header_map.get('start', 0))
+        
+        print(f"    📋 Headers found: {list(header_map.keys())}")
+        
+        chapters_created = 0
+        sheet_bitfields = []
+        
+        # Process each chapter row, padded so the default column positions below exist
+        for row_idx, row in sheet.rows(width=10):
+            # Skip empty rows
+            title_col = header_map.get('title', 2)  # Default to column 2
+            if is_blank(row[title_col]) or not str(row[title_col]).strip():
+                continue
+            
+            with transaction.atomic():
+                chapter = self.create_chapter_from_row(film, row, header_map, bitfield_key, start_column_images.get(row_idx), chapters_created, sheet_bitfields)
+                if chapter:
+                    chapters_created += 1
+        
+        # Hayward people for every chapter of the file in one pass
+        self.process_hayward_bitfields(sheet_bitfields, bitfield_key)
+        
+        print(f"    ✅ Created {chapters_created} chapters")
+        self.stats['chapters_created'] += chapters_created
+        self.stats['files_processed'] += 1
+
+    def create_chapter_from_row(self, film, row, header_map, bitfield_key, thumbnail, chapter_index, sheet_bitfields):
         """Create a single chapter from Excel row data"""
         try:
             # Extract basic chapter data
@@ -368,25 +347,25 @@ class BatchDChapterProcessor:
             
             # Handle description - check for NaN first
             description = ''
-            if header_map.get('description') is not None and not pd.isna(row[header_map.get('description')]):
+            if header_map.get('description') is not None and not is_blank(row[header_map.get('description')]):
                 desc_val = row[header_map.get('description')]
                 description = str(desc_val).strip() if desc_val != 'nan' else ''
             
             # Handle technical notes - check for NaN first  
             technical_notes = ''
-            if header_map.get('technical notes') is not None and not pd.isna(row[header_map.get('technical notes')]):
+            if header_map.get('technical notes') is not None and not is_blank(row[header_map.get('technical notes')]):
                 tech_val = row[header_map.get('technical notes')]
                 technical_notes = str(tech_val).strip() if tech_val != 'nan' else ''
             
             # Parse start time - check multiple columns
             start_seconds = 0
-            if header_map.get('18fps start seconds') and not pd.isna(row[header_map.get('18fps start seconds')]):
+            if header_map.get('18fps start seconds') and not is_blank(row[header_map.get('18fps start seconds')]):
                 start_seconds = int(float(row[header_map.get('18fps start seconds')]))
-            elif header_map.get('16fps start seconds') and not pd.isna(row[header_map.get('16fps start seconds')]):  
+            elif header_map.get('16fps start seconds') and not is_blank(row[header_map.get('16fps start seconds')]):  
                 start_seconds = int(float(row[header_map.get('16fps start seconds')]))
-            elif header_map.get('18fps start timecode') and not pd.isna(row[header_map.get('18fps start timecode')]):
+            elif header_map.get('18fps start timecode') and not is_blank(row[header_map.get('18fps start timecode')]):
                 start_seconds = self.parse_time_to_seconds(row[header_map.get('18fps start timecode')])
-            elif header_map.get('16fps start timecode') and not pd.isna(row[header_map.get('16fps start timecode')]):
+            elif header_map.get('16fps start timecode') and not is_blank(row[header_map.get('16fps start timecode')]):
                 start_seconds = self.parse_time_to_seconds(row[header_map.get('16fps start timecode')])
             
             # Create combined description
@@ -394,7 +373,7 @@ class BatchDChapterProcessor:
             
             # Handle year data - check for NaN first
             year_data = ''
-            if header_map.get('year') is not None and not pd.isna(row[header_map.get('year')]):
+            if header_map.get('year') is not None and not is_blank(row[header_map.get('year')]):
                 year_val = row[header_map.get('year')]
                 year_data = str(year_val).strip() if year_val != 'nan' else ''
             
@@ -413,17 +392,17 @@ class BatchDChapterProcessor:
             
             print(f"      📝 Created: {title} ({start_seconds}s)")
             
-            # Process Hayward bitfield
+            # Hayward bitfield is decoded with the rest of the file's bitfields
             haywards_col = header_map.get('haywards present', 5)
-            if haywards_col is not None and not pd.isna(row[haywards_col]):
+            if haywards_col is not None and not is_blank(row[haywards_col]):
                 bitfield_val = row[haywards_col]
                 bitfield = str(bitfield_val).strip()
-                if bitfield and bitfield != 'nan' and bitfield != 'nan':
-                    self.process_hayward_bitfield(chapter, bitfield, bitfield_key)
+                if bitfield and bitfield != 'nan':
+                    sheet_bitfields.append((chapter.id, bitfield))
             
             # Process locations
             locations_col = header_map.get('locations', 6)
-            if locations_col is not None and not pd.isna(row[locations_col]):
+            if locations_col is not None and not is_blank(row[locations_col]):
                 locations_val = row[locations_col]
                 locations_str = str(locations_val).strip()
                 if locations_str and locations_str != 'nan':
@@ -431,15 +410,15 @@ class BatchDChapterProcessor:
             
             # Process other people
             other_people_col = header_map.get('other people', 9)
-            if other_people_col is not None and not pd.isna(row[other_people_col]):
+            if other_people_col is not None and not is_blank(row[other_people_col]):
                 people_val = row[other_people_col]
                 other_people_str = str(people_val).strip()
                 if other_people_str and other_people_str != 'nan':
                     self.process_other_people(chapter, other_people_str)
             
             # Assign chapter thumbnail if available
-            if extracted_images and chapter_index < len(extracted_images):
-                self.assign_chapter_thumbnail(chapter, extracted_images[chapter_index])
+            if thumbnail:
+                self.assign_chapter_thumbnail(chapter, thumbnail)
             
             return chapter
             
@@ -447,16 +426,13 @@ class BatchDChapterProcessor:
             print(f"      ❌ Error creating chapter: {e}")
             return None
 
-    def assign_chapter_thumbnail(self, chapter, image_path):
-        """Assign extracted image as chapter thumbnail"""
+    def assign_chapter_thumbnail(self, chapter, thumbnail):
+        """Save an extracted (extension, bytes) image as chapter thumbnail"""
         try:
             # Create meaningful filename
-            filename = f"{chapter.film.file_id}_ch{chapter.order:02d}_{chapter.start_time_seconds}s.jpg"
-            dest_path = self.thumbnail_dir / filename
-            
-            # Copy image to thumbnails directory
-            import shutil
-            shutil.copy2(image_path, dest_path)
+            extension, image_bytes = thumbnail
+            filename = f"{chapter.film.file_id}_ch{chapter.order:02d}_{chapter.start_time_seconds}s.{extension}"
+            (self.thumbnail_dir / filename).write_bytes(image_bytes)
             
             # Update chapter with thumbnail URL
             chapter.thumbnail_url = f"/static/thumbnails/chapters/{filename}"
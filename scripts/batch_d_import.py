@@ -5,6 +5,11 @@ Batch D Film Import Tool
 This script imports new films from the family_movies_batchd.csv file for entries marked as "Batch D".
 It cross-references with the YouTube playlist to extract metadata from video descriptions and creates
 the necessary database entries for films, chapters, people, locations, and relationships.
+
+Replaced by `python manage.py ingest_films <csv> --batch "Batch D"`, whose
+read stage picks the Batch D rows, youtube stage finds each film's video in
+--youtube-mapping or the descriptions in --youtube-videos, and write stage
+creates the films and their links.
 """
 
 import os
@@ -24,11 +29,15 @@ os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'family_films.settings')
 django.setup()
 
 from main.models import Film, Person, Location, Tag, Chapter, FilmPeople, FilmLocations, ChapterPeople, ChapterLocations
+from main.importing.pipeline import parse_youtube_description
+from main.importing.state import FILE_KEY, ImportStateTracker, content_hash
 from django.db import transaction
 
 class BatchDImporter:
-    def __init__(self, dry_run=False):
+    def __init__(self, dry_run=False, force=False):
         self.dry_run = dry_run
+        self.state = ImportStateTracker('batch_d', force=force)
+        self.source_unchanged = False
         self.youtube_playlist_url = 'https://www.youtube.com/playlist?list=PLK3iapm6jnkkDIa9IzKV7eP17HS4vdlCm'
         self.added_videos_log = []
         self.stats = {
@@ -133,77 +142,7 @@ class BatchDImporter:
 
     def parse_youtube_description(self, description):
         """Parse YouTube video description to extract structured metadata"""
-        metadata = {
-            'description': '',
-            'chapters': [],
-            'people': [],
-            'years': [],
-            'locations': [],
-            'technical_notes': '',
-            'file_id': ''
-        }
-        
-        lines = description.split('\n')
-        current_section = 'description'
-        
-        for line in lines:
-            line = line.strip()
-            if not line:
-                continue
-                
-            # Check for section headers
-            if line.lower().startswith('chapters:'):
-                current_section = 'chapters'
-                continue
-            elif line.lower().startswith('people:'):
-                current_section = 'people'
-                continue
-            elif line.lower().startswith('years:'):
-                current_section = 'years'
-                continue
-            elif line.lower().startswith('locations:'):
-                current_section = 'locations'
-                continue
-            elif line.lower().startswith('technical notes:'):
-                current_section = 'technical_notes'
-                continue
-            elif line.startswith('File ID:'):
-                metadata['file_id'] = line.replace('File ID:', '').strip()
-                continue
-            
-            # Process content based on current section
-            if current_section == 'description':
-                if not any(line.lower().startswith(header) for header in ['chapters:', 'people:', 'years:', 'locations:', 'technical notes:']):
-                    metadata['description'] += line + ' '
-            elif current_section == 'chapters':
-                # Parse chapter format: MM:SS Title
-                match = re.match(r'^(\d{1,2}:\d{2})\s+(.+)$', line)
-                if match:
-                    timestamp, title = match.groups()
-                    metadata['chapters'].append({
-                        'start_time': timestamp,
-                        'title': title.strip()
-                    })
-            elif current_section == 'people':
-                # Parse comma-separated people
-                people = [p.strip() for p in line.split(',') if p.strip()]
-                metadata['people'].extend(people)
-            elif current_section == 'years':
-                # Parse comma-separated years
-                years = [y.strip() for y in line.split(',') if y.strip()]
-                metadata['years'].extend(years)
-            elif current_section == 'locations':
-                # Parse comma-separated locations
-                locations = [l.strip() for l in line.split(',') if l.strip()]
-                metadata['locations'].extend(locations)
-            elif current_section == 'technical_notes':
-                metadata['technical_notes'] += line + ' '
-        
-        # Clean up accumulated text
-        metadata['description'] = metadata['description'].strip()
-        metadata['technical_notes'] = metadata['technical_notes'].strip()
-        
-        return metadata
+        return parse_youtube_description(description)
 
     def get_or_create_person(self, name):
         """Get or create a person by name"""
@@ -337,6 +276,15 @@ class BatchDImporter:
         if self.dry_run:
             print("🏃 DRY RUN MODE - No database changes will be made\n")
         
+        # Skip the whole CSV, and within it every row, that is unchanged since the last run
+        source = os.path.abspath(csv_file)
+        if os.path.exists(csv_file):
+            file_changed, file_digest = self.state.file_changed(source, csv_file)
+            if not file_changed:
+                print("✅ CSV file unchanged since the last import; use --force to re-import")
+                self.source_unchanged = True
+                return True
+        
         try:
             with open(csv_file, 'r', encoding='utf-8') as f:
                 reader = csv.DictReader(f)
@@ -350,6 +298,11 @@ class BatchDImporter:
                     if not filename:
                         continue
                     
+                    row_digest = content_hash(row)
+                    if not self.state.changed(source, filename, row_digest):
+                        print(f"\n⏭️ {filename} unchanged since the last import, skipping")
+                        continue
+                    
                     self.stats['processed'] += 1
                     print(f"\n[{self.stats['processed']}/35] Processing: {filename}")
                     
@@ -358,6 +311,7 @@ class BatchDImporter:
                         if Film.objects.filter(file_id=filename).exists():
                             print(f"    ⚠️ Film {filename} already exists, skipping")
                             self.log_video_status(filename, '', f"http://localhost:8000/films/{filename}/", 'FOUND')
+                            self.state.mark(source, filename, row_digest)
                             continue
                         
                         # Get YouTube video information
@@ -372,6 +326,8 @@ class BatchDImporter:
                             
                             # Create the film (either real or placeholder)
                             film = self.create_film_from_csv_and_youtube(row, youtube_info)
+                            if film:
+                                self.state.mark(source, filename, row_digest)
                         else:
                             print(f"    ❌ No YouTube video found for {filename}")
                             self.log_video_status(filename, status='ERROR')
@@ -389,6 +345,10 @@ class BatchDImporter:
             print(f"❌ Error reading CSV file: {str(e)}")
             return False
         
+        if not self.dry_run:
+            if not self.stats['errors']:
+                self.state.mark(source, FILE_KEY, file_digest)
+            self.state.save()
         return True
 
     def write_log_file(self):
@@ -419,6 +379,7 @@ class BatchDImporter:
         print(f"People created: {self.stats['created_people']}")
         print(f"Locations created: {self.stats['created_locations']}")
         print(f"Errors: {self.stats['errors']}")
+        print(self.state.summary())
         
         if self.dry_run:
             print("\n⚠️  DRY RUN - No actual changes were made to the database")
@@ -430,13 +391,17 @@ def main():
                        help='Path to the family_movies_batchd.csv file')
     parser.add_argument('--dry-run', action='store_true',
                        help='Show what would be done without making changes')
+    parser.add_argument('--force', action='store_true',
+                       help='Re-import every row, even if unchanged since the last import')
     
     args = parser.parse_args()
     
-    importer = BatchDImporter(dry_run=args.dry_run)
+    importer = BatchDImporter(dry_run=args.dry_run, force=args.force)
     
     if importer.process_batch_d_films(args.csv_file):
-        importer.write_log_file()
+        # Keep the previous QA log when nothing was re-read
+        if not importer.source_unchanged:
+            importer.write_log_file()
         importer.print_summary()
     else:
         print("❌ Import failed")
@@ -4,16 +4,18 @@ Batch D Thumbnail Downloader
 
 This script finds the real YouTube videos for Batch D films by matching File IDs 
 in video descriptions, downloads thumbnails, and updates film records.
+
+With YOUTUBE_API_KEY set, the descriptions come from the YouTube Data API,
+50 videos to a request; without it, yt-dlp fetches them one video at a time.
 """
 
 import os
 import sys
 import django
-import subprocess
 import json
+import re
 import requests
-from urllib.parse import urlparse
-import time
+import subprocess
 
 # Setup Django
 sys.path.append('/home/viblio/family_films')
@@ -21,9 +23,14 @@ os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'family_films.settings')
 django.setup()
 
 from main.models import Film
+from main.youtube_api import YouTubeAPIError, YouTubeClient
 
 class BatchDThumbnailDownloader:
-    def __init__(self):
+    def __init__(self, client=None):
+        self.client = client
+        # One pooled session for the thumbnail downloads
+        self.session = client.session if client else requests.Session()
+        self.videos_by_file_id = None
         self.youtube_playlist_url = 'https://www.youtube.com/playlist?list=PLK3iapm6jnkkDIa9IzKV7eP17HS4vdlCm'
         self.thumbnails_dir = '/home/viblio/family_films/static/thumbnails'
         self.stats = {
@@ -33,6 +40,22 @@ class BatchDThumbnailDownloader:
             'errors': 0
         }
         
+    def fetch_descriptions(self, video_ids):
+        """{id, title, description} of each video, from the API if there is a client, else yt-dlp"""
+        if self.client:
+            return [
+                {'id': item['id'], 'title': item['snippet'].get('title', ''),
+                 'description': item['snippet'].get('description', '')}
+                for item in self.client.videos(video_ids, part='snippet')
+            ]
+        videos = []
+        for video_id in video_ids:
+            video_details = self.fetch_youtube_video_with_description(video_id)
+            if video_details:
+                videos.append({'id': video_id, 'title': video_details.get('title', ''),
+                               'description': video_details.get('description', '')})
+        return videos
+
     def fetch_youtube_video_with_description(self, video_id):
         """Fetch individual video details including description using yt-dlp"""
         try:
@@ -58,53 +81,55 @@ class BatchDThumbnailDownloader:
             print(f"      ❌ Error fetching video {video_id}: {e}")
             return None
 
-    def find_youtube_video_by_file_id(self, file_id):
-        """Find YouTube video by searching for File ID in descriptions"""
-        print(f"    🔍 Searching for YouTube video with File ID: {file_id}")
-        
-        # Load existing video list as starting point
+    def index_youtube_videos(self):
+        """{File ID: {id, title, description}} for the known videos"""
         youtube_json_file = '/home/viblio/family_films/scripts/youtube_videos.json'
+        videos_by_file_id = {}
         
         try:
             if os.path.exists(youtube_json_file):
                 with open(youtube_json_file, 'r') as f:
                     videos = json.load(f)
+                video_ids = [video['video_id'] for video in videos if video.get('video_id')]
+                print(f"📄 Fetching descriptions of {len(video_ids)} videos...")
+                for video in self.fetch_descriptions(video_ids):
+                    for file_id in re.findall(r'File ID:\s*(\S+)', video['description']):
+                        # "File ID: ABC." ends a sentence; the ID itself never ends in punctuation
+                        videos_by_file_id.setdefault(file_id.rstrip('.,;:!?)]}"\''), video)
                     
-                # Search through videos and get their descriptions
-                for video in videos:
-                    video_id = video.get('video_id')
-                    if not video_id:
-                        continue
-                        
-                    print(f"      📄 Checking video: {video.get('title', 'Unknown')}")
-                    video_details = self.fetch_youtube_video_with_description(video_id)
-                    
-                    if video_details:
-                        description = video_details.get('description', '')
-                        if f"File ID: {file_id}" in description:
-                            print(f"      ✅ Found matching video: {video_details.get('title', 'Unknown')}")
-                            return {
-                                'youtube_id': video_id,
-                                'youtube_url': f"https://www.youtube.com/watch?v={video_id}",
-                                'title': video_details.get('title', ''),
-                                'thumbnail_url': f"https://img.youtube.com/vi/{video_id}/maxresdefault.jpg",
-                                'thumbnail_hq_url': f"https://img.youtube.com/vi/{video_id}/hqdefault.jpg",
-                                'thumbnail_med_url': f"https://img.youtube.com/vi/{video_id}/mqdefault.jpg"
-                            }
-                    
-                    # Add small delay to be nice to YouTube
-                    time.sleep(1)
-                    
-        except Exception as e:
+        except (OSError, ValueError, YouTubeAPIError) as e:
             print(f"    ❌ Error searching videos: {e}")
         
+        return videos_by_file_id
+
+    def find_youtube_video_by_file_id(self, file_id):
+        """Find YouTube video by searching for File ID in descriptions"""
+        print(f"    🔍 Searching for YouTube video with File ID: {file_id}")
+        
+        # Every description is fetched once, on the first search
+        if self.videos_by_file_id is None:
+            self.videos_by_file_id = self.index_youtube_videos()
+        
+        video = self.videos_by_file_id.get(file_id)
+        if video:
+            video_id = video['id']
+            print(f"      ✅ Found matching video: {video['title'] or 'Unknown'}")
+            return {
+                'youtube_id': video_id,
+                'youtube_url': f"https://www.youtube.com/watch?v={video_id}",
+                'title': video['title'],
+                'thumbnail_url': f"https://img.youtube.com/vi/{video_id}/maxresdefault.jpg",
+                'thumbnail_hq_url': f"https://img.youtube.com/vi/{video_id}/hqdefault.jpg",
+                'thumbnail_med_url': f"https://img.youtube.com/vi/{video_id}/mqdefault.jpg"
+            }
+        
         print(f"    ⚠️ No YouTube video found with File ID: {file_id}")
         return None
 
     def download_thumbnail(self, url, file_path):
         """Download thumbnail image from URL"""
         try:
-            response = requests.get(url, timeout=30)
+            response = self.session.get(url, timeout=30)
             response.raise_for_status()
             
             # Create directory if it doesn't exist
@@ -115,7 +140,7 @@ class BatchDThumbnailDownloader:
             
             return True
             
-        except Exception as e:
+        except (requests.RequestException, OSError) as e:
             print(f"        ❌ Error downloading {url}: {e}")
             return False
 
@@ -188,9 +213,18 @@ class BatchDThumbnailDownloader:
         print(f"Errors: {self.stats['errors']}")
 
 def main():
-    downloader = BatchDThumbnailDownloader()
-    downloader.process_batch_d_films()
-    downloader.print_summary()
+    api_key = os.environ.get('YOUTUBE_API_KEY')
+    if not api_key:
+        print("ℹ️ YOUTUBE_API_KEY not set, fetching descriptions with yt-dlp")
+        downloader = BatchDThumbnailDownloader()
+        downloader.process_batch_d_films()
+        downloader.print_summary()
+        return 0
+    with YouTubeClient(api_key) as client:
+        downloader = BatchDThumbnailDownloader(client)
+        downloader.process_batch_d_films()
+        downloader.print_summary()
+        print(client.summary())
     return 0
 
 if __name__ == "__main__":
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+Benchmark the streaming chapter sheet reader against the pandas path
+
+Compares import cost, read time and peak traced memory of
+pd.read_excel(header=None) + df.iloc row access with
+main.importing.sheet_reader.ChapterSheet on the chapter sheet corpus,
+and checks both readers see the same cell values.
+
+Usage: python scripts/benchmark_sheet_reader.py [--sheet-dir DIR] [--limit N]
+"""
+
+import argparse
+import math
+import subprocess
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.append(str(ROOT))
+
+from main.importing.sheet_reader import ChapterSheet, HEADER_SEARCH_ROWS
+
+DEFAULT_SHEET_DIR = '/home/viblio/family_films/chapter_sheets'
+
+
+def import_seconds(statement, repeat=3):
+    """Best wall time of a fresh interpreter running one import statement"""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, '-c', statement], check=True)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def read_with_pandas(path):
+    import pandas as pd
+    df = pd.read_excel(path, header=None)
+    header_row = next(
+        (idx for idx in range(HEADER_SEARCH_ROWS.start, min(HEADER_SEARCH_ROWS.stop, len(df)))
+         if 'start' in ' '.join(str(c).lower() for c in df.iloc[idx] if pd.notna(c))
+         and 'title' in ' '.join(str(c).lower() for c in df.iloc[idx] if pd.notna(c))),
+        None
+    )
+    if header_row is None:
+        return []
+    return [
+        [None if (isinstance(value, float) and math.isnan(value)) else value for value in df.iloc[idx]]
+        for idx in range(header_row + 1, len(df))
+    ]
+
+
+def read_with_reader(path):
+    with ChapterSheet(path) as sheet:
+        return [row for _, row in sheet.rows()]
+
+
+def measure(reader, path):
+    tracemalloc.start()
+    start = time.perf_counter()
+    rows = reader(path)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return rows, elapsed, peak
+
+
+def same_rows(pandas_rows, reader_rows):
+    """pandas pads every row to the widest one; compare the cells both have"""
+    def trimmed(row):
+        row = list(row)
+        while row and row[-1] is None:
+            row.pop()
+        return row
+
+    pandas_rows = [trimmed(row) for row in pandas_rows]
+    reader_rows = [trimmed(row) for row in reader_rows]
+    # pandas drops trailing empty rows
+    while reader_rows and not reader_rows[-1]:
+        reader_rows.pop()
+    while pandas_rows and not pandas_rows[-1]:
+        pandas_rows.pop()
+    return pandas_rows == reader_rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the streaming sheet reader against pandas')
+    parser.add_argument('--sheet-dir', default=DEFAULT_SHEET_DIR, help='Directory of chapter sheets')
+    parser.add_argument('--limit', type=int, help='Only read the first N sheets')
+    args = parser.parse_args()
+
+    sheets = sorted(p for p in Path(args.sheet_dir).glob('*.xls*') if not p.name.startswith('~$'))
+    if args.limit:
+        sheets = sheets[:args.limit]
+    if not sheets:
+        print(f"❌ No .xls/.xlsx sheets found in {args.sheet_dir}")
+        return 1
+
+    print("=== IMPORT COST (fresh interpreter, best of 3) ===")
+    pandas_import = import_seconds('import pandas')
+    reader_import = import_seconds('import openpyxl, xlrd')
+    print(f"pandas:         {pandas_import * 1000:8.1f} ms")
+    print(f"openpyxl+xlrd:  {reader_import * 1000:8.1f} ms")
+
+    # Warm both paths so one-off imports are not charged to the first sheet
+    read_with_pandas(sheets[0])
+    read_with_reader(sheets[0])
+
+    print(f"\n=== READING {len(sheets)} SHEETS ===")
+    totals = {'pandas': [0.0, 0], 'reader': [0.0, 0]}
+    mismatches = []
+    for path in sheets:
+        pandas_rows, pandas_time, pandas_peak = measure(read_with_pandas, path)
+        reader_rows, reader_time, reader_peak = measure(read_with_reader, path)
+        totals['pandas'][0] += pandas_time
+        totals['pandas'][1] = max(totals['pandas'][1], pandas_peak)
+        totals['reader'][0] += reader_time
+        totals['reader'][1] = max(totals['reader'][1], reader_peak)
+        if not same_rows(pandas_rows, reader_rows):
+            mismatches.append(path.name)
+        print(f"{path.name[:50]:50} pandas {pandas_time * 1000:7.1f} ms {pandas_peak / 1024:8.0f} KiB   "
+              f"reader {reader_time * 1000:7.1f} ms {reader_peak / 1024:8.0f} KiB")
+
+    print("\n=== SUMMARY ===")
+    for name, (seconds, peak) in totals.items():
+        print(f"{name:7} total {seconds:7.2f} s   {len(sheets) / seconds:6.1f} sheets/s   peak {peak / 1024:8.0f} KiB")
+    if mismatches:
+        print(f"⚠️  {len(mismatches)} sheet(s) read differently: {', '.join(mismatches)}")
+    else:
+        print("✅ Both readers returned the same cells for every sheet")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
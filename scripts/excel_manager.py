@@ -3,28 +3,35 @@
 Production-ready XLS Image Extractor
 
 This script extracts embedded images from Excel 97-2003 (.xls) files
-by parsing the binary content and locating JPEG image data.
+by reading the Office Drawing picture store and the cell each picture
+is anchored to (see main/importing/xls_images.py).
 
 Usage:
     python xls_image_extractor.py input.xls [output_directory]
+    python xls_image_extractor.py chapter_sheets/ --batch --store thumbnail_store/
 """
 
 import os
 import sys
 import argparse
 from pathlib import Path
-from typing import List, Tuple
+from typing import List
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+from main.importing.image_store import EXTENSIONS as IMAGE_EXTENSIONS, ImageStore, store_xls_images, validate_image
+from main.importing.xls_images import iter_images
 
 def extract_images_from_xls(xls_file: str, output_dir: str = None) -> List[str]:
     """
-    Extract embedded JPEG images from an XLS file.
+    Extract embedded images from an XLS file.
     
     Args:
         xls_file: Path to the XLS file
         output_dir: Directory to save extracted images (defaults to same directory as XLS file)
     
     Returns:
-        List of paths to successfully extracted image files
+        List of paths to extracted image files, ordered by anchor cell
     """
     if not os.path.exists(xls_file):
         raise FileNotFoundError(f"XLS file not found: {xls_file}")
@@ -41,75 +48,29 @@ def extract_images_from_xls(xls_file: str, output_dir: str = None) -> List[str]:
     extracted_files = []
     
     try:
-        with open(xls_file, 'rb') as f:
-            content = f.read()
-        
-        # JPEG signature markers
-        jpeg_start = b'\xff\xd8\xff'
-        jpeg_end = b'\xff\xd9'
+        print(f"Analyzing {xls_file} ({os.path.getsize(xls_file):,} bytes)...")
         
+        # Pictures come from the drawing records, in the order of the cells they are anchored to
+        images = sorted(iter_images(xls_file), key=lambda image: (image.row, image.column))
         image_count = 0
-        start_pos = 0
-        
-        print(f"Analyzing {xls_file} ({len(content):,} bytes)...")
-        
-        while True:
-            # Find next JPEG start marker
-            start_pos = content.find(jpeg_start, start_pos)
-            if start_pos == -1:
-                break
-            
-            # Find corresponding end marker
-            end_pos = content.find(jpeg_end, start_pos)
-            if end_pos == -1:
-                # If no end marker found, try to estimate based on next start
-                next_start = content.find(jpeg_start, start_pos + 1)
-                if next_start != -1:
-                    end_pos = next_start - 1
-                else:
-                    # Use rest of file
-                    end_pos = len(content)
-            else:
-                end_pos += 2  # Include the end marker bytes
-            
-            # Extract potential JPEG data
-            jpeg_data = content[start_pos:end_pos]
-            
-            # Validate image size (reject very small fragments)
-            if len(jpeg_data) < 1024:  # Less than 1KB, probably not a real image
-                start_pos = end_pos
+        for image in images:
+            # Validated from memory, so bad pictures are never written
+            try:
+                validate_image(image.data)
+            except ValueError as e:
+                print(f"  ✗ Invalid image data at row {image.row + 1}, column {image.column + 1}: {e}")
                 continue
-            
-            # Create output filename
-            output_path = os.path.join(output_dir, f"{base_name}_image_{image_count:03d}.jpg")
-            
-            # Write potential image data
+            extension = IMAGE_EXTENSIONS.get(image.kind, image.kind)
+            output_path = os.path.join(output_dir, f"{base_name}_image_{image_count:03d}.{extension}")
             with open(output_path, 'wb') as img_file:
-                img_file.write(jpeg_data)
-            
-            # Validate with PIL if available
-            try:
-                from PIL import Image
-                with Image.open(output_path) as img:
-                    width, height = img.size
-                    print(f"  ✓ Extracted image {image_count}: {width}x{height} pixels ({len(jpeg_data):,} bytes)")
-                    print(f"    Saved to: {output_path}")
-                    extracted_files.append(output_path)
-                    image_count += 1
-            except ImportError:
-                # PIL not available, assume it's valid
-                print(f"  ? Extracted potential image {image_count} ({len(jpeg_data):,} bytes)")
-                print(f"    Saved to: {output_path} (validation skipped - PIL not available)")
-                extracted_files.append(output_path)
-                image_count += 1
-            except Exception as e:
-                # Invalid image data, remove the file
-                print(f"  ✗ Invalid image data at position {start_pos}: {e}")
-                os.remove(output_path)
-            
-            start_pos = end_pos
-        
-        print(f"\nExtraction complete: {len(extracted_files)} valid images extracted")
+                img_file.write(image.data)
+            print(f"  ✓ Extracted image {image_count}: {image.kind} at row {image.row + 1}, "
+                  f"column {image.column + 1} ({len(image.data):,} bytes)")
+            print(f"    Saved to: {output_path}")
+            extracted_files.append(output_path)
+            image_count += 1
+        
+        print(f"\nExtraction complete: {len(extracted_files)} images extracted")
         return extracted_files
         
     except Exception as e:
@@ -143,11 +104,49 @@ def batch_extract_images(xls_files: List[str], output_dir: str = None) -> dict:
     
     return results
 
+def extract_images_to_store(xls_files: List[str], store_dir: str, force: bool = False) -> dict:
+    """
+    Extract images from XLS files into a content-addressed store.
+    
+    Each distinct image is written once as <hash[:2]>/<hash>.<ext> under
+    store_dir; manifest.json maps every sheet's rows and columns to hashes.
+    Sheets that have not changed since the last run are skipped.
+    
+    Returns:
+        Dictionary mapping XLS file paths to their manifest entries
+    """
+    store = ImageStore(store_dir)
+    results = {}
+    skipped = 0
+    
+    for xls_file in xls_files:
+        try:
+            images, unchanged, rejected = store_xls_images(xls_file, store, force)
+        except Exception as e:
+            print(f"Error processing {xls_file}: {e}")
+            results[xls_file] = []
+            continue
+        results[xls_file] = images
+        if unchanged:
+            skipped += 1
+            print(f"  ⏭️  {os.path.basename(xls_file)}: unchanged, {len(images)} images already stored")
+            continue
+        print(f"  ✓ {os.path.basename(xls_file)}: {len(images)} images")
+        for row, column, reason in rejected:
+            print(f"    ✗ Invalid image data at row {row}, column {column}: {reason}")
+    
+    store.save()
+    print(f"\nStore {store_dir}: {store.written} images written, {store.reused} already stored, "
+          f"{skipped} unchanged sheets skipped")
+    return results
+
 def main():
     parser = argparse.ArgumentParser(description='Extract images from Excel 97-2003 (.xls) files')
     parser.add_argument('input', help='XLS file or directory containing XLS files')
     parser.add_argument('-o', '--output', help='Output directory for extracted images')
     parser.add_argument('--batch', action='store_true', help='Process all XLS files in directory')
+    parser.add_argument('--store', help='Write images once each into this content-addressed store, with a manifest')
+    parser.add_argument('--force', action='store_true', help='With --store, extract sheets even if they are unchanged')
     
     args = parser.parse_args()
     
@@ -157,6 +156,10 @@ def main():
             print("Error: Input file must be an XLS file")
             return 1
         
+        if args.store:
+            extract_images_to_store([args.input], args.store, args.force)
+            return 0
+        
         extracted = extract_images_from_xls(args.input, args.output)
         
         if extracted:
@@ -183,6 +186,10 @@ def main():
         
         print(f"Found {len(xls_files)} XLS files to process")
         
+        if args.store:
+            extract_images_to_store([str(f) for f in sorted(xls_files)], args.store, args.force)
+            return 0
+        
         results = batch_extract_images([str(f) for f in xls_files], args.output)
         
         # Summary
@@ -4,6 +4,11 @@ Extract Valid Thumbnails for Batch D Films Using import_chapter_metadata.py Tech
 
 Uses the same extraction method as the original import_chapter_metadata.py management command
 to extract valid thumbnails from Batch D chapter sheets.
+
+Replaced by the thumbnails stage of
+`python manage.py ingest_films <csv> --batch "Batch D"`, which extracts each
+row's picture with the same parser as import_chapter_metadata and copies it
+to --save-thumbnails when the chapter is written.
 """
 
 import os
@@ -1,46 +1,60 @@
 #!/usr/bin/env python3
+"""
+Fill in missing film durations from YouTube.
+
+With YOUTUBE_API_KEY set, durations come from the YouTube Data API, 50
+videos to a request; without it, they are read from each watch page.
+"""
 
 import django
 import os
-import sys
-import requests
 import re
+import sys
 from datetime import timedelta
 
+import requests
+
 # Set up Django environment
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'family_films.settings')
 sys.path.append('/home/viblio/family_films')
 django.setup()
 
 from main.models import Film
+from main.youtube_api import YouTubeAPIError, YouTubeClient, parse_duration
 
-def get_youtube_duration(video_id):
-    """Get video duration from YouTube using the same method as fix_p61_duration.py"""
+def get_youtube_durations(client, video_ids):
+    """{video ID: duration} from the YouTube Data API, 50 videos to a request"""
     try:
-        url = f"https://www.youtube.com/watch?v={video_id}"
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-        }
-        
-        response = requests.get(url, headers=headers, timeout=10)
-        response.raise_for_status()
-        
-        # Look for duration in the page content
-        duration_pattern = r'"lengthSeconds":"(\d+)"'
-        match = re.search(duration_pattern, response.text)
-        
+        items = client.videos(video_ids, part='contentDetails')
+    except YouTubeAPIError as e:
+        print(f"  ❌ Error fetching durations: {e}")
+        return {}
+    durations = {}
+    for item in items:
+        duration = parse_duration(item['contentDetails'].get('duration'))
+        if duration:
+            durations[item['id']] = duration
+    return durations
+
+def get_watch_page_durations(session, video_ids):
+    """{video ID: duration} read from lengthSeconds on each watch page, no key needed"""
+    headers = {
+        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+    }
+    durations = {}
+    for video_id in video_ids:
+        try:
+            response = session.get(f"https://www.youtube.com/watch?v={video_id}", headers=headers, timeout=10)
+            response.raise_for_status()
+        except requests.RequestException as e:
+            print(f"  ❌ Error fetching duration for {video_id}: {e}")
+            continue
+        match = re.search(r'"lengthSeconds":"(\d+)"', response.text)
         if match:
-            seconds = int(match.group(1))
-            duration = timedelta(seconds=seconds)
-            print(f"  ✅ Found duration: {duration} ({seconds}s)")
-            return duration
+            durations[video_id] = timedelta(seconds=int(match.group(1)))
         else:
-            print(f"  ❌ Could not find duration pattern")
-            return None
-            
-    except Exception as e:
-        print(f"  ❌ Error fetching duration: {e}")
-        return None
+            print(f"  ❌ Could not find duration pattern for {video_id}")
+    return durations
 
 def fix_all_durations():
     """Fix missing durations for all films"""
@@ -69,6 +83,19 @@ def fix_all_durations():
     
     print(f"\n🔧 Processing {len(films_needing_fix)} films...\n")
     
+    video_ids = [film.youtube_id for film in films_needing_fix if film.youtube_id]
+    api_key = os.environ.get('YOUTUBE_API_KEY')
+    if api_key:
+        # One videos.list request covers 50 films
+        with YouTubeClient(api_key) as client:
+            durations = get_youtube_durations(client, video_ids)
+        lookup_summary = client.summary()
+    else:
+        print("No YOUTUBE_API_KEY set, reading durations from the watch pages\n")
+        with requests.Session() as session:
+            durations = get_watch_page_durations(session, video_ids)
+        lookup_summary = f"{len(video_ids)} watch pages fetched"
+    
     fixed_count = 0
     failed_count = 0
     
@@ -80,8 +107,7 @@ def fix_all_durations():
             failed_count += 1
             continue
         
-        # Get duration from YouTube
-        duration = get_youtube_duration(film.youtube_id)
+        duration = durations.get(film.youtube_id)
         
         if duration:
             # Update the film
@@ -99,6 +125,7 @@ def fix_all_durations():
     print(f"✅ Fixed: {fixed_count} films")
     print(f"❌ Failed: {failed_count} films")
     print(f"📊 Total processed: {len(films_needing_fix)} films")
+    print(f"📡 {lookup_summary}")
     
     return fixed_count > 0
 
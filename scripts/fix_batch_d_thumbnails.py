@@ -4,6 +4,11 @@ Fix Batch D Thumbnail Extraction
 
 Correctly extract Start column thumbnails by analyzing each XLS file
 to determine if it has Start+End images (2 per row) or just Start images (1 per row).
+
+No longer needed: the thumbnails stage of
+`python manage.py ingest_films <csv> --batch "Batch D"` only takes the picture
+anchored in each row's Start cell, so sheets with End pictures too come out
+right the first time.
 """
 
 import os
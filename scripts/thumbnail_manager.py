@@ -18,14 +18,21 @@ import shutil
 import requests
 import json
 import re
-from PIL import Image, ImageDraw, ImageFont
+from contextlib import nullcontext
+from PIL import Image, ImageDraw, ImageEnhance, ImageFont
 
 # Set up Django environment
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'family_films.settings')
 sys.path.append('/home/viblio/family_films')
 django.setup()
 
+from django.conf import settings
+from django.core.management import call_command
 from main.models import Film, Chapter
+from main.image_fetch import FETCH_WORKERS, YOUTUBE_SOURCES, ImageFetchCache, youtube_thumbnail_urls
+from main.derivatives import relative_to_root, static_file
+from main.sprites import sheet_columns, sheet_rows
+from main.thumbnail_manifest import ThumbnailManifest
 
 def create_placeholder_sprite_for_film(film):
     """Create placeholder sprite with chapter information for a single film"""
@@ -126,7 +133,12 @@ def create_placeholder_sprite_for_film(film):
     
     return sprite_image, frame_width, frame_height, chapters.count()
 
-def create_youtube_sprite_for_film(film):
+def enhance_frame(img):
+    """Enhance brightness/contrast slightly to reduce ABAC patterns"""
+    img = ImageEnhance.Brightness(img).enhance(1.1)
+    return ImageEnhance.Contrast(img).enhance(1.1)
+
+def create_youtube_sprite_for_film(film, fetcher=None):
     """Create sprite using real YouTube thumbnails for a single film"""
     
     chapters = film.chapters.all().order_by('order')
@@ -147,44 +159,20 @@ def create_youtube_sprite_for_film(film):
     
     sprite_image = Image.new('RGB', (sprite_width, sprite_height), (0, 0, 0))
     
-    # YouTube thumbnail sources to try
-    youtube_sources = ['1.jpg', '2.jpg', '3.jpg', 'hqdefault.jpg', 'mqdefault.jpg', 'default.jpg']
+    # Every chapter uses the film's first available YouTube thumbnail, fetched and resized once
+    with ImageFetchCache() if fetcher is None else nullcontext(fetcher) as fetcher:
+        source_url, source_frame = fetcher.first_image(
+            youtube_thumbnail_urls(film.youtube_id), (frame_width, frame_height), enhance_frame
+        )
+    if source_url:
+        print(f"      ✓ Using thumbnail {source_url.rsplit('/', 1)[-1]}")
+    else:
+        print(f"      ⚠️ No YouTube thumbnail available, using placeholder frames")
     
     for i, chapter in enumerate(chapters):
-        frame_image = None
-        
-        # Try to download a YouTube thumbnail
-        for source in youtube_sources:
-            try:
-                thumbnail_url = f"https://img.youtube.com/vi/{film.youtube_id}/{source}"
-                response = requests.get(thumbnail_url, timeout=10)
-                
-                if response.status_code == 200:
-                    # Load the image
-                    from io import BytesIO
-                    img = Image.open(BytesIO(response.content))
-                    
-                    # Resize to frame size
-                    img = img.resize((frame_width, frame_height), Image.Resampling.LANCZOS)
-                    
-                    # Enhance brightness/contrast slightly to reduce ABAC patterns
-                    from PIL import ImageEnhance
-                    enhancer = ImageEnhance.Brightness(img)
-                    img = enhancer.enhance(1.1)
-                    enhancer = ImageEnhance.Contrast(img)
-                    img = enhancer.enhance(1.1)
-                    
-                    frame_image = img
-                    print(f"      ✓ Downloaded thumbnail from {source}")
-                    break
-                    
-            except Exception as e:
-                print(f"      ⚠️ Failed to download {source}: {e}")
-                continue
-        
-        # If no thumbnail downloaded, create placeholder
-        if frame_image is None:
-            print(f"      📝 Creating placeholder for chapter {i+1}")
+        if source_frame is not None:
+            frame_image = source_frame.copy()
+        else:
             frame_image = Image.new('RGB', (frame_width, frame_height), (65, 105, 225))
         
         # Add timestamp overlay
@@ -245,7 +233,7 @@ def save_sprite(film, sprite_image, frame_width, frame_height, frame_count, back
     
     return True
 
-def create_chapter_thumbnails_for_film(film, use_youtube=True):
+def create_chapter_thumbnails_for_film(film, use_youtube=True, fetcher=None):
     """Create individual chapter thumbnails for a film"""
     
     chapters = film.chapters.all().order_by('order')
@@ -263,22 +251,18 @@ def create_chapter_thumbnails_for_film(film, use_youtube=True):
     thumbnail_size = (80, 60)
     created_count = 0
     
+    # The film's hqdefault thumbnail is fetched and resized once for all its chapters
+    youtube_url = None
+    if use_youtube and not film.youtube_id.startswith('placeholder_'):
+        youtube_url = youtube_thumbnail_urls(film.youtube_id, sources=['hqdefault.jpg'])[0]
+    
+    with ImageFetchCache() if fetcher is None else nullcontext(fetcher) as fetcher:
+        youtube_image = fetcher.image(youtube_url, thumbnail_size) if youtube_url else None
+    if youtube_url and youtube_image is None:
+        print(f"      ⚠️ Failed to download YouTube thumbnail: {fetcher.missing.get(youtube_url)}")
+    
     for chapter in chapters:
-        chapter_image = None
-        
-        # Try to get YouTube thumbnail if enabled and available
-        if use_youtube and not film.youtube_id.startswith('placeholder_'):
-            try:
-                thumbnail_url = f"https://img.youtube.com/vi/{film.youtube_id}/hqdefault.jpg"
-                response = requests.get(thumbnail_url, timeout=10)
-                
-                if response.status_code == 200:
-                    from io import BytesIO
-                    chapter_image = Image.open(BytesIO(response.content))
-                    chapter_image = chapter_image.resize(thumbnail_size, Image.Resampling.LANCZOS)
-                    
-            except Exception as e:
-                print(f"      ⚠️ Failed to download YouTube thumbnail: {e}")
+        chapter_image = youtube_image.copy() if youtube_image is not None else None
         
         # Create placeholder if no YouTube thumbnail
         if chapter_image is None:
@@ -312,6 +296,23 @@ def create_chapter_thumbnails_for_film(film, use_youtube=True):
     print(f"      ✅ Created {created_count} chapter thumbnails")
     return created_count
 
+def thumbnail_manifest():
+    """Manifest of the files under the thumbnail root, refreshed by size and mtime"""
+    manifest = ThumbnailManifest(
+        settings.THUMBNAIL_ROOT, os.path.join(settings.BASE_DIR, 'cache', 'thumbnail_manifest.json'),
+        skip_dirs=[settings.THUMBNAIL_DERIVATIVES_DIR],
+    )
+    manifest.refresh()
+    manifest.save()
+    return manifest
+
+def expected_sprite_size(film):
+    """Size of a film's sprite sheet: a grid for WebP sheets, one row of frames for this script's JPEG strips"""
+    if film.has_sprite_sheet():
+        columns = sheet_columns(film.preview_frame_count)
+        return columns * film.preview_sprite_width, sheet_rows(film.preview_frame_count) * film.preview_sprite_height
+    return film.preview_frame_count * film.preview_sprite_width, film.preview_sprite_height
+
 def verify_thumbnails(film_ids=None):
     """Verify thumbnail existence and dimensions"""
     print("=== Verifying Thumbnails ===\n")
@@ -321,35 +322,34 @@ def verify_thumbnails(film_ids=None):
     else:
         films = Film.objects.filter(chapters__isnull=False).distinct()
     
-    total_films = films.count()
+    # One walk of the thumbnail directory instead of a stat and decode per film
+    files = thumbnail_manifest().files
+    static_dir = os.path.join(settings.BASE_DIR, 'static')
+    
+    total_films = 0
     verified_sprites = 0
     missing_sprites = 0
     dimension_mismatches = 0
     
-    for film in films:
-        sprite_path = f'/home/viblio/family_films/static/thumbnails/previews/{film.file_id}_sprite.jpg'
+    for film in films.order_by('file_id'):
+        total_films += 1
+        sprite_path = static_file(film.preview_sprite_url, settings.STATIC_URL, static_dir)
+        entry = files.get(relative_to_root(sprite_path, settings.THUMBNAIL_ROOT)) if sprite_path else None
         
-        if os.path.exists(sprite_path):
-            verified_sprites += 1
-            
-            # Check dimensions
-            try:
-                with Image.open(sprite_path) as img:
-                    actual_width, actual_height = img.size
-                    chapter_count = film.chapters.count()
-                    expected_width = film.preview_sprite_width * chapter_count if film.preview_sprite_width else 160 * chapter_count
-                    
-                    if actual_width != expected_width or actual_height != film.preview_sprite_height:
-                        print(f"  ❌ {film.file_id}: Dimension mismatch - actual: {actual_width}x{actual_height}, expected: {expected_width}x{film.preview_sprite_height}")
-                        dimension_mismatches += 1
-                    else:
-                        print(f"  ✅ {film.file_id}: OK ({actual_width}x{actual_height})")
-                        
-            except Exception as e:
-                print(f"  ⚠️ {film.file_id}: Error checking dimensions: {e}")
-        else:
+        if entry is None:
             missing_sprites += 1
             print(f"  ❌ {film.file_id}: Sprite missing")
+        elif 'error' in entry:
+            print(f"  ⚠️ {film.file_id}: Error checking dimensions: {entry['error']}")
+        else:
+            verified_sprites += 1
+            actual = (entry['width'], entry['height'])
+            expected = expected_sprite_size(film)
+            if actual != expected:
+                print(f"  ❌ {film.file_id}: Dimension mismatch - actual: {actual[0]}x{actual[1]}, expected: {expected[0]}x{expected[1]}")
+                dimension_mismatches += 1
+            else:
+                print(f"  ✅ {film.file_id}: OK ({actual[0]}x{actual[1]})")
     
     print(f"\n=== Verification Summary ===")
     print(f"Total films: {total_films}")
@@ -403,60 +403,42 @@ def analyze_thumbnail_coverage():
     """Analyze overall thumbnail coverage and issues"""
     print("=== Thumbnail Coverage Analysis ===\n")
     
-    total_films = Film.objects.count()
-    films_with_chapters = Film.objects.filter(chapters__isnull=False).distinct().count()
+    films_with_chapters = Film.objects.filter(chapters__isnull=False).distinct()
+    without_sprites = list(films_with_chapters.filter(preview_sprite_url='').values_list('file_id', flat=True))
     
-    # Check sprite coverage
-    previews_dir = '/home/viblio/family_films/static/thumbnails/previews'
-    sprite_files = []
-    if os.path.exists(previews_dir):
-        sprite_files = [f for f in os.listdir(previews_dir) if f.endswith('_sprite.jpg')]
+    print(f"Films in database: {Film.objects.count()}")
+    print(f"Films with chapters: {films_with_chapters.count()}")
     
-    # Check chapter thumbnail coverage
-    chapters_dir = '/home/viblio/family_films/static/thumbnails/chapters'
-    chapter_files = []
-    if os.path.exists(chapters_dir):
-        chapter_files = [f for f in os.listdir(chapters_dir) if f.endswith('.jpg')]
-    
-    print(f"Films in database: {total_films}")
-    print(f"Films with chapters: {films_with_chapters}")
-    print(f"Sprite files found: {len(sprite_files)}")
-    print(f"Chapter thumbnail files found: {len(chapter_files)}")
-    
-    # Coverage percentage
-    if films_with_chapters > 0:
-        sprite_coverage = (len(sprite_files) / films_with_chapters) * 100
-        print(f"\nSprite coverage: {sprite_coverage:.1f}%")
-    
-    # Find films missing sprites
-    films_missing_sprites = []
-    for film in Film.objects.filter(chapters__isnull=False).distinct():
-        sprite_path = os.path.join(previews_dir, f'{film.file_id}_sprite.jpg')
-        if not os.path.exists(sprite_path):
-            films_missing_sprites.append(film.file_id)
-    
-    if films_missing_sprites:
-        print(f"\nFilms missing sprites: {len(films_missing_sprites)}")
-        for file_id in films_missing_sprites[:10]:  # Show first 10
+    if without_sprites:
+        print(f"\nFilms with chapters but no sprite sheet: {len(without_sprites)}")
+        for file_id in without_sprites[:10]:  # Show first 10
             print(f"  - {file_id}")
-        if len(films_missing_sprites) > 10:
-            print(f"  ... and {len(films_missing_sprites) - 10} more")
-
-def main():
-    parser = argparse.ArgumentParser(description='Comprehensive thumbnail management tool')
-    parser.add_argument('command', choices=['create-sprites', 'create-chapters', 'verify', 
-                                           'analyze', 'storyboard', 'all'],
-                        help='Command to run')
-    parser.add_argument('--film-ids', nargs='+', help='Specific film IDs to process')
-    parser.add_argument('--use-youtube', action='store_true', default=True,
-                        help='Use real YouTube thumbnails when available')
-    parser.add_argument('--placeholder-only', action='store_true',
-                        help='Create placeholder sprites only (no YouTube downloads)')
-    parser.add_argument('--no-backup', action='store_true',
-                        help='Do not backup existing sprites')
-    
-    args = parser.parse_args()
+        if len(without_sprites) > 10:
+            print(f"  ... and {len(without_sprites) - 10} more")
     
+    # Missing, orphaned, oversized and unreadable files, from one walk of the thumbnail directory
+    print()
+    call_command('scan_thumbnails')
+
+def update_derivatives_for_changed_thumbnails():
+    """Resize new and changed thumbnails for srcset; unchanged ones are skipped"""
+    print("\n=== Updating Thumbnail Derivatives ===\n")
+    call_command('generate_thumbnail_derivatives')
+
+def update_placeholders_for_changed_thumbnails():
+    """Redraw the inline placeholders of new and changed thumbnails; unchanged ones are skipped"""
+    print("\n=== Updating Thumbnail Placeholders ===\n")
+    call_command('generate_thumbnail_placeholders')
+
+def prefetch_youtube_thumbnails(fetcher, films, sources):
+    """Fetch each film's YouTube thumbnail candidates concurrently before the films are drawn"""
+    url_lists = [youtube_thumbnail_urls(film.youtube_id, sources) for film in films
+                 if not film.youtube_id.startswith('placeholder_')]
+    if url_lists:
+        print(f"Fetching YouTube thumbnails for {len(url_lists)} films with {fetcher.workers} workers...\n")
+        fetcher.prefetch(url_lists)
+
+def run_command(args, fetcher):
     if args.command == 'create-sprites':
         print("=== Creating Sprite Sheets ===\n")
         
@@ -467,6 +449,8 @@ def main():
         
         use_youtube = args.use_youtube and not args.placeholder_only
         backup = not args.no_backup
+        if use_youtube:
+            prefetch_youtube_thumbnails(fetcher, films, YOUTUBE_SOURCES)
         
         success_count = 0
         for i, film in enumerate(films, 1):
@@ -474,7 +458,7 @@ def main():
             
             try:
                 if use_youtube:
-                    sprite_data = create_youtube_sprite_for_film(film)
+                    sprite_data = create_youtube_sprite_for_film(film, fetcher)
                 else:
                     sprite_data = create_placeholder_sprite_for_film(film)
                 
@@ -497,18 +481,22 @@ def main():
             films = Film.objects.filter(chapters__isnull=False).distinct()
         
         use_youtube = args.use_youtube and not args.placeholder_only
+        if use_youtube:
+            prefetch_youtube_thumbnails(fetcher, films, ['hqdefault.jpg'])
         
         total_thumbnails = 0
         for i, film in enumerate(films, 1):
             print(f"[{i}/{films.count()}] {film.file_id}: {film.title[:50]}...")
             
             try:
-                count = create_chapter_thumbnails_for_film(film, use_youtube)
+                count = create_chapter_thumbnails_for_film(film, use_youtube, fetcher)
                 total_thumbnails += count
             except Exception as e:
                 print(f"    ❌ Error: {e}")
         
         print(f"\n✅ Created {total_thumbnails} chapter thumbnails")
+        update_derivatives_for_changed_thumbnails()
+        update_placeholders_for_changed_thumbnails()
         
     elif args.command == 'verify':
         verify_thumbnails(args.film_ids)
@@ -538,13 +526,15 @@ def main():
         print("=== Creating Sprite Sheets ===\n")
         films = Film.objects.filter(chapters__isnull=False).distinct()
         use_youtube = args.use_youtube and not args.placeholder_only
+        if use_youtube:
+            prefetch_youtube_thumbnails(fetcher, films, YOUTUBE_SOURCES)
         
         for i, film in enumerate(films, 1):
             print(f"[{i}/{films.count()}] {film.file_id}: Creating sprite...")
             
             try:
                 if use_youtube:
-                    sprite_data = create_youtube_sprite_for_film(film)
+                    sprite_data = create_youtube_sprite_for_film(film, fetcher)
                 else:
                     sprite_data = create_placeholder_sprite_for_film(film)
                 
@@ -559,14 +549,18 @@ def main():
         
         # Create chapter thumbnails
         print("=== Creating Chapter Thumbnails ===\n")
+        if use_youtube:
+            prefetch_youtube_thumbnails(fetcher, films, ['hqdefault.jpg'])
         
         for i, film in enumerate(films, 1):
             print(f"[{i}/{films.count()}] {film.file_id}: Creating chapter thumbnails...")
             
             try:
-                create_chapter_thumbnails_for_film(film, use_youtube)
+                create_chapter_thumbnails_for_film(film, use_youtube, fetcher)
             except Exception as e:
                 print(f"    ❌ Error: {e}")
+        update_derivatives_for_changed_thumbnails()
+        update_placeholders_for_changed_thumbnails()
         
         print("\n" + "="*60 + "\n")
         
@@ -578,5 +572,29 @@ def main():
         # Analyze coverage
         analyze_thumbnail_coverage()
 
+def main():
+    parser = argparse.ArgumentParser(description='Comprehensive thumbnail management tool')
+    parser.add_argument('command', choices=['create-sprites', 'create-chapters', 'verify', 
+                                           'analyze', 'storyboard', 'all'],
+                        help='Command to run')
+    parser.add_argument('--film-ids', nargs='+', help='Specific film IDs to process')
+    parser.add_argument('--use-youtube', action='store_true', default=True,
+                        help='Use real YouTube thumbnails when available')
+    parser.add_argument('--placeholder-only', action='store_true',
+                        help='Create placeholder sprites only (no YouTube downloads)')
+    parser.add_argument('--no-backup', action='store_true',
+                        help='Do not backup existing sprites')
+    parser.add_argument('--fetch-workers', type=int, default=FETCH_WORKERS,
+                        help='Concurrent YouTube thumbnail downloads')
+    
+    args = parser.parse_args()
+    
+    # One fetch cache for the whole run, so each distinct image is downloaded and resized once
+    with ImageFetchCache(workers=args.fetch_workers) as fetcher:
+        run_command(args, fetcher)
+        if fetcher.requests:
+            print(f"\n📥 {fetcher.requests} HTTP requests, {fetcher.hits} cache hits, "
+                  f"{fetcher.decoded} images decoded")
+
 if __name__ == '__main__':
     main()
\ No newline at end of file
@@ -3,6 +3,11 @@
 Update Batch D Films
 
 Updates Batch D films with proper YouTube IDs and thumbnail URLs
+
+Replaced by the youtube stage of
+`python manage.py ingest_films <csv> --batch "Batch D"`: new films are created
+with their video's ID and thumbnail URL, and a rerun moves films still on a
+placeholder ID to the mapped video.
 """
 
 import os
@@ -3,11 +3,16 @@
 Update RLD-R01_FROS
 
 Updates the RLD-R01_FROS film with the correct YouTube ID and downloads its thumbnail.
+
+With YOUTUBE_API_KEY set, the video is looked up through the YouTube Data API;
+without it, yt-dlp is used.
 """
 
 import os
 import sys
 import django
+import json
+import requests
 import subprocess
 from pathlib import Path
 
@@ -17,9 +22,12 @@ os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'family_films.settings')
 django.setup()
 
 from main.models import Film
+from main.youtube_api import YouTubeAPIError, YouTubeClient
 
 class RLD_R01_Updater:
-    def __init__(self):
+    def __init__(self, client=None):
+        self.client = client
+        self.video = None
         self.file_id = "RLD-R01_FROS"
         self.youtube_id = "0Y3zJjOZcko"
         self.youtube_url = f"https://www.youtube.com/watch?v={self.youtube_id}"
@@ -34,43 +42,64 @@ class RLD_R01_Updater:
             
             print(f"📥 Downloading thumbnail for {self.youtube_id}...")
             
-            cmd = [
-                'yt-dlp',
-                '--write-thumbnail',
-                '--skip-download',
-                '--no-warnings',
-                '--quiet',
-                '-o', str(thumbnail_dir / f"{self.youtube_id}.%(ext)s"),
-                self.youtube_url
-            ]
-            
-            result = subprocess.run(cmd, capture_output=True, text=True, timeout=30)
-            
-            if result.returncode == 0:
-                # Find the downloaded thumbnail (it might have different extensions)
-                for ext in ['jpg', 'jpeg', 'png', 'webp']:
-                    downloaded_file = thumbnail_dir / f"{self.youtube_id}.{ext}"
-                    if downloaded_file.exists():
-                        # Rename to the desired filename
-                        if downloaded_file != output_path:
-                            if output_path.exists():
-                                output_path.unlink()  # Remove existing file
-                            downloaded_file.rename(output_path)
-                        
-                        print(f"    ✅ Downloaded: {output_path}")
-                        return True
-                
-                print(f"    ⚠️ Downloaded but couldn't find file for: {self.youtube_id}")
-                return False
-            else:
-                print(f"    ❌ Failed to download thumbnail")
-                print(f"       Error: {result.stderr}")
-                return False
+            if self.client:
+                return self.download_api_thumbnail(output_path)
+            return self.download_ytdlp_thumbnail(thumbnail_dir, output_path)
                 
-        except Exception as e:
+        except (requests.RequestException, subprocess.SubprocessError, OSError) as e:
             print(f"    ❌ Error downloading thumbnail: {e}")
             return False
 
+    def download_api_thumbnail(self, output_path):
+        """Largest thumbnail the API lists for the video, maxres first"""
+        thumbnails = (self.video or {}).get('snippet', {}).get('thumbnails', {})
+        for size in ['maxres', 'standard', 'high', 'medium', 'default']:
+            if size not in thumbnails:
+                continue
+            response = self.client.session.get(thumbnails[size]['url'], timeout=30)
+            if response.status_code == 200:
+                output_path.write_bytes(response.content)
+                print(f"    ✅ Downloaded: {output_path}")
+                return True
+        
+        print(f"    ❌ Failed to download thumbnail for: {self.youtube_id}")
+        return False
+
+    def download_ytdlp_thumbnail(self, thumbnail_dir, output_path):
+        """The thumbnail yt-dlp picks, renamed to output_path"""
+        cmd = [
+            'yt-dlp',
+            '--write-thumbnail',
+            '--skip-download',
+            '--no-warnings',
+            '--quiet',
+            '-o', str(thumbnail_dir / f"{self.youtube_id}.%(ext)s"),
+            self.youtube_url
+        ]
+        
+        result = subprocess.run(cmd, capture_output=True, text=True, timeout=30)
+        
+        if result.returncode == 0:
+            # Find the downloaded thumbnail (it might have different extensions)
+            for ext in ['jpg', 'jpeg', 'png', 'webp']:
+                downloaded_file = thumbnail_dir / f"{self.youtube_id}.{ext}"
+                if downloaded_file.exists():
+                    # Rename to the desired filename
+                    if downloaded_file != output_path:
+                        if output_path.exists():
+                            output_path.unlink()  # Remove existing file
+                        downloaded_file.rename(output_path)
+                    
+                    print(f"    ✅ Downloaded: {output_path}")
+                    return True
+            
+            print(f"    ⚠️ Downloaded but couldn't find file for: {self.youtube_id}")
+            return False
+        else:
+            print(f"    ❌ Failed to download thumbnail")
+            print(f"       Error: {result.stderr}")
+            return False
+
     def update_film_record(self):
         """Update the film record with correct YouTube info"""
         try:
@@ -110,46 +139,68 @@ class RLD_R01_Updater:
         try:
             print(f"📺 Getting video info for {self.youtube_id}...")
             
-            cmd = [
-                'yt-dlp',
-                '--dump-json',
-                '--skip-download',
-                '--no-warnings',
-                '--quiet',
-                self.youtube_url
-            ]
+            video = self.fetch_video()
+            if not video:
+                return False
+            title, description = video
             
-            result = subprocess.run(cmd, capture_output=True, text=True, timeout=30)
+            print(f"    🎬 Title: {title}")
+            print(f"    📝 Description length: {len(description)} chars")
             
-            if result.returncode == 0:
-                import json
-                video_data = json.loads(result.stdout)
-                title = video_data.get('title', 'Unknown')
-                description = video_data.get('description', '')
-                
-                print(f"    🎬 Title: {title}")
-                print(f"    📝 Description length: {len(description)} chars")
-                
-                # Check if File ID is in description
-                if f"File ID: {self.file_id}" in description:
-                    print(f"    ✅ Confirmed File ID {self.file_id} found in description")
-                else:
-                    print(f"    ⚠️ File ID {self.file_id} not found in description")
-                
-                return True
+            # Check if File ID is in description
+            if f"File ID: {self.file_id}" in description:
+                print(f"    ✅ Confirmed File ID {self.file_id} found in description")
             else:
-                print(f"    ❌ Failed to get video info: {result.stderr}")
-                return False
+                print(f"    ⚠️ File ID {self.file_id} not found in description")
+            
+            return True
                 
-        except Exception as e:
+        except (YouTubeAPIError, subprocess.SubprocessError, ValueError) as e:
             print(f"    ❌ Error getting video info: {e}")
             return False
 
+    def fetch_video(self):
+        """(title, description) from the API if there is a client, else yt-dlp; None if not found"""
+        if self.client:
+            videos = self.client.videos([self.youtube_id], part='snippet')
+            if not videos:
+                print(f"    ❌ Video not found: {self.youtube_id}")
+                return None
+            self.video = videos[0]
+            return self.video['snippet'].get('title', 'Unknown'), self.video['snippet'].get('description', '')
+        
+        cmd = [
+            'yt-dlp',
+            '--dump-json',
+            '--skip-download',
+            '--no-warnings',
+            '--quiet',
+            self.youtube_url
+        ]
+        
+        result = subprocess.run(cmd, capture_output=True, text=True, timeout=30)
+        
+        if result.returncode != 0:
+            print(f"    ❌ Failed to get video info: {result.stderr}")
+            return None
+        video_data = json.loads(result.stdout)
+        return video_data.get('title', 'Unknown'), video_data.get('description', '')
+
 def main():
     print("=== RLD-R01_FROS UPDATER ===\n")
     
-    updater = RLD_R01_Updater()
+    api_key = os.environ.get('YOUTUBE_API_KEY')
+    if not api_key:
+        print("ℹ️ YOUTUBE_API_KEY not set, using yt-dlp")
+        return update(RLD_R01_Updater())
     
+    with YouTubeClient(api_key) as client:
+        status = update(RLD_R01_Updater(client))
+        print(client.summary())
+    return status
+
+def update(updater):
+    """Verify the video, download its thumbnail and update the film; 0 on success"""
     print(f"Processing: {updater.file_id}")
     print(f"YouTube URL: {updater.youtube_url}")
     print()
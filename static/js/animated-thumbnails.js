@@ -1,25 +1,113 @@
 /**
  * Animated Thumbnails JavaScript
- * Handles Swiper-based hover animations for film thumbnails
+ * Handles sprite sheet and Swiper-based hover animations for film thumbnails
  */
 
+// Browsers that understand typed image-set() pick the WebP sheet, the rest get the JPEG
+const supportsImageSet = window.CSS && CSS.supports &&
+    CSS.supports('background-image', 'image-set(url("a.webp") type("image/webp"))');
+
+class SpriteSheetThumbnail {
+    constructor(element) {
+        this.element = element;
+        this.overlay = element.querySelector('.sprite-overlay');
+        // The animated WebP plays in an <img>, decoded off the main thread with no timers
+        this.animationUrl = element.dataset.animationUrl;
+        this.animation = null;
+        this.spriteUrl = element.dataset.spriteUrl;
+        this.fallbackUrl = element.dataset.fallbackUrl || this.spriteUrl;
+        this.frameCount = parseInt(element.dataset.frameCount) || 0;
+        this.frameInterval = (parseFloat(element.dataset.frameInterval) || 0.8) * 1000;
+        // Frames fill the sheet row by row; frame n is at column n % columns
+        this.columns = parseInt(element.dataset.spriteColumns) || Math.ceil(Math.sqrt(this.frameCount));
+        this.rows = Math.ceil(this.frameCount / this.columns);
+        this.frame = 0;
+        this.timer = null;
+        this.isLoaded = false;
+
+        this.init();
+    }
+
+    init() {
+        if (!this.overlay || !this.spriteUrl || this.frameCount === 0) {
+            return;
+        }
+        this.element.addEventListener('mouseenter', this.startAnimation.bind(this));
+        this.element.addEventListener('mouseleave', this.stopAnimation.bind(this));
+    }
+
+    load() {
+        // The whole film preview is this one image request
+        if (this.isLoaded || !this.overlay) return;
+        this.isLoaded = true;
+        if (this.animationUrl) {
+            this.animation = document.createElement('img');
+            this.animation.className = 'animated-preview';
+            this.animation.alt = '';
+            this.animation.decoding = 'async';
+            // Sheets drawn before the animations existed fall back to stepping through the sprite
+            this.animation.addEventListener('error', () => {
+                this.animation.remove();
+                this.animation = null;
+                this.animationUrl = null;
+                this.isLoaded = false;
+                if (this.element.classList.contains('playing')) {
+                    this.stopAnimation();
+                    this.startAnimation();
+                } else {
+                    this.load();
+                }
+            }, { once: true });
+            this.animation.src = this.animationUrl;
+            this.element.appendChild(this.animation);
+            return;
+        }
+        this.overlay.style.backgroundImage = supportsImageSet
+            ? `image-set(url("${this.spriteUrl}") type("image/webp"), url("${this.fallbackUrl}") type("image/jpeg"))`
+            : `url("${this.fallbackUrl}")`;
+        this.overlay.style.backgroundSize = `${this.columns * 100}% ${this.rows * 100}%`;
+        this.showFrame(0);
+    }
+
+    showFrame(index) {
+        const column = index % this.columns;
+        const row = Math.floor(index / this.columns);
+        const x = this.columns > 1 ? column / (this.columns - 1) * 100 : 0;
+        const y = this.rows > 1 ? row / (this.rows - 1) * 100 : 0;
+        this.overlay.style.backgroundPosition = `${x}% ${y}%`;
+    }
+
+    startAnimation() {
+        if (this.timer) return;
+        this.load();
+        this.element.classList.add('playing');
+        if (this.animation) return;
+        this.frame = 0;
+        this.showFrame(0);
+        if (this.frameCount > 1) {
+            this.timer = setInterval(() => {
+                this.frame = (this.frame + 1) % this.frameCount;
+                this.showFrame(this.frame);
+            }, this.frameInterval);
+        }
+    }
+
+    stopAnimation() {
+        clearInterval(this.timer);
+        this.timer = null;
+        this.element.classList.remove('playing');
+    }
+}
+
 class SwiperThumbnail {
     constructor(element) {
         this.element = element;
         this.frameSwiper = element.querySelector('.frame-swiper');
         this.staticThumbnail = element.querySelector('.static-thumbnail');
         
-        // Determine animation type and set appropriate frame count
-        this.animationType = element.dataset.animationType || 'sprite';
-        if (this.animationType === 'chapter') {
-            // Count actual slides for chapter-based animation
-            this.frameCount = element.querySelectorAll('.swiper-slide').length;
-            this.frameInterval = parseFloat(element.dataset.frameInterval) || 1000; // Default 1 second for chapters
-        } else {
-            // Legacy sprite-based animation
-            this.frameCount = parseInt(element.dataset.frameCount) || 0;
-            this.frameInterval = parseFloat(element.dataset.frameInterval) || 800; // Default 0.8 seconds for sprites
-        }
+        // Chapter thumbnails of films without a sprite sheet, one slide each
+        this.frameCount = element.querySelectorAll('.swiper-slide').length;
+        this.frameInterval = parseFloat(element.dataset.frameInterval) || 1000; // Default 1 second for chapters
         
         this.swiperInstance = null;
         this.isHovering = false;
@@ -73,12 +161,9 @@ class SwiperThumbnail {
         }
         
         if (this.swiperInstance && this.frameCount > 1) {
-            // Start autoplay with custom interval
-            // frameInterval is already in milliseconds for chapters, needs conversion for sprites
-            const delayMs = this.animationType === 'chapter' ? this.frameInterval : this.frameInterval * 1000;
-            
+            // Start autoplay with custom interval (milliseconds)
             this.swiperInstance.params.autoplay = {
-                delay: delayMs,
+                delay: this.frameInterval,
                 disableOnInteraction: false
             };
             this.swiperInstance.autoplay.start();
@@ -131,6 +216,10 @@ document.addEventListener('DOMContentLoaded', function() {
     });
     
     console.log(`Initialized ${thumbnailInstances.length} swiper thumbnails`);
+
+    document.querySelectorAll('.animated-thumbnail').forEach(element => {
+        element.spriteSheet = new SpriteSheetThumbnail(element);
+    });
 });
 
 // Performance optimization: Intersection Observer for lazy loading
@@ -138,6 +227,11 @@ if ('IntersectionObserver' in window) {
     const thumbnailObserver = new IntersectionObserver((entries) => {
         entries.forEach(entry => {
             if (entry.isIntersecting) {
+                // Fetch the sprite sheet before the first hover
+                const spriteThumbnail = entry.target.querySelector('.animated-thumbnail');
+                if (spriteThumbnail && spriteThumbnail.spriteSheet) {
+                    spriteThumbnail.spriteSheet.load();
+                }
                 const thumbnail = entry.target.querySelector('.swiper-thumbnail');
                 if (thumbnail && !thumbnail.classList.contains('preloaded')) {
                     thumbnail.classList.add('preloaded');